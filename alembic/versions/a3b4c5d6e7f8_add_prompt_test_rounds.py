@@ -0,0 +1,205 @@
+"""store prompt test experiment rounds in their own table
+
+Revision ID: a3b4c5d6e7f8
+Revises: f2a3b4c5d6e7
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+from typing import Any, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "a3b4c5d6e7f8"
+down_revision: Union[str, None] = "f2a3b4c5d6e7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 每批迁移的实验数；单个实验的结果可能有数千轮，批次不宜过大
+_BATCH_SIZE = 50
+_METRIC_FIELDS = ("latency_ms", "prompt_tokens", "completion_tokens", "total_tokens")
+
+_json = sa.JSON(none_as_null=True).with_variant(
+    postgresql.JSONB(none_as_null=True), "postgresql"
+)
+_experiments = sa.table(
+    "prompt_test_experiments",
+    sa.column("id", sa.Integer()),
+    sa.column("outputs", _json),
+)
+_rounds = sa.table(
+    "prompt_test_rounds",
+    sa.column("experiment_id", sa.Integer()),
+    sa.column("run_index", sa.Integer()),
+    sa.column("status", sa.String()),
+    sa.column("latency_ms", sa.Integer()),
+    sa.column("prompt_tokens", sa.Integer()),
+    sa.column("completion_tokens", sa.Integer()),
+    sa.column("total_tokens", sa.Integer()),
+    sa.column("cache_hit", sa.Boolean()),
+    sa.column("attempts", sa.Integer()),
+    sa.column("error", sa.Text()),
+    sa.column("payload", _json),
+)
+
+
+def _optional_int(value: Any) -> int | None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value)
+
+
+def _convert(experiment_id: int, outputs: list[Any]) -> list[dict[str, Any]]:
+    rows: dict[int, dict[str, Any]] = {}
+    for position, record in enumerate(outputs, start=1):
+        if not isinstance(record, dict):
+            continue
+        payload = dict(record)
+        run_index = _optional_int(
+            payload.pop("run_index", None) or payload.get("sequence")
+        )
+        status = str(payload.pop("status", "") or "").strip().lower()
+        cache_hit = payload.pop("cache_hit", None)
+        row = {
+            "experiment_id": experiment_id,
+            "run_index": run_index or position,
+            "status": "failed" if status in {"failed", "error"} else "success",
+            "cache_hit": bool(cache_hit) if cache_hit is not None else None,
+            "attempts": _optional_int(payload.pop("attempts", None)),
+            "error": payload.pop("error", None),
+        }
+        for field in _METRIC_FIELDS:
+            row[field] = _optional_int(payload.pop(field, None))
+        row["payload"] = payload or None
+        # 旧数据中序号重复时保留最后一条，满足 (experiment_id, run_index) 唯一约束
+        rows[row["run_index"]] = row
+    return list(rows.values())
+
+
+def _to_record(row: Any) -> dict[str, Any]:
+    """将轮次行还原为旧版 ``outputs`` 列表元素，与模型的 ``to_record`` 一致。"""
+
+    failed = row.status == "failed"
+    record: dict[str, Any] = {"run_index": row.run_index}
+    record.update(row.payload or {})
+    for field in _METRIC_FIELDS:
+        value = getattr(row, field)
+        if value is not None or not failed:
+            record[field] = value
+    if failed:
+        record["status"] = "failed"
+    if failed or row.error is not None:
+        record["error"] = row.error
+    if row.cache_hit is not None:
+        record["cache_hit"] = row.cache_hit
+    if row.attempts is not None:
+        record["attempts"] = row.attempts
+    return record
+
+
+def upgrade() -> None:
+    op.create_table(
+        "prompt_test_rounds",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("experiment_id", sa.Integer(), nullable=False),
+        sa.Column("run_index", sa.Integer(), nullable=False),
+        sa.Column(
+            "status", sa.String(length=50), server_default="success", nullable=False
+        ),
+        sa.Column("latency_ms", sa.Integer(), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=True),
+        sa.Column("completion_tokens", sa.Integer(), nullable=True),
+        sa.Column("total_tokens", sa.Integer(), nullable=True),
+        sa.Column("cache_hit", sa.Boolean(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("payload", _json, nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["experiment_id"], ["prompt_test_experiments.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "experiment_id", "run_index", name="uq_prompt_test_round_experiment_run"
+        ),
+    )
+    op.create_index(
+        op.f("ix_prompt_test_rounds_id"), "prompt_test_rounds", ["id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_prompt_test_rounds_experiment_id"),
+        "prompt_test_rounds",
+        ["experiment_id"],
+        unique=False,
+    )
+
+    # 按实验分批将旧版 JSON 结果拆分为轮次行，迁移完成的实验清空旧列
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        batch = connection.execute(
+            sa.select(_experiments.c.id, _experiments.c.outputs)
+            .where(_experiments.c.id > last_id, _experiments.c.outputs.is_not(None))
+            .order_by(_experiments.c.id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        for experiment_id, outputs in batch:
+            rows = _convert(experiment_id, outputs if isinstance(outputs, list) else [])
+            if rows:
+                connection.execute(_rounds.insert(), rows)
+        migrated_ids = [experiment_id for experiment_id, _ in batch]
+        connection.execute(
+            _experiments.update()
+            .where(_experiments.c.id.in_(migrated_ids))
+            .values(outputs=None)
+        )
+        last_id = migrated_ids[-1]
+
+
+def downgrade() -> None:
+    # 按实验分批将轮次行按序号写回旧版 JSON 列，之后再删除轮次表
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        experiment_ids = connection.scalars(
+            sa.select(_rounds.c.experiment_id)
+            .where(_rounds.c.experiment_id > last_id)
+            .group_by(_rounds.c.experiment_id)
+            .order_by(_rounds.c.experiment_id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not experiment_ids:
+            break
+        outputs: dict[int, list[dict[str, Any]]] = {
+            experiment_id: [] for experiment_id in experiment_ids
+        }
+        rows = connection.execute(
+            sa.select(_rounds)
+            .where(_rounds.c.experiment_id.in_(experiment_ids))
+            .order_by(_rounds.c.experiment_id, _rounds.c.run_index)
+        ).all()
+        for row in rows:
+            outputs[row.experiment_id].append(_to_record(row))
+        for experiment_id, records in outputs.items():
+            connection.execute(
+                _experiments.update()
+                .where(_experiments.c.id == experiment_id)
+                .values(outputs=records)
+            )
+        last_id = experiment_ids[-1]
+
+    op.drop_index(
+        op.f("ix_prompt_test_rounds_experiment_id"), table_name="prompt_test_rounds"
+    )
+    op.drop_index(op.f("ix_prompt_test_rounds_id"), table_name="prompt_test_rounds")
+    op.drop_table("prompt_test_rounds")
@@ -0,0 +1,139 @@
+"""compress large json columns outside postgresql
+
+Revision ID: b4c5d6e7f8a9
+Revises: a3b4c5d6e7f8
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+
+import json
+import zlib
+from typing import Any, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+revision: str = "b4c5d6e7f8a9"
+down_revision: Union[str, None] = "a3b4c5d6e7f8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app.db.types.CompressedJSON 保持一致的存储格式
+_HEADER_RAW = b"\x00"
+_HEADER_ZLIB = b"\x01"
+_THRESHOLD = 512
+_BATCH_SIZE = 500
+
+_COLUMNS: tuple[tuple[str, str], ...] = (
+    ("prompt_test_experiments", "outputs"),
+    ("prompt_test_rounds", "payload"),
+    ("llm_usage_logs", "messages"),
+    ("llm_usage_logs", "parameters"),
+)
+
+
+def _encode(value: Any) -> bytes:
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) >= _THRESHOLD:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return _HEADER_ZLIB + compressed
+    return _HEADER_RAW + raw
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, str):
+        return json.loads(value)
+    data = bytes(value)
+    if data[:1] == _HEADER_ZLIB:
+        return json.loads(zlib.decompress(data[1:]).decode("utf-8"))
+    if data[:1] == _HEADER_RAW:
+        data = data[1:]
+    return json.loads(data.decode("utf-8"))
+
+
+def _is_encoded(value: Any) -> bool:
+    return not isinstance(value, str) and bytes(value[:1]) in (
+        _HEADER_RAW,
+        _HEADER_ZLIB,
+    )
+
+
+def _rewrite(table_name: str, column_name: str, *, compress: bool) -> None:
+    """按主键分批改写单列，已是目标格式的行跳过。"""
+
+    connection = op.get_bind()
+    table = sa.table(
+        table_name,
+        sa.column("id", sa.Integer()),
+        sa.column(column_name, sa.LargeBinary()),
+    )
+    column = table.c[column_name]
+    last_id = 0
+    while True:
+        batch = connection.execute(
+            sa.select(table.c.id, column)
+            .where(table.c.id > last_id, column.is_not(None))
+            .order_by(table.c.id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        updates = []
+        for row_id, value in batch:
+            if compress and not _is_encoded(value):
+                updates.append({"row_id": row_id, "value": _encode(_decode(value))})
+            elif not compress and _is_encoded(value):
+                text = json.dumps(_decode(value), ensure_ascii=False)
+                updates.append({"row_id": row_id, "value": text.encode("utf-8")})
+        if updates:
+            connection.execute(
+                table.update()
+                .where(table.c.id == sa.bindparam("row_id"))
+                .values({column_name: sa.bindparam("value")}),
+                updates,
+            )
+        last_id = batch[-1][0]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    # PostgreSQL 的 JSONB 由 TOAST 自动压缩，保持原样
+    if dialect == "postgresql":
+        return
+    for table_name, column_name in _COLUMNS:
+        if dialect == "mysql":
+            op.alter_column(
+                table_name,
+                column_name,
+                existing_type=sa.JSON(),
+                type_=mysql.LONGBLOB(),
+                existing_nullable=True,
+            )
+        _rewrite(table_name, column_name, compress=True)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        return
+    for table_name, column_name in _COLUMNS:
+        _rewrite(table_name, column_name, compress=False)
+        if dialect == "mysql":
+            # 二进制字符集无法直接转换为 JSON，先转为 utf8mb4 文本
+            op.alter_column(
+                table_name,
+                column_name,
+                existing_type=mysql.LONGBLOB(),
+                type_=mysql.LONGTEXT(charset="utf8mb4"),
+                existing_nullable=True,
+            )
+            op.alter_column(
+                table_name,
+                column_name,
+                existing_type=mysql.LONGTEXT(charset="utf8mb4"),
+                type_=sa.JSON(),
+                existing_nullable=True,
+            )
@@ -0,0 +1,54 @@
+"""add llm response cache and result cache_hit flag
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "b8c9d0e1f2a3"
+down_revision: Union[str, None] = "a7b8c9d0e1f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "llm_response_cache",
+        sa.Column("cache_key", sa.String(length=64), nullable=False),
+        sa.Column("provider_id", sa.Integer(), nullable=True),
+        sa.Column("model_name", sa.String(length=150), nullable=True),
+        sa.Column("response", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.Float(), nullable=False),
+        sa.Column("last_accessed_at", sa.Float(), nullable=False),
+        sa.Column("expires_at", sa.Float(), nullable=True),
+        sa.Column("hit_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("cache_key"),
+    )
+    op.create_index(
+        "ix_llm_response_cache_provider_id", "llm_response_cache", ["provider_id"]
+    )
+    op.create_index(
+        "ix_llm_response_cache_last_accessed_at",
+        "llm_response_cache",
+        ["last_accessed_at"],
+    )
+    op.add_column(
+        "results",
+        sa.Column("cache_hit", sa.Boolean(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("results", "cache_hit")
+    op.drop_index(
+        "ix_llm_response_cache_last_accessed_at", table_name="llm_response_cache"
+    )
+    op.drop_index("ix_llm_response_cache_provider_id", table_name="llm_response_cache")
+    op.drop_table("llm_response_cache")
@@ -0,0 +1,254 @@
+"""store usage log and round messages as content-addressed blobs
+
+Revision ID: c5d6e7f8a9b0
+Revises: b4c5d6e7f8a9
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+
+import hashlib
+import json
+import zlib
+from typing import Any, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql, postgresql
+
+
+revision: str = "c5d6e7f8a9b0"
+down_revision: Union[str, None] = "b4c5d6e7f8a9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app.db.types.CompressedJSON 保持一致的存储格式
+_HEADER_RAW = b"\x00"
+_HEADER_ZLIB = b"\x01"
+_THRESHOLD = 512
+_BATCH_SIZE = 500
+
+_json = sa.JSON(none_as_null=True).with_variant(
+    postgresql.JSONB(none_as_null=True), "postgresql"
+)
+_blob = sa.LargeBinary().with_variant(mysql.LONGBLOB(), "mysql")
+
+
+def _canonical(value: Any) -> bytes:
+    return json.dumps(
+        value, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    ).encode("utf-8")
+
+
+def _encode(value: Any, postgres: bool) -> Any:
+    if postgres:
+        return value
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) >= _THRESHOLD:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return _HEADER_ZLIB + compressed
+    return _HEADER_RAW + raw
+
+
+def _decode(value: Any, postgres: bool) -> Any:
+    if value is None or postgres:
+        return value
+    if isinstance(value, str):
+        return json.loads(value)
+    data = bytes(value)
+    if data[:1] == _HEADER_ZLIB:
+        return json.loads(zlib.decompress(data[1:]).decode("utf-8"))
+    if data[:1] == _HEADER_RAW:
+        data = data[1:]
+    return json.loads(data.decode("utf-8"))
+
+
+def _compressed_column(postgres: bool) -> sa.types.TypeEngine:
+    # 上一迁移之后，PostgreSQL 仍为 JSONB，其余数据库为带头字节的二进制
+    return postgresql.JSONB(none_as_null=True) if postgres else _blob
+
+
+def _store_blobs(
+    connection: sa.Connection,
+    blobs: sa.TableClause,
+    messages: list[Any],
+    postgres: bool,
+) -> list[str]:
+    digests = [hashlib.sha256(_canonical(item)).hexdigest() for item in messages]
+    unique = dict(zip(digests, messages))
+    existing = set(
+        connection.scalars(
+            sa.select(blobs.c.digest).where(blobs.c.digest.in_(list(unique)))
+        )
+    )
+    rows = [
+        {
+            "digest": digest,
+            "content": _encode(content, postgres),
+            "size": len(_canonical(content)),
+        }
+        for digest, content in unique.items()
+        if digest not in existing
+    ]
+    if rows:
+        connection.execute(blobs.insert(), rows)
+    return digests
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    postgres = connection.dialect.name == "postgresql"
+    op.create_table(
+        "message_blobs",
+        sa.Column("digest", sa.String(length=64), nullable=False),
+        sa.Column("content", _compressed_column(postgres), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("digest"),
+    )
+    op.add_column("llm_usage_logs", sa.Column("message_refs", _json, nullable=True))
+
+    blobs = sa.table(
+        "message_blobs",
+        sa.column("digest", sa.String()),
+        sa.column("content", _compressed_column(postgres)),
+        sa.column("size", sa.Integer()),
+    )
+    logs = sa.table(
+        "llm_usage_logs",
+        sa.column("id", sa.Integer()),
+        sa.column("messages", _compressed_column(postgres)),
+        sa.column("message_refs", _json),
+    )
+    rounds = sa.table(
+        "prompt_test_rounds",
+        sa.column("id", sa.Integer()),
+        sa.column("payload", _compressed_column(postgres)),
+    )
+
+    # 按主键分批把内嵌的消息列表替换为摘要引用
+    last_id = 0
+    while True:
+        batch = connection.execute(
+            sa.select(logs.c.id, logs.c.messages)
+            .where(logs.c.id > last_id, logs.c.messages.is_not(None))
+            .order_by(logs.c.id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        for row_id, value in batch:
+            messages = _decode(value, postgres)
+            if not isinstance(messages, list):
+                continue
+            refs = _store_blobs(connection, blobs, messages, postgres)
+            connection.execute(
+                logs.update()
+                .where(logs.c.id == row_id)
+                .values(messages=None, message_refs=refs)
+            )
+        last_id = batch[-1][0]
+
+    last_id = 0
+    while True:
+        batch = connection.execute(
+            sa.select(rounds.c.id, rounds.c.payload)
+            .where(rounds.c.id > last_id, rounds.c.payload.is_not(None))
+            .order_by(rounds.c.id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        for row_id, value in batch:
+            payload = _decode(value, postgres)
+            if not isinstance(payload, dict) or not isinstance(
+                payload.get("messages"), list
+            ):
+                continue
+            payload["message_refs"] = _store_blobs(
+                connection, blobs, payload.pop("messages"), postgres
+            )
+            connection.execute(
+                rounds.update()
+                .where(rounds.c.id == row_id)
+                .values(payload=_encode(payload, postgres))
+            )
+        last_id = batch[-1][0]
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    postgres = connection.dialect.name == "postgresql"
+    blobs = sa.table(
+        "message_blobs",
+        sa.column("digest", sa.String()),
+        sa.column("content", _compressed_column(postgres)),
+    )
+    logs = sa.table(
+        "llm_usage_logs",
+        sa.column("id", sa.Integer()),
+        sa.column("messages", _compressed_column(postgres)),
+        sa.column("message_refs", _json),
+    )
+    rounds = sa.table(
+        "prompt_test_rounds",
+        sa.column("id", sa.Integer()),
+        sa.column("payload", _compressed_column(postgres)),
+    )
+
+    def _resolve(refs: list[str]) -> list[Any]:
+        rows = connection.execute(
+            sa.select(blobs.c.digest, blobs.c.content).where(blobs.c.digest.in_(refs))
+        ).all()
+        contents = {digest: _decode(content, postgres) for digest, content in rows}
+        return [contents[digest] for digest in refs if digest in contents]
+
+    last_id = 0
+    while True:
+        batch = connection.execute(
+            sa.select(logs.c.id, logs.c.message_refs)
+            .where(logs.c.id > last_id, logs.c.message_refs.is_not(None))
+            .order_by(logs.c.id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        for row_id, refs in batch:
+            connection.execute(
+                logs.update()
+                .where(logs.c.id == row_id)
+                .values(messages=_encode(_resolve(list(refs)), postgres))
+            )
+        last_id = batch[-1][0]
+
+    last_id = 0
+    while True:
+        batch = connection.execute(
+            sa.select(rounds.c.id, rounds.c.payload)
+            .where(rounds.c.id > last_id, rounds.c.payload.is_not(None))
+            .order_by(rounds.c.id)
+            .limit(_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        for row_id, value in batch:
+            payload = _decode(value, postgres)
+            if not isinstance(payload, dict) or not isinstance(
+                payload.get("message_refs"), list
+            ):
+                continue
+            payload["messages"] = _resolve(payload.pop("message_refs"))
+            connection.execute(
+                rounds.update()
+                .where(rounds.c.id == row_id)
+                .values(payload=_encode(payload, postgres))
+            )
+        last_id = batch[-1][0]
+
+    op.drop_column("llm_usage_logs", "message_refs")
+    op.drop_table("message_blobs")
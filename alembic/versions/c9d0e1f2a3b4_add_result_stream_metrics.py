@@ -0,0 +1,34 @@
+"""add streaming latency metrics to results
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "c9d0e1f2a3b4"
+down_revision: Union[str, None] = "b8c9d0e1f2a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("results", sa.Column("ttft_ms", sa.Integer(), nullable=True))
+    op.add_column(
+        "results", sa.Column("inter_token_latency_ms", sa.JSON(), nullable=True)
+    )
+    op.add_column(
+        "results", sa.Column("tokens_per_second", sa.Float(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("results", "tokens_per_second")
+    op.drop_column("results", "inter_token_latency_ms")
+    op.drop_column("results", "ttft_ms")
@@ -0,0 +1,29 @@
+"""add http options to llm providers
+
+Revision ID: d4e5f6a7b8c9
+Revises: c1d2e3f4g5h6
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "d4e5f6a7b8c9"
+down_revision: Union[str, None] = "c1d2e3f4g5h6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "llm_providers",
+        sa.Column("http_options", sa.JSON(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("llm_providers", "http_options")
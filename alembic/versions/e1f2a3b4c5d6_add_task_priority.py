@@ -0,0 +1,37 @@
+"""add execution priority to test runs, prompt test tasks and task jobs
+
+Revision ID: e1f2a3b4c5d6
+Revises: d0e1f2a3b4c5
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "e1f2a3b4c5d6"
+down_revision: Union[str, None] = "d0e1f2a3b4c5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("test_runs", sa.Column("priority", sa.Integer(), nullable=True))
+    op.add_column(
+        "prompt_test_tasks", sa.Column("priority", sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        "task_jobs",
+        sa.Column("priority", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.add_column("task_jobs", sa.Column("enqueued_at", sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("task_jobs", "enqueued_at")
+    op.drop_column("task_jobs", "priority")
+    op.drop_column("prompt_test_tasks", "priority")
+    op.drop_column("test_runs", "priority")
@@ -0,0 +1,36 @@
+"""add rpm/tpm limits to llm models and rate limit buckets
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "e5f6a7b8c9d0"
+down_revision: Union[str, None] = "d4e5f6a7b8c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("llm_models", sa.Column("rpm_limit", sa.Integer(), nullable=True))
+    op.add_column("llm_models", sa.Column("tpm_limit", sa.Integer(), nullable=True))
+    op.create_table(
+        "llm_rate_limit_buckets",
+        sa.Column("bucket_key", sa.String(length=255), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("bucket_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("llm_rate_limit_buckets")
+    op.drop_column("llm_models", "tpm_limit")
+    op.drop_column("llm_models", "rpm_limit")
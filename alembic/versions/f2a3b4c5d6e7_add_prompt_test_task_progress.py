@@ -0,0 +1,75 @@
+"""store prompt test task progress outside of task config
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "f2a3b4c5d6e7"
+down_revision: Union[str, None] = "e1f2a3b4c5d6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_LEGACY_PROGRESS_KEYS = (
+    "progress",
+    "progress_current",
+    "progressCurrent",
+    "progress_total",
+    "progressTotal",
+    "progress_percentage",
+    "progressPercentage",
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "prompt_test_task_progress",
+        sa.Column("task_id", sa.Integer(), nullable=False),
+        sa.Column("current", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("total", sa.Integer(), server_default="1", nullable=False),
+        sa.Column("percentage", sa.Integer(), server_default="0", nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["task_id"], ["prompt_test_tasks.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("task_id"),
+    )
+
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    # 迁移任务配置中已有的进度记录，并移除配置里冗余的进度字段
+    op.execute(
+        """
+        INSERT INTO prompt_test_task_progress (task_id, current, total, percentage)
+        SELECT
+            id,
+            COALESCE((config -> 'progress' ->> 'current')::int, 0),
+            GREATEST(COALESCE((config -> 'progress' ->> 'total')::int, 1), 1),
+            COALESCE((config -> 'progress' ->> 'percentage')::int, 0)
+        FROM prompt_test_tasks
+        WHERE jsonb_typeof(config -> 'progress') = 'object'
+        """
+    )
+    removed = " ".join(f"- '{key}'" for key in _LEGACY_PROGRESS_KEYS)
+    keys = ", ".join(f"'{key}'" for key in _LEGACY_PROGRESS_KEYS)
+    op.execute(
+        f"UPDATE prompt_test_tasks SET config = config {removed} "
+        f"WHERE config ?| array[{keys}]"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("prompt_test_task_progress")
@@ -7,6 +7,7 @@ from app.api.v1.endpoints import (
     prompt_classes,
     prompt_tags,
     prompts,
+    queues,
     test_prompt,
     usage,
     prompt_test_tasks,
@@ -32,4 +33,5 @@ api_router.include_router(
 api_router.include_router(usage.router, prefix="/usage", tags=["usage"])
 api_router.include_router(prompt_test_tasks.router)
 api_router.include_router(settings.router)
+api_router.include_router(queues.router)
 api_router.include_router(users.router, prefix="/users", tags=["users"])
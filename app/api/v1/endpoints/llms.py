@@ -17,12 +17,23 @@ from app.core.llm_provider_registry import (
     get_provider_defaults,
     iter_common_providers,
 )
+from app.core.adaptive_concurrency import adaptive_concurrency
+from app.core.concurrency_governor import concurrency_governor
+from app.core.llm_http import llm_client_registry
+from app.core.llm_stream import (
+    DONE_MARKER,
+    aiter_sse_events,
+    decode_sse_payload,
+    parse_sse_data,
+)
 from app.core.logging_config import get_logger
+from app.core.rate_limiter import llm_rate_limiter, usage_total_tokens
 from app.db.session import get_db
 from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.usage import LLMUsageLog
 from app.schemas.llm_provider import (
     KnownLLMProvider,
+    LLMModelConcurrencyRead,
     LLMModelCreate,
     LLMModelUpdate,
     LLMModelRead,
@@ -32,7 +43,8 @@ from app.schemas.llm_provider import (
     LLMUsageLogRead,
     LLMUsageMessage,
 )
-from app.services.llm_usage import list_quick_test_usage_logs
+from app.services.llm_resolution import mark_llm_config_changed
+from app.services.llm_usage import list_quick_test_usage_logs, store_usage_messages
 from app.services.system_settings import (
     DEFAULT_QUICK_TEST_TIMEOUT,
     get_testing_timeout_config,
@@ -95,6 +107,15 @@ def _normalize_base_url(base_url: str | None) -> str | None:
     return base_url.rstrip("/")
 
 
+def _normalize_json_options(
+    options: Mapping[str, Any] | None,
+) -> dict[str, Any] | None:
+    if not options:
+        return None
+    cleaned = {key: value for key, value in options.items() if value is not None}
+    return cleaned or None
+
+
 def _mask_api_key(api_key: str) -> str:
     if not api_key:
         return ""
@@ -105,9 +126,15 @@ def _mask_api_key(api_key: str) -> str:
     return f"{prefix}{'*' * (len(api_key) - 6)}{suffix}"
 
 
+def _serialize_model(model: LLMModel) -> LLMModelRead:
+    data = LLMModelRead.model_validate(model, from_attributes=True)
+    data.effective_concurrency_limit = adaptive_concurrency.effective_limit(model)
+    return data
+
+
 def _serialize_provider(provider: LLMProvider) -> LLMProviderRead:
     models = [
-        LLMModelRead.model_validate(model, from_attributes=True)
+        _serialize_model(model)
         for model in sorted(provider.models, key=lambda item: item.created_at)
     ]
     defaults = get_provider_defaults(provider.provider_key)
@@ -127,6 +154,8 @@ def _serialize_provider(provider: LLMProvider) -> LLMProviderRead:
         is_archived=provider.is_archived,
         default_model_name=provider.default_model_name,
         masked_api_key=_mask_api_key(provider.api_key),
+        http_options=provider.http_options,
+        retry_policy=provider.retry_policy,
         models=models,
         created_at=provider.created_at,
         updated_at=provider.updated_at,
@@ -278,13 +307,14 @@ def list_quick_test_history(
 ) -> list[LLMUsageLogRead]:
     """返回快速测试产生的最近调用记录。"""
 
-    logs = list_quick_test_usage_logs(db, limit=limit, offset=offset)
+    records = list_quick_test_usage_logs(db, limit=limit, offset=offset)
     history: list[LLMUsageLogRead] = []
-    for log in logs:
+    for record in records:
+        log = record.log
         provider = log.provider
         message_items: list[LLMUsageMessage] = []
-        if isinstance(log.messages, list):
-            for item in log.messages:
+        if isinstance(record.messages, list):
+            for item in record.messages:
                 if not isinstance(item, dict):
                     continue
                 try:
@@ -361,6 +391,8 @@ def create_llm_provider(
     """创建新的 LLM 提供者卡片，初始模型列表为空。"""
 
     data = payload.model_dump()
+    data["http_options"] = _normalize_json_options(data.get("http_options"))
+    data["retry_policy"] = _normalize_json_options(data.get("retry_policy"))
     data, provider_key = _resolve_provider_defaults_for_create(data)
 
     duplicate_stmt = select(LLMProvider).where(
@@ -376,6 +408,7 @@ def create_llm_provider(
 
     provider = LLMProvider(**data)
     db.add(provider)
+    mark_llm_config_changed(db)
     db.commit()
     db.refresh(provider)
 
@@ -419,6 +452,11 @@ def update_llm_provider(
             )
     if "api_key" in update_data and update_data["api_key"]:
         logger.info("更新 LLM 提供者密钥: provider_id=%s", provider.id)
+    for option_key in ("http_options", "retry_policy"):
+        if option_key in update_data:
+            update_data[option_key] = _normalize_json_options(
+                update_data[option_key]
+            )
 
     for key, value in update_data.items():
         setattr(provider, key, value)
@@ -438,8 +476,10 @@ def update_llm_provider(
             detail="该提供者需要配置基础 URL。",
         )
 
+    mark_llm_config_changed(db)
     db.commit()
     db.refresh(provider)
+    llm_client_registry.invalidate(provider.id)
 
     logger.info("更新 LLM 提供者成功: id=%s", provider.id)
     return _serialize_provider(provider)
@@ -464,6 +504,7 @@ def create_llm_model(
     model = LLMModel(provider_id=provider.id, **data)
     db.add(model)
     try:
+        mark_llm_config_changed(db)
         db.commit()
     except IntegrityError:
         db.rollback()
@@ -474,7 +515,7 @@ def create_llm_model(
     db.refresh(model)
 
     logger.info("新增模型成功: provider_id=%s model=%s", provider.id, model.name)
-    return LLMModelRead.model_validate(model, from_attributes=True)
+    return _serialize_model(model)
 
 
 @router.patch(
@@ -510,7 +551,12 @@ def update_llm_model(
         model.capability = update_data["capability"]
     if "quota" in update_data:
         model.quota = update_data["quota"]
+    if "rpm_limit" in update_data:
+        model.rpm_limit = update_data["rpm_limit"]
+    if "tpm_limit" in update_data:
+        model.tpm_limit = update_data["tpm_limit"]
 
+    mark_llm_config_changed(db)
     db.commit()
     db.refresh(model)
 
@@ -520,7 +566,33 @@ def update_llm_model(
         model_id,
         model.concurrency_limit,
     )
-    return LLMModelRead.model_validate(model, from_attributes=True)
+    return _serialize_model(model)
+
+
+@router.get(
+    "/{provider_id}/models/{model_id}/concurrency",
+    response_model=LLMModelConcurrencyRead,
+)
+def get_llm_model_concurrency(
+    *,
+    db: Session = Depends(get_db),
+    provider_id: int,
+    model_id: int,
+) -> LLMModelConcurrencyRead:
+    """查看模型当前的并发上限、占用与排队情况。"""
+
+    _ = _get_provider_or_404(db, provider_id)
+    model = db.scalar(
+        select(LLMModel).where(
+            LLMModel.id == model_id, LLMModel.provider_id == provider_id
+        )
+    )
+    if not model:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="未找到指定的模型",
+        )
+    return LLMModelConcurrencyRead(**concurrency_governor.snapshot(model))
 
 
 @router.delete(
@@ -556,6 +628,7 @@ def delete_llm_model(
     if remaining == 0:
         provider.is_archived = True
 
+    mark_llm_config_changed(db)
     db.commit()
 
     logger.info(
@@ -581,7 +654,9 @@ def delete_llm_provider(
 
     provider = _get_provider_or_404(db, provider_id, include_archived=True)
     db.delete(provider)
+    mark_llm_config_changed(db)
     db.commit()
+    llm_client_registry.invalidate(provider_id)
 
     logger.info("删除 LLM 提供者成功: id=%s", provider_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -619,25 +694,32 @@ def invoke_llm(
     timeout_config = get_testing_timeout_config(db)
     invoke_timeout = float(timeout_config.quick_test_timeout or DEFAULT_INVOKE_TIMEOUT)
 
-    start_time = time.perf_counter()
-    try:
-        response = httpx.post(
-            url,
-            headers=headers,
-            json=request_payload,
-            timeout=invoke_timeout,
-        )
-    except httpx.HTTPError as exc:
-        logger.error(
-            "调用外部 LLM 接口出现网络异常: provider_id=%s 错误=%s",
-            provider.id,
-            exc,
-        )
-        raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc)
-        ) from exc
+    reservation = llm_rate_limiter.acquire(target_model, request_payload)
+    with concurrency_governor.slot(target_model) as slot:
+        start_time = time.perf_counter()
+        try:
+            response = llm_client_registry.get_sync_client(provider).post(
+                url,
+                headers=headers,
+                json=request_payload,
+                timeout=llm_client_registry.request_timeout(provider, invoke_timeout),
+            )
+        except httpx.HTTPError as exc:
+            # 请求未完成，退回预支的额度
+            llm_rate_limiter.settle(reservation, 0)
+            logger.error(
+                "调用外部 LLM 接口出现网络异常: provider_id=%s 错误=%s",
+                provider.id,
+                exc,
+            )
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc)
+            ) from exc
+        slot.observe(response.status_code, (time.perf_counter() - start_time) * 1000)
 
     if response.status_code >= 400:
+        # 失败的调用不消耗 Token，退回预支的额度
+        llm_rate_limiter.settle(reservation, 0)
         try:
             error_payload = response.json()
         except ValueError:
@@ -675,6 +757,10 @@ def invoke_llm(
             status_code=status.HTTP_502_BAD_GATEWAY, detail="LLM 响应解析失败。"
         ) from exc
 
+    llm_rate_limiter.settle(
+        reservation, usage_total_tokens(response_payload.get("usage"))
+    )
+
     if payload.persist_usage:
         usage_raw = response_payload.get("usage")
         usage_obj: Mapping[str, Any] | None = (
@@ -741,6 +827,7 @@ def invoke_llm(
         )
 
         try:
+            store_usage_messages([log_entry])
             db.add(log_entry)
             db.commit()
             logger.info(
@@ -816,21 +903,11 @@ async def stream_invoke_llm(
 
     def _process_event(lines: list[str]) -> list[str]:
         nonlocal usage_summary
-        if not lines:
-            return []
-        data_segments: list[str] = []
-        for item in lines:
-            if item.startswith(":"):
-                continue
-            if item.startswith("data:"):
-                data_segments.append(item[5:].lstrip())
-        if not data_segments:
-            return []
-        data_str = "\n".join(data_segments).strip()
-        if not data_str:
+        data_str = parse_sse_data(lines)
+        if data_str is None:
             return []
-        if data_str == "[DONE]":
-            return ["[DONE]"]
+        if data_str == DONE_MARKER:
+            return [DONE_MARKER]
         snippet = data_str if len(data_str) <= 200 else f"{data_str[:200]}…"
         logger.info(
             "接收到流式事件: provider_id=%s model=%s data=%s",
@@ -838,10 +915,8 @@ async def stream_invoke_llm(
             model_name,
             snippet,
         )
-        try:
-            payload_obj = json.loads(data_str)
-        except json.JSONDecodeError:
-            logger.debug("忽略无法解析的流式分片: %s", data_str)
+        payload_obj = decode_sse_payload(data_str)
+        if payload_obj is None:
             return []
 
         usage_payload = payload_obj.get("usage")
@@ -963,6 +1038,7 @@ async def stream_invoke_llm(
             total_tokens=summary.get("total_tokens"),
         )
         try:
+            store_usage_messages([log_entry])
             db.add(log_entry)
             db.commit()
             logger.info(
@@ -981,68 +1057,77 @@ async def stream_invoke_llm(
 
     timeout_config = get_testing_timeout_config(db)
     invoke_timeout = float(timeout_config.quick_test_timeout or DEFAULT_INVOKE_TIMEOUT)
+    request_timeout = llm_client_registry.request_timeout(provider, invoke_timeout)
 
     async def _event_stream() -> AsyncIterator[bytes]:
         nonlocal should_persist
-        event_lines: list[str] = []
-        async with httpx.AsyncClient(timeout=invoke_timeout) as async_client:
-            try:
-                async with async_client.stream(
-                    "POST",
-                    url,
-                    headers=headers,
-                    json=request_payload,
-                ) as response:
-                    if response.status_code >= 400:
-                        should_persist = False
-                        error_body = await response.aread()
-                        decoded = error_body.decode("utf-8", errors="ignore")
-                        try:
-                            error_payload = json.loads(decoded)
-                        except ValueError:
-                            error_payload = {"message": decoded}
-                        logger.error(
-                            "流式调用返回错误: provider_id=%s 状态码=%s 响应=%s",
-                            provider.id,
-                            response.status_code,
-                            error_payload,
-                        )
-                        raise HTTPException(
-                            status_code=response.status_code, detail=error_payload
-                        )
-
-                    async for line in response.aiter_lines():
-                        if line is None:
-                            continue
-                        if line == "":
-                            for payload in _process_event(event_lines):
-                                if payload == "[DONE]":
-                                    yield b"data: [DONE]\n\n"
-                                else:
-                                    yield f"data: {payload}\n\n".encode("utf-8")
-                            event_lines = []
-                            continue
-                        event_lines.append(line)
-
-                    if event_lines:
-                        for payload in _process_event(event_lines):
-                            if payload == "[DONE]":
-                                yield b"data: [DONE]\n\n"
-                            else:
-                                yield f"data: {payload}\n\n".encode("utf-8")
-
-            except httpx.HTTPError as exc:
-                should_persist = False
-                logger.error(
-                    "流式调用外部 LLM 出现异常: provider_id=%s 错误=%s",
-                    provider.id,
-                    exc,
+        async_client = llm_client_registry.get_async_client(provider)
+        reservation = await llm_rate_limiter.acquire_async(
+            target_model, request_payload
+        )
+        lease = await concurrency_governor.acquire_async(target_model)
+        request_started = time.perf_counter()
+        failed = False
+        # 未拿到真实用量时保留预估额度，请求失败时全额退回
+        consumed_tokens: int | None = None
+        try:
+            async with async_client.stream(
+                "POST",
+                url,
+                headers=headers,
+                json=request_payload,
+                timeout=request_timeout,
+            ) as response:
+                lease.observe(
+                    response.status_code,
+                    (time.perf_counter() - request_started) * 1000,
                 )
-                raise HTTPException(
-                    status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc)
-                ) from exc
-            finally:
-                await run_in_threadpool(_persist_usage)
+                if response.status_code >= 400:
+                    should_persist = False
+                    consumed_tokens = 0
+                    error_body = await response.aread()
+                    decoded = error_body.decode("utf-8", errors="ignore")
+                    try:
+                        error_payload = json.loads(decoded)
+                    except ValueError:
+                        error_payload = {"message": decoded}
+                    logger.error(
+                        "流式调用返回错误: provider_id=%s 状态码=%s 响应=%s",
+                        provider.id,
+                        response.status_code,
+                        error_payload,
+                    )
+                    raise HTTPException(
+                        status_code=response.status_code, detail=error_payload
+                    )
+
+                async for event_lines in aiter_sse_events(response.aiter_lines()):
+                    for payload in _process_event(event_lines):
+                        if payload == DONE_MARKER:
+                            yield b"data: [DONE]\n\n"
+                        else:
+                            yield f"data: {payload}\n\n".encode("utf-8")
+                consumed_tokens = usage_total_tokens(usage_summary)
+
+        except httpx.HTTPError as exc:
+            should_persist = False
+            failed = True
+            consumed_tokens = 0
+            logger.error(
+                "流式调用外部 LLM 出现异常: provider_id=%s 错误=%s",
+                provider.id,
+                exc,
+            )
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc)
+            ) from exc
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            await concurrency_governor.arelease(lease, failed=failed)
+            await llm_rate_limiter.asettle(reservation, consumed_tokens)
+            await run_in_threadpool(_persist_usage)
 
     headers_extra = {
         "Cache-Control": "no-cache",
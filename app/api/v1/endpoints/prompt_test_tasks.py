@@ -1,13 +1,28 @@
 from __future__ import annotations
 
+import json
 from datetime import datetime, timezone
-from typing import Sequence
+from typing import Any, AsyncIterator, Mapping, Sequence
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session, selectinload
 
-from app.core.prompt_test_task_queue import enqueue_prompt_test_task
+from app.core.cancellation import PROMPT_TEST_TASK_SCOPE, cancellation_registry
+from app.core.prompt_test_task_queue import (
+    enqueue_prompt_test_task,
+    priority_for_prompt_test_task,
+)
+from app.core.config import settings
+from app.core.task_progress import (
+    PROGRESS_EVENT,
+    STATUS_EVENT,
+    ProgressSnapshot,
+    progress_store,
+)
+from app.db import session as db_session
 from app.db.session import get_db
 from app.models.prompt_test import (
     PromptTestExperiment,
@@ -20,19 +35,32 @@ from app.schemas.prompt_test import (
     PromptTestExperimentCreate,
     PromptTestExperimentRead,
     PromptTestTaskCreate,
+    PromptTestTaskProgressRead,
     PromptTestTaskRead,
     PromptTestTaskUpdate,
     PromptTestUnitCreate,
     PromptTestUnitRead,
     PromptTestUnitUpdate,
 )
+from app.schemas.task_estimate import TaskEstimateRead
 from app.services.prompt_test_engine import (
     PromptTestExecutionError,
     execute_prompt_test_experiment,
 )
+from app.services.task_estimator import (
+    TaskEstimate,
+    TaskEstimationError,
+    estimate_prompt_test_task,
+)
 
 router = APIRouter(prefix="/prompt-test", tags=["prompt-test"])
 
+_TERMINAL_TASK_STATUSES = {
+    PromptTestTaskStatus.COMPLETED,
+    PromptTestTaskStatus.FAILED,
+    PromptTestTaskStatus.CANCELLED,
+}
+
 
 def _get_task_or_404(db: Session, task_id: int) -> PromptTestTask:
     task = db.get(PromptTestTask, task_id)
@@ -67,7 +95,9 @@ def list_prompt_test_tasks(
 
     stmt = (
         select(PromptTestTask)
-        .options(selectinload(PromptTestTask.units))
+        .options(
+            selectinload(PromptTestTask.units), selectinload(PromptTestTask.progress)
+        )
         .where(PromptTestTask.is_deleted.is_(False))
         .order_by(PromptTestTask.created_at.desc())
     )
@@ -103,11 +133,32 @@ def create_prompt_test_task(
     db.refresh(task)
 
     if payload.auto_execute:
-        enqueue_prompt_test_task(task.id)
+        enqueue_prompt_test_task(
+            task.id, task.owner_id, priority=priority_for_prompt_test_task(task)
+        )
 
     return task
 
 
+@router.post("/tasks/estimate", response_model=TaskEstimateRead)
+def estimate_new_prompt_test_task(
+    *, db: Session = Depends(get_db), payload: PromptTestTaskCreate
+) -> TaskEstimate:
+    """在创建前预估测试任务的 Token、费用与耗时，不写入数据库。"""
+
+    task = PromptTestTask(**payload.model_dump(exclude={"units", "auto_execute"}))
+    units = [
+        PromptTestUnit(**unit_payload.model_dump(exclude_none=True))
+        for unit_payload in payload.units or []
+    ]
+    try:
+        return estimate_prompt_test_task(db, task, units)
+    except TaskEstimationError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)
+        ) from exc
+
+
 @router.get("/tasks/{task_id}", response_model=PromptTestTaskRead)
 def get_prompt_test_task(
     *, db: Session = Depends(get_db), task_id: int
@@ -118,6 +169,21 @@ def get_prompt_test_task(
     return task
 
 
+@router.get("/tasks/{task_id}/estimate", response_model=TaskEstimateRead)
+def estimate_prompt_test_task_by_id(
+    *, db: Session = Depends(get_db), task_id: int
+) -> TaskEstimate:
+    """预估已保存测试任务的 Token、费用与耗时。"""
+
+    task = _get_task_or_404(db, task_id)
+    try:
+        return estimate_prompt_test_task(db, task, list(task.units))
+    except TaskEstimationError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)
+        ) from exc
+
+
 @router.patch("/tasks/{task_id}", response_model=PromptTestTaskRead)
 def update_prompt_test_task(
     *,
@@ -153,6 +219,129 @@ def delete_prompt_test_task(*, db: Session = Depends(get_db), task_id: int) -> R
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@router.post(
+    "/tasks/{task_id}/cancel",
+    response_model=PromptTestTaskRead,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def cancel_prompt_test_task(
+    *, db: Session = Depends(get_db), task_id: int
+) -> PromptTestTask:
+    """取消排队中或执行中的测试任务，已完成的实验结果会被保留。"""
+
+    task = _get_task_or_404(db, task_id)
+    if task.status not in {PromptTestTaskStatus.READY, PromptTestTaskStatus.RUNNING}:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="仅排队中或执行中的测试任务可取消",
+        )
+
+    if not cancellation_registry.cancel(
+        PROMPT_TEST_TASK_SCOPE, task.id, reason="测试任务已取消"
+    ):
+        # 任务尚未开始执行，直接标记为已取消，队列消费时会跳过
+        task.status = PromptTestTaskStatus.CANCELLED
+        config = dict(task.config) if isinstance(task.config, dict) else {}
+        config["last_error"] = "测试任务已取消"
+        task.config = config
+        db.commit()
+
+    db.refresh(task)
+    return task
+
+
+def _format_event(event: str, data: Mapping[str, Any]) -> bytes:
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+def _read_progress_state(
+    task_id: int,
+) -> tuple[ProgressSnapshot | None, PromptTestTaskStatus | None]:
+    session = db_session.SessionLocal()
+    try:
+        task_status = session.scalar(
+            select(PromptTestTask.status).where(PromptTestTask.id == task_id)
+        )
+        snapshot = progress_store.get(task_id, session)
+    finally:
+        session.close()
+    return snapshot, PromptTestTaskStatus(task_status) if task_status else None
+
+
+@router.get("/tasks/{task_id}/progress", response_model=PromptTestTaskProgressRead)
+def get_prompt_test_task_progress(
+    *, db: Session = Depends(get_db), task_id: int
+) -> ProgressSnapshot:
+    """获取测试任务的最新执行进度。"""
+
+    _get_task_or_404(db, task_id)
+    snapshot = progress_store.get(task_id, db)
+    if snapshot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="测试任务尚未开始执行"
+        )
+    return snapshot
+
+
+@router.get("/tasks/{task_id}/progress/stream", response_class=StreamingResponse)
+async def stream_prompt_test_task_progress(
+    *, db: Session = Depends(get_db), task_id: int
+) -> StreamingResponse:
+    """以 Server-Sent Events 推送测试任务的进度、每轮调用完成与任务结束事件。
+
+    本进程执行的任务实时推送内存中的事件；没有新事件时按
+    ``PROMPT_TEST_PROGRESS_POLL_INTERVAL`` 读取进度表，覆盖由独立 worker 或
+    Celery 节点执行的任务。任务结束后推送 ``status`` 事件并关闭连接。
+    """
+
+    _get_task_or_404(db, task_id)
+    interval = max(0.1, settings.PROMPT_TEST_PROGRESS_POLL_INTERVAL)
+
+    async def _event_stream() -> AsyncIterator[bytes]:
+        # 先订阅再读取当前进度，避免两者之间产生的事件丢失
+        with progress_store.subscribe(task_id) as subscription:
+            last_snapshot: ProgressSnapshot | None = None
+            poll = True
+            while True:
+                if poll:
+                    snapshot, task_status = await run_in_threadpool(
+                        _read_progress_state, task_id
+                    )
+                    if snapshot is not None and snapshot != last_snapshot:
+                        last_snapshot = snapshot
+                        yield _format_event(PROGRESS_EVENT, snapshot.as_dict())
+                    else:
+                        yield b": keep-alive\n\n"
+                    if task_status is None:
+                        return
+                    if task_status in _TERMINAL_TASK_STATUSES:
+                        yield _format_event(
+                            STATUS_EVENT,
+                            {"task_id": task_id, "status": task_status.value},
+                        )
+                        return
+
+                event = await subscription.next(interval)
+                poll = event is None
+                if event is None:
+                    continue
+                if event.event == PROGRESS_EVENT:
+                    last_snapshot = ProgressSnapshot(**event.data)
+                yield _format_event(event.event, event.data)
+                if event.event == STATUS_EVENT:
+                    return
+
+    headers_extra = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "Connection": "keep-alive",
+    }
+    return StreamingResponse(
+        _event_stream(), media_type="text/event-stream", headers=headers_extra
+    )
+
+
 @router.get("/tasks/{task_id}/units", response_model=list[PromptTestUnitRead])
 def list_units_for_task(
     *, db: Session = Depends(get_db), task_id: int
@@ -236,6 +425,7 @@ def list_experiments_for_unit(
     stmt = (
         select(PromptTestExperiment)
         .where(PromptTestExperiment.unit_id == unit.id)
+        .options(selectinload(PromptTestExperiment.rounds))
         .order_by(PromptTestExperiment.created_at.desc())
     )
     return list(db.scalars(stmt))
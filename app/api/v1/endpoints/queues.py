@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from fastapi import APIRouter
+
+from app.core.prompt_test_task_queue import task_queue as prompt_test_task_queue
+from app.core.task_queue import task_queue as test_run_task_queue
+from app.schemas.queue import QueueStatsRead
+
+router = APIRouter(prefix="/queues", tags=["queues"])
+
+
+@router.get(
+    "/stats",
+    response_model=QueueStatsRead,
+    summary="查看任务队列深度、执行中的工作线程与各用户积压",
+)
+def get_queue_stats() -> QueueStatsRead:
+    return QueueStatsRead(
+        test_runs=test_run_task_queue.stats(),
+        prompt_test_tasks=prompt_test_task_queue.stats(),
+    )
+
+
+__all__ = ["router"]
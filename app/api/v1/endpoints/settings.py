@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 
 from app.db.session import get_db
 from app.schemas.settings import TestingTimeoutsRead, TestingTimeoutsUpdate
+from app.services.llm_resolution import llm_resolution_cache
 from app.services.system_settings import (
     get_testing_timeout_config,
     update_testing_timeout_config,
@@ -42,6 +43,7 @@ def update_testing_timeouts(
         quick_test_timeout=payload.quick_test_timeout,
         test_task_timeout=payload.test_task_timeout,
     )
+    llm_resolution_cache.invalidate()
     return TestingTimeoutsRead(
         quick_test_timeout=int(config.quick_test_timeout),
         test_task_timeout=int(config.test_task_timeout),
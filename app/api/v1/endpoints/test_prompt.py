@@ -3,7 +3,7 @@ from __future__ import annotations
 from typing import Sequence
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session, joinedload, selectinload
 
 from app.db.session import get_db
@@ -11,8 +11,11 @@ from app.models.prompt import Prompt, PromptVersion
 from app.models.result import Result
 from app.models.test_run import TestRun, TestRunStatus
 from app.schemas.result import ResultRead
+from app.schemas.task_estimate import TaskEstimateRead
 from app.schemas.test_run import TestRunCreate, TestRunRead, TestRunUpdate
-from app.core.task_queue import enqueue_test_run, task_queue
+from app.core.cancellation import TEST_RUN_SCOPE, cancellation_registry
+from app.core.task_queue import enqueue_test_run, priority_for_test_run, task_queue
+from app.services.task_estimator import TaskEstimate, estimate_test_run
 
 router = APIRouter()
 
@@ -74,7 +77,11 @@ def create_test_prompt(
     created_run = db.execute(stmt).unique().scalar_one()
 
     try:
-        enqueue_test_run(test_run.id)
+        enqueue_test_run(
+            test_run.id,
+            prompt_version.prompt.owner_id,
+            priority=priority_for_test_run(created_run),
+        )
         # 为提升测试稳定性，在入队后短暂等待队列消费，确保立即可见最新状态
         task_queue.wait_for_idle(timeout=0.05)
     except Exception as exc:  # pragma: no cover - 防御性兜底
@@ -91,6 +98,22 @@ def create_test_prompt(
     return created_run
 
 
+@router.post("/estimate", response_model=TaskEstimateRead)
+def estimate_test_prompt(
+    *, db: Session = Depends(get_db), payload: TestRunCreate
+) -> TaskEstimate:
+    """在创建前预估测试任务的 Token、费用与耗时，不写入数据库。"""
+
+    prompt_version = db.get(PromptVersion, payload.prompt_version_id)
+    if not prompt_version:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Prompt 版本不存在"
+        )
+
+    test_run = TestRun(**payload.model_dump(by_alias=True, exclude_none=True))
+    return estimate_test_run(db, test_run)
+
+
 @router.get("/{test_prompt_id}", response_model=TestRunRead)
 def get_test_prompt(*, db: Session = Depends(get_db), test_prompt_id: int) -> TestRun:
     """根据 ID 获取单个测试任务及其关联数据。"""
@@ -170,7 +193,7 @@ def list_results_for_test_prompt(
 
 @router.post("/{test_prompt_id}/retry", response_model=TestRunRead)
 def retry_test_prompt(*, db: Session = Depends(get_db), test_prompt_id: int) -> TestRun:
-    """重新入队执行失败的测试任务。"""
+    """重新入队执行失败或已取消的测试任务，仅补跑尚未产生结果的轮次。"""
 
     test_run = db.get(TestRun, test_prompt_id)
     if not test_run:
@@ -178,12 +201,14 @@ def retry_test_prompt(*, db: Session = Depends(get_db), test_prompt_id: int) ->
             status_code=status.HTTP_404_NOT_FOUND, detail="Test run 不存在"
         )
 
-    if test_run.status != TestRunStatus.FAILED:
+    if test_run.status not in {TestRunStatus.FAILED, TestRunStatus.CANCELLED}:
         raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT, detail="仅失败状态的测试任务可重试"
+            status_code=status.HTTP_409_CONFLICT,
+            detail="仅失败或已取消的测试任务可重试",
         )
 
     test_run.status = TestRunStatus.PENDING
+    test_run.cancel_requested = False
     test_run.last_error = None
     db.flush()
     db.commit()
@@ -192,7 +217,11 @@ def retry_test_prompt(*, db: Session = Depends(get_db), test_prompt_id: int) ->
     refreshed = db.execute(stmt).unique().scalar_one()
 
     try:
-        enqueue_test_run(test_run.id)
+        enqueue_test_run(
+            test_run.id,
+            refreshed.prompt_version.prompt.owner_id,
+            priority=priority_for_test_run(refreshed),
+        )
     except Exception as exc:  # pragma: no cover - 防御性兜底
         failed_run = db.get(TestRun, test_run.id)
         if failed_run:
@@ -205,3 +234,61 @@ def retry_test_prompt(*, db: Session = Depends(get_db), test_prompt_id: int) ->
         ) from exc
 
     return refreshed
+
+
+@router.post(
+    "/{test_prompt_id}/cancel",
+    response_model=TestRunRead,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def cancel_test_prompt(
+    *, db: Session = Depends(get_db), test_prompt_id: int
+) -> TestRun:
+    """取消排队中或执行中的测试任务。
+
+    本进程执行中的任务直接投递取消信号；尚未开始执行的任务以状态为条件标记为
+    已取消，队列消费时会跳过。由其他进程执行的任务只记录取消请求，执行方轮询
+    到请求后停止剩余轮次并写回取消状态，接口不会覆盖其最终状态。
+    """
+
+    test_run = db.get(TestRun, test_prompt_id)
+    if not test_run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Test run 不存在"
+        )
+
+    if test_run.status not in {TestRunStatus.PENDING, TestRunStatus.RUNNING}:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="仅排队中或执行中的测试任务可取消",
+        )
+
+    if not cancellation_registry.cancel(
+        TEST_RUN_SCOPE, test_run.id, reason="测试任务已取消"
+    ):
+        schema_data = dict(test_run.schema or {})
+        schema_data["last_error"] = "测试任务已取消"
+        cancelled = db.execute(
+            update(TestRun)
+            .where(
+                TestRun.id == test_run.id,
+                TestRun.status == TestRunStatus.PENDING,
+            )
+            .values(status=TestRunStatus.CANCELLED, schema=schema_data)
+            .execution_options(synchronize_session=False)
+        )
+        if cancelled.rowcount != 1:
+            db.execute(
+                update(TestRun)
+                .where(
+                    TestRun.id == test_run.id,
+                    TestRun.status == TestRunStatus.RUNNING,
+                )
+                .values(cancel_requested=True)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+        db.expire(test_run)
+
+    stmt = _test_run_query().where(TestRun.id == test_run.id)
+    return db.execute(stmt).unique().scalar_one()
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from app.core.config import settings
+
+if TYPE_CHECKING:  # pragma: no cover - 类型检查辅助
+    from app.models.llm_provider import LLMModel
+
+logger = logging.getLogger("promptworks.adaptive_concurrency")
+
+THROTTLE_STATUS_CODES = {408, 425, 429}
+
+
+def is_congestion_status(status_code: int | None) -> bool:
+    """判断响应状态是否意味着提供者过载，需要收缩并发。"""
+
+    if status_code is None:
+        return True
+    return status_code in THROTTLE_STATUS_CODES or status_code >= 500
+
+
+@dataclass
+class _ModelState:
+    max_limit: int
+    limit: float
+    successes: int = 0
+    samples: int = 0
+    latency_ewma_ms: float | None = None
+    baseline_latency_ms: float | None = None
+    last_decrease_at: float = 0.0
+    last_decrease_reason: str | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def effective_limit(self) -> int:
+        return max(1, min(self.max_limit, int(self.limit)))
+
+
+class ConcurrencySlot:
+    """一次调用的观测句柄，调用结束前通过 ``observe`` 上报结果。"""
+
+    def __init__(
+        self, controller: "AdaptiveConcurrencyController", model_id: int | None
+    ) -> None:
+        self._controller = controller
+        self._model_id = model_id
+        self._observed = False
+
+    def observe(self, status_code: int | None, latency_ms: float | None) -> None:
+        if self._observed or self._model_id is None:
+            return
+        self._observed = True
+        self._controller.record(self._model_id, status_code, latency_ms)
+
+
+class AdaptiveConcurrencyController:
+    """按模型维护 AIMD（加性增、乘性减）并发上限的控制器。
+
+    控制器只负责计算上限，名额的占用与排队由 ``ConcurrencyGovernor`` 完成。
+
+    成功调用累计达到当前上限次数后并发加一；遇到 429、5xx、网络异常或延迟显著高于
+    基线时按系数收缩。为避免同一批并发失败把上限连续压到底，每个延迟周期内最多
+    收缩一次。有效上限始终夹在 ``min_limit`` 与模型配置的 ``concurrency_limit`` 之间。
+    """
+
+    def __init__(
+        self,
+        *,
+        min_limit: int = 1,
+        increase_step: float = 1.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        ewma_alpha: float = 0.2,
+        warmup_samples: int = 5,
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.ewma_alpha = ewma_alpha
+        self.warmup_samples = warmup_samples
+        self._lock = threading.Lock()
+        self._states: dict[int, _ModelState] = {}
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.LLM_ADAPTIVE_CONCURRENCY_ENABLED
+
+    def _state_for(self, model_id: int, max_limit: int) -> _ModelState:
+        max_limit = max(self.min_limit, max_limit)
+        with self._lock:
+            state = self._states.get(model_id)
+            if state is None:
+                state = _ModelState(max_limit=max_limit, limit=float(max_limit))
+                self._states[model_id] = state
+            elif state.max_limit != max_limit:
+                with state.lock:
+                    state.max_limit = max_limit
+                    state.limit = min(state.limit, float(max_limit))
+            return state
+
+    def effective_limit(self, model: "LLMModel | None") -> int | None:
+        """返回模型当前生效的并发上限，未启用自适应时返回配置值。"""
+
+        if model is None or model.id is None:
+            return None
+        configured = max(1, model.concurrency_limit or 1)
+        if not self.enabled():
+            return configured
+        return self._state_for(model.id, configured).effective_limit
+
+    def record(
+        self, model_id: int, status_code: int | None, latency_ms: float | None
+    ) -> None:
+        """根据一次调用的结果调整并发上限。"""
+
+        with self._lock:
+            state = self._states.get(model_id)
+        if state is None:
+            return
+        with state.lock:
+            if is_congestion_status(status_code):
+                reason = "network" if status_code is None else f"http_{status_code}"
+                self._decrease(state, reason)
+            elif status_code is not None and status_code >= 400:
+                # 其余 4xx 属于请求本身的问题，与提供者容量无关
+                return
+            else:
+                if latency_ms is not None and self._observe_latency(state, latency_ms):
+                    self._decrease(state, "latency")
+                else:
+                    self._increase(state)
+
+    def _observe_latency(self, state: _ModelState, latency_ms: float) -> bool:
+        """更新延迟统计，返回本次延迟是否显著高于基线。"""
+
+        state.samples += 1
+        if state.latency_ewma_ms is None:
+            state.latency_ewma_ms = latency_ms
+        else:
+            state.latency_ewma_ms += self.ewma_alpha * (
+                latency_ms - state.latency_ewma_ms
+            )
+        if state.baseline_latency_ms is None:
+            state.baseline_latency_ms = latency_ms
+        else:
+            # 基线取历史较低的延迟并缓慢上浮，以适应提供者整体变慢的情况
+            state.baseline_latency_ms = min(
+                state.latency_ewma_ms,
+                state.baseline_latency_ms * (1 + self.ewma_alpha / 10),
+            )
+        if state.samples < self.warmup_samples:
+            return False
+        return state.latency_ewma_ms > state.baseline_latency_ms * self.latency_tolerance
+
+    def _increase(self, state: _ModelState) -> None:
+        state.successes += 1
+        if state.successes >= state.effective_limit and state.limit < state.max_limit:
+            state.limit = min(float(state.max_limit), state.limit + self.increase_step)
+            state.successes = 0
+
+    def _decrease(self, state: _ModelState, reason: str) -> None:
+        now = time.monotonic()
+        cooldown = (state.latency_ewma_ms or 0.0) / 1000
+        state.successes = 0
+        if now - state.last_decrease_at < cooldown:
+            return
+        previous = state.effective_limit
+        state.limit = max(float(self.min_limit), state.limit * self.decrease_factor)
+        state.last_decrease_at = now
+        state.last_decrease_reason = reason
+        if state.effective_limit != previous:
+            logger.info(
+                "模型并发上限收缩: %s -> %s 原因=%s",
+                previous,
+                state.effective_limit,
+                reason,
+            )
+
+    def snapshot(self, model: "LLMModel") -> dict[str, Any]:
+        """返回模型并发控制的当前状态，供接口展示。"""
+
+        configured = max(1, model.concurrency_limit or 1)
+        if not self.enabled():
+            return {
+                "model_id": model.id,
+                "adaptive": False,
+                "configured_limit": configured,
+                "effective_limit": configured,
+                "latency_ewma_ms": None,
+                "baseline_latency_ms": None,
+                "last_decrease_reason": None,
+            }
+        state = self._state_for(model.id, configured)
+        with state.lock:
+            return {
+                "model_id": model.id,
+                "adaptive": True,
+                "configured_limit": configured,
+                "effective_limit": state.effective_limit,
+                "latency_ewma_ms": state.latency_ewma_ms,
+                "baseline_latency_ms": state.baseline_latency_ms,
+                "last_decrease_reason": state.last_decrease_reason,
+            }
+
+    def reset(self, model_id: int | None = None) -> None:
+        """清空控制器状态，指定模型时仅重置该模型。"""
+
+        with self._lock:
+            if model_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(model_id, None)
+
+
+adaptive_concurrency = AdaptiveConcurrencyController()
+
+
+__all__ = [
+    "AdaptiveConcurrencyController",
+    "ConcurrencySlot",
+    "adaptive_concurrency",
+    "is_congestion_status",
+]
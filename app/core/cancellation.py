@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from app.core.config import settings
+
+logger = logging.getLogger("promptworks.cancellation")
+
+TEST_RUN_SCOPE = "test_run"
+PROMPT_TEST_TASK_SCOPE = "prompt_test_task"
+
+DEFAULT_CANCEL_REASON = "任务已取消"
+
+
+class OperationCancelledError(Exception):
+    """执行过程中检测到取消信号时抛出，用于中断排队或重试中的调用。"""
+
+    def __init__(self, reason: str | None = None) -> None:
+        super().__init__(reason or DEFAULT_CANCEL_REASON)
+        self.reason = reason or DEFAULT_CANCEL_REASON
+
+
+class CancellationToken:
+    """跨线程共享的协作式取消信号。
+
+    执行方在排队、重试等待与读取流式响应的间隙检查信号；取消时依次触发已登记
+    的回调（例如关闭正在读取的响应或取消协程任务），以尽快释放在途请求。
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], Any]] = []
+        self.reason: str | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str | None = None) -> bool:
+        """发出取消信号，返回本次调用是否首次触发取消。"""
+
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason or DEFAULT_CANCEL_REASON
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:  # pragma: no cover - 回调失败不影响取消
+                logger.exception("执行取消回调时出现异常")
+        return True
+
+    def add_callback(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """登记取消时执行的回调，返回用于注销的函数；已取消时立即执行。"""
+
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def _remove() -> None:
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return _remove
+        callback()
+        return lambda: None
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise OperationCancelledError(self.reason)
+
+    def sleep(self, seconds: float) -> None:
+        """可被取消打断的等待，用于替换重试退避中的 ``time.sleep``。"""
+
+        if self._event.wait(max(0.0, seconds)):
+            raise OperationCancelledError(self.reason)
+
+
+def raise_if_cancelled(token: CancellationToken | None) -> None:
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def resolve_fail_fast(flag: Any) -> bool:
+    """解析单次任务上的快速失败开关，未显式指定时沿用全局配置。"""
+
+    if isinstance(flag, bool):
+        return flag
+    return settings.TEST_RUN_FAIL_FAST
+
+
+class CancellationRegistry:
+    """登记当前进程内正在执行的任务，供取消接口投递取消信号。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tokens: dict[tuple[str, int], CancellationToken] = {}
+
+    @contextmanager
+    def track(self, scope: str, key: int) -> Iterator[CancellationToken]:
+        token = CancellationToken()
+        with self._lock:
+            self._tokens[(scope, key)] = token
+        try:
+            yield token
+        finally:
+            with self._lock:
+                if self._tokens.get((scope, key)) is token:
+                    del self._tokens[(scope, key)]
+
+    def get(self, scope: str, key: int) -> CancellationToken | None:
+        with self._lock:
+            return self._tokens.get((scope, key))
+
+    def cancel(self, scope: str, key: int, reason: str | None = None) -> bool:
+        """向执行中的任务发出取消信号，任务不在本进程执行时返回 ``False``。"""
+
+        token = self.get(scope, key)
+        if token is None:
+            return False
+        token.cancel(reason)
+        logger.info("已向 %s %s 发出取消信号", scope, key)
+        return True
+
+
+cancellation_registry = CancellationRegistry()
+
+
+__all__ = [
+    "CancellationRegistry",
+    "CancellationToken",
+    "DEFAULT_CANCEL_REASON",
+    "OperationCancelledError",
+    "PROMPT_TEST_TASK_SCOPE",
+    "TEST_RUN_SCOPE",
+    "cancellation_registry",
+    "raise_if_cancelled",
+    "resolve_fail_fast",
+]
@@ -0,0 +1,38 @@
+"""Celery 应用实例。
+
+启动 worker::
+
+    celery -A app.core.celery_app worker --loglevel=info
+
+消息代理与结果存储默认使用 ``REDIS_URL``，Prompt 测试任务依赖结果存储汇总
+各最小测试单元的执行结果。
+"""
+
+from __future__ import annotations
+
+from celery import Celery
+
+from app.core.config import settings
+
+celery_app = Celery(
+    "promptworks",
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL,
+    backend=settings.CELERY_RESULT_BACKEND or settings.REDIS_URL,
+    include=["app.core.celery_tasks"],
+)
+celery_app.conf.update(
+    task_serializer="json",
+    result_serializer="json",
+    accept_content=["json"],
+    # 测试任务耗时较长，执行完成后再确认消息，worker 异常退出时由其他节点重新执行
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    task_always_eager=settings.CELERY_TASK_ALWAYS_EAGER,
+    task_eager_propagates=True,
+)
+
+app = celery_app
+
+
+__all__ = ["app", "celery_app"]
@@ -0,0 +1,205 @@
+"""通过 Celery 分布式执行测试任务。
+
+测试任务整体作为一条消息执行；Prompt 测试任务由协调消息标记为执行中后，将
+每个最小测试单元拆分为独立消息分发到各节点，全部单元结束后由 chord 回调汇总
+任务状态。单元执行结果仍写入各自的 ``PromptTestExperiment``。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+from celery import chord
+from sqlalchemy import select
+
+from app.core.cancellation import CancellationToken
+from app.core.celery_app import celery_app
+from app.core.prompt_test_task_queue import (
+    PromptTestProgressTracker,
+    priority_for_prompt_test_task,
+)
+from app.core.prompt_test_task_queue import task_queue as prompt_test_task_queue
+from app.core.task_progress import progress_store
+from app.core.task_queue import task_queue as test_run_queue
+from app.db import session as db_session
+from app.models.prompt_test import (
+    PromptTestExperiment,
+    PromptTestExperimentStatus,
+    PromptTestTask,
+    PromptTestTaskStatus,
+    PromptTestUnit,
+)
+
+logger = logging.getLogger("promptworks.celery_tasks")
+
+# 单元执行期间汇总进度并检查取消状态的最短间隔（秒）
+_PROGRESS_FLUSH_INTERVAL = 1.0
+# Redis 代理默认按 0/3/6/9 四档区分消息优先级，数值越小越先消费
+_CELERY_PRIORITY_STEP = 3
+
+
+def celery_priority(priority: int) -> int:
+    """将执行队列优先级映射为 Celery 消息优先级。"""
+
+    return min(9, max(0, priority) * _CELERY_PRIORITY_STEP)
+
+
+class _SharedProgressReporter:
+    """将单元的进度增量合并写入进度表，同时感知其他进程发起的取消。"""
+
+    def __init__(
+        self,
+        task_id: int,
+        cancel_token: CancellationToken,
+        interval: float = _PROGRESS_FLUSH_INTERVAL,
+    ) -> None:
+        self._task_id = task_id
+        self._cancel_token = cancel_token
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, amount: int) -> None:
+        with self._lock:
+            self._pending += amount
+            due = time.monotonic() - self._last_flush >= self._interval
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            amount, self._pending = self._pending, 0
+            self._last_flush = time.monotonic()
+
+        session = db_session.SessionLocal()
+        try:
+            status = session.scalar(
+                select(PromptTestTask.status).where(PromptTestTask.id == self._task_id)
+            )
+            if status == PromptTestTaskStatus.CANCELLED:
+                self._cancel_token.cancel("测试任务已取消")
+            if amount:
+                # 多个节点同时累加同一任务的进度，锁定进度行避免相互覆盖
+                progress_store.add_shared(session, self._task_id, amount)
+            session.commit()
+        finally:
+            session.close()
+
+
+def _should_skip_unit(task_id: int) -> bool:
+    """任务已取消或已有单元失败时不再启动新的单元。"""
+
+    session = db_session.SessionLocal()
+    try:
+        status = session.scalar(
+            select(PromptTestTask.status).where(PromptTestTask.id == task_id)
+        )
+        if status is None or status == PromptTestTaskStatus.CANCELLED:
+            return True
+        failed = session.scalar(
+            select(PromptTestExperiment.id)
+            .join(PromptTestUnit, PromptTestExperiment.unit_id == PromptTestUnit.id)
+            .where(
+                PromptTestUnit.task_id == task_id,
+                PromptTestExperiment.status == PromptTestExperimentStatus.FAILED,
+            )
+            .limit(1)
+        )
+        return failed is not None
+    finally:
+        session.close()
+
+
+@celery_app.task(name="promptworks.run_test_run")
+def run_test_run(test_run_id: int) -> None:
+    """执行单个测试任务。"""
+
+    test_run_queue.run(test_run_id)
+
+
+@celery_app.task(name="promptworks.run_prompt_test_task")
+def run_prompt_test_task(task_id: int) -> None:
+    """标记任务开始执行，并将每个最小测试单元分发为独立消息。"""
+
+    session = db_session.SessionLocal()
+    try:
+        started = prompt_test_task_queue.start_task(session, task_id)
+        if started is None:
+            return
+        task, units, _ = started
+        unit_ids = [unit.id for unit in units]
+        priority = celery_priority(priority_for_prompt_test_task(task))
+    finally:
+        session.close()
+
+    logger.info("Prompt 测试任务 %s 拆分为 %s 个单元分发执行", task_id, len(unit_ids))
+    chord(
+        run_prompt_test_unit.s(task_id, unit_id).set(priority=priority)
+        for unit_id in unit_ids
+    )(finalize_prompt_test_task.s(task_id).set(priority=priority))
+
+
+@celery_app.task(name="promptworks.run_prompt_test_unit")
+def run_prompt_test_unit(task_id: int, unit_id: int) -> list[str | None]:
+    """执行单个最小测试单元，返回 ``[实验状态, 失败原因]`` 供汇总使用。"""
+
+    if _should_skip_unit(task_id):
+        return [None, None]
+
+    cancel_token = CancellationToken()
+    reporter = _SharedProgressReporter(task_id, cancel_token)
+    try:
+        status, error = prompt_test_task_queue.run_unit(
+            task_id, unit_id, reporter.add, cancel_token, threading.Event()
+        )
+    finally:
+        reporter.flush()
+    return [status.value if status else None, error]
+
+
+@celery_app.task(name="promptworks.finalize_prompt_test_task")
+def finalize_prompt_test_task(
+    results: list[list[str | None]], task_id: int
+) -> None:
+    """汇总全部单元的执行结果并写入任务最终状态。"""
+
+    failure = next(
+        (
+            error or "执行测试任务失败"
+            for status, error in results
+            if status == PromptTestExperimentStatus.FAILED.value
+        ),
+        None,
+    )
+    unit_cancelled = any(
+        status == PromptTestExperimentStatus.CANCELLED.value for status, _ in results
+    )
+
+    session = db_session.SessionLocal()
+    try:
+        task = session.get(PromptTestTask, task_id)
+        if task is None:
+            return
+        cancelled = unit_cancelled or task.status == PromptTestTaskStatus.CANCELLED
+        prompt_test_task_queue.finish_task(
+            session,
+            task,
+            PromptTestProgressTracker.resume(task_id),
+            failure=failure,
+            cancelled=cancelled,
+            cancel_reason="测试任务已取消" if cancelled else None,
+        )
+    finally:
+        session.close()
+
+
+__all__ = [
+    "celery_priority",
+    "finalize_prompt_test_task",
+    "run_prompt_test_task",
+    "run_prompt_test_unit",
+    "run_test_run",
+]
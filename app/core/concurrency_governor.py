@@ -0,0 +1,480 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Protocol
+
+from sqlalchemy import delete, func, select, update
+
+from app.core.adaptive_concurrency import (
+    AdaptiveConcurrencyController,
+    ConcurrencySlot,
+    adaptive_concurrency,
+)
+from app.core.config import settings
+
+if TYPE_CHECKING:  # pragma: no cover - 类型检查辅助
+    from app.models.llm_provider import LLMModel
+
+logger = logging.getLogger("promptworks.concurrency_governor")
+
+POLL_INTERVAL = 0.02
+# 协程等待本地名额时依赖归还通知唤醒，仅按此间隔兜底检查自适应上限是否放大
+ASYNC_WAKE_INTERVAL = 0.5
+GLOBAL_POLL_INTERVAL = 0.2
+GLOBAL_POLL_MAX_INTERVAL = 2.0
+
+
+class ConcurrencyBackend(Protocol):
+    """跨进程的并发名额登记，``try_acquire`` 必须原子地完成计数与占用。"""
+
+    def try_acquire(self, model_id: int, limit: int) -> int | None: ...
+
+    def release(self, lease_id: int) -> None: ...
+
+    def renew(self, lease_ids: list[int]) -> None: ...
+
+    def count(self, model_id: int) -> int: ...
+
+
+class DatabaseConcurrencyBackend:
+    """基于 ``llm_concurrency_leases`` 表的并发名额，多个进程共享同一上限。
+
+    占用名额前锁定模型所在行以串行化同一模型的计数，过期租约视为持有进程已崩溃，
+    会在下一次获取时被清理。持有进程通过 ``renew`` 定期续期，调用耗时超过有效期
+    也不会被其他进程回收。
+    """
+
+    def __init__(self, lease_ttl: float | None = None) -> None:
+        self.lease_ttl = lease_ttl or settings.LLM_CONCURRENCY_LEASE_TTL
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def try_acquire(self, model_id: int, limit: int) -> int | None:
+        from app.db import session as db_session
+        from app.models.concurrency_lease import LLMConcurrencyLease
+        from app.models.llm_provider import LLMModel
+
+        session = db_session.SessionLocal()
+        try:
+            now = time.time()
+            session.execute(
+                select(LLMModel.id).where(LLMModel.id == model_id).with_for_update()
+            )
+            session.execute(
+                delete(LLMConcurrencyLease).where(
+                    LLMConcurrencyLease.model_id == model_id,
+                    LLMConcurrencyLease.expires_at <= now,
+                )
+            )
+            active = session.scalar(
+                select(func.count(LLMConcurrencyLease.id)).where(
+                    LLMConcurrencyLease.model_id == model_id
+                )
+            )
+            if (active or 0) >= limit:
+                session.commit()
+                return None
+            lease = LLMConcurrencyLease(
+                model_id=model_id,
+                holder=self.holder,
+                acquired_at=now,
+                expires_at=now + self.lease_ttl,
+            )
+            session.add(lease)
+            session.commit()
+            return lease.id
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def release(self, lease_id: int) -> None:
+        from app.db import session as db_session
+        from app.models.concurrency_lease import LLMConcurrencyLease
+
+        session = db_session.SessionLocal()
+        try:
+            session.execute(
+                delete(LLMConcurrencyLease).where(LLMConcurrencyLease.id == lease_id)
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def renew(self, lease_ids: list[int]) -> None:
+        from app.db import session as db_session
+        from app.models.concurrency_lease import LLMConcurrencyLease
+
+        session = db_session.SessionLocal()
+        try:
+            session.execute(
+                update(LLMConcurrencyLease)
+                .where(LLMConcurrencyLease.id.in_(lease_ids))
+                .values(expires_at=time.time() + self.lease_ttl)
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def count(self, model_id: int) -> int:
+        from app.db import session as db_session
+        from app.models.concurrency_lease import LLMConcurrencyLease
+
+        session = db_session.SessionLocal()
+        try:
+            return (
+                session.scalar(
+                    select(func.count(LLMConcurrencyLease.id)).where(
+                        LLMConcurrencyLease.model_id == model_id,
+                        LLMConcurrencyLease.expires_at > time.time(),
+                    )
+                )
+                or 0
+            )
+        finally:
+            session.close()
+
+
+def build_concurrency_backend(name: str | None = None) -> ConcurrencyBackend | None:
+    backend_name = (name or settings.LLM_CONCURRENCY_BACKEND).strip().lower()
+    if backend_name == "database":
+        return DatabaseConcurrencyBackend()
+    return None
+
+
+@dataclass
+class _Gate:
+    in_flight: int = 0
+    waiting: int = 0
+    condition: threading.Condition = field(default_factory=threading.Condition)
+    async_waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = field(
+        default_factory=set
+    )
+
+
+@dataclass
+class ConcurrencyLease:
+    """一次调用持有的并发名额，释放前通过 ``observe`` 上报调用结果。"""
+
+    model_id: int | None
+    slot: ConcurrencySlot
+    lease_id: int | None = None
+    released: bool = False
+
+    def observe(self, status_code: int | None, latency_ms: float | None) -> None:
+        self.slot.observe(status_code, latency_ms)
+
+
+class ConcurrencyGovernor:
+    """进程级的模型并发闸门，所有 LLM 调用路径共享同一组名额。
+
+    上限取自 ``AdaptiveConcurrencyController`` 的有效值（未启用自适应时即模型配置的
+    ``concurrency_limit``），因此测试任务队列、提示词测试队列与快速测试接口对同一模型的
+    调用合计不会超过上限。配置数据库后端后，名额还会通过租约表在多个进程间共享，
+    持有中的租约由后台线程按有效期的三分之一定期续期。
+    """
+
+    def __init__(
+        self,
+        controller: AdaptiveConcurrencyController | None = None,
+        backend: ConcurrencyBackend | None = None,
+    ) -> None:
+        self._controller = controller or adaptive_concurrency
+        self._backend = backend
+        self._backend_resolved = backend is not None
+        self._lock = threading.Lock()
+        self._gates: dict[int, _Gate] = {}
+        self._held_leases: set[int] = set()
+        self._renewer: threading.Thread | None = None
+
+    @property
+    def backend(self) -> ConcurrencyBackend | None:
+        if not self._backend_resolved:
+            with self._lock:
+                if not self._backend_resolved:
+                    self._backend = build_concurrency_backend()
+                    self._backend_resolved = True
+        return self._backend
+
+    def configure(self, backend: ConcurrencyBackend | None) -> None:
+        """替换跨进程后端，传入 ``None`` 时按配置重新构建。"""
+
+        with self._lock:
+            self._backend = backend
+            self._backend_resolved = backend is not None
+
+    def _gate(self, model_id: int) -> _Gate:
+        with self._lock:
+            gate = self._gates.get(model_id)
+            if gate is None:
+                gate = _Gate()
+                self._gates[model_id] = gate
+            return gate
+
+    def _try_enter(self, gate: _Gate, model: "LLMModel") -> bool:
+        limit = self._controller.effective_limit(model) or 1
+        if gate.in_flight < limit:
+            gate.in_flight += 1
+            return True
+        return False
+
+    def _leave(self, gate: _Gate) -> None:
+        with gate.condition:
+            gate.in_flight = max(0, gate.in_flight - 1)
+            gate.condition.notify_all()
+            waiters = list(gate.async_waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # pragma: no cover - 等待方所在事件循环已关闭
+                pass
+
+    def _set_waiting(self, gate: _Gate, delta: int) -> None:
+        with gate.condition:
+            gate.waiting += delta
+
+    def _try_global(self, model: "LLMModel") -> tuple[bool, int | None]:
+        """尝试占用跨进程名额，后端不可用时放行以免阻塞调用。"""
+
+        backend = self.backend
+        if backend is None:
+            return True, None
+        limit = self._controller.effective_limit(model) or 1
+        try:
+            lease_id = backend.try_acquire(model.id, limit)
+        except Exception:  # pragma: no cover - 后端故障时退化为进程内限流
+            logger.exception("获取跨进程并发名额失败，本次调用仅做进程内限流")
+            return True, None
+        return lease_id is not None, lease_id
+
+    def acquire(self, model: "LLMModel | None") -> ConcurrencyLease:
+        """阻塞直到模型有空闲并发名额。"""
+
+        if model is None or model.id is None:
+            return ConcurrencyLease(None, ConcurrencySlot(self._controller, None))
+        gate = self._gate(model.id)
+        with gate.condition:
+            gate.waiting += 1
+            try:
+                while not self._try_enter(gate, model):
+                    # 自适应上限可能在等待期间放大，定期醒来重新判断
+                    gate.condition.wait(POLL_INTERVAL)
+            finally:
+                gate.waiting -= 1
+
+        lease_id: int | None = None
+        if self.backend is not None:
+            self._set_waiting(gate, 1)
+            try:
+                while True:
+                    acquired, lease_id = self._try_global(model)
+                    if acquired:
+                        break
+                    time.sleep(GLOBAL_POLL_INTERVAL)
+            except BaseException:
+                self._leave(gate)
+                raise
+            finally:
+                self._set_waiting(gate, -1)
+        return self._make_lease(model, lease_id)
+
+    async def acquire_async(self, model: "LLMModel | None") -> ConcurrencyLease:
+        """协程版本的名额获取，等待期间让出事件循环。"""
+
+        if model is None or model.id is None:
+            return ConcurrencyLease(None, ConcurrencySlot(self._controller, None))
+        gate = self._gate(model.id)
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with gate.condition:
+            gate.waiting += 1
+            gate.async_waiters.add(waiter)
+        try:
+            while True:
+                with gate.condition:
+                    waiter[1].clear()
+                    if self._try_enter(gate, model):
+                        break
+                try:
+                    # 名额归还时由 ``_leave`` 唤醒，超时后重新判断自适应上限
+                    await asyncio.wait_for(waiter[1].wait(), ASYNC_WAKE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            with gate.condition:
+                gate.async_waiters.discard(waiter)
+
+            lease_id: int | None = None
+            if self.backend is not None:
+                delay = GLOBAL_POLL_INTERVAL
+                try:
+                    while True:
+                        acquired, lease_id = await asyncio.to_thread(
+                            self._try_global, model
+                        )
+                        if acquired:
+                            break
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, GLOBAL_POLL_MAX_INTERVAL)
+                except BaseException:
+                    self._leave(gate)
+                    raise
+        finally:
+            with gate.condition:
+                gate.waiting -= 1
+                gate.async_waiters.discard(waiter)
+        return self._make_lease(model, lease_id)
+
+    def _make_lease(self, model: "LLMModel", lease_id: int | None) -> ConcurrencyLease:
+        if lease_id is not None:
+            self._hold_lease(lease_id)
+        observed_id = model.id if self._controller.enabled() else None
+        return ConcurrencyLease(
+            model.id, ConcurrencySlot(self._controller, observed_id), lease_id
+        )
+
+    def release(self, lease: ConcurrencyLease, *, failed: bool = False) -> None:
+        """归还名额；``failed`` 为真且未上报结果时按网络异常计入自适应控制。"""
+
+        if lease.released:
+            return
+        lease_id = self._mark_released(lease, failed=failed)
+        if lease.model_id is None:
+            return
+        if lease_id is not None:
+            self._release_global(lease_id)
+        self._leave(self._gate(lease.model_id))
+
+    async def arelease(self, lease: ConcurrencyLease, *, failed: bool = False) -> None:
+        """协程版本的名额归还，跨进程租约在线程中删除以免阻塞事件循环。"""
+
+        if lease.released:
+            return
+        lease_id = self._mark_released(lease, failed=failed)
+        if lease.model_id is None:
+            return
+        if lease_id is not None:
+            await asyncio.to_thread(self._release_global, lease_id)
+        self._leave(self._gate(lease.model_id))
+
+    def _mark_released(self, lease: ConcurrencyLease, *, failed: bool) -> int | None:
+        """标记租约已归还，返回需要删除的跨进程租约编号。"""
+
+        lease.released = True
+        if failed:
+            lease.observe(None, None)
+        if lease.model_id is None or lease.lease_id is None or self.backend is None:
+            return None
+        with self._lock:
+            self._held_leases.discard(lease.lease_id)
+        return lease.lease_id
+
+    def _release_global(self, lease_id: int) -> None:
+        try:
+            self.backend.release(lease_id)
+        except Exception:  # pragma: no cover - 租约到期后会被自动回收
+            logger.exception("释放跨进程并发名额失败: lease_id=%s", lease_id)
+
+    def _hold_lease(self, lease_id: int) -> None:
+        with self._lock:
+            self._held_leases.add(lease_id)
+            if self._renewer is None:
+                self._renewer = threading.Thread(
+                    target=self._renew_loop, name="concurrency-lease-renewer", daemon=True
+                )
+                self._renewer.start()
+
+    def renew_leases(self) -> None:
+        """为本进程持有的跨进程租约续期。"""
+
+        with self._lock:
+            lease_ids = sorted(self._held_leases)
+        backend = self.backend
+        if lease_ids and backend is not None:
+            backend.renew(lease_ids)
+
+    def _renew_loop(self) -> None:
+        while True:
+            lease_ttl = getattr(self.backend, "lease_ttl", None)
+            time.sleep((lease_ttl or settings.LLM_CONCURRENCY_LEASE_TTL) / 3)
+            try:
+                self.renew_leases()
+            except Exception:  # pragma: no cover - 下一次续期重试
+                logger.exception("续期跨进程并发名额失败")
+
+    @contextmanager
+    def slot(self, model: "LLMModel | None") -> Iterator[ConcurrencyLease]:
+        """占用名额执行一次调用，退出时自动归还。"""
+
+        lease = self.acquire(model)
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease, failed=True)
+            raise
+        else:
+            self.release(lease)
+
+    @asynccontextmanager
+    async def slot_async(
+        self, model: "LLMModel | None"
+    ) -> AsyncIterator[ConcurrencyLease]:
+        lease = await self.acquire_async(model)
+        try:
+            yield lease
+        except BaseException:
+            await self.arelease(lease, failed=True)
+            raise
+        else:
+            await self.arelease(lease)
+
+    def snapshot(self, model: "LLMModel") -> dict[str, Any]:
+        """合并自适应上限与当前占用、排队情况，供接口展示争用程度。"""
+
+        data = self._controller.snapshot(model)
+        gate = self._gates.get(model.id)
+        if gate is not None:
+            with gate.condition:
+                in_flight, waiting = gate.in_flight, gate.waiting
+        else:
+            in_flight, waiting = 0, 0
+        backend = self.backend
+        global_in_flight: int | None = None
+        if backend is not None:
+            try:
+                global_in_flight = backend.count(model.id)
+            except Exception:  # pragma: no cover - 统计失败不影响展示其他字段
+                logger.exception("统计跨进程并发名额失败: model_id=%s", model.id)
+        data.update(
+            backend="database" if backend is not None else "memory",
+            in_flight=in_flight,
+            waiting=waiting,
+            global_in_flight=global_in_flight,
+        )
+        return data
+
+    def reset(self) -> None:
+        """清空进程内的占用统计，供测试使用。"""
+
+        with self._lock:
+            self._gates.clear()
+
+
+concurrency_governor = ConcurrencyGovernor()
+
+
+__all__ = [
+    "ConcurrencyBackend",
+    "ConcurrencyGovernor",
+    "ConcurrencyLease",
+    "DatabaseConcurrencyBackend",
+    "build_concurrency_backend",
+    "concurrency_governor",
+]
@@ -25,6 +25,80 @@ class Settings(BaseSettings):
     ANTHROPIC_BASE_URL: str | None = None
     BACKEND_CORS_ORIGINS: list[str] | str = ["http://localhost:5173"]
     BACKEND_CORS_ALLOW_CREDENTIALS: bool = True
+    # 测试任务的默认执行模式：thread 为线程池，async 为共享连接池的协程模式
+    TEST_RUN_EXECUTION_MODE: str = "thread"
+    # 测试结果批量写入：达到条数或间隔秒数即提交一批
+    TEST_RUN_RESULT_BATCH_SIZE: int = 50
+    TEST_RUN_RESULT_FLUSH_INTERVAL: float = 2.0
+    # 快速失败：任一轮调用失败后立即取消剩余轮次，可在单次任务中单独开启或关闭
+    TEST_RUN_FAIL_FAST: bool = False
+    # 任务队列后端：memory 为进程内线程池；database 写入 task_jobs 表，
+    # 由可独立扩容的 python -m app.worker 进程按租约领取执行，重启不丢任务；
+    # celery 通过消息队列分发，Prompt 测试任务按最小测试单元拆分到多个节点执行
+    TASK_QUEUE_BACKEND: str = "memory"
+    # Celery 的消息代理与结果存储，未配置时使用 REDIS_URL；
+    # 开启 ALWAYS_EAGER 后任务在调用进程内同步执行，便于本地调试与测试
+    CELERY_BROKER_URL: str | None = None
+    CELERY_RESULT_BACKEND: str | None = None
+    CELERY_TASK_ALWAYS_EAGER: bool = False
+    # 数据库任务队列的租约时长、心跳间隔、空闲轮询间隔（秒）与最大领取次数
+    TASK_JOB_LEASE_SECONDS: float = 60.0
+    TASK_JOB_HEARTBEAT_INTERVAL: float = 15.0
+    TASK_JOB_POLL_INTERVAL: float = 1.0
+    TASK_JOB_MAX_ATTEMPTS: int = 3
+    # 单个 worker 进程同时执行的任务数
+    TASK_WORKER_CONCURRENCY: int = 2
+    # 启动 API 或 worker 时恢复进程退出后遗留的执行中/排队任务，此后按租约时长定期检查；
+    # 超过租约时长未刷新心跳的任务视为孤立任务，恢复次数上限沿用 TASK_JOB_MAX_ATTEMPTS
+    TASK_RECOVERY_ENABLED: bool = True
+    # 执行队列优先级（数值越小越先执行）：未显式指定时，预估调用次数不超过
+    # INTERACTIVE_MAX_RUNS 视为交互式任务，不少于 BATCH_MIN_RUNS 视为批量任务；
+    # 排队每满 AGING_SECONDS 秒提升一级优先级，为 0 时不老化
+    TASK_PRIORITY_INTERACTIVE_MAX_RUNS: int = 20
+    TASK_PRIORITY_BATCH_MIN_RUNS: int = 1000
+    TASK_PRIORITY_AGING_SECONDS: float = 300.0
+    # 测试任务与 Prompt 测试任务队列的工作线程数，按所属用户公平调度
+    TEST_RUN_QUEUE_WORKERS: int = 2
+    PROMPT_TEST_QUEUE_WORKERS: int = 2
+    # Prompt 测试任务内同时执行的最小测试单元数，任务配置 unit_concurrency 可单独覆盖
+    PROMPT_TEST_UNIT_CONCURRENCY: int = 4
+    # Prompt 测试任务进度推送（SSE）在没有本进程事件时读取进度表的间隔（秒），
+    # 使独立 worker 或 Celery 节点执行的任务同样能推送进度，也作为连接保活间隔
+    PROMPT_TEST_PROGRESS_POLL_INTERVAL: float = 2.0
+    # 调用外部 LLM 时的 HTTP 连接池配置
+    LLM_HTTP2_ENABLED: bool = False
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    # RPM/TPM 限流的令牌桶存储：memory 为进程内，database/redis 供多进程共享额度
+    LLM_RATE_LIMIT_BACKEND: str = "memory"
+    # 是否根据 429/5xx 与延迟变化自动调节模型并发（上限为模型配置的并发数）
+    LLM_ADAPTIVE_CONCURRENCY_ENABLED: bool = True
+    # 模型并发名额的登记方式：memory 为进程内，database 通过租约表在多进程间共享
+    LLM_CONCURRENCY_BACKEND: str = "memory"
+    # 数据库并发租约的有效期（秒），持有进程按三分之一有效期续期，
+    # 进程崩溃后遗留的名额在到期后自动回收
+    LLM_CONCURRENCY_LEASE_TTL: float = 900.0
+    # 提供者、模型与测试超时配置的进程内解析缓存；TTL 为 0 时关闭，
+    # 其他进程的配置变更在版本检查间隔内生效
+    LLM_RESOLUTION_CACHE_TTL: float = 300.0
+    LLM_RESOLUTION_CACHE_VERSION_CHECK_INTERVAL: float = 5.0
+    # 确定性请求（温度为 0 或固定 seed）的响应缓存，可在单次任务中单独开启或关闭
+    LLM_RESPONSE_CACHE_ENABLED: bool = False
+    LLM_RESPONSE_CACHE_TTL: float = 7 * 24 * 3600
+    LLM_RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    LLM_RESPONSE_CACHE_PERSISTENT: bool = True
+    LLM_RESPONSE_CACHE_MAX_PERSISTENT_ENTRIES: int = 100_000
+    # LLM 调用失败时的默认重试策略，可在提供者的 retry_policy 中单独覆盖
+    LLM_RETRY_MAX_ATTEMPTS: int = 3
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 30.0
+    # 愿意遵循的 Retry-After 上限（秒），服务端要求更久时直接返回失败
+    LLM_RETRY_MAX_RETRY_AFTER: float = 60.0
+    # 按模型名称配置每千 Token 的输入/输出单价，用于任务执行前的费用预估，
+    # 例如 {"gpt-4o-mini": {"input": 0.00015, "output": 0.0006}}；未配置的模型不估算费用
+    LLM_MODEL_PRICING: dict[str, dict[str, float]] = {}
+    # 预估任务耗时与输出 Token 时参考的同模型最近调用记录条数
+    TASK_ESTIMATE_HISTORY_SIZE: int = 200
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -40,6 +114,42 @@ class Settings(BaseSettings):
             raise ValueError(msg)
         return value
 
+    @field_validator("TEST_RUN_EXECUTION_MODE")
+    @classmethod
+    def validate_execution_mode(cls, value: str) -> str:
+        normalized = (value or "").strip().lower()
+        if normalized not in {"thread", "async"}:
+            msg = "TEST_RUN_EXECUTION_MODE must be either 'thread' or 'async'"
+            raise ValueError(msg)
+        return normalized
+
+    @field_validator("LLM_RATE_LIMIT_BACKEND")
+    @classmethod
+    def validate_rate_limit_backend(cls, value: str) -> str:
+        normalized = (value or "").strip().lower()
+        if normalized not in {"memory", "database", "redis"}:
+            msg = "LLM_RATE_LIMIT_BACKEND must be one of 'memory', 'database', 'redis'"
+            raise ValueError(msg)
+        return normalized
+
+    @field_validator("LLM_CONCURRENCY_BACKEND")
+    @classmethod
+    def validate_concurrency_backend(cls, value: str) -> str:
+        normalized = (value or "").strip().lower()
+        if normalized not in {"memory", "database"}:
+            msg = "LLM_CONCURRENCY_BACKEND must be either 'memory' or 'database'"
+            raise ValueError(msg)
+        return normalized
+
+    @field_validator("TASK_QUEUE_BACKEND")
+    @classmethod
+    def validate_task_queue_backend(cls, value: str) -> str:
+        normalized = (value or "").strip().lower()
+        if normalized not in {"memory", "database", "celery"}:
+            msg = "TASK_QUEUE_BACKEND must be one of 'memory', 'database', 'celery'"
+            raise ValueError(msg)
+        return normalized
+
     @field_validator("BACKEND_CORS_ORIGINS", mode="before")
     @classmethod
     def parse_cors_origins(cls, value: Any) -> list[str]:
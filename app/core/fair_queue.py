@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Hashable
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.core.task_priority import PRIORITY_NORMAL, effective_priority
+from app.core.task_recovery import task_liveness
+from app.models.task_job import TaskJobKind
+
+
+@dataclass
+class _PendingItem:
+    item: int
+    priority: int
+    enqueued_at: float
+    sequence: int
+
+
+@dataclass
+class _OwnerState:
+    pending: deque[_PendingItem] = field(default_factory=deque)
+    active: int = 0
+    last_served: int = 0
+
+
+class FairWorkQueue:
+    """按优先级与所属用户公平调度的内存任务队列。
+
+    空闲工作线程取任务时先比较按排队时长老化后的有效优先级，相同优先级下优先
+    选择当前执行中任务最少的用户，再选择最久未被调度的用户，因此交互式的小任务
+    不会排在批量回归任务之后，单个用户提交的大量任务也不会占满全部工作线程。
+    同一任务在排队期间重复入队会被忽略，但会保留两次中较高的优先级。
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._owners: dict[Hashable, _OwnerState] = {}
+        self._queued: set[int] = set()
+        self._running: set[int] = set()
+        self._serve_counter = itertools.count(1)
+        self._sequence = itertools.count(1)
+        self._unfinished = 0
+        self._active_workers = 0
+
+    def put(
+        self, item: int, owner: Hashable = None, priority: int = PRIORITY_NORMAL
+    ) -> bool:
+        """加入任务，返回是否实际入队。"""
+
+        with self._condition:
+            if item in self._queued:
+                for state in self._owners.values():
+                    for pending in state.pending:
+                        if pending.item == item:
+                            pending.priority = min(pending.priority, priority)
+                return False
+            state = self._owners.setdefault(owner, _OwnerState())
+            state.pending.append(
+                _PendingItem(item, priority, time.monotonic(), next(self._sequence))
+            )
+            self._queued.add(item)
+            self._unfinished += 1
+            self._condition.notify()
+            return True
+
+    def get(self, timeout: float | None = None) -> tuple[int, Hashable] | None:
+        """按公平策略取出下一个任务，超时返回 ``None``。"""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                selected = self._select()
+                if selected is not None:
+                    pending, owner = selected
+                    item = pending.item
+                    state = self._owners[owner]
+                    state.pending.remove(pending)
+                    state.active += 1
+                    state.last_served = next(self._serve_counter)
+                    self._queued.discard(item)
+                    self._running.add(item)
+                    self._active_workers += 1
+                    return item, owner
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def task_done(self, item: int, owner: Hashable = None) -> None:
+        with self._condition:
+            state = self._owners.get(owner)
+            if state is not None:
+                state.active = max(0, state.active - 1)
+                if not state.active and not state.pending:
+                    del self._owners[owner]
+            self._running.discard(item)
+            self._active_workers = max(0, self._active_workers - 1)
+            self._unfinished = max(0, self._unfinished - 1)
+            self._condition.notify_all()
+
+    def _select(self) -> tuple[_PendingItem, Hashable] | None:
+        now = time.monotonic()
+        best_rank: tuple[int, int, int, int] | None = None
+        best: tuple[_PendingItem, Hashable] | None = None
+        for owner, state in self._owners.items():
+            for pending in state.pending:
+                # 同一任务仍在执行时暂不重复领取，等待其结束后再调度
+                if pending.item in self._running:
+                    continue
+                rank = (
+                    effective_priority(pending.priority, now - pending.enqueued_at),
+                    state.active,
+                    state.last_served,
+                    pending.sequence,
+                )
+                if best_rank is None or rank < best_rank:
+                    best_rank = rank
+                    best = (pending, owner)
+        return best
+
+    @property
+    def unfinished_tasks(self) -> int:
+        with self._condition:
+            return self._unfinished
+
+    def join(self) -> None:
+        with self._condition:
+            while self._unfinished:
+                self._condition.wait()
+
+    def stats(self) -> dict[str, Any]:
+        """返回排队数量、执行中的工作线程数、各用户与各优先级的积压情况。"""
+
+        with self._condition:
+            lanes: dict[int, int] = {}
+            for state in self._owners.values():
+                for pending in state.pending:
+                    lanes[pending.priority] = lanes.get(pending.priority, 0) + 1
+            owners = [
+                {
+                    "owner_id": owner,
+                    "queued": len(state.pending),
+                    "active": state.active,
+                }
+                for owner, state in self._owners.items()
+            ]
+            return {
+                "queue_depth": len(self._queued),
+                "active_workers": self._active_workers,
+                "owners": owners,
+                "lanes": [
+                    {"priority": priority, "queued": queued}
+                    for priority, queued in sorted(lanes.items())
+                ],
+            }
+
+
+class FairTaskQueue(ABC):
+    """由多个工作线程消费 ``FairWorkQueue`` 的任务执行队列基类。
+
+    子类实现 ``_execute_task`` 执行单个任务。工作线程在首次入队时才启动，
+    只通过 ``run`` 同步执行任务的进程（例如独立 worker）不会创建空闲线程。
+    """
+
+    task_label = "任务"
+    # 用于登记存活心跳的任务类型，排队与执行中的任务不会被其他进程当作孤立任务恢复
+    job_kind: TaskJobKind | None = None
+
+    def __init__(
+        self, *, name: str, worker_count: int, logger: logging.Logger
+    ) -> None:
+        self._queue = FairWorkQueue()
+        self._logger = logger
+        self._name = name
+        self._worker_count = max(1, int(worker_count))
+        self._workers: list[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+    @property
+    def worker_count(self) -> int:
+        return self._worker_count
+
+    def _ensure_workers(self) -> None:
+        with self._start_lock:
+            if self._workers:
+                return
+            self._workers = [
+                threading.Thread(
+                    target=self._worker_loop,
+                    name=f"{self._name}-{index}",
+                    daemon=True,
+                )
+                for index in range(self._worker_count)
+            ]
+            for worker in self._workers:
+                worker.start()
+
+    def run(self, task_id: int) -> None:
+        """在当前线程同步执行任务，供持久化队列的 worker 调用。"""
+
+        if self.job_kind is None:
+            self._execute_task(task_id)
+            return
+        with task_liveness.hold(self.job_kind, task_id):
+            self._execute_task(task_id)
+
+    def enqueue(
+        self,
+        task_id: int,
+        owner_id: int | None = None,
+        priority: int = PRIORITY_NORMAL,
+    ) -> None:
+        """将任务加入所属用户的待执行队列。"""
+
+        self._ensure_workers()
+        if self._queue.put(task_id, owner_id, priority):
+            if self.job_kind is not None:
+                task_liveness.add(self.job_kind, task_id)
+            self._logger.info("%s %s 已加入执行队列", self.task_label, task_id)
+        else:
+            self._logger.info(
+                "%s %s 已在队列中等待执行，忽略重复入队", self.task_label, task_id
+            )
+
+    def wait_for_idle(self, timeout: float | None = None) -> bool:
+        """等待队列清空，供测试或调试使用。"""
+
+        if timeout is None:
+            self._queue.join()
+            return True
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._queue.unfinished_tasks == 0:
+                return True
+            time.sleep(0.02)
+        return self._queue.unfinished_tasks == 0
+
+    def stats(self) -> dict[str, Any]:
+        return {"workers": self.worker_count, **self._queue.stats()}
+
+    def _worker_loop(self) -> None:
+        while True:
+            selected = self._queue.get()
+            if selected is None:  # pragma: no cover - 无超时时不会返回空值
+                continue
+            task_id, owner_id = selected
+            try:
+                self._execute_task(task_id)
+            except Exception:  # pragma: no cover - 防御性兜底
+                self._logger.exception(
+                    "执行%s %s 过程中发生未捕获异常", self.task_label, task_id
+                )
+            finally:
+                self._queue.task_done(task_id, owner_id)
+                if self.job_kind is not None:
+                    task_liveness.remove(self.job_kind, task_id)
+
+    @abstractmethod
+    def _execute_task(self, task_id: int) -> None:
+        """执行单个任务，由子类实现。"""
+
+
+__all__ = ["FairTaskQueue", "FairWorkQueue"]
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.task_priority import PRIORITY_NORMAL, effective_priority
+from app.db import session as db_session
+from app.models.task_job import TaskJob, TaskJobKind, TaskJobStatus
+
+logger = logging.getLogger("promptworks.job_queue")
+
+# 每次领取时锁定的候选任务数，在其中按所属用户的执行数挑选最公平的一条
+_CLAIM_BATCH_SIZE = 20
+
+
+@dataclass(frozen=True)
+class ClaimedJob:
+    """worker 成功领取的任务快照，不依赖数据库会话。"""
+
+    id: int
+    kind: TaskJobKind
+    target_id: int
+    owner_id: int | None
+    attempts: int
+
+
+def default_holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_job(
+    kind: TaskJobKind,
+    target_id: int,
+    owner_id: int | None = None,
+    priority: int = PRIORITY_NORMAL,
+) -> int:
+    """写入持久化任务并返回任务 ID；同一目标已在排队时直接复用并保留较高优先级。"""
+
+    session = db_session.SessionLocal()
+    try:
+        existing = session.scalar(
+            select(TaskJob).where(
+                TaskJob.kind == kind,
+                TaskJob.target_id == target_id,
+                TaskJob.status == TaskJobStatus.QUEUED,
+            )
+        )
+        if existing is not None:
+            if priority < existing.priority:
+                existing.priority = priority
+                session.commit()
+            return existing.id
+        job = TaskJob(
+            kind=kind,
+            target_id=target_id,
+            owner_id=owner_id,
+            priority=priority,
+            enqueued_at=time.time(),
+        )
+        session.add(job)
+        session.commit()
+        logger.info("任务 %s:%s 已写入持久化队列 (job=%s)", kind.value, target_id, job.id)
+        return job.id
+    finally:
+        session.close()
+
+
+def _claimable(now: float):
+    return or_(
+        TaskJob.status == TaskJobStatus.QUEUED,
+        and_(
+            TaskJob.status == TaskJobStatus.RUNNING,
+            TaskJob.lease_expires_at < now,
+        ),
+    )
+
+
+def claim_next_job(
+    session: Session,
+    holder: str,
+    *,
+    lease_seconds: float | None = None,
+    max_attempts: int | None = None,
+    kinds: Iterable[TaskJobKind] | None = None,
+) -> ClaimedJob | None:
+    """领取下一条可执行的任务。
+
+    PostgreSQL 上以 ``FOR UPDATE SKIP LOCKED`` 锁定候选行，其他数据库依靠带条件
+    的更新语句实现比较并交换；租约已过期的执行中任务视为 worker 已退出，会被
+    重新领取，超过最大尝试次数后标记为失败。候选任务按老化后的有效优先级排序，
+    相同优先级下优先选择执行中任务最少的所属用户。
+    """
+
+    lease = float(lease_seconds or settings.TASK_JOB_LEASE_SECONDS)
+    attempts_limit = int(max_attempts or settings.TASK_JOB_MAX_ATTEMPTS)
+    now = time.time()
+
+    order_key = TaskJob.priority
+    aging = settings.TASK_PRIORITY_AGING_SECONDS
+    if aging > 0:
+        waited = now - func.coalesce(TaskJob.enqueued_at, now)
+        order_key = TaskJob.priority - waited / aging
+    stmt = (
+        select(TaskJob)
+        .where(_claimable(now))
+        .order_by(order_key, TaskJob.id)
+        .limit(_CLAIM_BATCH_SIZE)
+    )
+    kind_values = list(kinds or [])
+    if kind_values:
+        stmt = stmt.where(TaskJob.kind.in_(kind_values))
+    if session.get_bind().dialect.name == "postgresql":
+        stmt = stmt.with_for_update(skip_locked=True)
+
+    try:
+        candidates = list(session.scalars(stmt))
+        if not candidates:
+            session.commit()
+            return None
+
+        active_by_owner = dict(
+            session.execute(
+                select(TaskJob.owner_id, func.count(TaskJob.id))
+                .where(
+                    TaskJob.status == TaskJobStatus.RUNNING,
+                    TaskJob.lease_expires_at >= now,
+                )
+                .group_by(TaskJob.owner_id)
+            ).all()
+        )
+        candidates.sort(
+            key=lambda job: (
+                effective_priority(job.priority, now - (job.enqueued_at or now)),
+                active_by_owner.get(job.owner_id, 0),
+                job.id,
+            )
+        )
+
+        for job in candidates:
+            if job.attempts >= attempts_limit:
+                abandoned = session.execute(
+                    update(TaskJob)
+                    .where(TaskJob.id == job.id, _claimable(now))
+                    .values(
+                        status=TaskJobStatus.FAILED,
+                        lease_holder=None,
+                        lease_expires_at=None,
+                        last_error=f"租约多次过期，已尝试 {job.attempts} 次，放弃执行",
+                        finished_at=datetime.now(timezone.utc),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                if abandoned.rowcount:
+                    logger.warning(
+                        "任务 %s:%s 已尝试 %s 次仍未完成，标记为失败",
+                        job.kind,
+                        job.target_id,
+                        job.attempts,
+                    )
+                continue
+
+            claimed = session.execute(
+                update(TaskJob)
+                .where(TaskJob.id == job.id, _claimable(now))
+                .values(
+                    status=TaskJobStatus.RUNNING,
+                    lease_holder=holder,
+                    lease_expires_at=now + lease,
+                    heartbeat_at=now,
+                    attempts=TaskJob.attempts + 1,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if claimed.rowcount != 1:
+                continue
+            if job.status == TaskJobStatus.RUNNING:
+                logger.warning(
+                    "回收租约已过期的任务 %s:%s（原持有者 %s）",
+                    job.kind,
+                    job.target_id,
+                    job.lease_holder,
+                )
+            snapshot = ClaimedJob(
+                id=job.id,
+                kind=TaskJobKind(job.kind),
+                target_id=job.target_id,
+                owner_id=job.owner_id,
+                attempts=job.attempts + 1,
+            )
+            session.commit()
+            return snapshot
+
+        session.commit()
+        return None
+    except Exception:
+        session.rollback()
+        raise
+
+
+def renew_lease(
+    session: Session, job_id: int, holder: str, *, lease_seconds: float | None = None
+) -> bool:
+    """续期租约，返回 ``False`` 表示租约已被其他 worker 回收。"""
+
+    now = time.time()
+    lease = float(lease_seconds or settings.TASK_JOB_LEASE_SECONDS)
+    result = session.execute(
+        update(TaskJob)
+        .where(
+            TaskJob.id == job_id,
+            TaskJob.lease_holder == holder,
+            TaskJob.status == TaskJobStatus.RUNNING,
+        )
+        .values(lease_expires_at=now + lease, heartbeat_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def finish_job(
+    session: Session, job_id: int, holder: str, *, error: str | None = None
+) -> bool:
+    """结束任务并释放租约，租约已被回收时不覆盖新持有者的状态。"""
+
+    result = session.execute(
+        update(TaskJob)
+        .where(TaskJob.id == job_id, TaskJob.lease_holder == holder)
+        .values(
+            status=TaskJobStatus.FAILED if error else TaskJobStatus.COMPLETED,
+            last_error=error,
+            lease_holder=None,
+            lease_expires_at=None,
+            finished_at=datetime.now(timezone.utc),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+__all__ = [
+    "ClaimedJob",
+    "claim_next_job",
+    "default_holder",
+    "enqueue_job",
+    "finish_job",
+    "renew_lease",
+]
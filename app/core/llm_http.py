@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import weakref
+from collections.abc import Coroutine, Mapping
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, TypeVar
+
+import httpx
+
+from app.core.config import settings
+
+if TYPE_CHECKING:  # pragma: no cover - 类型检查辅助
+    from app.models.llm_provider import LLMProvider
+
+logger = logging.getLogger("promptworks.llm_http")
+
+T = TypeVar("T")
+
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_http2_flag(requested: bool) -> bool:
+    """仅在安装了 h2 依赖时启用 HTTP/2，否则降级为 HTTP/1.1。"""
+
+    if not requested:
+        return False
+    if _http2_available():
+        return True
+    logger.warning("未安装 h2 依赖，LLM 调用将回退为 HTTP/1.1")
+    return False
+
+
+def _positive_float(value: Any) -> float | None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value) if value > 0 else None
+
+
+def _non_negative_int(value: Any) -> int | None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value) if value >= 0 else None
+
+
+@dataclass(frozen=True)
+class ProviderHttpOptions:
+    """单个提供者的连接池、超时与 HTTP/2 配置。"""
+
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    connect_timeout: float | None = None
+    read_timeout: float | None = None
+    pool_timeout: float | None = None
+    http2: bool = False
+
+    @classmethod
+    def from_mapping(cls, raw: Mapping[str, Any] | None) -> "ProviderHttpOptions":
+        data = raw if isinstance(raw, Mapping) else {}
+        max_connections = _non_negative_int(data.get("max_connections"))
+        max_keepalive = _non_negative_int(data.get("max_keepalive_connections"))
+        http2_value = data.get("http2")
+        return cls(
+            max_connections=max_connections or settings.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=(
+                max_keepalive
+                if max_keepalive is not None
+                else settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            keepalive_expiry=_positive_float(data.get("keepalive_expiry"))
+            or DEFAULT_KEEPALIVE_EXPIRY,
+            connect_timeout=_positive_float(data.get("connect_timeout")),
+            read_timeout=_positive_float(data.get("read_timeout")),
+            pool_timeout=_positive_float(data.get("pool_timeout")),
+            http2=(
+                http2_value
+                if isinstance(http2_value, bool)
+                else settings.LLM_HTTP2_ENABLED
+            ),
+        )
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def build_timeout(self, default: float) -> float | httpx.Timeout:
+        """组合系统级超时与提供者级细分超时，未配置细分项时直接返回默认值。"""
+
+        if (
+            self.connect_timeout is None
+            and self.read_timeout is None
+            and self.pool_timeout is None
+        ):
+            return default
+        return httpx.Timeout(
+            default,
+            connect=self.connect_timeout or default,
+            read=self.read_timeout or default,
+            pool=self.pool_timeout or default,
+        )
+
+
+def _client_fingerprint(provider: "LLMProvider") -> tuple[Any, ...]:
+    options = ProviderHttpOptions.from_mapping(provider.http_options)
+    return (provider.base_url, provider.api_key, options)
+
+
+def _default_headers(provider: "LLMProvider") -> dict[str, str]:
+    return {
+        "Authorization": f"Bearer {provider.api_key}",
+        "Content-Type": "application/json",
+    }
+
+
+@dataclass
+class _SyncClientEntry:
+    fingerprint: tuple[Any, ...]
+    client: httpx.Client
+
+
+@dataclass
+class _AsyncClientEntry:
+    fingerprint: tuple[Any, ...]
+    client: httpx.AsyncClient
+    loop: asyncio.AbstractEventLoop
+
+
+class LLMClientRegistry:
+    """按提供者 ID 复用同步与异步 HTTP 客户端的进程级注册表。
+
+    客户端以提供者的基础 URL、密钥与 ``http_options`` 作为指纹，指纹变化时自动重建；
+    异步客户端与事件循环绑定，因此额外以事件循环区分缓存。被替换的同步客户端可能
+    仍在其他线程中使用，注册表只丢弃引用，待其被回收时再关闭连接池。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sync_clients: dict[int, _SyncClientEntry] = {}
+        self._async_clients: dict[tuple[int, int], _AsyncClientEntry] = {}
+
+    def get_sync_client(self, provider: "LLMProvider") -> httpx.Client:
+        fingerprint = _client_fingerprint(provider)
+        with self._lock:
+            entry = self._sync_clients.get(provider.id)
+            if entry is not None and entry.fingerprint == fingerprint:
+                if not entry.client.is_closed:
+                    return entry.client
+            # 旧客户端可能仍被其他线程使用，只丢弃引用，由回收时的终结器关闭连接池
+            client = self._build_sync_client(provider, fingerprint[2])
+            self._sync_clients[provider.id] = _SyncClientEntry(fingerprint, client)
+        return client
+
+    @staticmethod
+    def _build_sync_client(
+        provider: "LLMProvider", options: ProviderHttpOptions
+    ) -> httpx.Client:
+        transport = httpx.HTTPTransport(
+            limits=options.limits, http2=resolve_http2_flag(options.http2)
+        )
+        client = httpx.Client(
+            base_url=provider.base_url or "",
+            headers=_default_headers(provider),
+            transport=transport,
+        )
+        # 终结器只持有连接池，不会阻止客户端本身被回收
+        weakref.finalize(client, transport.close)
+        return client
+
+    def get_async_client(self, provider: "LLMProvider") -> httpx.AsyncClient:
+        """返回绑定当前事件循环的异步客户端，需在协程上下文中调用。"""
+
+        loop = asyncio.get_running_loop()
+        fingerprint = _client_fingerprint(provider)
+        key = (provider.id, id(loop))
+        stale: list[_AsyncClientEntry] = []
+        with self._lock:
+            for cache_key, cached in list(self._async_clients.items()):
+                if cached.loop.is_closed():
+                    self._async_clients.pop(cache_key, None)
+            entry = self._async_clients.get(key)
+            if (
+                entry is not None
+                and entry.fingerprint == fingerprint
+                and not entry.client.is_closed
+            ):
+                return entry.client
+            if entry is not None:
+                stale.append(entry)
+            options: ProviderHttpOptions = fingerprint[2]
+            client = httpx.AsyncClient(
+                base_url=provider.base_url or "",
+                headers=_default_headers(provider),
+                limits=options.limits,
+                http2=resolve_http2_flag(options.http2),
+            )
+            self._async_clients[key] = _AsyncClientEntry(fingerprint, client, loop)
+        for item in stale:
+            self._close_async(item)
+        return client
+
+    def request_timeout(
+        self, provider: "LLMProvider", default: float
+    ) -> float | httpx.Timeout:
+        """根据提供者的细分超时配置生成单次请求的超时参数。"""
+
+        return ProviderHttpOptions.from_mapping(provider.http_options).build_timeout(
+            default
+        )
+
+    def invalidate(self, provider_id: int) -> None:
+        """丢弃指定提供者的全部客户端，下一次调用时按最新配置重建。"""
+
+        with self._lock:
+            sync_entry = self._sync_clients.pop(provider_id, None)
+            async_entries = [
+                self._async_clients.pop(key)
+                for key in list(self._async_clients)
+                if key[0] == provider_id
+            ]
+        for entry in async_entries:
+            self._close_async(entry)
+        if sync_entry is not None or async_entries:
+            logger.info("LLM 提供者 %s 的连接池已失效，将在下次调用时重建", provider_id)
+
+    def close_all(self) -> None:
+        """进程退出时关闭全部客户端，此时不应再有在途请求。"""
+
+        with self._lock:
+            sync_clients = [entry.client for entry in self._sync_clients.values()]
+            provider_ids = {key for key in self._sync_clients}
+            provider_ids.update(key[0] for key in self._async_clients)
+        for client in sync_clients:
+            self._close_sync(client)
+        for provider_id in provider_ids:
+            self.invalidate(provider_id)
+
+    def has_client(self, provider_id: int) -> bool:
+        with self._lock:
+            return provider_id in self._sync_clients or any(
+                key[0] == provider_id for key in self._async_clients
+            )
+
+    @staticmethod
+    def _close_sync(client: httpx.Client) -> None:
+        try:
+            client.close()
+        except Exception:  # pragma: no cover - 关闭阶段容错
+            logger.exception("关闭 LLM 同步客户端失败")
+
+    @staticmethod
+    def _close_async(entry: _AsyncClientEntry) -> None:
+        loop = entry.loop
+        if loop.is_closed() or entry.client.is_closed:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(entry.client.aclose())
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(entry.client.aclose(), loop)
+        else:
+            # 所属事件循环已停止运行，改在后台事件循环上关闭，避免连接泄漏
+            future = async_runner.submit(entry.client.aclose())
+            future.add_done_callback(_log_close_failure)
+
+
+def _log_close_failure(future: Future[Any]) -> None:
+    if future.cancelled():  # pragma: no cover - 后台事件循环已停止
+        return
+    exc = future.exception()
+    if exc is not None:  # pragma: no cover - 关闭阶段容错
+        logger.warning("关闭 LLM 异步客户端失败: %s", exc)
+
+
+class AsyncLoopRunner:
+    """在后台线程中维护常驻事件循环，供同步代码提交协程。"""
+
+    def __init__(self, name: str = "llm-async-loop") -> None:
+        self._name = name
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._ensure_started()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None and self._thread and self._thread.is_alive():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run() -> None:
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=_run, name=self._name, daemon=True)
+            thread.start()
+            ready.wait()
+            self._loop = loop
+            self._thread = thread
+            return loop
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        """将协程提交到后台事件循环，返回可阻塞等待的 Future。"""
+
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+        """同步执行协程并返回结果。"""
+
+        return self.submit(coro).result(timeout)
+
+    def shutdown(self) -> None:
+        """停止后台事件循环。"""
+
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
+
+
+llm_client_registry = LLMClientRegistry()
+async_runner = AsyncLoopRunner()
+
+
+__all__ = [
+    "AsyncLoopRunner",
+    "LLMClientRegistry",
+    "ProviderHttpOptions",
+    "async_runner",
+    "llm_client_registry",
+    "resolve_http2_flag",
+]
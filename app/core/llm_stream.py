@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import statistics
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator, Mapping
+from typing import Any
+
+import httpx
+
+from app.core.cancellation import CancellationToken, raise_if_cancelled
+
+logger = logging.getLogger("promptworks.llm_stream")
+
+DONE_MARKER = "[DONE]"
+
+
+def parse_sse_data(lines: Iterable[str]) -> str | None:
+    """合并单个 SSE 事件中的 ``data:`` 行，忽略注释行，返回去除首尾空白的数据。"""
+
+    data_segments: list[str] = []
+    for item in lines:
+        if item.startswith(":"):
+            continue
+        if item.startswith("data:"):
+            data_segments.append(item[5:].lstrip())
+    if not data_segments:
+        return None
+    data_str = "\n".join(data_segments).strip()
+    return data_str or None
+
+
+def decode_sse_payload(data_str: str) -> dict[str, Any] | None:
+    """解析事件数据中的 JSON 对象，无法解析时返回 ``None``。"""
+
+    try:
+        payload = json.loads(data_str)
+    except json.JSONDecodeError:
+        logger.debug("忽略无法解析的流式分片: %s", data_str)
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def iter_sse_events(lines: Iterable[str]) -> Iterator[list[str]]:
+    """按空行切分 SSE 文本行，逐个产出事件包含的原始行。"""
+
+    event_lines: list[str] = []
+    for line in lines:
+        if line is None:
+            continue
+        if line == "":
+            if event_lines:
+                yield event_lines
+            event_lines = []
+            continue
+        event_lines.append(line)
+    if event_lines:
+        yield event_lines
+
+
+async def aiter_sse_events(lines: AsyncIterable[str]) -> AsyncIterator[list[str]]:
+    """``iter_sse_events`` 的协程版本。"""
+
+    event_lines: list[str] = []
+    async for line in lines:
+        if line is None:
+            continue
+        if line == "":
+            if event_lines:
+                yield event_lines
+            event_lines = []
+            continue
+        event_lines.append(line)
+    if event_lines:
+        yield event_lines
+
+
+def extract_delta_text(payload: Mapping[str, Any]) -> str:
+    """提取流式分片中新增的文本，兼容 ``delta``、``message`` 与 ``text`` 三种格式。"""
+
+    chunks: list[str] = []
+    choices = payload.get("choices")
+    if not isinstance(choices, list):
+        return ""
+    for choice in choices:
+        if not isinstance(choice, Mapping):
+            continue
+        for key in ("delta", "message"):
+            container = choice.get(key)
+            if isinstance(container, Mapping) and isinstance(
+                container.get("content"), str
+            ):
+                chunks.append(container["content"])
+                break
+        else:
+            if isinstance(choice.get("text"), str):
+                chunks.append(choice["text"])
+    return "".join(chunks)
+
+
+def _percentile(values: list[float], ratio: float) -> float:
+    ordered = sorted(values)
+    index = max(0, math.ceil(ratio * len(ordered)) - 1)
+    return ordered[index]
+
+
+class StreamCollector:
+    """累积一次流式调用的输出与逐 Token 时间点，计算首 Token 延迟与吞吐。"""
+
+    def __init__(self, started_at: float | None = None) -> None:
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.finished_at: float | None = None
+        self.chunks: list[str] = []
+        self.token_times: list[float] = []
+        self.usage: dict[str, Any] | None = None
+        self.model: str | None = None
+        self.finish_reason: str | None = None
+
+    def feed_event(self, lines: Iterable[str], *, now: float | None = None) -> bool:
+        """处理一个 SSE 事件，返回流是否已结束。"""
+
+        data_str = parse_sse_data(lines)
+        if data_str is None:
+            return False
+        if data_str == DONE_MARKER:
+            return True
+        payload = decode_sse_payload(data_str)
+        if payload is not None:
+            self.feed(payload, now=now)
+        return False
+
+    def feed(self, payload: Mapping[str, Any], *, now: float | None = None) -> None:
+        moment = time.perf_counter() if now is None else now
+        text = extract_delta_text(payload)
+        if text:
+            self.chunks.append(text)
+            self.token_times.append(moment)
+        usage = payload.get("usage")
+        if isinstance(usage, Mapping):
+            self.usage = dict(usage)
+        if isinstance(payload.get("model"), str):
+            self.model = payload["model"]
+        choices = payload.get("choices")
+        if isinstance(choices, list):
+            for choice in choices:
+                if isinstance(choice, Mapping) and choice.get("finish_reason"):
+                    self.finish_reason = str(choice["finish_reason"])
+
+    def finish(self, now: float | None = None) -> None:
+        self.finished_at = time.perf_counter() if now is None else now
+
+    @property
+    def output_text(self) -> str:
+        return "".join(self.chunks)
+
+    def completion_payload(self) -> dict[str, Any]:
+        """将流式分片还原为非流式 ``chat/completions`` 的响应结构。"""
+
+        payload: dict[str, Any] = {
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.output_text},
+                    "finish_reason": self.finish_reason,
+                }
+            ],
+        }
+        if self.model:
+            payload["model"] = self.model
+        if self.usage is not None:
+            payload["usage"] = self.usage
+        return payload
+
+    def metrics(self) -> dict[str, Any]:
+        """返回首 Token 延迟、Token 间隔统计与解码吞吐。
+
+        吞吐优先使用 ``usage.completion_tokens``，缺失时以内容分片数近似。
+        """
+
+        finished_at = self.finished_at or time.perf_counter()
+        result: dict[str, Any] = {
+            "ttft_ms": None,
+            "inter_token_latency_ms": None,
+            "tokens_per_second": None,
+        }
+        if not self.token_times:
+            return result
+
+        first = self.token_times[0]
+        result["ttft_ms"] = max(int((first - self.started_at) * 1000), 0)
+
+        gaps = [
+            (later - earlier) * 1000
+            for earlier, later in zip(self.token_times, self.token_times[1:])
+        ]
+        if gaps:
+            result["inter_token_latency_ms"] = {
+                "mean": round(statistics.fmean(gaps), 3),
+                "p50": round(_percentile(gaps, 0.5), 3),
+                "p95": round(_percentile(gaps, 0.95), 3),
+                "max": round(max(gaps), 3),
+            }
+
+        completion_tokens = (self.usage or {}).get("completion_tokens")
+        if not isinstance(completion_tokens, (int, float)) or completion_tokens <= 0:
+            completion_tokens = len(self.token_times)
+        decode_seconds = max(finished_at, self.token_times[-1]) - first
+        if decode_seconds > 0:
+            result["tokens_per_second"] = round(completion_tokens / decode_seconds, 3)
+        return result
+
+
+def build_stream_payload(payload: Mapping[str, Any]) -> dict[str, Any]:
+    """在请求体上开启流式输出，并要求提供者在末尾返回用量统计。"""
+
+    stream_payload = dict(payload)
+    stream_payload["stream"] = True
+    options = stream_payload.get("stream_options")
+    stream_payload["stream_options"] = {
+        **(options if isinstance(options, Mapping) else {}),
+        "include_usage": True,
+    }
+    return stream_payload
+
+
+def consume_chat_stream(
+    client: httpx.Client,
+    url: str,
+    *,
+    headers: Mapping[str, str],
+    payload: Mapping[str, Any],
+    timeout: Any,
+    started_at: float,
+    cancel_token: CancellationToken | None = None,
+) -> tuple[httpx.Response, StreamCollector | None]:
+    """以流式方式调用 ``chat/completions`` 并读完整个事件流。
+
+    提供者返回错误状态时读取响应体后直接返回，收集器为 ``None``，以便沿用
+    非流式调用的错误处理与重试判断。传入取消令牌时，取消会立即关闭响应连接并
+    抛出 ``OperationCancelledError``。
+    """
+
+    with client.stream(
+        "POST",
+        url,
+        headers=dict(headers),
+        json=build_stream_payload(payload),
+        timeout=timeout,
+    ) as response:
+        if response.status_code >= 400:
+            response.read()
+            return response, None
+        collector = StreamCollector(started_at)
+        remove_callback = (
+            cancel_token.add_callback(response.close)
+            if cancel_token is not None
+            else None
+        )
+        try:
+            for event_lines in iter_sse_events(response.iter_lines()):
+                raise_if_cancelled(cancel_token)
+                if collector.feed_event(event_lines):
+                    break
+        except (httpx.HTTPError, httpx.StreamError):
+            # 取消回调关闭了连接，统一转换为取消异常，避免被当作网络错误重试
+            raise_if_cancelled(cancel_token)
+            raise
+        finally:
+            if remove_callback is not None:
+                remove_callback()
+        raise_if_cancelled(cancel_token)
+        collector.finish()
+    return response, collector
+
+
+async def aconsume_chat_stream(
+    client: httpx.AsyncClient,
+    url: str,
+    *,
+    headers: Mapping[str, str],
+    payload: Mapping[str, Any],
+    timeout: Any,
+    started_at: float,
+) -> tuple[httpx.Response, StreamCollector | None]:
+    """``consume_chat_stream`` 的协程版本。"""
+
+    async with client.stream(
+        "POST",
+        url,
+        headers=dict(headers),
+        json=build_stream_payload(payload),
+        timeout=timeout,
+    ) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            return response, None
+        collector = StreamCollector(started_at)
+        async for event_lines in aiter_sse_events(response.aiter_lines()):
+            if collector.feed_event(event_lines):
+                break
+        collector.finish()
+    return response, collector
+
+
+__all__ = [
+    "DONE_MARKER",
+    "StreamCollector",
+    "aconsume_chat_stream",
+    "build_stream_payload",
+    "consume_chat_stream",
+    "aiter_sse_events",
+    "decode_sse_payload",
+    "extract_delta_text",
+    "iter_sse_events",
+    "parse_sse_data",
+]
@@ -0,0 +1,205 @@
+"""按内容寻址的对话消息存储。
+
+同一任务的上千次调用往往携带相同的系统提示词，调用记录只保存每条消息的摘要，
+消息原文在 ``message_blobs`` 表中按摘要仅保存一份。摘要由内容决定、消息写入后
+不再变化，因此进程内缓存无需失效，命中缓存的消息也无需再次写库。
+
+``put_many`` 由服务层在写入调用记录之前显式调用，消息块在独立的短事务中先行
+提交：引用消息块的记录提交时消息块必定已存在，调用方回滚也只会留下未被引用的
+消息块；消息块也不随调用方的长事务持有锁，并发任务写入相同的系统提示词时不会
+互相等待。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.db import session as db_session
+
+logger = logging.getLogger("promptworks.message_store")
+
+# 并发写入同一批消息时主键冲突的重试次数
+_WRITE_ATTEMPTS = 3
+
+
+def _canonical(message: Any) -> bytes:
+    return json.dumps(
+        message,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    ).encode("utf-8")
+
+
+def message_digest(message: Any) -> str:
+    """返回单条消息规范化 JSON 的 SHA-256 摘要。"""
+
+    return hashlib.sha256(_canonical(message)).hexdigest()
+
+
+class MissingMessageBlobError(LookupError):
+    """调用记录引用的消息块不存在。"""
+
+    def __init__(self, digests: Sequence[str]) -> None:
+        super().__init__(f"消息块不存在: {', '.join(digests)}")
+        self.digests = list(digests)
+
+
+class MessageStore:
+    """写入与读取按摘要去重的消息，并缓存最近使用的消息原文。"""
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries = max(0, max_entries)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+
+    def put_many(self, messages: Sequence[Any]) -> list[str]:
+        """保存消息列表并按原顺序返回摘要，已存在的消息不会重复写入。
+
+        返回前消息块已提交，调用方随后可在自己的事务中写入引用这些摘要的记录。
+        """
+
+        digests: list[str] = []
+        pending: dict[str, Any] = {}
+        for message in messages:
+            digest = message_digest(message)
+            digests.append(digest)
+            if digest not in pending and not self._contains(digest):
+                pending[digest] = message
+        if pending:
+            # 进程内串行写入，并发执行的多轮调用不会因同一系统提示词互相冲突
+            with self._write_lock:
+                pending = {
+                    digest: message
+                    for digest, message in pending.items()
+                    if not self._contains(digest)
+                }
+                if pending:
+                    self._persist(pending)
+                    self._remember(pending)
+        return digests
+
+    def get_many(self, digests: Sequence[str]) -> list[Any]:
+        """按摘要顺序还原消息列表。
+
+        存在缺失的消息块时抛出 ``MissingMessageBlobError``。
+        """
+
+        found = self._lookup(digests)
+        missing = [digest for digest in dict.fromkeys(digests) if digest not in found]
+        if missing:
+            loaded = self._load(missing)
+            self._remember(loaded)
+            found.update(loaded)
+        absent = [digest for digest in dict.fromkeys(digests) if digest not in found]
+        if absent:
+            # 静默跳过会把残缺的消息列表当作完整记录返回，宁可明确报错
+            raise MissingMessageBlobError(absent)
+        return [
+            dict(content) if isinstance(content, dict) else content
+            for content in (found[digest] for digest in digests)
+        ]
+
+    def prefetch(self, digests: Iterable[str]) -> None:
+        """批量加载尚未缓存的消息，避免逐条记录还原时重复查询。"""
+
+        unique = list(dict.fromkeys(digests))
+        found = self._lookup(unique)
+        missing = [digest for digest in unique if digest not in found]
+        if missing:
+            self._remember(self._load(missing))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _contains(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._entries
+
+    def _lookup(self, digests: Iterable[str]) -> dict[str, Any]:
+        found: dict[str, Any] = {}
+        with self._lock:
+            for digest in digests:
+                if digest in self._entries:
+                    self._entries.move_to_end(digest)
+                    found[digest] = self._entries[digest]
+        return found
+
+    def _remember(self, contents: dict[str, Any]) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            for digest, content in contents.items():
+                self._entries[digest] = content
+                self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, digests: Sequence[str]) -> dict[str, Any]:
+        from app.models.message_blob import MessageBlob
+
+        session = db_session.SessionLocal()
+        try:
+            rows = session.execute(
+                select(MessageBlob.digest, MessageBlob.content).where(
+                    MessageBlob.digest.in_(digests)
+                )
+            ).all()
+        finally:
+            session.close()
+        return {digest: content for digest, content in rows}
+
+    def _persist(self, pending: dict[str, Any]) -> None:
+        from app.models.message_blob import MessageBlob
+
+        session = db_session.SessionLocal()
+        try:
+            for _ in range(_WRITE_ATTEMPTS):
+                existing = set(
+                    session.scalars(
+                        select(MessageBlob.digest).where(
+                            MessageBlob.digest.in_(list(pending))
+                        )
+                    )
+                )
+                session.add_all(
+                    MessageBlob(
+                        digest=digest,
+                        content=content,
+                        size=len(_canonical(content)),
+                    )
+                    for digest, content in pending.items()
+                    if digest not in existing
+                )
+                try:
+                    session.commit()
+                    return
+                except IntegrityError:
+                    # 其他调用同时写入了相同消息，重新查询后只补写仍缺失的部分
+                    session.rollback()
+            raise RuntimeError("消息块写入冲突次数过多")
+        finally:
+            session.close()
+
+
+message_store = MessageStore()
+
+
+__all__ = [
+    "MessageStore",
+    "MissingMessageBlobError",
+    "message_digest",
+    "message_store",
+]
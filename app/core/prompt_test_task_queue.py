@@ -1,17 +1,27 @@
 from __future__ import annotations
 
 import logging
-import math
 import threading
-import time
 from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 from queue import Empty, Queue
-from collections.abc import Mapping, Sequence
+from collections.abc import Callable, Mapping, Sequence
 from typing import Any
 
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session, selectinload
 
+from app.core.cancellation import (
+    PROMPT_TEST_TASK_SCOPE,
+    CancellationToken,
+    cancellation_registry,
+)
+from app.core.config import settings
+from app.core.fair_queue import FairTaskQueue
+from app.core.job_queue import enqueue_job
+from app.core.task_priority import resolve_priority
+from app.core.task_progress import TaskProgressStore, progress_store
 from app.db import session as db_session
 from app.models.prompt_test import (
     PromptTestExperiment,
@@ -20,6 +30,7 @@ from app.models.prompt_test import (
     PromptTestTaskStatus,
     PromptTestUnit,
 )
+from app.models.task_job import TaskJobKind
 from app.services.prompt_test_engine import (
     PromptTestExecutionError,
     execute_prompt_test_experiment,
@@ -27,105 +38,61 @@ from app.services.prompt_test_engine import (
 
 logger = logging.getLogger("promptworks.prompt_test_queue")
 
+_PROGRESS_POLL_INTERVAL = 0.1
+
 
 class PromptTestProgressTracker:
-    """在任务执行期间追踪并持久化进度信息。"""
+    """在任务执行期间追踪进度，写入独立的进度存储而不改写任务配置。"""
 
     def __init__(
         self,
-        session: Session,
-        task: PromptTestTask,
+        task_id: int,
         total_runs: int,
         *,
-        step_percent: int = 5,
+        store: TaskProgressStore | None = None,
     ) -> None:
-        self._session = session
-        self._task = task
-        self._configured_total = max(1, int(total_runs)) if total_runs else 1
-        self._actual_total = max(1, total_runs)
-        self._step = max(1, step_percent)
-        self._completed = 0
-        self._last_percent = 0
-        self._next_threshold = self._step
+        self._task_id = task_id
+        self._total = max(1, int(total_runs)) if total_runs else 1
+        self._store = store or progress_store
         self._initialized = False
 
+    @classmethod
+    def resume(
+        cls, task_id: int, *, store: TaskProgressStore | None = None
+    ) -> "PromptTestProgressTracker":
+        """基于已记录的进度恢复追踪器，供多个节点共同执行同一任务时使用。"""
+
+        store = store or progress_store
+        snapshot = store.get(task_id)
+        if snapshot is None:
+            tracker = cls(task_id, 1, store=store)
+            tracker.initialize()
+            return tracker
+        tracker = cls(task_id, snapshot.total, store=store)
+        store.start(task_id, snapshot.total, snapshot.current, persist=False)
+        tracker._initialized = True
+        return tracker
+
     def initialize(self) -> None:
-        config = dict(self._task.config) if isinstance(self._task.config, dict) else {}
-        progress_record = config.get("progress")
-        if not isinstance(progress_record, dict):
-            progress_record = {}
-        progress_record.update(
-            {
-                "current": 0,
-                "total": self._configured_total,
-                "percentage": 0,
-                "step": self._step,
-            }
-        )
-        config["progress"] = progress_record
-        config["progress_current"] = 0
-        config["progressCurrent"] = 0
-        config["progress_total"] = self._configured_total
-        config["progressTotal"] = self._configured_total
-        config["progress_percentage"] = 0
-        config["progressPercentage"] = 0
-        self._task.config = config
+        self._store.start(self._task_id, self._total)
         self._initialized = True
-        self._session.flush()
 
-    def advance(self, amount: int = 1) -> None:
-        if not self._initialized or amount <= 0:
-            return
-        self._completed = min(self._actual_total, self._completed + amount)
-        percent = self._calculate_percent(self._completed)
-        if self._completed < self._actual_total and percent < self._next_threshold:
+    def record(self, amount: int) -> None:
+        """累加完成数并立即写入进度表，不按百分比步长节流。"""
+
+        if not self._initialized:
             return
-        self._write_progress(self._completed, percent)
-        self._last_percent = percent
-        if self._completed >= self._actual_total:
-            self._next_threshold = 100
-        else:
-            next_multiple = ((percent // self._step) + 1) * self._step
-            self._next_threshold = min(100, max(self._step, next_multiple))
-        self._session.commit()
+        self._store.advance(self._task_id, amount, persist=True)
 
-    def finish(self, force: bool = False) -> None:
+    def advance(self, amount: int = 1) -> None:
         if not self._initialized:
             return
-        if not force and self._last_percent >= 100:
+        self._store.advance(self._task_id, amount)
+
+    def finish(self) -> None:
+        if not self._initialized:
             return
-        self._completed = self._actual_total
-        self._write_progress(self._actual_total, 100)
-        self._last_percent = 100
-        self._session.commit()
-
-    def _calculate_percent(self, completed: int) -> int:
-        ratio = completed / self._actual_total if self._actual_total else 0
-        percent = math.ceil(ratio * 100)
-        return min(100, max(0, percent))
-
-    def _write_progress(self, current: int, percent: int) -> None:
-        config = dict(self._task.config) if isinstance(self._task.config, dict) else {}
-        progress_record = config.get("progress")
-        if not isinstance(progress_record, dict):
-            progress_record = {}
-        progress_record.update(
-            {
-                "current": min(current, self._configured_total),
-                "total": self._configured_total,
-                "percentage": percent,
-                "step": self._step,
-            }
-        )
-        config["progress"] = progress_record
-        config["progress_current"] = min(current, self._configured_total)
-        config["progressCurrent"] = min(current, self._configured_total)
-        config["progress_total"] = self._configured_total
-        config["progressTotal"] = self._configured_total
-        config["progress_percentage"] = percent
-        config["progressPercentage"] = percent
-        self._task.config = config
-        self._session.flush()
+        self._store.complete(self._task_id)
 
 
 def _count_variable_cases(value: Any) -> int:
@@ -168,15 +135,42 @@ def _estimate_total_runs(units: Sequence[PromptTestUnit]) -> int:
     return max(total, 1)
 
 
-class PromptTestTaskQueue:
-    """Prompt 测试任务的串行执行队列。"""
+def resolve_unit_concurrency(task: PromptTestTask, unit_count: int) -> int:
+    """读取任务内单元并行数，任务配置 ``unit_concurrency`` 优先于全局配置。"""
+
+    limit = settings.PROMPT_TEST_UNIT_CONCURRENCY
+    config = task.config if isinstance(task.config, Mapping) else {}
+    override = config.get("unit_concurrency")
+    if isinstance(override, int) and not isinstance(override, bool) and override > 0:
+        limit = override
+    return max(1, min(int(limit), unit_count))
+
 
-    def __init__(self) -> None:
-        self._queue: Queue[int] = Queue()
-        self._worker = threading.Thread(
-            target=self._worker_loop, name="prompt-test-task-queue", daemon=True
+def _drain_progress(
+    updates: Queue[int], progress_tracker: PromptTestProgressTracker
+) -> None:
+    completed = 0
+    while True:
+        try:
+            completed += updates.get_nowait()
+        except Empty:
+            break
+    if completed:
+        progress_tracker.advance(completed)
+
+
+class PromptTestTaskQueue(FairTaskQueue):
+    """Prompt 测试任务的执行队列，由多个工作线程按所属用户公平调度。"""
+
+    task_label = "Prompt 测试任务"
+    job_kind = TaskJobKind.PROMPT_TEST_TASK
+
+    def __init__(self, worker_count: int | None = None) -> None:
+        super().__init__(
+            name="prompt-test-task-queue",
+            worker_count=worker_count or settings.PROMPT_TEST_QUEUE_WORKERS,
+            logger=logger,
         )
-        self._worker.start()
 
     @staticmethod
     def _update_task_last_error(task: PromptTestTask, message: str | None) -> None:
@@ -191,136 +185,267 @@ class PromptTestTaskQueue:
             cleaned.pop("last_error", None)
             task.config = cleaned
 
-    def enqueue(self, task_id: int) -> None:
-        """将任务加入待执行队列。"""
-
-        self._queue.put_nowait(task_id)
-        logger.info("Prompt 测试任务 %s 已加入执行队列", task_id)
-
-    def wait_for_idle(self, timeout: float | None = None) -> bool:
-        """等待队列清空，便于测试或调试。"""
-
-        if timeout is None:
-            self._queue.join()
-            return True
-
-        deadline = time.monotonic() + timeout
-        while time.monotonic() < deadline:
-            if self._queue.unfinished_tasks == 0:
-                return True
-            time.sleep(0.02)
-        return self._queue.unfinished_tasks == 0
-
-    def _worker_loop(self) -> None:
-        while True:
-            try:
-                task_id = self._queue.get()
-            except Empty:  # pragma: no cover - Queue.get 默认阻塞
-                continue
-
-            try:
-                self._execute_task(task_id)
-            except Exception:  # pragma: no cover - 防御性兜底
-                logger.exception(
-                    "执行 Prompt 测试任务 %s 过程中发生未捕获异常", task_id
-                )
-            finally:
-                self._queue.task_done()
-
     def _execute_task(self, task_id: int) -> None:
         session = db_session.SessionLocal()
         try:
-            task = session.execute(
-                select(PromptTestTask)
-                .where(PromptTestTask.id == task_id)
-                .options(selectinload(PromptTestTask.units))
-            ).scalar_one_or_none()
-            if not task:
-                logger.warning("Prompt 测试任务 %s 不存在，跳过执行", task_id)
-                return
-            if task.is_deleted:
-                logger.info("Prompt 测试任务 %s 已被标记删除，跳过执行", task_id)
+            started = self.start_task(session, task_id)
+            if started is None:
                 return
+            task, units, progress_tracker = started
+            with cancellation_registry.track(
+                PROMPT_TEST_TASK_SCOPE, task_id
+            ) as cancel_token:
+                self._execute_units(
+                    session, task, units, progress_tracker, cancel_token
+                )
+        finally:
+            session.close()
 
-            units = [unit for unit in task.units if isinstance(unit, PromptTestUnit)]
-            total_runs = _estimate_total_runs(units)
-            progress_tracker = PromptTestProgressTracker(session, task, total_runs)
-            progress_tracker.initialize()
-
+    def start_task(
+        self, session: Session, task_id: int
+    ) -> (
+        tuple[PromptTestTask, list[PromptTestUnit], PromptTestProgressTracker] | None
+    ):
+        """加载任务并标记为执行中，返回待执行的单元；无需执行时返回 ``None``。"""
+
+        task = session.execute(
+            select(PromptTestTask)
+            .where(PromptTestTask.id == task_id)
+            .options(selectinload(PromptTestTask.units))
+        ).scalar_one_or_none()
+        if not task:
+            logger.warning("Prompt 测试任务 %s 不存在，跳过执行", task_id)
+            return None
+        if task.is_deleted:
+            logger.info("Prompt 测试任务 %s 已被标记删除，跳过执行", task_id)
+            return None
+        if task.status == PromptTestTaskStatus.CANCELLED:
+            logger.info("Prompt 测试任务 %s 已被取消，跳过执行", task_id)
+            return None
+
+        units = [unit for unit in task.units if isinstance(unit, PromptTestUnit)]
+        total_runs = _estimate_total_runs(units)
+        progress_tracker = PromptTestProgressTracker(task.id, total_runs)
+        progress_tracker.initialize()
+
+        if not units:
+            self._complete_without_units(session, task, progress_tracker)
+            logger.info("Prompt 测试任务 %s 无最小测试单元，自动标记为完成", task_id)
+            return None
+
+        # 进程退出后恢复执行时，跳过已有完成实验的单元，进度从已完成的轮次继续
+        completed_unit_ids = set(
+            session.scalars(
+                select(PromptTestExperiment.unit_id).where(
+                    PromptTestExperiment.unit_id.in_([unit.id for unit in units]),
+                    PromptTestExperiment.status
+                    == PromptTestExperimentStatus.COMPLETED,
+                )
+            )
+        )
+        if completed_unit_ids:
+            progress_tracker.record(
+                _estimate_total_runs(
+                    [unit for unit in units if unit.id in completed_unit_ids]
+                )
+            )
+            units = [unit for unit in units if unit.id not in completed_unit_ids]
+            logger.info(
+                "Prompt 测试任务 %s 已有 %s 个单元完成，本次仅执行剩余 %s 个单元",
+                task_id,
+                len(completed_unit_ids),
+                len(units),
+            )
             if not units:
-                task.status = PromptTestTaskStatus.COMPLETED
-                self._update_task_last_error(task, None)
-                progress_tracker.finish(force=True)
-                logger.info(
-                    "Prompt 测试任务 %s 无最小测试单元，自动标记为完成", task_id
+                self._complete_without_units(session, task, progress_tracker)
+                return None
+
+        task.status = PromptTestTaskStatus.RUNNING
+        self._update_task_last_error(task, None)
+        session.commit()
+        return task, units, progress_tracker
+
+    def _complete_without_units(
+        self,
+        session: Session,
+        task: PromptTestTask,
+        progress_tracker: PromptTestProgressTracker,
+    ) -> None:
+        task.status = PromptTestTaskStatus.COMPLETED
+        self._update_task_last_error(task, None)
+        progress_tracker.finish()
+        session.commit()
+        progress_store.close(task.id, PromptTestTaskStatus(task.status).value)
+
+    def _execute_units(
+        self,
+        session: Session,
+        task: PromptTestTask,
+        units: Sequence[PromptTestUnit],
+        progress_tracker: PromptTestProgressTracker,
+        cancel_token: CancellationToken,
+    ) -> None:
+        """并行执行任务内的最小测试单元。
+
+        每个单元在独立线程与独立会话中执行，轮次并发仍由各自模型的并发上限控制；
+        进度增量经队列汇总后由当前线程写入进度存储。任一单元失败后不再启动新的
+        单元，已在执行的单元继续完成。
+        """
+
+        task_id = task.id
+        unit_ids = [unit.id for unit in units]
+        worker_count = resolve_unit_concurrency(task, len(unit_ids))
+        progress_updates: Queue[int] = Queue()
+        halt = threading.Event()
+
+        failure: str | None = None
+        cancelled = False
+        executor = ThreadPoolExecutor(
+            max_workers=worker_count, thread_name_prefix="prompt-test-unit"
+        )
+        try:
+            pending = {
+                executor.submit(
+                    self.run_unit,
+                    task_id,
+                    unit_id,
+                    progress_updates.put,
+                    cancel_token,
+                    halt,
                 )
-                return
+                for unit_id in unit_ids
+            }
+            while pending:
+                done, pending = wait(
+                    pending,
+                    timeout=_PROGRESS_POLL_INTERVAL,
+                    return_when=FIRST_COMPLETED,
+                )
+                _drain_progress(progress_updates, progress_tracker)
+                for future in done:
+                    status, error = future.result()
+                    if status == PromptTestExperimentStatus.FAILED:
+                        failure = failure or error
+                    elif status == PromptTestExperimentStatus.CANCELLED:
+                        cancelled = True
+        finally:
+            executor.shutdown(wait=True)
+        _drain_progress(progress_updates, progress_tracker)
+
+        self.finish_task(
+            session,
+            task,
+            progress_tracker,
+            failure=failure,
+            cancelled=cancelled or cancel_token.cancelled,
+            cancel_reason=cancel_token.reason,
+        )
 
-            task.status = PromptTestTaskStatus.RUNNING
+    def finish_task(
+        self,
+        session: Session,
+        task: PromptTestTask,
+        progress_tracker: PromptTestProgressTracker,
+        *,
+        failure: str | None,
+        cancelled: bool,
+        cancel_reason: str | None = None,
+    ) -> None:
+        """根据各单元的执行结果汇总任务最终状态，提交后向订阅者推送结束事件。"""
+
+        progress_tracker.finish()
+        if failure is not None:
+            task.status = PromptTestTaskStatus.FAILED
+            self._update_task_last_error(task, failure)
+        elif cancelled:
+            task.status = PromptTestTaskStatus.CANCELLED
+            self._update_task_last_error(task, cancel_reason)
+        else:
+            task.status = PromptTestTaskStatus.COMPLETED
             self._update_task_last_error(task, None)
-            session.commit()
+        session.commit()
+        progress_store.close(task.id, PromptTestTaskStatus(task.status).value)
 
-            for unit in units:
-                sequence = (
-                    session.scalar(
-                        select(func.max(PromptTestExperiment.sequence)).where(
-                            PromptTestExperiment.unit_id == unit.id
-                        )
-                    )
-                    or 0
-                ) + 1
+        if task.status == PromptTestTaskStatus.CANCELLED:
+            logger.info("Prompt 测试任务 %s 已取消", task.id)
+        elif task.status == PromptTestTaskStatus.COMPLETED:
+            logger.info("Prompt 测试任务 %s 执行完成", task.id)
 
-                experiment = PromptTestExperiment(
-                    unit_id=unit.id,
-                    sequence=sequence,
-                    status=PromptTestExperimentStatus.PENDING,
-                )
-                session.add(experiment)
-                session.flush()
+    def run_unit(
+        self,
+        task_id: int,
+        unit_id: int,
+        report_progress: Callable[[int], None],
+        cancel_token: CancellationToken,
+        halt: threading.Event,
+    ) -> tuple[PromptTestExperimentStatus | None, str | None]:
+        """在独立会话中执行单个最小测试单元，返回实验状态与失败原因。
 
-                try:
-                    execute_prompt_test_experiment(
-                        session, experiment, progress_tracker.advance
-                    )
-                except PromptTestExecutionError as exc:
-                    session.refresh(experiment)
-                    experiment.status = PromptTestExperimentStatus.FAILED
-                    experiment.error = str(exc)
-                    experiment.finished_at = datetime.now(timezone.utc)
-                    task.status = PromptTestTaskStatus.FAILED
-                    self._update_task_last_error(task, str(exc))
-                    progress_tracker.finish(force=True)
-                    session.commit()
-                    logger.warning(
-                        "Prompt 测试任务 %s 的最小单元 %s 执行失败: %s",
-                        task_id,
-                        unit.id,
-                        exc,
-                    )
-                    return
-                except Exception as exc:  # pragma: no cover - 防御性兜底
-                    session.refresh(experiment)
-                    experiment.status = PromptTestExperimentStatus.FAILED
-                    experiment.error = "执行测试任务失败"
-                    experiment.finished_at = datetime.now(timezone.utc)
-                    task.status = PromptTestTaskStatus.FAILED
-                    self._update_task_last_error(task, "执行测试任务失败")
-                    progress_tracker.finish(force=True)
-                    session.commit()
-                    logger.exception(
-                        "Prompt 测试任务 %s 的最小单元 %s 执行出现未知异常",
-                        task_id,
-                        unit.id,
+        任务已取消或其他单元已失败时直接跳过，不创建实验记录。
+        """
+
+        if cancel_token.cancelled or halt.is_set():
+            return None, None
+
+        session = db_session.SessionLocal()
+        try:
+            sequence = (
+                session.scalar(
+                    select(func.max(PromptTestExperiment.sequence)).where(
+                        PromptTestExperiment.unit_id == unit_id
                     )
-                    return
+                )
+                or 0
+            ) + 1
 
+            experiment = PromptTestExperiment(
+                unit_id=unit_id,
+                sequence=sequence,
+                status=PromptTestExperimentStatus.PENDING,
+            )
+            session.add(experiment)
+            session.flush()
+
+            try:
+                execute_prompt_test_experiment(
+                    session,
+                    experiment,
+                    report_progress,
+                    cancel_token=cancel_token,
+                    round_callback=partial(progress_store.publish_round, task_id),
+                )
+            except PromptTestExecutionError as exc:
+                session.refresh(experiment)
+                experiment.status = PromptTestExperimentStatus.FAILED
+                experiment.error = str(exc)
+                experiment.finished_at = datetime.now(timezone.utc)
+                session.commit()
+                # 在工作线程内立即置位，避免同一线程继续领取排队中的单元
+                halt.set()
+                logger.warning(
+                    "Prompt 测试任务 %s 的最小单元 %s 执行失败: %s",
+                    task_id,
+                    unit_id,
+                    exc,
+                )
+                return PromptTestExperimentStatus.FAILED, str(exc)
+            except Exception:  # pragma: no cover - 防御性兜底
+                session.rollback()
+                session.add(experiment)
+                experiment.status = PromptTestExperimentStatus.FAILED
+                experiment.error = "执行测试任务失败"
+                experiment.finished_at = datetime.now(timezone.utc)
                 session.commit()
+                halt.set()
+                logger.exception(
+                    "Prompt 测试任务 %s 的最小单元 %s 执行出现未知异常",
+                    task_id,
+                    unit_id,
+                )
+                return PromptTestExperimentStatus.FAILED, "执行测试任务失败"
 
-            task.status = PromptTestTaskStatus.COMPLETED
-            self._update_task_last_error(task, None)
-            progress_tracker.finish()
             session.commit()
-            logger.info("Prompt 测试任务 %s 执行完成", task_id)
+            return experiment.status, experiment.error
         finally:
             session.close()
 
@@ -328,10 +453,41 @@ class PromptTestTaskQueue:
 task_queue = PromptTestTaskQueue()
 
 
-def enqueue_prompt_test_task(task_id: int) -> None:
-    """对外暴露的入队方法。"""
+def priority_for_prompt_test_task(task: PromptTestTask) -> int:
+    """Prompt 测试任务的执行优先级，未显式指定时按预估调用次数推导。"""
+
+    units = [unit for unit in task.units if isinstance(unit, PromptTestUnit)]
+    return resolve_priority(task.priority, _estimate_total_runs(units))
 
-    task_queue.enqueue(task_id)
+
+def enqueue_prompt_test_task(
+    task_id: int, owner_id: int | None = None, priority: int | None = None
+) -> None:
+    """对外暴露的入队方法，``owner_id`` 对应任务的 ``owner_id``，用于公平调度。
+
+    ``priority`` 通常由 ``priority_for_prompt_test_task`` 计算，数值越小越先执行。
+
+    ``TASK_QUEUE_BACKEND`` 为 ``database`` 时写入持久化队列，由独立 worker 执行；
+    为 ``celery`` 时投递到消息队列，任务内的最小测试单元分发到各 Celery 节点。
+    """
+
+    resolved = resolve_priority(priority)
+    if settings.TASK_QUEUE_BACKEND == "database":
+        enqueue_job(TaskJobKind.PROMPT_TEST_TASK, task_id, owner_id, resolved)
+        return
+    if settings.TASK_QUEUE_BACKEND == "celery":
+        from app.core.celery_tasks import celery_priority, run_prompt_test_task
+
+        run_prompt_test_task.apply_async(
+            args=[task_id], priority=celery_priority(resolved)
+        )
+        return
+    task_queue.enqueue(task_id, owner_id, resolved)
 
 
-__all__ = ["enqueue_prompt_test_task", "task_queue"]
+__all__ = [
+    "enqueue_prompt_test_task",
+    "priority_for_prompt_test_task",
+    "resolve_unit_concurrency",
+    "task_queue",
+]
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Protocol
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+
+if TYPE_CHECKING:  # pragma: no cover - 类型检查辅助
+    from app.models.llm_provider import LLMModel
+
+logger = logging.getLogger("promptworks.rate_limiter")
+
+WINDOW_SECONDS = 60.0
+CHARS_PER_TOKEN = 4
+
+
+@dataclass(frozen=True)
+class TokenBucketRule:
+    """令牌桶规则：容量即每分钟额度，按秒匀速回填。"""
+
+    capacity: float
+
+    @property
+    def refill_per_second(self) -> float:
+        return self.capacity / WINDOW_SECONDS
+
+
+def _settle_bucket(
+    tokens: float, updated_at: float, now: float, cost: float, rule: TokenBucketRule
+) -> tuple[float, float]:
+    """结算令牌桶并预支本次消耗，返回剩余令牌数与需要等待的秒数。
+
+    令牌允许透支为负数，等待时间即透支部分按回填速率补齐所需的时长，
+    因此并发请求会被精确地排成匀速队列，而不是在同一时刻一起重试。
+    """
+
+    elapsed = max(0.0, now - updated_at)
+    available = min(rule.capacity, tokens + elapsed * rule.refill_per_second)
+    remaining = available - min(cost, rule.capacity)
+    wait = -remaining / rule.refill_per_second if remaining < 0 else 0.0
+    return remaining, wait
+
+
+class RateLimitBackend(Protocol):
+    """令牌桶存储后端，``reserve`` 必须原子地完成结算与预支。"""
+
+    blocking: bool
+
+    def reserve(self, key: str, cost: float, rule: TokenBucketRule) -> float: ...
+
+
+class MemoryRateLimitBackend:
+    """单进程内的令牌桶，适用于只有一个工作进程的部署。"""
+
+    blocking = False
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def reserve(self, key: str, cost: float, rule: TokenBucketRule) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (rule.capacity, now))
+            remaining, wait = _settle_bucket(tokens, updated_at, now, cost, rule)
+            self._buckets[key] = (remaining, now)
+        return wait
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseRateLimitBackend:
+    """基于 ``llm_rate_limit_buckets`` 表的令牌桶，多个进程共享同一额度。"""
+
+    blocking = True
+
+    def reserve(self, key: str, cost: float, rule: TokenBucketRule) -> float:
+        from app.db import session as db_session
+        from app.models.rate_limit import LLMRateLimitBucket
+
+        for _ in range(2):
+            session = db_session.SessionLocal()
+            try:
+                now = time.time()
+                bucket = session.scalar(
+                    select(LLMRateLimitBucket)
+                    .where(LLMRateLimitBucket.bucket_key == key)
+                    .with_for_update()
+                )
+                if bucket is None:
+                    remaining, wait = _settle_bucket(
+                        rule.capacity, now, now, cost, rule
+                    )
+                    session.add(
+                        LLMRateLimitBucket(
+                            bucket_key=key, tokens=remaining, updated_at=now
+                        )
+                    )
+                else:
+                    remaining, wait = _settle_bucket(
+                        bucket.tokens, bucket.updated_at, now, cost, rule
+                    )
+                    bucket.tokens = remaining
+                    bucket.updated_at = now
+                session.commit()
+                return wait
+            except IntegrityError:
+                # 并发首次创建同一令牌桶时以另一进程写入的记录为准重新结算
+                session.rollback()
+            finally:
+                session.close()
+        return 0.0  # pragma: no cover - 连续冲突时放行，避免阻塞调用
+
+
+_REDIS_RESERVE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1])
+local updated_at = tonumber(state[2])
+if tokens == nil or updated_at == nil then
+  tokens = capacity
+  updated_at = now
+end
+local elapsed = math.max(0, now - updated_at)
+tokens = math.min(capacity, tokens + elapsed * rate) - math.min(cost, capacity)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2 + 60)
+if tokens < 0 then
+  return tostring(-tokens / rate)
+end
+return '0'
+"""
+
+
+class RedisRateLimitBackend:
+    """基于 Redis Lua 脚本的令牌桶，使用 Redis 服务器时钟保证多进程一致。"""
+
+    blocking = True
+
+    def __init__(self, url: str, *, prefix: str = "promptworks:ratelimit:") -> None:
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_RESERVE_SCRIPT)
+        self._prefix = prefix
+
+    def reserve(self, key: str, cost: float, rule: TokenBucketRule) -> float:
+        raw = self._script(
+            keys=[f"{self._prefix}{key}"],
+            args=[rule.capacity, rule.refill_per_second, cost],
+        )
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        return float(raw)
+
+
+def build_rate_limit_backend(name: str | None = None) -> RateLimitBackend:
+    backend_name = (name or settings.LLM_RATE_LIMIT_BACKEND).strip().lower()
+    if backend_name == "database":
+        return DatabaseRateLimitBackend()
+    if backend_name == "redis":
+        return RedisRateLimitBackend(settings.REDIS_URL)
+    return MemoryRateLimitBackend()
+
+
+def estimate_request_tokens(payload: Mapping[str, Any]) -> int:
+    """按字符数粗略估算一次请求的 Token 消耗，包含预期的输出上限。"""
+
+    characters = 0
+    messages = payload.get("messages")
+    if isinstance(messages, Sequence) and not isinstance(messages, (str, bytes)):
+        for message in messages:
+            if not isinstance(message, Mapping):
+                continue
+            content = message.get("content")
+            if isinstance(content, str):
+                characters += len(content)
+            elif isinstance(content, Sequence):
+                for part in content:
+                    if isinstance(part, Mapping) and isinstance(part.get("text"), str):
+                        characters += len(part["text"])
+    estimated = math.ceil(characters / CHARS_PER_TOKEN)
+    max_tokens = payload.get("max_tokens")
+    if isinstance(max_tokens, int) and not isinstance(max_tokens, bool):
+        estimated += max(max_tokens, 0)
+    return max(estimated, 1)
+
+
+def usage_total_tokens(usage: Any) -> int | None:
+    """从 OpenAI 兼容的 ``usage`` 字段中提取总 Token 数。"""
+
+    if not isinstance(usage, Mapping):
+        return None
+    total = usage.get("total_tokens")
+    if isinstance(total, (int, float)) and not isinstance(total, bool):
+        return int(total)
+    parts = [
+        usage.get(key)
+        for key in ("prompt_tokens", "completion_tokens")
+        if isinstance(usage.get(key), (int, float))
+    ]
+    return int(sum(parts)) if parts else None
+
+
+@dataclass
+class RateLimitReservation:
+    """一次调用预支的额度，用于在拿到真实用量后校正 TPM 令牌桶。"""
+
+    bucket_prefix: str
+    tpm_limit: int | None
+    estimated_tokens: int
+    waited_seconds: float = 0.0
+
+
+class LLMRateLimiter:
+    """按提供者与模型共享的 RPM/TPM 限流器。
+
+    未在模型上配置 ``rpm_limit``/``tpm_limit`` 时直接放行；配置后每次调用会按
+    令牌桶精确计算需要等待的时间，而不是随机休眠。
+    """
+
+    def __init__(self, backend: RateLimitBackend | None = None) -> None:
+        self._backend = backend
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> RateLimitBackend:
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = build_rate_limit_backend()
+        return self._backend
+
+    def configure(self, backend: RateLimitBackend | None) -> None:
+        """替换存储后端，传入 ``None`` 时按配置重新构建。"""
+
+        with self._lock:
+            self._backend = backend
+
+    def reserve(
+        self, model: "LLMModel | None", payload: Mapping[str, Any]
+    ) -> tuple[RateLimitReservation | None, float]:
+        """预支额度并返回需要等待的秒数，未配置限额时返回 ``(None, 0)``。"""
+
+        if model is None:
+            return None, 0.0
+        rpm_limit = model.rpm_limit
+        tpm_limit = model.tpm_limit
+        if not rpm_limit and not tpm_limit:
+            return None, 0.0
+
+        prefix = f"{model.provider_id}:{model.name}"
+        estimated = estimate_request_tokens(payload)
+        wait = 0.0
+        try:
+            if rpm_limit:
+                wait = max(
+                    wait,
+                    self.backend.reserve(
+                        f"{prefix}:rpm", 1, TokenBucketRule(float(rpm_limit))
+                    ),
+                )
+            if tpm_limit:
+                wait = max(
+                    wait,
+                    self.backend.reserve(
+                        f"{prefix}:tpm", estimated, TokenBucketRule(float(tpm_limit))
+                    ),
+                )
+        except Exception:  # pragma: no cover - 后端不可用时放行，避免阻塞调用
+            logger.exception("限流后端结算失败，本次调用不做限流: %s", prefix)
+            return None, 0.0
+        reservation = RateLimitReservation(
+            bucket_prefix=prefix,
+            tpm_limit=tpm_limit,
+            estimated_tokens=estimated,
+            waited_seconds=wait,
+        )
+        return reservation, wait
+
+    def acquire(
+        self, model: "LLMModel | None", payload: Mapping[str, Any]
+    ) -> RateLimitReservation | None:
+        """同步获取额度，必要时阻塞当前线程直到令牌桶允许发送。"""
+
+        reservation, wait = self.reserve(model, payload)
+        if wait > 0:
+            logger.debug("触发限流，等待 %.3fs 后发送请求", wait)
+            time.sleep(wait)
+        return reservation
+
+    async def acquire_async(
+        self, model: "LLMModel | None", payload: Mapping[str, Any]
+    ) -> RateLimitReservation | None:
+        """协程版本的额度获取，阻塞型后端在线程池中结算。"""
+
+        if self.backend.blocking:
+            reservation, wait = await asyncio.to_thread(self.reserve, model, payload)
+        else:
+            reservation, wait = self.reserve(model, payload)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return reservation
+
+    def settle(
+        self, reservation: RateLimitReservation | None, actual_tokens: int | None
+    ) -> None:
+        """用真实 Token 用量校正 TPM 令牌桶，多退少补。"""
+
+        if reservation is None or not reservation.tpm_limit or actual_tokens is None:
+            return
+        delta = actual_tokens - reservation.estimated_tokens
+        if delta == 0:
+            return
+        try:
+            self.backend.reserve(
+                f"{reservation.bucket_prefix}:tpm",
+                delta,
+                TokenBucketRule(float(reservation.tpm_limit)),
+            )
+        except Exception:  # pragma: no cover - 校正失败不影响调用结果
+            logger.exception("限流额度校正失败: %s", reservation.bucket_prefix)
+
+    async def asettle(
+        self, reservation: RateLimitReservation | None, actual_tokens: int | None
+    ) -> None:
+        """协程版本的额度校正，阻塞型后端在线程池中结算。"""
+
+        if self.backend.blocking:
+            await asyncio.to_thread(self.settle, reservation, actual_tokens)
+        else:
+            self.settle(reservation, actual_tokens)
+
+
+llm_rate_limiter = LLMRateLimiter()
+
+
+__all__ = [
+    "DatabaseRateLimitBackend",
+    "LLMRateLimiter",
+    "MemoryRateLimitBackend",
+    "RateLimitBackend",
+    "RateLimitReservation",
+    "RedisRateLimitBackend",
+    "TokenBucketRule",
+    "build_rate_limit_backend",
+    "estimate_request_tokens",
+    "llm_rate_limiter",
+    "usage_total_tokens",
+]
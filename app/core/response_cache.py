@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+
+if TYPE_CHECKING:  # pragma: no cover - 类型检查辅助
+    from app.models.llm_provider import LLMProvider
+
+logger = logging.getLogger("promptworks.response_cache")
+
+_VOLATILE_PAYLOAD_KEYS = {"stream", "stream_options", "user"}
+
+
+def is_deterministic_request(payload: Mapping[str, Any]) -> bool:
+    """只有温度为 0 或固定了 ``seed`` 的请求才有可复用的确定性结果。"""
+
+    if payload.get("seed") is not None:
+        return True
+    temperature = payload.get("temperature")
+    return isinstance(temperature, (int, float)) and float(temperature) == 0.0
+
+
+def resolve_cache_enabled(flag: Any) -> bool:
+    """解析单次任务上的缓存开关，未显式指定时沿用全局配置。"""
+
+    if isinstance(flag, bool):
+        return flag
+    return settings.LLM_RESPONSE_CACHE_ENABLED
+
+
+def build_cache_key(provider: "LLMProvider", payload: Mapping[str, Any]) -> str:
+    """以提供者、模型、消息与参数的规范化 JSON 计算缓存键。"""
+
+    canonical = {
+        "provider_id": provider.id,
+        "base_url": provider.base_url,
+        "payload": {
+            key: value
+            for key, value in payload.items()
+            if key not in _VOLATILE_PAYLOAD_KEYS
+        },
+    }
+    serialized = json.dumps(
+        canonical,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """确定性 LLM 响应的两级缓存：进程内 LRU 加数据库持久层。
+
+    内存层按条数做 LRU 淘汰，持久层在写入时清理过期记录并按最近访问时间裁剪
+    到上限；两层共享同一 TTL。命中持久层的记录会回填到内存层。
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int | None = None,
+        ttl_seconds: float | None = None,
+        persistent: bool | None = None,
+        max_persistent_entries: int | None = None,
+    ) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._persistent = persistent
+        self._max_persistent_entries = max_persistent_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[dict[str, Any], float | None]] = (
+            OrderedDict()
+        )
+
+    @property
+    def max_entries(self) -> int:
+        value = self._max_entries
+        return max(
+            0, value if value is not None else settings.LLM_RESPONSE_CACHE_MAX_ENTRIES
+        )
+
+    @property
+    def ttl_seconds(self) -> float | None:
+        value = (
+            self._ttl_seconds
+            if self._ttl_seconds is not None
+            else settings.LLM_RESPONSE_CACHE_TTL
+        )
+        return value if value and value > 0 else None
+
+    @property
+    def persistent(self) -> bool:
+        if self._persistent is not None:
+            return self._persistent
+        return settings.LLM_RESPONSE_CACHE_PERSISTENT
+
+    @property
+    def max_persistent_entries(self) -> int:
+        value = self._max_persistent_entries
+        return max(
+            0,
+            value
+            if value is not None
+            else settings.LLM_RESPONSE_CACHE_MAX_PERSISTENT_ENTRIES,
+        )
+
+    def _expires_at(self, now: float) -> float | None:
+        ttl = self.ttl_seconds
+        return now + ttl if ttl is not None else None
+
+    def _get_memory(self, key: str) -> dict[str, Any] | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def _set_memory(
+        self, key: str, response: dict[str, Any], expires_at: float | None
+    ) -> None:
+        limit = self.max_entries
+        if limit == 0:
+            return
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > limit:
+                self._entries.popitem(last=False)
+
+    def _get_persistent(self, key: str) -> tuple[dict[str, Any], float | None] | None:
+        from app.db import session as db_session
+        from app.models.response_cache import LLMResponseCacheEntry
+
+        session = db_session.SessionLocal()
+        try:
+            entry = session.get(LLMResponseCacheEntry, key)
+            if entry is None:
+                return None
+            now = time.time()
+            if entry.expires_at is not None and entry.expires_at <= now:
+                session.delete(entry)
+                session.commit()
+                return None
+            entry.hit_count += 1
+            entry.last_accessed_at = now
+            response, expires_at = dict(entry.response), entry.expires_at
+            session.commit()
+            return response, expires_at
+        finally:
+            session.close()
+
+    def _set_persistent(
+        self,
+        key: str,
+        response: dict[str, Any],
+        expires_at: float | None,
+        *,
+        provider_id: int | None,
+        model_name: str | None,
+    ) -> None:
+        from app.db import session as db_session
+        from app.models.response_cache import LLMResponseCacheEntry
+
+        session = db_session.SessionLocal()
+        try:
+            now = time.time()
+            entry = session.get(LLMResponseCacheEntry, key)
+            if entry is None:
+                entry = LLMResponseCacheEntry(cache_key=key, hit_count=0)
+                session.add(entry)
+            entry.provider_id = provider_id
+            entry.model_name = model_name
+            entry.response = response
+            entry.created_at = now
+            entry.last_accessed_at = now
+            entry.expires_at = expires_at
+            session.commit()
+            self._evict_persistent(session, now)
+        except IntegrityError:
+            # 并发写入同一键时保留先写入的记录即可
+            session.rollback()
+        finally:
+            session.close()
+
+    def _evict_persistent(self, session: Any, now: float) -> None:
+        from app.models.response_cache import LLMResponseCacheEntry
+
+        session.execute(
+            delete(LLMResponseCacheEntry).where(
+                LLMResponseCacheEntry.expires_at.is_not(None),
+                LLMResponseCacheEntry.expires_at <= now,
+            )
+        )
+        limit = self.max_persistent_entries
+        total = session.scalar(select(func.count(LLMResponseCacheEntry.cache_key))) or 0
+        if limit and total > limit:
+            stale_keys = session.scalars(
+                select(LLMResponseCacheEntry.cache_key)
+                .order_by(LLMResponseCacheEntry.last_accessed_at.asc())
+                .limit(total - limit)
+            ).all()
+            session.execute(
+                delete(LLMResponseCacheEntry).where(
+                    LLMResponseCacheEntry.cache_key.in_(stale_keys)
+                )
+            )
+        session.commit()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """读取缓存的响应体，未命中或已过期时返回 ``None``。"""
+
+        response = self._get_memory(key)
+        if response is not None or not self.persistent:
+            return response
+        try:
+            stored = self._get_persistent(key)
+        except Exception:  # pragma: no cover - 持久层故障时视为未命中
+            logger.exception("读取持久化响应缓存失败: %s", key)
+            return None
+        if stored is None:
+            return None
+        response, expires_at = stored
+        self._set_memory(key, response, expires_at)
+        return response
+
+    def set(
+        self,
+        key: str,
+        response: Mapping[str, Any],
+        *,
+        provider_id: int | None = None,
+        model_name: str | None = None,
+    ) -> None:
+        """写入成功的响应体，两层共享同一过期时间。"""
+
+        payload = dict(response)
+        expires_at = self._expires_at(time.time())
+        self._set_memory(key, payload, expires_at)
+        if not self.persistent:
+            return
+        try:
+            self._set_persistent(
+                key,
+                payload,
+                expires_at,
+                provider_id=provider_id,
+                model_name=model_name,
+            )
+        except Exception:  # pragma: no cover - 持久层故障不影响调用结果
+            logger.exception("写入持久化响应缓存失败: %s", key)
+
+    async def aget(self, key: str) -> dict[str, Any] | None:
+        """协程版本的读取，持久层查询放到线程池中执行。"""
+
+        response = self._get_memory(key)
+        if response is not None or not self.persistent:
+            return response
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(
+        self,
+        key: str,
+        response: Mapping[str, Any],
+        *,
+        provider_id: int | None = None,
+        model_name: str | None = None,
+    ) -> None:
+        if not self.persistent:
+            self.set(key, response, provider_id=provider_id, model_name=model_name)
+            return
+        await asyncio.to_thread(
+            self.set, key, response, provider_id=provider_id, model_name=model_name
+        )
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = LLMResponseCache()
+
+
+__all__ = [
+    "LLMResponseCache",
+    "build_cache_key",
+    "is_deterministic_request",
+    "resolve_cache_enabled",
+    "response_cache",
+]
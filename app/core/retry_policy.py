@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable, Mapping
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger("promptworks.retry_policy")
+
+DEFAULT_RETRY_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+class RetryDeadlineExceeded(Exception):
+    """整体截止时间已到，无法再发起新的尝试。"""
+
+    def __init__(self, attempts: int, last_error: BaseException | None) -> None:
+        super().__init__(f"超过整体重试截止时间，共尝试 {attempts} 次")
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+def _positive_float(value: Any) -> float | None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value) if value > 0 else None
+
+
+def _positive_int(value: Any) -> int | None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value) if value >= 1 else None
+
+
+def parse_retry_after(headers: Mapping[str, str] | None) -> float | None:
+    """解析 ``Retry-After`` 响应头，支持秒数与 HTTP 日期两种格式。"""
+
+    if not headers:
+        return None
+    raw = headers.get("retry-after") or headers.get("Retry-After")
+    if raw is None:
+        return None
+    raw = str(raw).strip()
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """LLM 调用的重试策略：指数退避加随机抖动，并遵循 ``Retry-After``。"""
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    max_retry_after: float = 60.0
+    attempt_timeout: float | None = None
+    deadline: float | None = None
+    retry_statuses: frozenset[int] = field(default=DEFAULT_RETRY_STATUSES)
+
+    @classmethod
+    def from_mapping(cls, raw: Mapping[str, Any] | None) -> "RetryPolicy":
+        """以全局配置为默认值，叠加提供者上的 ``retry_policy`` 覆盖项。"""
+
+        data = raw if isinstance(raw, Mapping) else {}
+        statuses = data.get("retry_statuses")
+        retry_statuses = (
+            frozenset(int(item) for item in statuses if isinstance(item, int))
+            if isinstance(statuses, (list, tuple, set, frozenset))
+            else DEFAULT_RETRY_STATUSES
+        )
+        return cls(
+            max_attempts=_positive_int(data.get("max_attempts"))
+            or settings.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=_positive_float(data.get("base_delay"))
+            or settings.LLM_RETRY_BASE_DELAY,
+            max_delay=_positive_float(data.get("max_delay"))
+            or settings.LLM_RETRY_MAX_DELAY,
+            multiplier=_positive_float(data.get("multiplier")) or 2.0,
+            max_retry_after=_positive_float(data.get("max_retry_after"))
+            or settings.LLM_RETRY_MAX_RETRY_AFTER,
+            attempt_timeout=_positive_float(data.get("attempt_timeout")),
+            deadline=_positive_float(data.get("deadline")),
+            retry_statuses=retry_statuses,
+        )
+
+    def backoff_delay(
+        self, attempt: int, retry_after: float | None = None
+    ) -> float | None:
+        """计算第 ``attempt`` 次失败后的等待时间（全抖动指数退避）。
+
+        服务端要求的 ``Retry-After`` 超过 ``max_retry_after`` 时返回 ``None``，
+        本次调用不再重试，避免单次调用被无限期挂起。
+        """
+
+        if retry_after is not None and retry_after > self.max_retry_after:
+            return None
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def should_retry_status(self, status_code: int) -> bool:
+        return status_code in self.retry_statuses
+
+
+@dataclass
+class RetryOutcome:
+    response: httpx.Response
+    attempts: int
+
+
+class _RetryState:
+    """记录一次带重试调用的进度，供同步与协程实现共享判断逻辑。"""
+
+    def __init__(self, policy: RetryPolicy, default_timeout: float) -> None:
+        self.policy = policy
+        self.default_timeout = default_timeout
+        self.started = time.monotonic()
+        self.attempts = 0
+        self.last_error: BaseException | None = None
+
+    def remaining(self) -> float | None:
+        if self.policy.deadline is None:
+            return None
+        return self.policy.deadline - (time.monotonic() - self.started)
+
+    def next_timeout(self) -> float:
+        timeout = self.policy.attempt_timeout or self.default_timeout
+        remaining = self.remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise RetryDeadlineExceeded(self.attempts, self.last_error)
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def delay_before_retry(
+        self, response: httpx.Response | None, error: BaseException | None
+    ) -> float | None:
+        """返回下一次尝试前需要等待的秒数，``None`` 表示不再重试。"""
+
+        if self.attempts >= self.policy.max_attempts:
+            return None
+        if response is not None:
+            if not self.policy.should_retry_status(response.status_code):
+                return None
+            retry_after = parse_retry_after(getattr(response, "headers", None))
+        elif isinstance(error, httpx.TransportError):
+            retry_after = None
+        else:
+            return None
+        delay = self.policy.backoff_delay(self.attempts, retry_after)
+        if delay is None:
+            logger.warning(
+                "LLM 调用第 %s 次失败，服务端要求等待 %.0fs，超过上限 %.0fs，不再重试",
+                self.attempts,
+                retry_after,
+                self.policy.max_retry_after,
+            )
+            return None
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        logger.info(
+            "LLM 调用第 %s 次失败（%s），%.2fs 后重试",
+            self.attempts,
+            response.status_code if response is not None else error,
+            delay,
+        )
+        return delay
+
+
+def call_with_retry(
+    send: Callable[[float], httpx.Response],
+    *,
+    policy: RetryPolicy,
+    default_timeout: float,
+    sleep: Callable[[float], None] | None = None,
+) -> RetryOutcome:
+    """按策略重复执行 ``send``，返回最后一次响应以及总尝试次数。
+
+    ``send`` 接收本次尝试可用的超时时间；网络层异常在重试耗尽后原样抛出。
+    """
+
+    state = _RetryState(policy, default_timeout)
+    while True:
+        timeout = state.next_timeout()
+        state.attempts += 1
+        response: httpx.Response | None = None
+        try:
+            response = send(timeout)
+        except httpx.TransportError as exc:
+            state.last_error = exc
+            delay = state.delay_before_retry(None, exc)
+            if delay is None:
+                raise
+        else:
+            delay = state.delay_before_retry(response, None)
+            if delay is None:
+                return RetryOutcome(response=response, attempts=state.attempts)
+        (sleep or time.sleep)(delay)
+
+
+async def acall_with_retry(
+    send: Callable[[float], Awaitable[httpx.Response]],
+    *,
+    policy: RetryPolicy,
+    default_timeout: float,
+) -> RetryOutcome:
+    """``call_with_retry`` 的协程版本，等待期间让出事件循环。"""
+
+    state = _RetryState(policy, default_timeout)
+    while True:
+        timeout = state.next_timeout()
+        state.attempts += 1
+        response: httpx.Response | None = None
+        try:
+            response = await send(timeout)
+        except httpx.TransportError as exc:
+            state.last_error = exc
+            delay = state.delay_before_retry(None, exc)
+            if delay is None:
+                raise
+        else:
+            delay = state.delay_before_retry(response, None)
+            if delay is None:
+                return RetryOutcome(response=response, attempts=state.attempts)
+        await asyncio.sleep(delay)
+
+
+__all__ = [
+    "DEFAULT_RETRY_STATUSES",
+    "RetryDeadlineExceeded",
+    "RetryOutcome",
+    "RetryPolicy",
+    "acall_with_retry",
+    "call_with_retry",
+    "parse_retry_after",
+]
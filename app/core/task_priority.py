@@ -0,0 +1,49 @@
+"""执行队列的优先级策略。
+
+优先级数值越小越先执行。任务可显式指定优先级，未指定时按预估调用次数自动
+划分：少量调用的交互式任务优先，大批量回归任务靠后。排队时间每经过
+``TASK_PRIORITY_AGING_SECONDS`` 秒，有效优先级提升一级，低优先级任务不会被
+持续到来的交互式任务无限期推迟。
+"""
+
+from __future__ import annotations
+
+from app.core.config import settings
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BATCH = 2
+MAX_PRIORITY = 9
+
+
+def resolve_priority(explicit: int | None, estimated_runs: int | None = None) -> int:
+    """返回任务的基础优先级，显式指定的值优先于按调用量推导的值。"""
+
+    if explicit is not None:
+        return min(MAX_PRIORITY, max(0, int(explicit)))
+    if estimated_runs is None:
+        return PRIORITY_NORMAL
+    if estimated_runs <= settings.TASK_PRIORITY_INTERACTIVE_MAX_RUNS:
+        return PRIORITY_INTERACTIVE
+    if estimated_runs >= settings.TASK_PRIORITY_BATCH_MIN_RUNS:
+        return PRIORITY_BATCH
+    return PRIORITY_NORMAL
+
+
+def effective_priority(priority: int, waited_seconds: float) -> int:
+    """按排队时长老化后的有效优先级。"""
+
+    aging = settings.TASK_PRIORITY_AGING_SECONDS
+    if aging <= 0 or waited_seconds <= 0:
+        return priority
+    return max(0, priority - int(waited_seconds // aging))
+
+
+__all__ = [
+    "MAX_PRIORITY",
+    "PRIORITY_BATCH",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_NORMAL",
+    "effective_priority",
+    "resolve_priority",
+]
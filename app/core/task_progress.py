@@ -0,0 +1,305 @@
+"""Prompt 测试任务的执行进度存储与事件推送。
+
+执行线程只更新进程内的进度快照，进度每跨过一个百分比步长才通过独立的短会话
+写入 ``prompt_test_task_progress`` 表，既不改写任务配置，也不提交执行线程的
+会话。同一进程内的订阅者（SSE 连接）实时收到进度、每轮调用完成与任务结束事件；
+由独立 worker 或 Celery 节点执行的任务，订阅端通过定期读取进度表获得进度。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.db import session as db_session
+from app.models.prompt_test import PromptTestTaskProgress
+
+logger = logging.getLogger("promptworks.task_progress")
+
+PROGRESS_EVENT = "progress"
+ROUND_EVENT = "round"
+STATUS_EVENT = "status"
+
+# 单个订阅者积压的事件上限，消费过慢时丢弃新事件，进度仍可由后续快照补齐
+_SUBSCRIBER_BACKLOG = 1000
+
+
+def calculate_percentage(current: int, total: int) -> int:
+    """按完成数计算进度百分比，向上取整并限制在 0-100。"""
+
+    ratio = current / total if total else 0
+    return min(100, max(0, math.ceil(ratio * 100)))
+
+
+@dataclass(frozen=True)
+class ProgressSnapshot:
+    """某一时刻的任务进度。"""
+
+    task_id: int
+    current: int
+    total: int
+    percentage: int
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "task_id": self.task_id,
+            "current": self.current,
+            "total": self.total,
+            "percentage": self.percentage,
+        }
+
+    @classmethod
+    def from_record(cls, record: PromptTestTaskProgress) -> "ProgressSnapshot":
+        return cls(
+            task_id=record.task_id,
+            current=record.current,
+            total=record.total,
+            percentage=record.percentage,
+        )
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """推送给订阅者的事件，``event`` 对应 SSE 的事件名。"""
+
+    event: str
+    data: dict[str, Any]
+
+
+class ProgressSubscription:
+    """单个订阅者的事件队列，事件由执行线程投递到订阅者所在的事件循环。"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._queue: asyncio.Queue[ProgressEvent] = asyncio.Queue(
+            maxsize=_SUBSCRIBER_BACKLOG
+        )
+
+    def deliver(self, event: ProgressEvent) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # 订阅者的事件循环已关闭，连接即将释放
+            pass
+
+    def _put(self, event: ProgressEvent) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.debug("进度订阅者积压过多，丢弃事件 %s", event.event)
+
+    async def next(self, timeout: float) -> ProgressEvent | None:
+        """等待下一条事件，超时返回 ``None``。"""
+
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TaskProgressStore:
+    """维护执行中任务的进度快照，按步长持久化并向订阅者广播事件。"""
+
+    def __init__(self, step_percent: int = 5) -> None:
+        self._step = max(1, step_percent)
+        self._lock = threading.Lock()
+        self._snapshots: dict[int, ProgressSnapshot] = {}
+        self._persisted: dict[int, ProgressSnapshot] = {}
+        self._subscribers: dict[int, set[ProgressSubscription]] = {}
+
+    def start(
+        self, task_id: int, total: int, current: int = 0, *, persist: bool = True
+    ) -> ProgressSnapshot:
+        """开始追踪任务进度并立即写入进度表，``persist`` 为假表示进度取自进度表。"""
+
+        total = max(1, int(total or 1))
+        current = min(total, max(0, int(current)))
+        snapshot = ProgressSnapshot(
+            task_id, current, total, calculate_percentage(current, total)
+        )
+        with self._lock:
+            self._snapshots[task_id] = snapshot
+            self._persisted[task_id] = snapshot
+        if persist:
+            self._persist(snapshot)
+        self._publish(task_id, PROGRESS_EVENT, snapshot.as_dict())
+        return snapshot
+
+    def advance(
+        self, task_id: int, amount: int, *, persist: bool = False
+    ) -> ProgressSnapshot | None:
+        """累加完成数；跨过百分比步长、全部完成或 ``persist`` 为真时写入进度表。
+
+        同一任务的进度只应由一个线程推进，持久化在锁外进行，避免阻塞其他任务。
+        """
+
+        if amount <= 0:
+            return None
+        with self._lock:
+            previous = self._snapshots.get(task_id)
+            if previous is None:
+                return None
+            current = min(previous.total, previous.current + amount)
+            snapshot = replace(
+                previous,
+                current=current,
+                percentage=calculate_percentage(current, previous.total),
+            )
+            self._snapshots[task_id] = snapshot
+            persisted = self._persisted.get(task_id)
+            due = (
+                persist
+                or persisted is None
+                or current >= snapshot.total
+                or snapshot.percentage // self._step
+                > persisted.percentage // self._step
+            )
+            if due:
+                self._persisted[task_id] = snapshot
+        if due:
+            self._persist(snapshot)
+        self._publish(task_id, PROGRESS_EVENT, snapshot.as_dict())
+        return snapshot
+
+    def complete(self, task_id: int) -> ProgressSnapshot | None:
+        """将进度置为 100% 并写入进度表，已写入相同进度时不再重复写入。"""
+
+        with self._lock:
+            previous = self._snapshots.get(task_id)
+            if previous is None:
+                return None
+            snapshot = replace(previous, current=previous.total, percentage=100)
+            self._snapshots[task_id] = snapshot
+            due = self._persisted.get(task_id) != snapshot
+            self._persisted[task_id] = snapshot
+        if due:
+            self._persist(snapshot)
+            self._publish(task_id, PROGRESS_EVENT, snapshot.as_dict())
+        return snapshot
+
+    def add_shared(
+        self, session: Session, task_id: int, amount: int
+    ) -> ProgressSnapshot | None:
+        """在调用方会话中锁定进度行并累加完成数，供多个节点共同执行同一任务时使用。
+
+        由调用方提交事务。
+        """
+
+        record = session.scalar(
+            select(PromptTestTaskProgress)
+            .where(PromptTestTaskProgress.task_id == task_id)
+            .with_for_update()
+        )
+        if record is None or amount <= 0:
+            return None
+        record.current = min(record.total, record.current + amount)
+        record.percentage = calculate_percentage(record.current, record.total)
+        session.flush()
+        snapshot = ProgressSnapshot.from_record(record)
+        with self._lock:
+            if task_id in self._snapshots:
+                self._snapshots[task_id] = snapshot
+                self._persisted[task_id] = snapshot
+        self._publish(task_id, PROGRESS_EVENT, snapshot.as_dict())
+        return snapshot
+
+    def publish_round(self, task_id: int, payload: dict[str, Any]) -> None:
+        """广播单轮调用完成事件，仅推送给订阅者，不做持久化。"""
+
+        self._publish(task_id, ROUND_EVENT, payload)
+
+    def close(self, task_id: int, status: str) -> None:
+        """广播任务结束事件并释放内存中的进度快照，此后读取进度回退到进度表。"""
+
+        with self._lock:
+            self._snapshots.pop(task_id, None)
+            self._persisted.pop(task_id, None)
+        self._publish(task_id, STATUS_EVENT, {"task_id": task_id, "status": status})
+
+    def get(
+        self, task_id: int, session: Session | None = None
+    ) -> ProgressSnapshot | None:
+        """返回任务的最新进度，本进程未在执行该任务时读取进度表。"""
+
+        with self._lock:
+            snapshot = self._snapshots.get(task_id)
+        if snapshot is not None:
+            return snapshot
+        if session is not None:
+            record = session.get(PromptTestTaskProgress, task_id)
+            return ProgressSnapshot.from_record(record) if record else None
+        owned = db_session.SessionLocal()
+        try:
+            record = owned.get(PromptTestTaskProgress, task_id)
+            return ProgressSnapshot.from_record(record) if record else None
+        finally:
+            owned.close()
+
+    @contextmanager
+    def subscribe(self, task_id: int) -> Iterator[ProgressSubscription]:
+        """在当前事件循环中订阅任务事件，退出上下文时取消订阅。"""
+
+        subscription = ProgressSubscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(task_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(task_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        self._subscribers.pop(task_id, None)
+
+    def _publish(self, task_id: int, event: str, data: dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(task_id, ()))
+        if not subscribers:
+            return
+        message = ProgressEvent(event, data)
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def _persist(self, snapshot: ProgressSnapshot) -> None:
+        session = db_session.SessionLocal()
+        try:
+            record = session.get(PromptTestTaskProgress, snapshot.task_id)
+            if record is None:
+                record = PromptTestTaskProgress(task_id=snapshot.task_id)
+                session.add(record)
+            record.current = snapshot.current
+            record.total = snapshot.total
+            record.percentage = snapshot.percentage
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            logger.exception("写入 Prompt 测试任务 %s 的进度失败", snapshot.task_id)
+        finally:
+            session.close()
+
+
+progress_store = TaskProgressStore()
+
+
+__all__ = [
+    "PROGRESS_EVENT",
+    "ROUND_EVENT",
+    "STATUS_EVENT",
+    "ProgressEvent",
+    "ProgressSnapshot",
+    "ProgressSubscription",
+    "TaskProgressStore",
+    "calculate_percentage",
+    "progress_store",
+]
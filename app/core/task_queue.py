@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import logging
-import threading
-import time
-from queue import Empty, Queue
 
+from app.core.config import settings
+from app.core.fair_queue import FairTaskQueue
+from app.core.job_queue import enqueue_job
+from app.core.task_priority import resolve_priority
 from app.db import session as db_session
+from app.models.task_job import TaskJobKind
 from app.models.test_run import TestRun, TestRunStatus
 from app.services.test_run import TestRunExecutionError, execute_test_run
 
@@ -13,35 +15,18 @@ from app.services.test_run import TestRunExecutionError, execute_test_run
 logger = logging.getLogger("promptworks.task_queue")
 
 
-class TestRunTaskQueue:
-    """简单的内存消息队列，用于串行执行测试任务。"""
+class TestRunTaskQueue(FairTaskQueue):
+    """内存消息队列，由多个工作线程按所属用户公平地执行测试任务。"""
 
-    def __init__(self) -> None:
-        self._queue: Queue[int] = Queue()
-        self._worker = threading.Thread(
-            target=self._worker_loop, name="test-run-queue", daemon=True
-        )
-        self._worker.start()
-
-    def enqueue(self, test_run_id: int) -> None:
-        """将测试任务加入待执行队列。"""
-
-        self._queue.put_nowait(test_run_id)
-        logger.info("测试任务 %s 已加入执行队列", test_run_id)
-
-    def _worker_loop(self) -> None:
-        while True:
-            try:
-                test_run_id = self._queue.get()
-            except Empty:  # pragma: no cover - Queue.get 默认阻塞，不会出现
-                continue
+    task_label = "测试任务"
+    job_kind = TaskJobKind.TEST_RUN
 
-            try:
-                self._execute_task(test_run_id)
-            except Exception:  # pragma: no cover - 防御性兜底
-                logger.exception("执行测试任务 %s 过程中发生未捕获异常", test_run_id)
-            finally:
-                self._queue.task_done()
+    def __init__(self, worker_count: int | None = None) -> None:
+        super().__init__(
+            name="test-run-queue",
+            worker_count=worker_count or settings.TEST_RUN_QUEUE_WORKERS,
+            logger=logger,
+        )
 
     def _execute_task(self, test_run_id: int) -> None:
         session = db_session.SessionLocal()
@@ -51,11 +36,10 @@ class TestRunTaskQueue:
                 logger.warning("测试任务 %s 不存在，跳过执行", test_run_id)
                 return
 
-            nested_txn = session.begin_nested()
             try:
                 execute_test_run(session, test_run)
             except TestRunExecutionError as exc:
-                nested_txn.rollback()
+                # 校验失败发生在状态提交之前，尚未写库，丢弃内存中的改动即可
                 session.expire(test_run)
 
                 failed_run = session.get(TestRun, test_run_id)
@@ -69,9 +53,8 @@ class TestRunTaskQueue:
 
                 logger.warning("测试任务 %s 执行失败: %s", test_run_id, exc)
                 return
-            except Exception as exc:  # pragma: no cover - 防御性兜底
-                nested_txn.rollback()
-                session.expire_all()
+            except Exception:  # pragma: no cover - 防御性兜底
+                session.rollback()
 
                 failed_run = session.get(TestRun, test_run_id)
                 if failed_run:
@@ -82,34 +65,44 @@ class TestRunTaskQueue:
                 logger.exception("测试任务 %s 执行出现未知异常", test_run_id)
                 return
             else:
-                nested_txn.commit()
                 session.commit()
                 logger.info("测试任务 %s 执行完成", test_run_id)
         finally:
             session.close()
 
-    def wait_for_idle(self, timeout: float | None = None) -> bool:
-        """等待队列清空，供测试或调试使用。"""
 
-        if timeout is None:
-            self._queue.join()
-            return True
+task_queue = TestRunTaskQueue()
+
 
-        deadline = time.monotonic() + timeout
-        while time.monotonic() < deadline:
-            if self._queue.unfinished_tasks == 0:
-                return True
-            time.sleep(0.02)
-        return self._queue.unfinished_tasks == 0
+def priority_for_test_run(test_run: TestRun) -> int:
+    """测试任务的执行优先级，未显式指定时按重复次数推导。"""
 
+    return resolve_priority(test_run.priority, test_run.repetitions)
 
-task_queue = TestRunTaskQueue()
 
+def enqueue_test_run(
+    test_run_id: int, owner_id: int | None = None, priority: int | None = None
+) -> None:
+    """对外暴露的入队方法，``owner_id`` 用于在不同用户之间公平调度。
 
-def enqueue_test_run(test_run_id: int) -> None:
-    """对外暴露的入队方法。"""
+    ``priority`` 通常由 ``priority_for_test_run`` 计算，数值越小越先执行。
 
-    task_queue.enqueue(test_run_id)
+    ``TASK_QUEUE_BACKEND`` 为 ``database`` 时写入持久化队列，由独立 worker 执行；
+    为 ``celery`` 时投递到消息队列，由任意 Celery 节点执行。
+    """
+
+    resolved = resolve_priority(priority)
+    if settings.TASK_QUEUE_BACKEND == "database":
+        enqueue_job(TaskJobKind.TEST_RUN, test_run_id, owner_id, resolved)
+        return
+    if settings.TASK_QUEUE_BACKEND == "celery":
+        from app.core.celery_tasks import celery_priority, run_test_run
+
+        run_test_run.apply_async(
+            args=[test_run_id], priority=celery_priority(resolved)
+        )
+        return
+    task_queue.enqueue(test_run_id, owner_id, resolved)
 
 
-__all__ = ["enqueue_test_run", "task_queue"]
+__all__ = ["enqueue_test_run", "priority_for_test_run", "task_queue"]
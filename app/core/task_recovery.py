@@ -0,0 +1,408 @@
+"""孤立任务的恢复。
+
+进程在执行途中退出后，测试任务会停留在执行中或排队状态。各进程通过
+``task_liveness`` 定期在 ``task_heartbeats`` 表中刷新自己持有（排队或执行中）
+的任务的心跳；恢复流程将任务更新时间与心跳均超过租约时长、且没有持久化队列
+记录的执行中或排队任务视为孤立任务，重新入队并从已持久化的进度继续执行。
+
+心跳单独成表而不写任务行：执行方提交状态时会锁定任务行，心跳若也更新任务行，
+会与执行方互相等待，刷新超时后任务又被误判为孤立而重复执行。
+
+恢复时以任务的状态、``updated_at`` 以及心跳未再刷新作为比较并交换的条件，
+多个进程同时执行恢复也只会有一个进程重新入队同一任务。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.job_queue import default_holder
+from app.core.task_priority import resolve_priority
+from app.db import session as db_session
+from app.models.prompt import Prompt, PromptVersion
+from app.models.prompt_test import PromptTestTask, PromptTestTaskStatus
+from app.models.task_heartbeat import TaskHeartbeat
+from app.models.task_job import TaskJob, TaskJobKind, TaskJobStatus
+from app.models.test_run import TestRun, TestRunStatus
+
+logger = logging.getLogger("promptworks.task_recovery")
+
+_TARGET_MODELS = {
+    TaskJobKind.TEST_RUN: TestRun,
+    TaskJobKind.PROMPT_TEST_TASK: PromptTestTask,
+}
+
+
+class TaskLiveness:
+    """登记本进程持有的任务，并定期在 ``task_heartbeats`` 中刷新存活心跳。"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._held: Counter[tuple[TaskJobKind, int]] = Counter()
+        self._heartbeat: threading.Thread | None = None
+
+    def add(self, kind: TaskJobKind, target_id: int) -> None:
+        with self._lock:
+            self._held[(kind, target_id)] += 1
+            if self._heartbeat is None and settings.TASK_JOB_HEARTBEAT_INTERVAL > 0:
+                self._heartbeat = threading.Thread(
+                    target=self._heartbeat_loop, name="task-liveness", daemon=True
+                )
+                self._heartbeat.start()
+
+    def remove(self, kind: TaskJobKind, target_id: int) -> None:
+        with self._lock:
+            key = (kind, target_id)
+            self._held[key] -= 1
+            if self._held[key] <= 0:
+                del self._held[key]
+
+    @contextmanager
+    def hold(self, kind: TaskJobKind, target_id: int) -> Iterator[None]:
+        self.add(kind, target_id)
+        try:
+            yield
+        finally:
+            self.remove(kind, target_id)
+
+    def is_held(self, kind: TaskJobKind, target_id: int) -> bool:
+        with self._lock:
+            return (kind, target_id) in self._held
+
+    def touch(self) -> None:
+        """刷新本进程持有的全部任务的心跳。
+
+        每种任务类型在独立的短事务中写入，且只写心跳表，不会等待执行方持有的
+        任务行锁。
+        """
+
+        with self._lock:
+            held = sorted(self._held, key=lambda item: (item[0].value, item[1]))
+        if not held:
+            return
+
+        holder = default_holder()
+        session = db_session.SessionLocal()
+        try:
+            for kind in _TARGET_MODELS:
+                ids = [target_id for item_kind, target_id in held if item_kind == kind]
+                if ids:
+                    _write_heartbeats(session, kind, ids, holder)
+        finally:
+            session.close()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(settings.TASK_JOB_HEARTBEAT_INTERVAL)
+            try:
+                self.touch()
+            except Exception:  # pragma: no cover - 下一次心跳重试
+                logger.exception("刷新任务存活心跳失败")
+
+
+def _write_heartbeats(
+    session, kind: TaskJobKind, ids: list[int], holder: str
+) -> None:
+    now = datetime.now(timezone.utc)
+    condition = (TaskHeartbeat.kind == kind.value, TaskHeartbeat.target_id.in_(ids))
+    session.execute(
+        update(TaskHeartbeat)
+        .where(*condition)
+        .values(heartbeat_at=now, holder=holder)
+        .execution_options(synchronize_session=False)
+    )
+    existing = set(session.scalars(select(TaskHeartbeat.target_id).where(*condition)))
+    session.add_all(
+        TaskHeartbeat(kind=kind.value, target_id=target_id, holder=holder, heartbeat_at=now)
+        for target_id in ids
+        if target_id not in existing
+    )
+    try:
+        session.commit()
+    except IntegrityError:
+        # 其他进程同时为同一任务插入了心跳，下一次心跳会改为更新该行
+        session.rollback()
+
+
+task_liveness = TaskLiveness()
+
+
+@dataclass
+class RecoveryReport:
+    """一次恢复的结果，元素为 ``(任务类型, 任务 ID)``。"""
+
+    requeued: list[tuple[TaskJobKind, int]] = field(default_factory=list)
+    failed: list[tuple[TaskJobKind, int]] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class _Candidate:
+    kind: TaskJobKind
+    target_id: int
+    status: str
+    updated_at: datetime
+    payload: dict[str, Any] | None
+    owner_id: int | None
+    priority: int | None
+    estimated_runs: int | None = None
+    heartbeat_at: datetime | None = None
+
+    @property
+    def last_seen(self) -> datetime:
+        updated_at = _as_utc(self.updated_at)
+        if self.heartbeat_at is None:
+            return updated_at
+        return max(updated_at, _as_utc(self.heartbeat_at))
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _load_candidates(session) -> list[_Candidate]:
+    test_runs = session.execute(
+        select(
+            TestRun.id,
+            TestRun.status,
+            TestRun.updated_at,
+            TestRun.schema,
+            Prompt.owner_id,
+            TestRun.priority,
+            TestRun.repetitions,
+        )
+        .join(PromptVersion, TestRun.prompt_version_id == PromptVersion.id)
+        .join(Prompt, PromptVersion.prompt_id == Prompt.id)
+        .where(TestRun.status.in_([TestRunStatus.PENDING, TestRunStatus.RUNNING]))
+    ).all()
+    tasks = session.execute(
+        select(
+            PromptTestTask.id,
+            PromptTestTask.status,
+            PromptTestTask.updated_at,
+            PromptTestTask.config,
+            PromptTestTask.owner_id,
+            PromptTestTask.priority,
+        ).where(
+            PromptTestTask.status.in_(
+                [PromptTestTaskStatus.READY, PromptTestTaskStatus.RUNNING]
+            ),
+            PromptTestTask.is_deleted.is_(False),
+        )
+    ).all()
+    heartbeats = {
+        (TaskJobKind(kind), target_id): heartbeat_at
+        for kind, target_id, heartbeat_at in session.execute(
+            select(
+                TaskHeartbeat.kind, TaskHeartbeat.target_id, TaskHeartbeat.heartbeat_at
+            )
+        )
+    }
+    candidates = [_Candidate(TaskJobKind.TEST_RUN, *row) for row in test_runs] + [
+        _Candidate(TaskJobKind.PROMPT_TEST_TASK, *row) for row in tasks
+    ]
+    return [
+        replace(
+            candidate,
+            heartbeat_at=heartbeats.get((candidate.kind, candidate.target_id)),
+        )
+        for candidate in candidates
+    ]
+
+
+def _purge_heartbeats(session, cutoff: datetime) -> None:
+    """删除早于截止时间的心跳，持有进程已退出或任务已结束。"""
+
+    session.execute(delete(TaskHeartbeat).where(TaskHeartbeat.heartbeat_at < cutoff))
+    session.commit()
+
+
+def _queued_in_job_table(session) -> set[tuple[TaskJobKind, int]]:
+    rows = session.execute(
+        select(TaskJob.kind, TaskJob.target_id).where(
+            TaskJob.status.in_([TaskJobStatus.QUEUED, TaskJobStatus.RUNNING])
+        )
+    ).all()
+    return {(TaskJobKind(kind), target_id) for kind, target_id in rows}
+
+
+def _claim(
+    session,
+    candidate: _Candidate,
+    *,
+    status: str,
+    payload: dict[str, Any],
+) -> bool:
+    """以原状态与更新时间为条件改写任务，返回本进程是否抢到恢复权。"""
+
+    model = _TARGET_MODELS[candidate.kind]
+    payload_column = (
+        model.schema if candidate.kind == TaskJobKind.TEST_RUN else model.config
+    )
+    # 读取候选任务之后有进程刷新了心跳，说明任务仍被持有
+    refreshed = exists().where(
+        TaskHeartbeat.kind == candidate.kind.value,
+        TaskHeartbeat.target_id == candidate.target_id,
+    )
+    if candidate.heartbeat_at is not None:
+        refreshed = refreshed.where(TaskHeartbeat.heartbeat_at > candidate.heartbeat_at)
+    result = session.execute(
+        update(model)
+        .where(
+            model.id == candidate.target_id,
+            model.status == candidate.status,
+            # 其他进程抢先恢复后更新时间会变大，条件不再成立
+            model.updated_at <= candidate.updated_at,
+            ~refreshed,
+        )
+        .values(
+            {
+                model.status: status,
+                payload_column: payload,
+                model.updated_at: datetime.now(timezone.utc),
+            }
+        )
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def _enqueuers() -> dict[TaskJobKind, Callable[..., None]]:
+    # 队列模块依赖本模块登记存活心跳，此处延迟导入以避免循环依赖
+    from app.core.prompt_test_task_queue import enqueue_prompt_test_task
+    from app.core.task_queue import enqueue_test_run
+
+    return {
+        TaskJobKind.TEST_RUN: enqueue_test_run,
+        TaskJobKind.PROMPT_TEST_TASK: enqueue_prompt_test_task,
+    }
+
+
+def recover_orphaned_tasks(
+    *, stale_after: float | None = None, max_attempts: int | None = None
+) -> RecoveryReport:
+    """重新入队孤立的测试任务，多次恢复仍未完成的任务标记为失败。
+
+    测试任务会跳过已写入结果的轮次，Prompt 测试任务会跳过已有完成实验的
+    最小测试单元，因此恢复后从最近一次持久化的进度继续执行。使用 Celery 时
+    由消息代理在 worker 异常退出后重新投递，不在此处处理。
+    """
+
+    report = RecoveryReport()
+    if settings.TASK_QUEUE_BACKEND == "celery":
+        return report
+
+    threshold = timedelta(seconds=float(stale_after or settings.TASK_JOB_LEASE_SECONDS))
+    attempts_limit = int(max_attempts or settings.TASK_JOB_MAX_ATTEMPTS)
+    now = datetime.now(timezone.utc)
+    enqueuers = _enqueuers()
+
+    session = db_session.SessionLocal()
+    try:
+        candidates = _load_candidates(session)
+        tracked_jobs = _queued_in_job_table(session)
+        for candidate in candidates:
+            key = (candidate.kind, candidate.target_id)
+            if task_liveness.is_held(*key) or key in tracked_jobs:
+                continue
+            if now - candidate.last_seen < threshold:
+                continue
+
+            payload = dict(candidate.payload or {})
+            attempts = int(payload.get("recovery_attempts") or 0) + 1
+            payload["recovery_attempts"] = attempts
+            if attempts > attempts_limit:
+                payload["last_error"] = (
+                    f"任务执行进程多次异常退出，已恢复 {attempts - 1} 次，放弃执行"
+                )
+                failed_status = (
+                    TestRunStatus.FAILED
+                    if candidate.kind == TaskJobKind.TEST_RUN
+                    else PromptTestTaskStatus.FAILED
+                )
+                if _claim(session, candidate, status=failed_status, payload=payload):
+                    report.failed.append(key)
+                    logger.warning(
+                        "%s %s 多次恢复仍未完成，标记为失败",
+                        candidate.kind.value,
+                        candidate.target_id,
+                    )
+                continue
+
+            pending_status = (
+                TestRunStatus.PENDING
+                if candidate.kind == TaskJobKind.TEST_RUN
+                else PromptTestTaskStatus.READY
+            )
+            if not _claim(session, candidate, status=pending_status, payload=payload):
+                continue
+            enqueuers[candidate.kind](
+                candidate.target_id,
+                candidate.owner_id,
+                priority=resolve_priority(
+                    candidate.priority, candidate.estimated_runs
+                ),
+            )
+            report.requeued.append(key)
+            logger.info(
+                "恢复孤立任务 %s %s（原状态 %s，第 %s 次恢复）",
+                candidate.kind.value,
+                candidate.target_id,
+                candidate.status,
+                attempts,
+            )
+        _purge_heartbeats(session, now - threshold)
+    finally:
+        session.close()
+    return report
+
+
+class RecoveryLoop:
+    """启动时执行一次恢复，之后按租约时长定期检查。"""
+
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="task-recovery", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                recover_orphaned_tasks()
+            except Exception:  # pragma: no cover - 下一轮重试
+                logger.exception("恢复孤立任务失败")
+            if self._stop.wait(settings.TASK_JOB_LEASE_SECONDS):
+                return
+
+
+__all__ = [
+    "RecoveryLoop",
+    "RecoveryReport",
+    "TaskLiveness",
+    "recover_orphaned_tasks",
+    "task_liveness",
+]
@@ -2,10 +2,22 @@
 
 from __future__ import annotations
 
-from sqlalchemy import JSON
+import json
+import zlib
+from typing import Any
+
+from sqlalchemy import JSON, LargeBinary
+from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.types import TypeDecorator
 
+# Header bytes prefixed to values stored by ``CompressedJSON``. Legacy rows
+# written as plain JSON text never start with either byte.
+JSON_HEADER_RAW = b"\x00"
+JSON_HEADER_ZLIB = b"\x01"
+
+DEFAULT_COMPRESSION_THRESHOLD = 512
+
 
 class JSONBCompat(TypeDecorator):
     """Use PostgreSQL JSONB when available, fallback to generic JSON otherwise."""
@@ -17,3 +29,75 @@ class JSONBCompat(TypeDecorator):
         if dialect.name == "postgresql":
             return dialect.type_descriptor(JSONB())
         return dialect.type_descriptor(JSON())
+
+
+def encode_json(
+    value: Any, threshold: int = DEFAULT_COMPRESSION_THRESHOLD, level: int = 6
+) -> bytes:
+    """Serialize ``value`` and zlib-compress it once it reaches ``threshold`` bytes."""
+
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) >= threshold:
+        compressed = zlib.compress(raw, level)
+        if len(compressed) < len(raw):
+            return JSON_HEADER_ZLIB + compressed
+    return JSON_HEADER_RAW + raw
+
+
+def decode_json(value: bytes | bytearray | memoryview | str) -> Any:
+    """Decode a stored value, accepting header-prefixed bytes and legacy JSON text."""
+
+    if isinstance(value, str):
+        return json.loads(value)
+    data = bytes(value)
+    if data[:1] == JSON_HEADER_ZLIB:
+        return json.loads(zlib.decompress(data[1:]).decode("utf-8"))
+    if data[:1] == JSON_HEADER_RAW:
+        data = data[1:]
+    return json.loads(data.decode("utf-8"))
+
+
+class CompressedJSON(TypeDecorator):
+    """JSON stored as compressed bytes for large, rarely queried columns.
+
+    PostgreSQL keeps JSONB because TOAST already compresses large values there.
+    Other dialects store a one-byte header followed by either plain or
+    zlib-compressed UTF-8 JSON; rows written before the column was converted
+    carry no header and are read as plain JSON text.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(
+        self, threshold: int = DEFAULT_COMPRESSION_THRESHOLD, level: int = 6
+    ) -> None:
+        super().__init__()
+        self.threshold = threshold
+        self.level = level
+
+    def load_dialect_impl(self, dialect):  # type: ignore[override]
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB(none_as_null=True))
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(LONGBLOB())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value, dialect):  # type: ignore[override]
+        if value is None or dialect.name == "postgresql":
+            return value
+        return encode_json(value, self.threshold, self.level)
+
+    def process_result_value(self, value, dialect):  # type: ignore[override]
+        if value is None or dialect.name == "postgresql":
+            return value
+        return decode_json(value)
+
+
+__all__ = [
+    "CompressedJSON",
+    "DEFAULT_COMPRESSION_THRESHOLD",
+    "JSONBCompat",
+    "decode_json",
+    "encode_json",
+]
@@ -1,3 +1,6 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -6,6 +9,20 @@ from app.core.config import settings
 from app.core.logging_config import configure_logging, get_logger
 from app.core.middleware import RequestLoggingMiddleware
 from app.core.task_queue import task_queue as _test_run_task_queue  # noqa: F401 - 确保队列初始化
+from app.core.task_recovery import RecoveryLoop
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    """应用启动时恢复上次进程退出后遗留的任务，关闭时停止定期检查。"""
+
+    recovery_loop = RecoveryLoop()
+    if settings.TASK_RECOVERY_ENABLED:
+        recovery_loop.start()
+    try:
+        yield
+    finally:
+        recovery_loop.stop()
 
 
 def create_application() -> FastAPI:
@@ -20,6 +37,7 @@ def create_application() -> FastAPI:
         title=settings.PROJECT_NAME,
         version="0.1.0",
         openapi_url=f"{settings.API_V1_STR}/openapi.json",
+        lifespan=lifespan,
     )
 
     # 注册自定义请求日志中间件，捕获每一次请求信息
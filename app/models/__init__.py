@@ -1,5 +1,7 @@
 from app.models.base import Base
+from app.models.concurrency_lease import LLMConcurrencyLease
 from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.message_blob import MessageBlob
 from app.models.metric import Metric
 from app.models.prompt import (
     Prompt,
@@ -9,17 +11,24 @@ from app.models.prompt import (
     PromptVersion,
     PromptImplementationRecord,
 )
+from app.models.rate_limit import LLMRateLimitBucket
+from app.models.response_cache import LLMResponseCacheEntry
 from app.models.result import Result
 from app.models.usage import LLMUsageLog
 from app.models.test_run import TestRun, TestRunStatus
 from app.models.prompt_test import (
     PromptTestTask,
+    PromptTestTaskProgress,
     PromptTestTaskStatus,
     PromptTestUnit,
     PromptTestExperiment,
     PromptTestExperimentStatus,
+    PromptTestRound,
+    PromptTestRoundStatus,
 )
 from app.models.system_setting import SystemSetting
+from app.models.task_heartbeat import TaskHeartbeat
+from app.models.task_job import TaskJob, TaskJobKind, TaskJobStatus
 from app.models.user import User
 
 __all__ = [
@@ -37,11 +46,22 @@ __all__ = [
     "LLMProvider",
     "LLMModel",
     "LLMUsageLog",
+    "MessageBlob",
+    "LLMRateLimitBucket",
+    "LLMConcurrencyLease",
+    "LLMResponseCacheEntry",
     "PromptTestTask",
+    "PromptTestTaskProgress",
     "PromptTestTaskStatus",
     "PromptTestUnit",
     "PromptTestExperiment",
     "PromptTestExperimentStatus",
+    "PromptTestRound",
+    "PromptTestRoundStatus",
     "SystemSetting",
+    "TaskHeartbeat",
+    "TaskJob",
+    "TaskJobKind",
+    "TaskJobStatus",
     "User",
 ]
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from sqlalchemy import Float, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class LLMConcurrencyLease(Base):
+    """跨进程共享的模型并发名额，每条记录代表一次进行中的 LLM 调用。"""
+
+    __tablename__ = "llm_concurrency_leases"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    model_id: Mapped[int] = mapped_column(
+        ForeignKey("llm_models.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+        doc="占用名额的模型",
+    )
+    holder: Mapped[str] = mapped_column(
+        String(255),
+        nullable=False,
+        doc="持有租约的进程标识（主机名:进程号）",
+    )
+    acquired_at: Mapped[float] = mapped_column(
+        Float,
+        nullable=False,
+        doc="获取租约的 Unix 时间戳（秒）",
+    )
+    expires_at: Mapped[float] = mapped_column(
+        Float,
+        nullable=False,
+        doc="租约到期时间，过期后视为持有进程已退出",
+    )
+
+
+__all__ = ["LLMConcurrencyLease"]
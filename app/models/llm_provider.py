@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 from sqlalchemy import (
     Boolean,
     DateTime,
@@ -12,6 +12,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.db.types import JSONBCompat
 from app.models.base import Base
 
 if TYPE_CHECKING:  # pragma: no cover - 类型检查辅助
@@ -33,6 +34,12 @@ class LLMProvider(Base):
     logo_url: Mapped[str | None] = mapped_column(String(255), nullable=True)
     logo_emoji: Mapped[str | None] = mapped_column(String(16), nullable=True)
     default_model_name: Mapped[str | None] = mapped_column(String(150), nullable=True)
+    http_options: Mapped[dict[str, Any] | None] = mapped_column(
+        JSONBCompat, nullable=True, doc="连接池、超时与 HTTP/2 等调用配置"
+    )
+    retry_policy: Mapped[dict[str, Any] | None] = mapped_column(
+        JSONBCompat, nullable=True, doc="重试次数、退避与截止时间等重试配置"
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
@@ -82,6 +89,12 @@ class LLMModel(Base):
     concurrency_limit: Mapped[int] = mapped_column(
         Integer, nullable=False, default=5, server_default="5"
     )
+    rpm_limit: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, doc="每分钟允许的请求数，为空表示不限制"
+    )
+    tpm_limit: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, doc="每分钟允许消耗的 Token 数，为空表示不限制"
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
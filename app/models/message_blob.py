@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import DateTime, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.types import CompressedJSON
+from app.models.base import Base
+
+
+class MessageBlob(Base):
+    """按内容寻址保存的单条对话消息，调用记录仅保存消息摘要。"""
+
+    __tablename__ = "message_blobs"
+
+    digest: Mapped[str] = mapped_column(
+        String(64), primary_key=True, doc="消息规范化 JSON 的 SHA-256 摘要"
+    )
+    content: Mapped[dict[str, Any]] = mapped_column(
+        CompressedJSON, nullable=False, doc="消息原文，包含 role 与 content 等字段"
+    )
+    size: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, doc="规范化 JSON 的字节数"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+__all__ = ["MessageBlob"]
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
 from datetime import datetime
 from enum import Enum
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 from sqlalchemy import (
     Boolean,
@@ -17,7 +18,8 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.db.types import JSONBCompat
+from app.core.message_store import message_store
+from app.db.types import CompressedJSON, JSONBCompat
 from app.models.base import Base
 
 if TYPE_CHECKING:
@@ -33,6 +35,7 @@ class PromptTestTaskStatus(str, Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class PromptTestTask(Base):
@@ -48,6 +51,11 @@ class PromptTestTask(Base):
     )
     owner_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     config: Mapped[dict | None] = mapped_column(JSONBCompat, nullable=True)
+    priority: Mapped[int | None] = mapped_column(
+        Integer,
+        nullable=True,
+        doc="执行优先级，数值越小越先执行；为空时按预估调用次数自动推导",
+    )
     status: Mapped[PromptTestTaskStatus] = mapped_column(
         String(50),
         nullable=False,
@@ -74,6 +82,34 @@ class PromptTestTask(Base):
         cascade="all, delete-orphan",
         passive_deletes=True,
     )
+    progress: Mapped["PromptTestTaskProgress | None"] = relationship(
+        "PromptTestTaskProgress", uselist=False, viewonly=True
+    )
+
+
+class PromptTestTaskProgress(Base):
+    """测试任务的执行进度，与任务配置分开存储，执行期间只更新这张小表。"""
+
+    __tablename__ = "prompt_test_task_progress"
+
+    task_id: Mapped[int] = mapped_column(
+        ForeignKey("prompt_test_tasks.id", ondelete="CASCADE"), primary_key=True
+    )
+    current: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    total: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=1, server_default="1"
+    )
+    percentage: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
 
 
 class PromptTestUnit(Base):
@@ -154,8 +190,12 @@ class PromptTestExperiment(Base):
         default=PromptTestExperimentStatus.PENDING,
         server_default=PromptTestExperimentStatus.PENDING.value,
     )
-    outputs: Mapped[list[dict] | None] = mapped_column(
-        JSONBCompat, nullable=True, doc="多轮执行的返回结果列表"
+    legacy_outputs: Mapped[list[dict] | None] = mapped_column(
+        "outputs",
+        CompressedJSON,
+        nullable=True,
+        deferred=True,
+        doc="旧版以单个 JSON 列表保存的多轮结果，新结果写入 prompt_test_rounds",
     )
     metrics: Mapped[dict | None] = mapped_column(
         JSONBCompat, nullable=True, doc="自动化评估指标与统计信息"
@@ -180,12 +220,170 @@ class PromptTestExperiment(Base):
     unit: Mapped["PromptTestUnit"] = relationship(
         "PromptTestUnit", back_populates="experiments"
     )
+    rounds: Mapped[list["PromptTestRound"]] = relationship(
+        "PromptTestRound",
+        back_populates="experiment",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="PromptTestRound.run_index",
+    )
+
+    @property
+    def outputs(self) -> list[dict[str, Any]] | None:
+        """按轮次顺序返回多轮结果，尚未迁移的实验回退到旧版 JSON 列表。"""
+
+        if self.rounds:
+            # 同一会话内追加的轮次按完成先后排列，读取时按序号重新排序
+            ordered = sorted(self.rounds, key=lambda item: item.run_index)
+            message_store.prefetch(
+                digest for item in ordered for digest in item.message_refs
+            )
+            return [item.to_record() for item in ordered]
+        return self.legacy_outputs
+
+    @outputs.setter
+    def outputs(self, records: list[dict[str, Any]] | None) -> None:
+        self.legacy_outputs = None
+        self.rounds = [
+            PromptTestRound.from_record(record, position)
+            for position, record in enumerate(records or [], start=1)
+            if isinstance(record, Mapping)
+        ]
+
+
+class PromptTestRoundStatus(str, Enum):
+    """单轮调用的结果状态。"""
+
+    __test__ = False
+    SUCCESS = "success"
+    FAILED = "failed"
+
+
+# 单独成列的轮次字段，其余内容（消息、变量、输出与原始响应等）存放在 payload 中
+_ROUND_METRIC_FIELDS = (
+    "latency_ms",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+)
+
+
+class PromptTestRound(Base):
+    """实验中单轮调用的结果，统计所需的标量指标单独成列，便于按列读取。"""
+
+    __tablename__ = "prompt_test_rounds"
+    __table_args__ = (
+        UniqueConstraint(
+            "experiment_id", "run_index", name="uq_prompt_test_round_experiment_run"
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    experiment_id: Mapped[int] = mapped_column(
+        ForeignKey("prompt_test_experiments.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    run_index: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[PromptTestRoundStatus] = mapped_column(
+        String(50),
+        nullable=False,
+        default=PromptTestRoundStatus.SUCCESS,
+        server_default=PromptTestRoundStatus.SUCCESS.value,
+    )
+    latency_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    prompt_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    completion_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    total_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    cache_hit: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
+    attempts: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    payload: Mapped[dict | None] = mapped_column(
+        CompressedJSON, nullable=True, doc="消息、变量、输出与原始响应等完整记录"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    experiment: Mapped["PromptTestExperiment"] = relationship(
+        "PromptTestExperiment", back_populates="rounds"
+    )
+
+    @classmethod
+    def from_record(
+        cls, record: Mapping[str, Any], position: int = 1
+    ) -> "PromptTestRound":
+        """由引擎生成的单轮记录构建行，``position`` 为记录缺少序号时的兜底值。"""
+
+        payload = dict(record)
+        run_index = payload.pop("run_index", None) or payload.get("sequence")
+        raw_status = str(payload.pop("status", "") or "").strip().lower()
+        status = (
+            PromptTestRoundStatus.FAILED
+            if raw_status in {"failed", "error"}
+            else PromptTestRoundStatus.SUCCESS
+        )
+        metrics = {
+            field: _optional_int(payload.pop(field, None))
+            for field in _ROUND_METRIC_FIELDS
+        }
+        cache_hit = payload.pop("cache_hit", None)
+        return cls(
+            run_index=_optional_int(run_index) or position,
+            status=status,
+            cache_hit=bool(cache_hit) if cache_hit is not None else None,
+            attempts=_optional_int(payload.pop("attempts", None)),
+            error=payload.pop("error", None),
+            payload=payload or None,
+            **metrics,
+        )
+
+    @property
+    def message_refs(self) -> list[str]:
+        """本轮请求消息在 message_blobs 中的摘要列表。"""
+
+        refs = (self.payload or {}).get("message_refs")
+        return list(refs) if isinstance(refs, list) else []
+
+    def to_record(self) -> dict[str, Any]:
+        """还原为与旧版 ``outputs`` 列表元素一致的单轮记录。"""
+
+        failed = self.status == PromptTestRoundStatus.FAILED
+        record: dict[str, Any] = {"run_index": self.run_index}
+        record.update(self.payload or {})
+        message_refs = record.pop("message_refs", None)
+        if isinstance(message_refs, list):
+            record["messages"] = message_store.get_many(message_refs)
+        for field in _ROUND_METRIC_FIELDS:
+            value = getattr(self, field)
+            if value is not None or not failed:
+                record[field] = value
+        if failed:
+            record["status"] = PromptTestRoundStatus.FAILED.value
+        if failed or self.error is not None:
+            record["error"] = self.error
+        if self.cache_hit is not None:
+            record["cache_hit"] = self.cache_hit
+        if self.attempts is not None:
+            record["attempts"] = self.attempts
+        return record
+
+
+def _optional_int(value: Any) -> int | None:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    return None
 
 
 __all__ = [
     "PromptTestTask",
+    "PromptTestTaskProgress",
     "PromptTestTaskStatus",
     "PromptTestUnit",
     "PromptTestExperiment",
     "PromptTestExperimentStatus",
+    "PromptTestRound",
+    "PromptTestRoundStatus",
 ]
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from sqlalchemy import Float, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class LLMRateLimitBucket(Base):
+    """多进程共享的令牌桶状态，供数据库限流后端使用。"""
+
+    __tablename__ = "llm_rate_limit_buckets"
+
+    bucket_key: Mapped[str] = mapped_column(
+        String(255),
+        primary_key=True,
+        doc="令牌桶标识，由提供者、模型与维度组成",
+    )
+    tokens: Mapped[float] = mapped_column(
+        Float,
+        nullable=False,
+        doc="最近一次结算后桶内剩余的令牌数，可为负数表示已预支",
+    )
+    updated_at: Mapped[float] = mapped_column(
+        Float,
+        nullable=False,
+        doc="最近一次结算的 Unix 时间戳（秒）",
+    )
+
+
+__all__ = ["LLMRateLimitBucket"]
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from sqlalchemy import Float, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.types import JSONBCompat
+from app.models.base import Base
+
+
+class LLMResponseCacheEntry(Base):
+    """确定性 LLM 请求的响应缓存持久层。"""
+
+    __tablename__ = "llm_response_cache"
+
+    cache_key: Mapped[str] = mapped_column(
+        String(64),
+        primary_key=True,
+        doc="提供者、模型、消息与参数规范化后的 SHA-256 摘要",
+    )
+    provider_id: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, index=True, doc="产生该响应的提供者"
+    )
+    model_name: Mapped[str | None] = mapped_column(
+        String(150), nullable=True, doc="产生该响应的模型名称"
+    )
+    response: Mapped[dict] = mapped_column(
+        JSONBCompat, nullable=False, doc="提供者返回的原始响应体"
+    )
+    created_at: Mapped[float] = mapped_column(
+        Float, nullable=False, doc="写入缓存的 Unix 时间戳（秒）"
+    )
+    last_accessed_at: Mapped[float] = mapped_column(
+        Float, nullable=False, index=True, doc="最近一次命中或写入的时间，用于容量淘汰"
+    )
+    expires_at: Mapped[float | None] = mapped_column(
+        Float, nullable=True, doc="过期时间，为空表示不过期"
+    )
+    hit_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0", doc="累计命中次数"
+    )
+
+
+__all__ = ["LLMResponseCacheEntry"]
@@ -4,7 +4,7 @@ from datetime import datetime
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Text, func
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Integer, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.types import JSONBCompat
@@ -27,6 +27,17 @@ class Result(Base):
     parsed_output: Mapped[dict | None] = mapped_column(JSONBCompat, nullable=True)
     tokens_used: Mapped[int | None] = mapped_column(Integer, nullable=True)
     latency_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=1, server_default="1"
+    )
+    cache_hit: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=False, server_default="0"
+    )
+    ttft_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    inter_token_latency_ms: Mapped[dict | None] = mapped_column(
+        JSONBCompat, nullable=True
+    )
+    tokens_per_second: Mapped[float | None] = mapped_column(Float, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
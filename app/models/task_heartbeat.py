@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class TaskHeartbeat(Base):
+    """进程持有任务的存活心跳。
+
+    心跳与任务行分开保存：执行方在提交任务状态时会锁定任务行，刷新心跳不应
+    等待这些锁，恢复流程也据此判断任务是否仍有进程持有。
+    """
+
+    __tablename__ = "task_heartbeats"
+
+    kind: Mapped[str] = mapped_column(
+        String(50), primary_key=True, doc="任务类型，与 task_jobs.kind 取值一致"
+    )
+    target_id: Mapped[int] = mapped_column(
+        Integer, primary_key=True, doc="测试任务或 Prompt 测试任务的 ID"
+    )
+    holder: Mapped[str | None] = mapped_column(
+        String(255), nullable=True, doc="最近一次刷新心跳的进程标识（主机名:进程号）"
+    )
+    heartbeat_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, doc="最近一次心跳时间"
+    )
+
+
+__all__ = ["TaskHeartbeat"]
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import DateTime, Float, Index, Integer, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class TaskJobKind(str, Enum):
+    TEST_RUN = "test_run"
+    PROMPT_TEST_TASK = "prompt_test_task"
+
+
+class TaskJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class TaskJob(Base):
+    """持久化的任务队列记录，由独立的 worker 进程通过租约领取执行。"""
+
+    __tablename__ = "task_jobs"
+    __table_args__ = (
+        Index("ix_task_jobs_status_id", "status", "id"),
+        Index("ix_task_jobs_kind_target", "kind", "target_id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[TaskJobKind] = mapped_column(
+        String(50), nullable=False, doc="任务类型，决定由哪个执行器处理"
+    )
+    target_id: Mapped[int] = mapped_column(
+        Integer, nullable=False, doc="测试任务或 Prompt 测试任务的 ID"
+    )
+    owner_id: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, doc="任务所属用户，用于在不同用户之间公平调度"
+    )
+    priority: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=1,
+        server_default="1",
+        doc="执行优先级，数值越小越先领取",
+    )
+    enqueued_at: Mapped[float | None] = mapped_column(
+        Float, nullable=True, doc="入队的 Unix 时间戳（秒），用于优先级老化"
+    )
+    status: Mapped[TaskJobStatus] = mapped_column(
+        String(50),
+        nullable=False,
+        default=TaskJobStatus.QUEUED,
+        server_default=TaskJobStatus.QUEUED.value,
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0", doc="已被领取的次数"
+    )
+    lease_holder: Mapped[str | None] = mapped_column(
+        String(255), nullable=True, doc="持有租约的 worker 标识（主机名:进程号）"
+    )
+    lease_expires_at: Mapped[float | None] = mapped_column(
+        Float, nullable=True, doc="租约到期的 Unix 时间戳（秒），过期后可被其他 worker 回收"
+    )
+    heartbeat_at: Mapped[float | None] = mapped_column(
+        Float, nullable=True, doc="最近一次心跳的 Unix 时间戳（秒）"
+    )
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+
+
+__all__ = ["TaskJob", "TaskJobKind", "TaskJobStatus"]
@@ -5,7 +5,17 @@ from enum import Enum
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import DateTime, Enum as PgEnum, ForeignKey, Integer, String, Text, func
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    Enum as PgEnum,
+    ForeignKey,
+    Integer,
+    String,
+    Text,
+    false,
+    func,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.types import JSONBCompat
@@ -22,6 +32,7 @@ class TestRunStatus(str, Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class TestRun(Base):
@@ -38,6 +49,11 @@ class TestRun(Base):
     temperature: Mapped[float] = mapped_column(nullable=False, default=0.7)
     top_p: Mapped[float] = mapped_column(nullable=False, default=1.0)
     repetitions: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    priority: Mapped[int | None] = mapped_column(
+        Integer,
+        nullable=True,
+        doc="执行优先级，数值越小越先执行；为空时按调用次数自动推导",
+    )
     schema: Mapped[dict | None] = mapped_column(JSONBCompat, nullable=True)
     status: Mapped[TestRunStatus] = mapped_column(
         String(50),
@@ -45,6 +61,13 @@ class TestRun(Base):
         default=TestRunStatus.PENDING,
         server_default=TestRunStatus.PENDING.value,
     )
+    cancel_requested: Mapped[bool] = mapped_column(
+        Boolean,
+        nullable=False,
+        default=False,
+        server_default=false(),
+        doc="已请求取消，由执行任务的进程轮询后停止并写回取消状态",
+    )
     notes: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
@@ -14,7 +14,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.db.types import JSONBCompat
+from app.db.types import CompressedJSON, JSONBCompat
 from app.models.base import Base
 
 if TYPE_CHECKING:  # pragma: no cover - 类型检查辅助
@@ -43,11 +43,16 @@ class LLMUsageLog(Base):
     prompt_version_id: Mapped[int | None] = mapped_column(
         ForeignKey("prompts_versions.id", ondelete="SET NULL"), nullable=True
     )
+    message_refs: Mapped[list[str] | None] = mapped_column(
+        JSONBCompat, nullable=True, doc="按顺序引用 message_blobs 的消息摘要"
+    )
     messages: Mapped[list[dict[str, Any]] | None] = mapped_column(
-        JSONBCompat, nullable=True
+        CompressedJSON,
+        nullable=True,
+        doc="内嵌保存的完整消息列表，服务层写入消息块后清空并改为引用 message_refs",
     )
     parameters: Mapped[dict[str, Any] | None] = mapped_column(
-        JSONBCompat, nullable=True
+        CompressedJSON, nullable=True
     )
     response_text: Mapped[str | None] = mapped_column(Text, nullable=True)
     temperature: Mapped[float | None] = mapped_column(Float, nullable=True)
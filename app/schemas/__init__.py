@@ -34,6 +34,7 @@ from app.schemas.prompt import (
     PromptVersionRead,
 )
 from app.schemas.result import ResultCreate, ResultRead
+from app.schemas.task_estimate import RunEstimateRead, TaskEstimateRead
 from app.schemas.test_run import TestRunCreate, TestRunRead, TestRunUpdate
 from app.schemas.usage import UsageModelSummary, UsageOverview, UsageTimeseriesPoint
 from app.schemas.settings import TestingTimeoutsRead, TestingTimeoutsUpdate
@@ -67,6 +68,8 @@ __all__ = [
     "TestRunRead",
     "ResultCreate",
     "ResultRead",
+    "RunEstimateRead",
+    "TaskEstimateRead",
     "MetricCreate",
     "MetricRead",
     "LLMProviderCreate",
@@ -18,6 +18,12 @@ class LLMModelBase(BaseModel):
         le=50,
         description="执行测试任务时的最大并发请求数",
     )
+    rpm_limit: int | None = Field(
+        default=None, ge=1, description="每分钟允许的请求数，留空表示不限制"
+    )
+    tpm_limit: int | None = Field(
+        default=None, ge=1, description="每分钟允许消耗的 Token 数，留空表示不限制"
+    )
 
 
 class LLMModelCreate(LLMModelBase):
@@ -33,16 +39,95 @@ class LLMModelUpdate(BaseModel):
         le=50,
         description="执行测试任务时的最大并发请求数",
     )
+    rpm_limit: int | None = Field(
+        default=None, ge=1, description="每分钟允许的请求数"
+    )
+    tpm_limit: int | None = Field(
+        default=None, ge=1, description="每分钟允许消耗的 Token 数"
+    )
 
 
 class LLMModelRead(LLMModelBase):
     id: int
+    effective_concurrency_limit: int | None = Field(
+        default=None, description="自适应并发控制当前生效的并发上限"
+    )
     created_at: datetime
     updated_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class LLMModelConcurrencyRead(BaseModel):
+    model_id: int
+    adaptive: bool = Field(..., description="是否启用自适应并发控制")
+    configured_limit: int = Field(..., description="模型配置的并发上限")
+    effective_limit: int = Field(..., description="当前生效的并发上限")
+    in_flight: int = Field(..., description="本进程内进行中的请求数")
+    waiting: int = Field(default=0, description="本进程内等待并发名额的请求数")
+    backend: str = Field(default="memory", description="并发名额的登记方式")
+    global_in_flight: int | None = Field(
+        default=None, description="所有进程合计进行中的请求数，仅数据库模式提供"
+    )
+    latency_ewma_ms: float | None = Field(
+        default=None, description="请求延迟的指数滑动平均（毫秒）"
+    )
+    baseline_latency_ms: float | None = Field(
+        default=None, description="用于判断拥塞的基线延迟（毫秒）"
+    )
+    last_decrease_reason: str | None = Field(
+        default=None, description="最近一次收缩并发的原因"
+    )
+
+
+class LLMProviderHttpOptions(BaseModel):
+    max_connections: int | None = Field(
+        default=None, ge=1, le=1000, description="连接池允许的最大连接数"
+    )
+    max_keepalive_connections: int | None = Field(
+        default=None, ge=0, le=1000, description="保持长连接的最大空闲连接数"
+    )
+    keepalive_expiry: float | None = Field(
+        default=None, gt=0, description="空闲长连接的保留时间（秒）"
+    )
+    connect_timeout: float | None = Field(
+        default=None, gt=0, description="建立连接的超时时间（秒）"
+    )
+    read_timeout: float | None = Field(
+        default=None, gt=0, description="读取响应的超时时间（秒）"
+    )
+    pool_timeout: float | None = Field(
+        default=None, gt=0, description="等待连接池空闲连接的超时时间（秒）"
+    )
+    http2: bool | None = Field(default=None, description="是否启用 HTTP/2")
+
+
+class LLMProviderRetryPolicy(BaseModel):
+    max_attempts: int | None = Field(
+        default=None, ge=1, le=10, description="单次调用的最大尝试次数（含首次）"
+    )
+    base_delay: float | None = Field(
+        default=None, gt=0, description="指数退避的初始等待时间（秒）"
+    )
+    max_delay: float | None = Field(
+        default=None, gt=0, description="单次退避等待的上限（秒）"
+    )
+    max_retry_after: float | None = Field(
+        default=None,
+        gt=0,
+        description="遵循 Retry-After 的等待上限（秒），超过时不再重试",
+    )
+    attempt_timeout: float | None = Field(
+        default=None, gt=0, description="单次尝试的超时时间（秒），默认沿用系统配置"
+    )
+    deadline: float | None = Field(
+        default=None, gt=0, description="包含全部重试在内的整体截止时间（秒）"
+    )
+    retry_statuses: list[int] | None = Field(
+        default=None, description="需要重试的 HTTP 状态码列表"
+    )
+
+
 class LLMProviderBase(BaseModel):
     provider_name: str = Field(..., description="展示用名称，例如 OpenAI")
     provider_key: str | None = Field(
@@ -56,6 +141,12 @@ class LLMProviderBase(BaseModel):
     is_custom: bool | None = Field(
         default=None, description="是否为自定义提供方，未指定时由后端推断"
     )
+    http_options: LLMProviderHttpOptions | None = Field(
+        default=None, description="连接池与超时等 HTTP 调用配置"
+    )
+    retry_policy: LLMProviderRetryPolicy | None = Field(
+        default=None, description="调用失败时的重试策略"
+    )
 
 
 class LLMProviderCreate(LLMProviderBase):
@@ -70,6 +161,8 @@ class LLMProviderUpdate(BaseModel):
     logo_url: str | None = None
     is_custom: bool | None = None
     default_model_name: str | None = None
+    http_options: LLMProviderHttpOptions | None = None
+    retry_policy: LLMProviderRetryPolicy | None = None
 
 
 class LLMProviderRead(BaseModel):
@@ -83,6 +176,8 @@ class LLMProviderRead(BaseModel):
     is_archived: bool
     default_model_name: str | None
     masked_api_key: str
+    http_options: LLMProviderHttpOptions | None = None
+    retry_policy: LLMProviderRetryPolicy | None = None
     models: list[LLMModelRead] = Field(default_factory=list)
     created_at: datetime
     updated_at: datetime
@@ -21,6 +21,9 @@ class PromptTestTaskBase(BaseModel):
     prompt_version_id: int | None = None
     owner_id: int | None = None
     config: dict[str, Any] | None = None
+    priority: int | None = Field(
+        default=None, ge=0, le=9, description="执行优先级，越小越先执行；为空时自动推导"
+    )
 
 
 class PromptTestTaskCreate(PromptTestTaskBase):
@@ -41,6 +44,20 @@ class PromptTestTaskUpdate(BaseModel):
     description: str | None = None
     config: dict[str, Any] | None = None
     status: PromptTestTaskStatus | None = None
+    priority: int | None = Field(default=None, ge=0, le=9)
+
+
+class PromptTestTaskProgressRead(BaseModel):
+    """测试任务的执行进度，独立于任务配置存储。"""
+
+    __test__ = False
+
+    task_id: int
+    current: int
+    total: int
+    percentage: int
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 class PromptTestTaskRead(PromptTestTaskBase):
@@ -53,6 +70,7 @@ class PromptTestTaskRead(PromptTestTaskBase):
     created_at: datetime
     updated_at: datetime
     units: list["PromptTestUnitRead"] | None = None
+    progress: PromptTestTaskProgressRead | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -164,6 +182,7 @@ __all__ = [
     "PromptTestTaskCreate",
     "PromptTestTaskUpdate",
     "PromptTestTaskRead",
+    "PromptTestTaskProgressRead",
     "PromptTestUnitCreate",
     "PromptTestUnitUpdate",
     "PromptTestUnitRead",
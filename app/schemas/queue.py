@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from pydantic import BaseModel, Field
+
+
+class QueueOwnerBacklog(BaseModel):
+    owner_id: int | None = Field(default=None, description="任务所属用户，为空表示未归属")
+    queued: int = Field(..., description="该用户排队中的任务数")
+    active: int = Field(..., description="该用户执行中的任务数")
+
+
+class QueueLaneBacklog(BaseModel):
+    priority: int = Field(..., description="基础优先级，数值越小越先执行")
+    queued: int = Field(..., description="该优先级排队中的任务数")
+
+
+class QueueStats(BaseModel):
+    workers: int = Field(..., description="队列工作线程数")
+    queue_depth: int = Field(..., description="排队中的任务总数")
+    active_workers: int = Field(..., description="正在执行任务的工作线程数")
+    owners: list[QueueOwnerBacklog] = Field(
+        default_factory=list, description="按所属用户统计的积压情况"
+    )
+    lanes: list[QueueLaneBacklog] = Field(
+        default_factory=list, description="按优先级统计的积压情况"
+    )
+
+
+class QueueStatsRead(BaseModel):
+    """测试任务与 Prompt 测试任务队列的运行状态。"""
+
+    test_runs: QueueStats
+    prompt_test_tasks: QueueStats
+
+
+__all__ = ["QueueLaneBacklog", "QueueOwnerBacklog", "QueueStats", "QueueStatsRead"]
@@ -11,6 +11,11 @@ class ResultBase(BaseModel):
     parsed_output: dict | None = None
     tokens_used: int | None = Field(default=None, ge=0)
     latency_ms: int | None = Field(default=None, ge=0)
+    attempts: int = Field(default=1, ge=1)
+    cache_hit: bool = False
+    ttft_ms: int | None = Field(default=None, ge=0)
+    inter_token_latency_ms: dict[str, float] | None = None
+    tokens_per_second: float | None = Field(default=None, ge=0)
 
 
 class ResultCreate(ResultBase):
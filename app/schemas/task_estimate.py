@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class RunEstimateRead(BaseModel):
+    """单个测试单元或测试任务的执行预估。"""
+
+    name: str
+    model_name: str
+    run_count: int = Field(ge=0, description="预计调用次数")
+    prompt_tokens: int = Field(ge=0, description="预计输入 Token 数")
+    completion_tokens: int = Field(ge=0, description="按历史记录推算的输出 Token 数")
+    total_tokens: int = Field(ge=0)
+    cost: float | None = Field(default=None, description="预计费用，模型未配置单价时为空")
+    duration_seconds: float = Field(ge=0, description="预计耗时（秒）")
+    concurrency: int = Field(ge=0, description="模型并发上限")
+    rpm_limit: int | None = None
+    tpm_limit: int | None = None
+    bottleneck: str = Field(description="决定耗时的限制：concurrency、rpm 或 tpm")
+    history_samples: int = Field(ge=0, description="参考的同模型历史调用条数")
+    avg_latency_ms: float = Field(ge=0, description="参考的单次调用平均延迟")
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TaskEstimateRead(BaseModel):
+    """任务执行前的 Token、费用与耗时预估汇总。"""
+
+    run_count: int = Field(ge=0)
+    prompt_tokens: int = Field(ge=0)
+    completion_tokens: int = Field(ge=0)
+    total_tokens: int = Field(ge=0)
+    cost: float | None = Field(default=None, description="任一模型未配置单价时为空")
+    duration_seconds: float = Field(ge=0)
+    tokenizer: str = Field(description="输入 Token 的计数方式：tiktoken 或按字节估算")
+    items: list[RunEstimateRead] = Field(default_factory=list)
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+__all__ = ["RunEstimateRead", "TaskEstimateRead"]
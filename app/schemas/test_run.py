@@ -19,6 +19,9 @@ class TestRunBase(BaseModel):
     )
     notes: str | None = None
     batch_id: str | None = Field(default=None, max_length=64)
+    priority: int | None = Field(
+        default=None, ge=0, le=9, description="执行优先级，越小越先执行；为空时自动推导"
+    )
 
     model_config = ConfigDict(populate_by_name=True, serialize_by_alias=True)
 
@@ -41,6 +44,7 @@ class TestRunUpdate(BaseModel):
     notes: str | None = None
     status: TestRunStatus | None = None
     batch_id: str | None = Field(default=None, max_length=64)
+    priority: int | None = Field(default=None, ge=0, le=9)
 
     model_config = ConfigDict(populate_by_name=True, serialize_by_alias=True)
 
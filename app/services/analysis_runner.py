@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections import defaultdict
 from dataclasses import dataclass
 from typing import Any, cast
 
@@ -9,7 +10,7 @@ from sqlalchemy.orm import Session, selectinload
 
 from app.models.result import Result
 from app.models.test_run import TestRun
-from app.models.prompt_test import PromptTestTask, PromptTestUnit
+from app.models.prompt_test import PromptTestRound, PromptTestTask, PromptTestUnit
 from app.schemas.analysis_module import (
     AnalysisContext,
     AnalysisResult,
@@ -139,7 +140,7 @@ def _safe_int(value: Any) -> int | None:
     return None
 
 
-def _build_prompt_test_dataframe(task: PromptTestTask) -> pd.DataFrame:
+def _build_prompt_test_dataframe(db: Session, task: PromptTestTask) -> pd.DataFrame:
     columns = [
         "task_id",
         "unit_id",
@@ -150,11 +151,43 @@ def _build_prompt_test_dataframe(task: PromptTestTask) -> pd.DataFrame:
         "tokens_used",
     ]
 
+    experiment_ids = [
+        experiment.id
+        for unit in task.units
+        for experiment in getattr(unit, "experiments", []) or []
+    ]
+    # 只读取轮次表中的标量列，不反序列化消息与原始响应
+    rounds_by_experiment: dict[int, list[Any]] = defaultdict(list)
+    if experiment_ids:
+        round_rows = db.execute(
+            select(
+                PromptTestRound.experiment_id,
+                PromptTestRound.run_index,
+                PromptTestRound.status,
+                PromptTestRound.latency_ms,
+                PromptTestRound.prompt_tokens,
+                PromptTestRound.completion_tokens,
+                PromptTestRound.total_tokens,
+            )
+            .where(PromptTestRound.experiment_id.in_(experiment_ids))
+            .order_by(PromptTestRound.experiment_id, PromptTestRound.run_index)
+        )
+        for round_row in round_rows:
+            rounds_by_experiment[round_row.experiment_id].append(round_row)
+
     rows: list[dict[str, Any]] = []
     for unit in task.units:
         experiments = getattr(unit, "experiments", []) or []
         for experiment in experiments:
-            outputs = experiment.outputs if isinstance(experiment.outputs, list) else []
+            if experiment.id in rounds_by_experiment:
+                outputs: list[Any] = [
+                    dict(round_row._mapping)
+                    for round_row in rounds_by_experiment[experiment.id]
+                ]
+            else:
+                # 尚未迁移到轮次表的历史实验仍从 JSON 列表读取
+                legacy = experiment.legacy_outputs
+                outputs = legacy if isinstance(legacy, list) else []
             for index, output in enumerate(outputs, start=1):
                 if not isinstance(output, dict):
                     continue
@@ -244,7 +277,7 @@ def execute_module_for_prompt_test_task(
     deps = dependencies or get_execution_dependencies()
     task_id = _parse_task_id(request.task_id)
     task = _load_prompt_test_task(db, task_id)
-    data_frame = _build_prompt_test_dataframe(task)
+    data_frame = _build_prompt_test_dataframe(db, task)
 
     context = AnalysisContext(
         task_id=str(task_id),
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Hashable
+from typing import Any, TypeVar
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.llm_provider_registry import get_provider_defaults
+from app.db import session as db_session
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.services.system_settings import (
+    TestingTimeoutConfig,
+    bump_runtime_config_version,
+    get_runtime_config_version,
+    get_testing_timeout_config,
+)
+
+logger = logging.getLogger("promptworks.llm_resolution")
+
+T = TypeVar("T")
+
+
+class LLMResolutionCache:
+    """进程内缓存提供者、模型、基础 URL 与测试超时配置的解析结果。
+
+    命中结果以脱离会话的对象保存，但从不直接交给调用方：每次返回时以
+    ``merge(load=False)`` 复制到调用方的会话中，调用方修改或延迟加载关联都只作用
+    于自己的副本，不会影响缓存或其他线程。未命中不做缓存，新建的配置无需失效即可
+    被发现。本进程的修改在提交后立即失效本地缓存，其他进程通过定期比对
+    ``runtime_config_version`` 得知变更，另有 TTL 兜底。
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float | None = None,
+        version_check_interval: float | None = None,
+    ) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._version_check_interval = version_check_interval
+        self._lock = threading.Lock()
+        self._entries: dict[Hashable, tuple[Any, float]] = {}
+        self._version: int | None = None
+        self._version_checked_at = 0.0
+
+    @property
+    def ttl_seconds(self) -> float:
+        value = self._ttl_seconds
+        if value is None:
+            value = settings.LLM_RESOLUTION_CACHE_TTL
+        return max(0.0, float(value))
+
+    @property
+    def version_check_interval(self) -> float:
+        value = self._version_check_interval
+        if value is None:
+            value = settings.LLM_RESOLUTION_CACHE_VERSION_CHECK_INTERVAL
+        return max(0.0, float(value))
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def invalidate(self) -> None:
+        """清空本进程缓存，并在下次查询时重新比对版本号。"""
+
+        with self._lock:
+            self._entries.clear()
+            self._version_checked_at = 0.0
+
+    def _sync_version(self, db: Session) -> None:
+        now = time.monotonic()
+        if (
+            self._version is not None
+            and now - self._version_checked_at < self.version_check_interval
+        ):
+            return
+        version = get_runtime_config_version(db)
+        with self._lock:
+            if self._version is not None and version != self._version:
+                logger.info(
+                    "运行时配置版本由 %s 变为 %s，清空解析缓存", self._version, version
+                )
+                self._entries.clear()
+            self._version = version
+            self._version_checked_at = now
+
+    def _lookup(
+        self,
+        db: Session,
+        key: Hashable,
+        loader: Callable[[Session], T | None],
+    ) -> T | None:
+        if not self.enabled:
+            return loader(db)
+
+        self._sync_version(db)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return _attach(db, entry[0])
+
+        # 在独立会话中加载，关闭后对象脱离会话，仅作为复制到调用方会话的模板
+        session = db_session.SessionLocal()
+        try:
+            value = loader(session)
+        finally:
+            session.close()
+        if value is None:
+            return None
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl_seconds)
+        return _attach(db, value)
+
+    def provider_by_id(self, db: Session, provider_id: int) -> LLMProvider | None:
+        return self._lookup(
+            db,
+            ("provider_id", provider_id),
+            lambda session: session.get(LLMProvider, provider_id),
+        )
+
+    def provider_by_name(self, db: Session, name: str) -> LLMProvider | None:
+        return self._lookup(
+            db,
+            ("provider_name", name),
+            lambda session: session.scalar(
+                select(LLMProvider).where(LLMProvider.provider_name == name)
+            ),
+        )
+
+    def provider_by_key(self, db: Session, provider_key: str) -> LLMProvider | None:
+        return self._lookup(
+            db,
+            ("provider_key", provider_key),
+            lambda session: session.scalar(
+                select(LLMProvider).where(LLMProvider.provider_key == provider_key)
+            ),
+        )
+
+    def model_by_id(self, db: Session, model_id: int) -> LLMModel | None:
+        return self._lookup(
+            db,
+            ("model_id", model_id),
+            lambda session: session.get(LLMModel, model_id),
+        )
+
+    def model_by_name(
+        self, db: Session, provider_id: int, name: str
+    ) -> LLMModel | None:
+        return self._lookup(
+            db,
+            ("model_name", provider_id, name),
+            lambda session: session.scalar(
+                select(LLMModel).where(
+                    LLMModel.provider_id == provider_id, LLMModel.name == name
+                )
+            ),
+        )
+
+    def provider_and_model_by_model_name(
+        self, db: Session, name: str
+    ) -> tuple[LLMProvider, LLMModel] | None:
+        """按模型名称反查所属提供者，多个提供者同名时取第一条记录。"""
+
+        def _load(session: Session) -> tuple[LLMProvider, LLMModel] | None:
+            record = session.execute(
+                select(LLMProvider, LLMModel)
+                .join(LLMModel, LLMModel.provider_id == LLMProvider.id)
+                .where(LLMModel.name == name)
+            ).first()
+            return (record[0], record[1]) if record else None
+
+        return self._lookup(db, ("provider_by_model_name", name), _load)
+
+    def base_url(self, provider: LLMProvider) -> str | None:
+        """返回去除末尾斜杠的基础 URL，未配置且无内置默认值时返回 ``None``。"""
+
+        key = ("base_url", provider.id, provider.base_url, provider.provider_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[0]
+        defaults = get_provider_defaults(provider.provider_key)
+        base_url = provider.base_url or (defaults.base_url if defaults else None)
+        if not base_url:
+            return None
+        resolved = base_url.rstrip("/")
+        if self.enabled:
+            with self._lock:
+                self._entries[key] = (resolved, float("inf"))
+        return resolved
+
+    def testing_timeout(self, db: Session) -> TestingTimeoutConfig:
+        return self._lookup(db, ("testing_timeout",), get_testing_timeout_config)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self._version_checked_at = 0.0
+
+
+def _attach(db: Session, value: T) -> T:
+    """把缓存的 ORM 对象复制到调用方会话，其他值原样返回。"""
+
+    if isinstance(value, tuple):
+        return tuple(_attach(db, item) for item in value)  # type: ignore[return-value]
+    if not isinstance(value, (LLMProvider, LLMModel)):
+        return value
+    # 会话中已有同一行时直接复用，避免用缓存值覆盖调用方尚未提交的修改
+    existing = db.identity_map.get(inspect(value).key)
+    if existing is not None:
+        return existing
+    return db.merge(value, load=False)
+
+
+llm_resolution_cache = LLMResolutionCache()
+
+
+def mark_llm_config_changed(db: Session) -> None:
+    """记录提供者或模型配置的变更。
+
+    递增全局版本号以通知其他进程，并在当前事务提交后立即清空本进程缓存。
+    """
+
+    bump_runtime_config_version(db)
+    event.listen(
+        db,
+        "after_commit",
+        lambda _session: llm_resolution_cache.invalidate(),
+        once=True,
+    )
+
+
+__all__ = [
+    "LLMResolutionCache",
+    "llm_resolution_cache",
+    "mark_llm_config_changed",
+]
@@ -1,14 +1,30 @@
 from __future__ import annotations
 
+import logging
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from typing import Any
+
 from sqlalchemy import select
 from sqlalchemy.orm import Session, selectinload
 
+from app.core.message_store import MissingMessageBlobError, message_store
 from app.models.usage import LLMUsageLog
 
+logger = logging.getLogger("promptworks.llm_usage")
+
+
+@dataclass(frozen=True)
+class UsageLogRecord:
+    """调用记录及其还原后的消息列表，消息块缺失时 ``messages`` 为空。"""
+
+    log: LLMUsageLog
+    messages: list[dict[str, Any]] | None
+
 
 def list_quick_test_usage_logs(
     db: Session, *, limit: int = 20, offset: int = 0
-) -> list[LLMUsageLog]:
+) -> list[UsageLogRecord]:
     stmt = (
         select(LLMUsageLog)
         .options(selectinload(LLMUsageLog.provider))
@@ -17,7 +33,55 @@ def list_quick_test_usage_logs(
         .offset(offset)
         .limit(limit)
     )
-    return list(db.scalars(stmt))
+    logs = list(db.scalars(stmt))
+    return [
+        UsageLogRecord(log=log, messages=messages)
+        for log, messages in zip(logs, load_usage_messages(logs))
+    ]
+
+
+def load_usage_messages(
+    logs: Sequence[LLMUsageLog],
+) -> list[list[dict[str, Any]] | None]:
+    """按记录顺序还原消息列表，兼容旧版内嵌保存的记录。
+
+    本批记录引用的消息块一次性加载；个别记录的消息块缺失时该条返回 ``None``
+    并记录告警，不影响其余记录。
+    """
+
+    message_store.prefetch(
+        digest for log in logs for digest in (log.message_refs or [])
+    )
+    restored: list[list[dict[str, Any]] | None] = []
+    for log in logs:
+        if log.message_refs is None:
+            restored.append(log.messages)
+            continue
+        try:
+            restored.append(message_store.get_many(log.message_refs))
+        except MissingMessageBlobError as exc:
+            logger.warning(
+                "调用记录 %s 的消息块缺失，跳过消息还原: %s", log.id, exc.digests
+            )
+            restored.append(None)
+    return restored
+
+
+def store_usage_messages(logs: Iterable[LLMUsageLog]) -> None:
+    """将调用记录内嵌的消息写入消息块表，记录改为按摘要引用。
+
+    须在调用方把记录加入会话之前调用；消息块先行提交，记录随调用方的事务写入。
+    """
+
+    for log in logs:
+        if isinstance(log.messages, list):
+            log.message_refs = message_store.put_many(log.messages)
+            log.messages = None
 
 
-__all__ = ["list_quick_test_usage_logs"]
+__all__ = [
+    "UsageLogRecord",
+    "list_quick_test_usage_logs",
+    "load_usage_messages",
+    "store_usage_messages",
+]
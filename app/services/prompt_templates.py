@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import re
+import string
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+RUN_INDEX_PLACEHOLDER = "{{run_index}}"
+
+# ``{{run_index}}`` 在编译阶段改写为该占位字段，渲染时直接替换为轮次序号
+_RUN_INDEX_FIELD = "\x00run_index"
+_FIELD_ROOT_PATTERN = re.compile(r"[^.\[]*")
+_ALLOWED_CONVERSIONS = {None, "r", "s", "a"}
+_formatter = string.Formatter()
+
+
+class MissingTemplateVariablesError(ValueError):
+    """渲染模板时上下文缺少其引用的变量。"""
+
+    def __init__(self, missing: Iterable[str]) -> None:
+        self.missing = tuple(sorted(set(missing)))
+        super().__init__(f"模板缺少变量: {', '.join(self.missing)}")
+
+
+@dataclass(frozen=True, slots=True)
+class _Field:
+    expression: str
+    root: str
+    conversion: str | None
+    format_spec: str
+    nested_spec: bool
+
+    @property
+    def simple(self) -> bool:
+        return (
+            self.expression == self.root
+            and self.conversion is None
+            and not self.format_spec
+        )
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """预先解析的 ``str.format`` 模板。
+
+    ``formattable`` 为 ``False`` 表示模板本身无法按变量格式化（例如包含 JSON
+    片段或位置参数），此时与旧实现一致，仅替换 ``{{run_index}}`` 后原样发送。
+    """
+
+    source: str
+    parts: tuple[tuple[str, _Field | None], ...]
+    variables: frozenset[str]
+    formattable: bool
+
+    def missing_variables(self, context: Mapping[str, Any]) -> set[str]:
+        return {name for name in self.variables if name not in context}
+
+    def render(self, context: Mapping[str, Any], run_index: int) -> str:
+        if not self.formattable:
+            return self.source.replace(RUN_INDEX_PLACEHOLDER, str(run_index))
+
+        pieces: list[str] = []
+        for literal, field in self.parts:
+            if literal:
+                pieces.append(literal)
+            if field is None:
+                continue
+            if field.root == _RUN_INDEX_FIELD:
+                pieces.append(str(run_index))
+                continue
+            if field.root not in context:
+                raise MissingTemplateVariablesError(self.missing_variables(context))
+            if field.simple:
+                pieces.append(format(context[field.root]))
+                continue
+            try:
+                pieces.append(self._render_field(field, context, run_index))
+            except Exception:
+                # 属性/下标访问或格式说明不适用于实际取值时，保持旧实现的原样回退
+                return self.source.replace(RUN_INDEX_PLACEHOLDER, str(run_index))
+        return "".join(pieces)
+
+    @staticmethod
+    def _render_field(
+        field: _Field, context: Mapping[str, Any], run_index: int
+    ) -> str:
+        value, _ = _formatter.get_field(field.expression, (), context)
+        value = _formatter.convert_field(value, field.conversion)
+        format_spec = field.format_spec
+        if field.nested_spec:
+            format_spec = _formatter.vformat(
+                format_spec, (), {**context, _RUN_INDEX_FIELD: run_index}
+            )
+        return format(value, format_spec)
+
+
+def _literal(source: str) -> CompiledTemplate:
+    return CompiledTemplate(
+        source=source, parts=(), variables=frozenset(), formattable=False
+    )
+
+
+def _field_root(expression: str) -> str | None:
+    root = _FIELD_ROOT_PATTERN.match(expression).group()
+    if root == _RUN_INDEX_FIELD or root.isidentifier():
+        return root
+    return None
+
+
+@lru_cache(maxsize=1024)
+def compile_template(source: str) -> CompiledTemplate:
+    """解析模板并记录引用的变量名，相同文本只解析一次。"""
+
+    prepared = source.replace(RUN_INDEX_PLACEHOLDER, "{%s}" % _RUN_INDEX_FIELD)
+    try:
+        parsed = list(_formatter.parse(prepared))
+    except ValueError:
+        return _literal(source)
+
+    parts: list[tuple[str, _Field | None]] = []
+    variables: set[str] = set()
+    for literal, expression, format_spec, conversion in parsed:
+        if expression is None:
+            parts.append((literal, None))
+            continue
+        root = _field_root(expression)
+        if root is None or conversion not in _ALLOWED_CONVERSIONS:
+            return _literal(source)
+        nested_spec = bool(format_spec) and "{" in format_spec
+        if nested_spec:
+            try:
+                nested = list(_formatter.parse(format_spec))
+            except ValueError:
+                return _literal(source)
+            for _, nested_expression, _, _ in nested:
+                if nested_expression is None:
+                    continue
+                nested_root = _field_root(nested_expression)
+                if nested_root is None:
+                    return _literal(source)
+                if nested_root != _RUN_INDEX_FIELD:
+                    variables.add(nested_root)
+        if root != _RUN_INDEX_FIELD:
+            variables.add(root)
+        parts.append(
+            (
+                literal,
+                _Field(
+                    expression=expression,
+                    root=root,
+                    conversion=conversion,
+                    format_spec=format_spec or "",
+                    nested_spec=nested_spec,
+                ),
+            )
+        )
+
+    return CompiledTemplate(
+        source=source,
+        parts=tuple(parts),
+        variables=frozenset(variables),
+        formattable=True,
+    )
+
+
+__all__ = [
+    "CompiledTemplate",
+    "MissingTemplateVariablesError",
+    "RUN_INDEX_PLACEHOLDER",
+    "compile_template",
+]
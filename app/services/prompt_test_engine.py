@@ -1,34 +1,62 @@
 from __future__ import annotations
 
 import logging
-import random
+import math
 import statistics
 import time
 from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Any
 
 import httpx
-from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.core.llm_provider_registry import get_provider_defaults
+from app.core.cancellation import (
+    CancellationToken,
+    OperationCancelledError,
+    raise_if_cancelled,
+    resolve_fail_fast,
+)
+from app.core.concurrency_governor import concurrency_governor
+from app.core.llm_http import llm_client_registry
+from app.core.llm_stream import StreamCollector, consume_chat_stream
+from app.core.message_store import message_store
+from app.core.rate_limiter import llm_rate_limiter
+from app.core.response_cache import (
+    build_cache_key,
+    is_deterministic_request,
+    resolve_cache_enabled,
+    response_cache,
+)
+from app.core.retry_policy import (
+    RetryDeadlineExceeded,
+    RetryPolicy,
+    call_with_retry,
+)
 from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import PromptVersion
 from app.models.prompt_test import (
     PromptTestExperiment,
+    PromptTestRound,
     PromptTestExperimentStatus,
     PromptTestUnit,
 )
 from app.models.usage import LLMUsageLog
 from app.services.test_run import (
-    REQUEST_SLEEP_RANGE,
     _format_error_detail,
     _try_parse_json,
+    resolve_concurrency_limit,
 )
-from app.services.system_settings import (
-    DEFAULT_TEST_TASK_TIMEOUT,
-    get_testing_timeout_config,
+from app.services.llm_resolution import llm_resolution_cache
+from app.services.llm_usage import store_usage_messages
+from app.services.run_execution import iter_threaded_outcomes, track_reservation
+from app.services.prompt_templates import (
+    CompiledTemplate,
+    MissingTemplateVariablesError,
+    compile_template,
 )
+from app.services.system_settings import DEFAULT_TEST_TASK_TIMEOUT
 
 logger = logging.getLogger("promptworks.prompt_test_engine")
 
@@ -57,17 +85,97 @@ class PromptTestExecutionError(Exception):
 
     __test__ = False
 
-    def __init__(self, message: str, *, status_code: int | None = None) -> None:
+    def __init__(
+        self,
+        message: str,
+        *,
+        status_code: int | None = None,
+        attempts: int | None = None,
+    ) -> None:
         super().__init__(message)
         self.status_code = status_code
+        self.attempts = attempts
+
+
+@dataclass(frozen=True)
+class UnitRunPlan:
+    """测试单元的调用计划，请求体与并发数按执行时的逻辑构造，供执行前预估使用。
+
+    同一用例各轮的消息仅 ``run_index`` 不同，``case_payloads`` 每个用例只渲染一次，
+    各用例均执行 ``rounds_per_case`` 轮。
+    """
+
+    provider: LLMProvider | None
+    model: LLMModel | None
+    case_payloads: list[dict[str, Any]]
+    rounds_per_case: int
+    concurrency: int
+
+    @property
+    def run_count(self) -> int:
+        return self.rounds_per_case * len(self.case_payloads)
+
+
+def plan_unit_runs(db: Session, unit: PromptTestUnit) -> UnitRunPlan:
+    """构造测试单元的调用计划，不发起调用也不写库。
+
+    尚未配置提供者时 ``provider`` 与 ``model`` 为空，执行时才会报错；消息模板缺少
+    变量时抛出 ``PromptTestExecutionError``。
+    """
+
+    try:
+        provider, model = _resolve_provider_and_model(db, unit)
+    except PromptTestExecutionError:
+        provider, model = None, None
+
+    prompt_snapshot = _resolve_prompt_snapshot(unit)
+    if not prompt_snapshot and unit.prompt_version_id:
+        # 尚未保存的测试单元只有 Prompt 版本 ID，关联对象不会自动加载
+        version = db.get(PromptVersion, unit.prompt_version_id)
+        prompt_snapshot = version.content if version and version.content else ""
+    context_template = unit.variables or {}
+    message_plan = _compile_messages(unit, prompt_snapshot)
+    _validate_message_plan(message_plan, context_template)
+
+    parameters = _collect_parameters(unit)
+    rounds_per_case = max(1, int(unit.rounds or 1))
+    case_count = max(_count_variable_cases(context_template), 1)
+    case_payloads = [
+        {
+            "model": model.name if model else unit.model_name,
+            "messages": message_plan.render(
+                _resolve_context(context_template, index), index
+            ),
+            **parameters,
+        }
+        for index in range(1, case_count + 1)
+    ]
+    return UnitRunPlan(
+        provider=provider,
+        model=model,
+        case_payloads=case_payloads,
+        rounds_per_case=rounds_per_case,
+        concurrency=min(
+            resolve_concurrency_limit(model), rounds_per_case * case_count
+        ),
+    )
 
 
 def execute_prompt_test_experiment(
     db: Session,
     experiment: PromptTestExperiment,
     progress_callback: Callable[[int], None] | None = None,
+    cancel_token: CancellationToken | None = None,
+    round_callback: Callable[[dict[str, Any]], None] | None = None,
 ) -> PromptTestExperiment:
-    """执行单个最小测试单元的实验，并存储结果。"""
+    """执行单个最小测试单元的实验，并存储结果。
+
+    各轮次按模型的 ``concurrency_limit`` 在线程池中并发执行，结果、进度回调、
+    每轮完成回调 ``round_callback`` 与用量记录均在调用线程中处理；每轮完成即
+    追加一行 ``PromptTestRound`` 及其用量记录，读取时按 ``run_index`` 排序。每轮调用前检查取消
+    令牌，取消后保留已完成轮次并标记为已取消；单元开启 ``fail_fast`` 时首个失败
+    轮次即停止剩余轮次并抛出 ``PromptTestExecutionError``。
+    """
 
     if experiment.status not in {
         PromptTestExperimentStatus.PENDING,
@@ -83,13 +191,18 @@ def execute_prompt_test_experiment(
     prompt_snapshot = _resolve_prompt_snapshot(unit)
     parameters = _collect_parameters(unit)
     context_template = unit.variables or {}
+    message_plan = _compile_messages(unit, prompt_snapshot)
+    _validate_message_plan(message_plan, context_template)
 
     experiment.status = PromptTestExperimentStatus.RUNNING
     experiment.started_at = datetime.now(timezone.utc)
     experiment.error = None
+    # 重新执行时清空上一次的轮次结果；删除须先于新轮次写入，避免序号唯一约束冲突
+    experiment.rounds.clear()
+    experiment.legacy_outputs = None
     db.flush()
 
-    timeout_config = get_testing_timeout_config(db)
+    timeout_config = llm_resolution_cache.testing_timeout(db)
     request_timeout = float(
         timeout_config.test_task_timeout or DEFAULT_TEST_TASK_TIMEOUT
     )
@@ -97,89 +210,218 @@ def execute_prompt_test_experiment(
     run_records: list[dict[str, Any]] = []
     latencies: list[int] = []
     token_totals: list[int] = []
+    ttfts: list[int] = []
+    throughputs: list[float] = []
     json_success = 0
     failed_runs = 0
+    cache_hits = 0
+
+    fail_fast_error: PromptTestExecutionError | None = None
+    extra_data = unit.extra if isinstance(unit.extra, Mapping) else {}
+    fail_fast = resolve_fail_fast(extra_data.get("fail_fast"))
 
     rounds_per_case = max(1, int(unit.rounds or 1))
     case_count = _count_variable_cases(context_template)
     total_runs = rounds_per_case * max(case_count, 1)
 
-    for run_index in range(1, total_runs + 1):
-        context = _resolve_context(context_template, run_index)
+    round_token = CancellationToken()
+    unlink_cancel = (
+        cancel_token.add_callback(lambda: round_token.cancel(cancel_token.reason))
+        if cancel_token is not None
+        else (lambda: None)
+    )
+
+    def _run_round(run_index: int) -> dict[str, Any]:
+        round_token.raise_if_cancelled()
         try:
-            run_record = _execute_single_round(
+            return _execute_single_round(
                 provider=provider,
                 model=model,
                 unit=unit,
                 prompt_snapshot=prompt_snapshot,
                 base_parameters=parameters,
-                context=context,
+                context=_resolve_context(context_template, run_index),
                 run_index=run_index,
                 request_timeout=request_timeout,
+                cancel_token=round_token,
+                message_plan=message_plan,
             )
         except PromptTestExecutionError as exc:
-            failed_runs += 1
-            failure_record: dict[str, Any] = {
-                "run_index": run_index,
-                "status": "failed",
-                "error": str(exc),
-                "variables": _extract_variables(context) or None,
-            }
-            if exc.status_code is not None:
-                failure_record["status_code"] = exc.status_code
-            run_records.append(failure_record)
-            if progress_callback is not None:
-                try:
-                    progress_callback(1)
-                except Exception:  # pragma: no cover - 防御性兜底
-                    logger.exception("更新 Prompt 测试进度时出现异常")
-            logger.warning(
-                "Prompt 测试单元 %s 的第 %s 次调用失败: %s", unit.id, run_index, exc
-            )
-            continue
+            if fail_fast:
+                # 在工作线程内立即停止，避免同一线程继续领取排队中的轮次
+                round_token.cancel(f"快速失败: {exc}")
+            raise
+
+    # 取消或快速失败时不提前退出迭代：排队中的轮次被丢弃，在途轮次结束后照常保留
+    outcomes = iter_threaded_outcomes(
+        range(1, total_runs + 1),
+        _run_round,
+        worker_count=min(resolve_concurrency_limit(model), total_runs),
+        cancel_token=round_token,
+    )
+    completed_records: dict[int, dict[str, Any]] = {}
+    try:
+        for run_index, outcome in outcomes:
+            if isinstance(outcome, OperationCancelledError):
+                continue
+            if isinstance(outcome, PromptTestExecutionError):
+                failed_runs += 1
+                failure_record: dict[str, Any] = {
+                    "run_index": run_index,
+                    "status": "failed",
+                    "error": str(outcome),
+                    "variables": _extract_variables(
+                        _resolve_context(context_template, run_index)
+                    )
+                    or None,
+                }
+                if outcome.status_code is not None:
+                    failure_record["status_code"] = outcome.status_code
+                if outcome.attempts is not None:
+                    failure_record["attempts"] = outcome.attempts
+                completed_records[run_index] = failure_record
+                _append_round(db, experiment, failure_record)
+                _report_progress(progress_callback)
+                _report_round(round_callback, experiment, failure_record)
+                logger.warning(
+                    "Prompt 测试单元 %s 的第 %s 次调用失败: %s",
+                    unit.id,
+                    run_index,
+                    outcome,
+                )
+                if fail_fast and fail_fast_error is None:
+                    fail_fast_error = PromptTestExecutionError(
+                        f"快速失败: {outcome}",
+                        status_code=outcome.status_code,
+                        attempts=outcome.attempts,
+                    )
+                continue
+            if isinstance(outcome, BaseException):
+                raise outcome
+            completed_records[run_index] = outcome
+            if not outcome.get("cache_hit"):
+                # 用量随轮次一起写入，实验中途出错或快速失败时计费记录也不会丢失
+                usage_log = _build_usage_log(
+                    provider=provider, model=model, unit=unit, run_record=outcome
+                )
+                store_usage_messages([usage_log])
+                db.add(usage_log)
+            _append_round(db, experiment, outcome)
+            _report_progress(progress_callback)
+            _report_round(round_callback, experiment, outcome)
+    finally:
+        unlink_cancel()
+        outcomes.close()
+
+    cancelled = (
+        fail_fast_error is None and cancel_token is not None and cancel_token.cancelled
+    )
 
+    # 并发完成顺序不确定，按轮次序号排序后再汇总输出与指标
+    for run_index in sorted(completed_records):
+        run_record = completed_records[run_index]
         run_records.append(run_record)
-        if progress_callback is not None:
-            try:
-                progress_callback(1)
-            except Exception:  # pragma: no cover - 防御性兜底
-                logger.exception("更新 Prompt 测试进度时出现异常")
-        usage_log = _build_usage_log(
-            provider=provider,
-            model=model,
-            unit=unit,
-            run_record=run_record,
-        )
-        db.add(usage_log)
+        if run_record.get("status") == "failed":
+            continue
+        if run_record.get("cache_hit"):
+            # 命中响应缓存时没有实际调用提供者，不计入用量
+            cache_hits += 1
         latency = run_record.get("latency_ms")
         if isinstance(latency, (int, float)):
             latencies.append(int(latency))
         tokens = run_record.get("total_tokens")
         if isinstance(tokens, (int, float)):
             token_totals.append(int(tokens))
+        ttft = run_record.get("ttft_ms")
+        if isinstance(ttft, (int, float)):
+            ttfts.append(int(ttft))
+        throughput = run_record.get("tokens_per_second")
+        if isinstance(throughput, (int, float)):
+            throughputs.append(float(throughput))
         if run_record.get("parsed_output") is not None:
             json_success += 1
 
-    experiment.outputs = run_records
     experiment.metrics = _aggregate_metrics(
         latencies=latencies,
         tokens=token_totals,
         total_rounds=len(run_records),
         json_success=json_success,
+        ttfts=ttfts,
+        throughputs=throughputs,
     )
     experiment.metrics["failed_runs"] = failed_runs
     experiment.metrics["success_runs"] = len(run_records) - failed_runs
+    experiment.metrics["cache_hits"] = cache_hits
 
-    if failed_runs and failed_runs == len(run_records):
+    if cancelled:
+        experiment.status = PromptTestExperimentStatus.CANCELLED
+        experiment.error = cancel_token.reason if cancel_token else None
+    elif fail_fast_error is not None:
+        experiment.status = PromptTestExperimentStatus.FAILED
+        experiment.error = str(fail_fast_error)
+    elif failed_runs and failed_runs == len(run_records):
         experiment.status = PromptTestExperimentStatus.FAILED
     else:
         experiment.status = PromptTestExperimentStatus.COMPLETED
         experiment.error = f"{failed_runs} 次调用失败" if failed_runs else None
     experiment.finished_at = datetime.now(timezone.utc)
     db.flush()
+    if fail_fast_error is not None:
+        raise fail_fast_error
     return experiment
 
 
+def _report_progress(progress_callback: Callable[[int], None] | None) -> None:
+    if progress_callback is None:
+        return
+    try:
+        progress_callback(1)
+    except Exception:  # pragma: no cover - 防御性兜底
+        logger.exception("更新 Prompt 测试进度时出现异常")
+
+
+def _append_round(
+    db: Session, experiment: PromptTestExperiment, run_record: Mapping[str, Any]
+) -> None:
+    """轮次完成即写入结果表，避免在实验结束时整体改写一个大 JSON 列。
+
+    请求消息先写入消息块表（独立提交），轮次只保存消息摘要。
+    """
+
+    record = dict(run_record)
+    messages = record.pop("messages", None)
+    if isinstance(messages, list):
+        record["message_refs"] = message_store.put_many(messages)
+    elif messages is not None:
+        record["messages"] = messages
+    experiment.rounds.append(PromptTestRound.from_record(record))
+    db.flush()
+
+
+def _report_round(
+    round_callback: Callable[[dict[str, Any]], None] | None,
+    experiment: PromptTestExperiment,
+    run_record: Mapping[str, Any],
+) -> None:
+    if round_callback is None:
+        return
+    try:
+        round_callback(
+            {
+                "unit_id": experiment.unit_id,
+                "experiment_id": experiment.id,
+                "run_index": run_record.get("run_index"),
+                "status": run_record.get("status") or "success",
+                "latency_ms": run_record.get("latency_ms"),
+                "total_tokens": run_record.get("total_tokens"),
+                "cache_hit": bool(run_record.get("cache_hit")),
+                "error": run_record.get("error"),
+            }
+        )
+    except Exception:  # pragma: no cover - 防御性兜底
+        logger.exception("推送 Prompt 测试轮次完成事件时出现异常")
+
+
 def _resolve_provider_and_model(
     db: Session, unit: PromptTestUnit
 ) -> tuple[LLMProvider, LLMModel | None]:
@@ -187,44 +429,32 @@ def _resolve_provider_and_model(
     model: LLMModel | None = None
 
     if isinstance(unit.llm_provider_id, int):
-        provider = db.get(LLMProvider, unit.llm_provider_id)
+        provider = llm_resolution_cache.provider_by_id(db, unit.llm_provider_id)
 
     extra_data = unit.extra if isinstance(unit.extra, Mapping) else {}
     provider_key = extra_data.get("provider_key")
     if provider is None and isinstance(provider_key, str):
-        provider = db.scalar(
-            select(LLMProvider).where(LLMProvider.provider_key == provider_key)
-        )
+        provider = llm_resolution_cache.provider_by_key(db, provider_key)
 
     model_id = extra_data.get("llm_model_id")
     if provider and isinstance(model_id, int):
-        model = db.get(LLMModel, model_id)
+        model = llm_resolution_cache.model_by_id(db, model_id)
 
     if provider is None:
-        stmt = (
-            select(LLMProvider, LLMModel)
-            .join(LLMModel, LLMModel.provider_id == LLMProvider.id)
-            .where(LLMModel.name == unit.model_name)
+        record = llm_resolution_cache.provider_and_model_by_model_name(
+            db, unit.model_name
         )
-        record = db.execute(stmt).first()
         if record:
             provider, model = record
 
     if provider is None:
-        provider = db.scalar(
-            select(LLMProvider).where(LLMProvider.provider_name == unit.model_name)
-        )
+        provider = llm_resolution_cache.provider_by_name(db, unit.model_name)
 
     if provider is None:
         raise PromptTestExecutionError("未找到合适的模型提供者配置。")
 
     if model is None:
-        model = db.scalar(
-            select(LLMModel).where(
-                LLMModel.provider_id == provider.id,
-                LLMModel.name == unit.model_name,
-            )
-        )
+        model = llm_resolution_cache.model_by_name(db, provider.id, unit.model_name)
 
     return provider, model
 
@@ -267,8 +497,15 @@ def _execute_single_round(
     context: Mapping[str, Any],
     run_index: int,
     request_timeout: float,
+    cancel_token: CancellationToken | None = None,
+    message_plan: _MessagePlan | None = None,
 ) -> dict[str, Any]:
-    messages = _build_messages(unit, prompt_snapshot, context, run_index)
+    if message_plan is None:
+        message_plan = _compile_messages(unit, prompt_snapshot)
+    try:
+        messages = message_plan.render(context, run_index)
+    except MissingTemplateVariablesError as exc:
+        raise PromptTestExecutionError(str(exc)) from exc
     payload = {
         "model": model.name if model else unit.model_name,
         "messages": messages,
@@ -279,31 +516,89 @@ def _execute_single_round(
         key: value for key, value in payload.items() if key not in {"model", "messages"}
     }
 
+    cache_key: str | None = None
+    extra_data = unit.extra if isinstance(unit.extra, Mapping) else {}
+    streaming = extra_data.get("streaming") is True
+    if resolve_cache_enabled(
+        extra_data.get("response_cache")
+    ) and is_deterministic_request(payload):
+        cache_key = build_cache_key(provider, payload)
+        cache_started = time.perf_counter()
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return _build_run_record(
+                cached,
+                run_index=run_index,
+                messages=messages,
+                request_parameters=request_parameters,
+                context=context,
+                latency_ms=int((time.perf_counter() - cache_started) * 1000),
+                attempts=1,
+                cache_hit=True,
+            )
+
     base_url = _resolve_base_url(provider)
     headers = {
         "Authorization": f"Bearer {provider.api_key}",
         "Content-Type": "application/json",
     }
 
+    client = llm_client_registry.get_sync_client(provider)
+    attempt_state: dict[str, Any] = {}
+
+    def _send(timeout: float) -> httpx.Response:
+        raise_if_cancelled(cancel_token)
+        reservation = llm_rate_limiter.acquire(model, payload)
+        try:
+            with concurrency_governor.slot(model) as slot:
+                raise_if_cancelled(cancel_token)
+                attempt_state["start_time"] = time.perf_counter()
+                request_timeout_value = llm_client_registry.request_timeout(
+                    provider, timeout
+                )
+                if streaming:
+                    response, attempt_state["stream"] = consume_chat_stream(
+                        client,
+                        f"{base_url}/chat/completions",
+                        headers=headers,
+                        payload=payload,
+                        timeout=request_timeout_value,
+                        started_at=attempt_state["start_time"],
+                        cancel_token=cancel_token,
+                    )
+                else:
+                    response = client.post(
+                        f"{base_url}/chat/completions",
+                        headers=headers,
+                        json=payload,
+                        timeout=request_timeout_value,
+                    )
+                slot.observe(
+                    response.status_code,
+                    (time.perf_counter() - attempt_state["start_time"]) * 1000,
+                )
+        except BaseException:
+            # 调用未完成或被取消，预支的额度不会被消耗
+            llm_rate_limiter.settle(reservation, 0)
+            raise
+        track_reservation(attempt_state, reservation, response)
+        return response
+
     try:
-        sleep_lower, sleep_upper = REQUEST_SLEEP_RANGE
-        if sleep_upper > 0:
-            jitter = random.uniform(sleep_lower, sleep_upper)
-            if jitter > 0:
-                time.sleep(jitter)
-    except Exception:  # pragma: no cover - 容错兜底
-        pass
-
-    start_time = time.perf_counter()
-    try:
-        response = httpx.post(
-            f"{base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=request_timeout,
+        outcome = call_with_retry(
+            _send,
+            policy=RetryPolicy.from_mapping(provider.retry_policy),
+            default_timeout=request_timeout,
+            sleep=cancel_token.sleep if cancel_token is not None else None,
         )
+    except RetryDeadlineExceeded as exc:
+        raise PromptTestExecutionError(
+            f"调用外部 LLM 超时: {exc}", status_code=504, attempts=exc.attempts
+        ) from exc
     except httpx.HTTPError as exc:  # pragma: no cover - 网络异常兜底
         raise PromptTestExecutionError(f"调用外部 LLM 失败: {exc}") from exc
+    response = outcome.response
+    start_time = attempt_state["start_time"]
 
     if response.status_code >= 400:
         try:
@@ -314,21 +609,63 @@ def _execute_single_round(
         raise PromptTestExecutionError(
             f"LLM 请求失败 (HTTP {response.status_code}): {detail}",
             status_code=response.status_code,
+            attempts=outcome.attempts,
         )
 
-    try:
-        payload_obj = response.json()
-    except ValueError as exc:  # pragma: no cover - 响应解析异常
-        raise PromptTestExecutionError("LLM 响应解析失败。") from exc
-
-    elapsed = response.elapsed.total_seconds() * 1000 if response.elapsed else None
-    latency_ms = (
-        int(elapsed)
-        if elapsed is not None
-        else int((time.perf_counter() - start_time) * 1000)
+    collector: StreamCollector | None = attempt_state.get("stream")
+    if collector is not None:
+        payload_obj = collector.completion_payload()
+        finished_at = collector.finished_at or time.perf_counter()
+        latency_ms = int((finished_at - start_time) * 1000)
+    else:
+        try:
+            payload_obj = response.json()
+        except ValueError as exc:  # pragma: no cover - 响应解析异常
+            raise PromptTestExecutionError("LLM 响应解析失败。") from exc
+
+        elapsed = response.elapsed.total_seconds() * 1000 if response.elapsed else None
+        latency_ms = (
+            int(elapsed)
+            if elapsed is not None
+            else int((time.perf_counter() - start_time) * 1000)
+        )
+
+    run_record = _build_run_record(
+        payload_obj,
+        run_index=run_index,
+        messages=messages,
+        request_parameters=request_parameters,
+        context=context,
+        latency_ms=latency_ms,
+        attempts=outcome.attempts,
+        cache_hit=False,
     )
-    latency_ms = max(latency_ms, 0)
+    if collector is not None:
+        run_record.update(collector.metrics())
+    llm_rate_limiter.settle(
+        attempt_state.get("reservation"), run_record["total_tokens"]
+    )
+    if cache_key is not None:
+        response_cache.set(
+            cache_key,
+            payload_obj,
+            provider_id=provider.id,
+            model_name=payload.get("model"),
+        )
+    return run_record
 
+
+def _build_run_record(
+    payload_obj: Mapping[str, Any],
+    *,
+    run_index: int,
+    messages: list[dict[str, Any]],
+    request_parameters: Mapping[str, Any],
+    context: Mapping[str, Any],
+    latency_ms: int,
+    attempts: int,
+    cache_hit: bool,
+) -> dict[str, Any]:
     output_text = _extract_output(payload_obj)
     parsed_output = _try_parse_json(output_text)
 
@@ -360,8 +697,10 @@ def _execute_single_round(
         "prompt_tokens": prompt_tokens,
         "completion_tokens": completion_tokens,
         "total_tokens": total_tokens,
-        "latency_ms": latency_ms,
-        "raw_response": payload_obj,
+        "latency_ms": max(latency_ms, 0),
+        "attempts": attempts,
+        "cache_hit": cache_hit,
+        "raw_response": dict(payload_obj),
     }
 
 
@@ -435,74 +774,135 @@ def _extract_variables(context: Mapping[str, Any] | None) -> dict[str, Any] | No
     return sanitized or None
 
 
-def _build_messages(
-    unit: PromptTestUnit,
-    prompt_snapshot: str,
+@dataclass(frozen=True)
+class _MessagePlan:
+    """单元消息结构的预编译结果，每个实验只解析一次，逐轮仅做变量替换。"""
+
+    conversation: tuple[tuple[str, CompiledTemplate | str], ...]
+    snapshot: CompiledTemplate | None
+    user_template: CompiledTemplate | None
+    needs_user_template: bool
+
+    def _resolve_user_template(
+        self, context: Mapping[str, Any]
+    ) -> CompiledTemplate | str | None:
+        if not self.needs_user_template:
+            return None
+        if self.user_template is not None:
+            return self.user_template
+        # 未配置 prompt_template 时用户消息来自用例变量，随用例变化按文本缓存编译
+        return _compile_content(context.get("user_prompt"))
+
+    def missing_variables(self, context: Mapping[str, Any]) -> set[str]:
+        missing: set[str] = set()
+        for _, content in self.conversation:
+            if isinstance(content, CompiledTemplate):
+                missing |= content.missing_variables(context)
+        if self.snapshot is not None:
+            missing |= self.snapshot.missing_variables(context)
+        user_template = self._resolve_user_template(context)
+        if isinstance(user_template, CompiledTemplate):
+            missing |= user_template.missing_variables(context)
+        return missing
+
+    def render(self, context: Mapping[str, Any], run_index: int) -> list[dict[str, Any]]:
+        messages: list[dict[str, Any]] = [
+            {"role": role, "content": _render_content(content, context, run_index)}
+            for role, content in self.conversation
+        ]
+
+        snapshot_message: dict[str, Any] | None = None
+        if self.snapshot is not None:
+            prompt_message = self.snapshot.render(context, run_index)
+            if prompt_message:
+                snapshot_message = {"role": "user", "content": prompt_message}
+                messages.insert(0, snapshot_message)
+
+        user_message = _render_content(
+            self._resolve_user_template(context), context, run_index
+        )
+        if user_message:
+            messages.append({"role": "user", "content": user_message})
+
+        if not messages:
+            messages.append(
+                {
+                    "role": "user",
+                    "content": f"请生成第 {run_index} 次响应。",
+                }
+            )
+        return messages
+
+
+def _compile_content(content: Any) -> CompiledTemplate | str | None:
+    if content is None:
+        return None
+    if not isinstance(content, str):
+        return str(content)
+    return compile_template(content)
+
+
+def _render_content(
+    content: CompiledTemplate | str | None,
     context: Mapping[str, Any],
     run_index: int,
-) -> list[dict[str, Any]]:
-    conversation: Any = None
+) -> str | None:
+    if isinstance(content, CompiledTemplate):
+        return content.render(context, run_index)
+    return content
+
+
+def _compile_messages(unit: PromptTestUnit, prompt_snapshot: str) -> _MessagePlan:
+    conversation_source: Any = None
     if isinstance(unit.parameters, Mapping):
-        conversation = unit.parameters.get("conversation") or unit.parameters.get(
-            "messages"
-        )
+        conversation_source = unit.parameters.get(
+            "conversation"
+        ) or unit.parameters.get("messages")
 
-    messages: list[dict[str, Any]] = []
-    if isinstance(conversation, Sequence):
-        for item in conversation:
+    conversation: list[tuple[str, CompiledTemplate | str]] = []
+    if isinstance(conversation_source, Sequence):
+        for item in conversation_source:
             if not isinstance(item, Mapping):
                 continue
-            role = str(item.get("role", "")).strip() or "user"
-            content = _format_text(item.get("content"), context, run_index)
+            content = _compile_content(item.get("content"))
             if content is None:
                 continue
-            messages.append({"role": role, "content": content})
+            role = str(item.get("role", "")).strip() or "user"
+            conversation.append((role, content))
 
-    snapshot_message: dict[str, Any] | None = None
-    prompt_message = _format_text(prompt_snapshot, context, run_index)
-    if prompt_message:
-        if not messages:
-            snapshot_message = {"role": "user", "content": prompt_message}
-            messages.append(snapshot_message)
-        elif not any(msg["role"] == "system" for msg in messages):
-            snapshot_message = {"role": "user", "content": prompt_message}
-            messages.insert(0, snapshot_message)
-
-    user_template = unit.prompt_template or context.get("user_prompt")
-    user_message = _format_text(user_template, context, run_index)
-
-    has_user = any(
-        msg.get("role") == "user"
-        and (snapshot_message is None or msg is not snapshot_message)
-        for msg in messages
+    # 快照仅在没有 system 消息时作为首条用户消息插入
+    uses_snapshot = bool(prompt_snapshot) and not any(
+        role == "system" for role, _ in conversation
+    )
+    # 对话中已有用户消息时不再追加 prompt_template 渲染出的用户消息
+    needs_user_template = not any(role == "user" for role, _ in conversation)
+    user_template = (
+        compile_template(str(unit.prompt_template)) if unit.prompt_template else None
+    )
+    return _MessagePlan(
+        conversation=tuple(conversation),
+        snapshot=compile_template(prompt_snapshot) if uses_snapshot else None,
+        user_template=user_template,
+        needs_user_template=needs_user_template,
     )
 
-    if user_message and not has_user:
-        messages.append({"role": "user", "content": user_message})
 
-    if not messages:
-        messages.append(
-            {
-                "role": "user",
-                "content": f"请生成第 {run_index} 次响应。",
-            }
+def _validate_message_plan(
+    plan: _MessagePlan, context_template: Mapping[str, Any] | Sequence[Any]
+) -> None:
+    """逐组用例检查模板引用的变量，缺失时在发出任何请求前报错。"""
+
+    missing: dict[str, int] = {}
+    case_count = max(_count_variable_cases(context_template), 1)
+    for case_index in range(1, case_count + 1):
+        context = _resolve_context(context_template, case_index)
+        for name in sorted(plan.missing_variables(context)):
+            missing.setdefault(name, case_index)
+    if missing:
+        detail = "、".join(
+            f"{name}（第 {case_index} 组用例）" for name, case_index in missing.items()
         )
-
-    return messages
-
-
-def _format_text(
-    template: Any, context: Mapping[str, Any], run_index: int
-) -> str | None:
-    if template is None:
-        return None
-    if not isinstance(template, str):
-        return str(template)
-    try:
-        replaced = template.replace("{{run_index}}", str(run_index))
-        return replaced.format(**context)
-    except Exception:
-        return template.replace("{{run_index}}", str(run_index))
+        raise PromptTestExecutionError(f"Prompt 模板缺少变量: {detail}")
 
 
 def _extract_output(payload_obj: Mapping[str, Any]) -> str:
@@ -536,6 +936,8 @@ def _aggregate_metrics(
     tokens: Sequence[int],
     total_rounds: int,
     json_success: int,
+    ttfts: Sequence[int] = (),
+    throughputs: Sequence[float] = (),
 ) -> dict[str, Any]:
     metrics: dict[str, Any] = {
         "rounds": total_rounds,
@@ -551,6 +953,16 @@ def _aggregate_metrics(
         metrics["max_total_tokens"] = max(tokens)
         metrics["min_total_tokens"] = min(tokens)
 
+    if ttfts:
+        ordered = sorted(ttfts)
+        metrics["avg_ttft_ms"] = statistics.fmean(ordered)
+        metrics["p95_ttft_ms"] = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+        metrics["min_ttft_ms"] = ordered[0]
+        metrics["max_ttft_ms"] = ordered[-1]
+
+    if throughputs:
+        metrics["avg_tokens_per_second"] = statistics.fmean(throughputs)
+
     if total_rounds:
         metrics["json_success_rate"] = round(json_success / total_rounds, 4)
 
@@ -611,11 +1023,15 @@ def _build_usage_log(
 
 
 def _resolve_base_url(provider: LLMProvider) -> str:
-    defaults = get_provider_defaults(provider.provider_key)
-    base_url = provider.base_url or (defaults.base_url if defaults else None)
+    base_url = llm_resolution_cache.base_url(provider)
     if not base_url:
         raise PromptTestExecutionError("模型提供者缺少基础 URL 配置。")
-    return base_url.rstrip("/")
+    return base_url
 
 
-__all__ = ["execute_prompt_test_experiment", "PromptTestExecutionError"]
+__all__ = [
+    "execute_prompt_test_experiment",
+    "plan_unit_runs",
+    "PromptTestExecutionError",
+    "UnitRunPlan",
+]
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Callable
+from types import TracebackType
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.result import Result
+from app.models.usage import LLMUsageLog
+from app.services.llm_usage import store_usage_messages
+
+logger = logging.getLogger("promptworks.result_writer")
+
+
+class BufferedResultWriter:
+    """缓冲测试结果与用量日志，按批量大小或时间间隔批量写入数据库。
+
+    每次刷新都使用独立会话并立即提交，不依赖调用方事务：即便任务执行到一半
+    进程崩溃或外层事务回滚，已经刷新的批次依然保留，最多丢失一个未满的批次。
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+        session_factory: Callable[[], Session] | None = None,
+    ) -> None:
+        self.batch_size = max(
+            1, batch_size if batch_size is not None else settings.TEST_RUN_RESULT_BATCH_SIZE
+        )
+        self.flush_interval = max(
+            0.0,
+            flush_interval
+            if flush_interval is not None
+            else settings.TEST_RUN_RESULT_FLUSH_INTERVAL,
+        )
+        self._session_factory = session_factory
+        self._results: list[Result] = []
+        self._usage_logs: list[LLMUsageLog] = []
+        self._last_flush = time.monotonic()
+        self.flushed_count = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._results)
+
+    def add(self, result: Result, usage_log: LLMUsageLog | None = None) -> None:
+        """登记一条完成的结果，达到批量大小或超过刷新间隔时自动写入。"""
+
+        self._results.append(result)
+        if usage_log is not None:
+            self._usage_logs.append(usage_log)
+        if (
+            len(self._results) >= self.batch_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> int:
+        """将缓冲区中的记录一次性写入并提交，返回写入的结果条数。"""
+
+        self._last_flush = time.monotonic()
+        if not self._results and not self._usage_logs:
+            return 0
+        results, usage_logs = self._results, self._usage_logs
+        self._results, self._usage_logs = [], []
+
+        factory = self._session_factory or db_session.SessionLocal
+        session = factory()
+        try:
+            store_usage_messages(usage_logs)
+            session.add_all(results)
+            session.add_all(usage_logs)
+            session.commit()
+        except Exception:
+            session.rollback()
+            # 写入失败时放回缓冲区，交由调用方决定是否重试
+            self._results = results + self._results
+            self._usage_logs = usage_logs + self._usage_logs
+            raise
+        finally:
+            session.close()
+
+        self.flushed_count += len(results)
+        logger.debug("批量写入测试结果 %s 条、用量日志 %s 条", len(results), len(usage_logs))
+        return len(results)
+
+    def __enter__(self) -> "BufferedResultWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self.flush()
+            return
+        # 执行中途出错时尽量保留已完成的结果，但不能掩盖原始异常
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("测试任务异常退出时写入剩余结果失败")
+
+
+__all__ = ["BufferedResultWriter"]
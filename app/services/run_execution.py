@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from queue import Empty, Queue
+from typing import Any, TypeVar
+
+import httpx
+
+from app.core.cancellation import CancellationToken
+from app.core.llm_http import async_runner
+from app.core.rate_limiter import RateLimitReservation, llm_rate_limiter
+
+T = TypeVar("T")
+
+CANCEL_POLL_INTERVAL = 0.1
+
+
+def iter_threaded_outcomes(
+    run_indices: Sequence[int],
+    execute: Callable[[int], T],
+    *,
+    worker_count: int,
+    cancel_token: CancellationToken | None = None,
+) -> Iterator[tuple[int, T | BaseException]]:
+    """在线程池中执行全部轮次，并按完成顺序回传结果或异常。
+
+    收到取消信号后丢弃排队中的轮次，但仍等待在途轮次结束并回传其结果：这些调用
+    已经发生，结果与用量需要落库。流式读取会随令牌取消而关闭，不会拖延太久。
+    """
+
+    executor = ThreadPoolExecutor(max_workers=worker_count)
+    try:
+        future_map = {executor.submit(execute, index): index for index in run_indices}
+        pending = set(future_map)
+        while pending:
+            if cancel_token is not None and cancel_token.cancelled:
+                pending = {future for future in pending if not future.cancel()}
+                cancel_token = None
+                if not pending:
+                    break
+            done, pending = wait(
+                pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                run_index = future_map[future]
+                try:
+                    yield run_index, future.result()
+                except Exception as exc:
+                    yield run_index, exc
+    finally:
+        # 调用方提前结束迭代时不阻塞在在途线程上
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_async_outcomes(
+    run_indices: Sequence[int],
+    execute: Callable[[httpx.AsyncClient, int], Awaitable[T]],
+    *,
+    client_factory: Callable[[], httpx.AsyncClient],
+    concurrency_limit: int,
+    cancel_token: CancellationToken | None = None,
+) -> Iterator[tuple[int, T | BaseException]]:
+    """在后台事件循环中并发执行全部轮次，并按完成顺序回传结果或异常。
+
+    所有轮次共享提供者在后台事件循环上的长连接 AsyncClient，并发度由信号量控制；
+    结果通过线程安全队列交回调用线程，从而保证数据库会话只在调用线程中使用。
+    收到取消信号时直接取消全部协程，在途的 HTTP 请求随之关闭。
+    """
+
+    outcomes: Queue[tuple[int, T | BaseException]] = Queue()
+
+    async def _run_all() -> None:
+        client = client_factory()
+        semaphore = asyncio.Semaphore(max(1, concurrency_limit))
+
+        async def _run_one(run_index: int) -> None:
+            async with semaphore:
+                try:
+                    outcome: T | BaseException = await execute(client, run_index)
+                except asyncio.CancelledError:
+                    return
+                except Exception as exc:
+                    outcome = exc
+            outcomes.put((run_index, outcome))
+
+        tasks = [asyncio.create_task(_run_one(index)) for index in run_indices]
+        remove_callback: Callable[[], None] = lambda: None
+        if cancel_token is not None:
+            loop = asyncio.get_running_loop()
+
+            def _cancel_tasks() -> None:
+                for task in tasks:
+                    loop.call_soon_threadsafe(task.cancel)
+
+            remove_callback = cancel_token.add_callback(_cancel_tasks)
+        try:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            remove_callback()
+
+    future = async_runner.submit(_run_all())
+    remaining = len(run_indices)
+    while remaining:
+        if cancel_token is not None and cancel_token.cancelled:
+            break
+        try:
+            item = outcomes.get(timeout=CANCEL_POLL_INTERVAL)
+        except Empty:
+            if future.done():
+                future.result()
+                if outcomes.empty():
+                    break
+            continue
+        remaining -= 1
+        yield item
+    future.result()
+
+
+def track_reservation(
+    attempt_state: dict[str, Any],
+    reservation: RateLimitReservation | None,
+    response: httpx.Response,
+) -> None:
+    """失败的尝试不会消耗 Token，退回预支额度；成功时留待按真实用量校正。"""
+
+    if response.status_code >= 400:
+        llm_rate_limiter.settle(reservation, 0)
+    else:
+        attempt_state["reservation"] = reservation
+
+
+async def atrack_reservation(
+    attempt_state: dict[str, Any],
+    reservation: RateLimitReservation | None,
+    response: httpx.Response,
+) -> None:
+    """协程版本的 ``track_reservation``，不在事件循环中执行阻塞的结算。"""
+
+    if response.status_code >= 400:
+        await llm_rate_limiter.asettle(reservation, 0)
+    else:
+        attempt_state["reservation"] = reservation
+
+
+__all__ = [
+    "CANCEL_POLL_INTERVAL",
+    "atrack_reservation",
+    "iter_async_outcomes",
+    "iter_threaded_outcomes",
+    "track_reservation",
+]
@@ -5,11 +5,13 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Any
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.models.system_setting import SystemSetting
 
 TESTING_TIMEOUT_SETTING_KEY = "testing_timeout"
+RUNTIME_CONFIG_VERSION_KEY = "runtime_config_version"
 DEFAULT_QUICK_TEST_TIMEOUT = 30.0
 DEFAULT_TEST_TASK_TIMEOUT = 30.0
 
@@ -82,6 +84,7 @@ def update_testing_timeout_config(
         "test_task_timeout": sanitized_task,
     }
 
+    bump_runtime_config_version(db)
     record = db.get(SystemSetting, TESTING_TIMEOUT_SETTING_KEY)
     if record is None:
         record = SystemSetting(
@@ -104,10 +107,52 @@ def update_testing_timeout_config(
     )
 
 
+def get_runtime_config_version(db: Session) -> int:
+    """读取运行时配置版本号，供各进程判断本地缓存是否需要失效。
+
+    直接查询列值而不经过会话的对象缓存，保证长事务中也能读到其他进程的更新。
+    """
+
+    value = db.scalar(
+        select(SystemSetting.value).where(
+            SystemSetting.key == RUNTIME_CONFIG_VERSION_KEY
+        )
+    )
+    if isinstance(value, Mapping) and isinstance(value.get("version"), int):
+        return value["version"]
+    return 0
+
+
+def bump_runtime_config_version(db: Session) -> int:
+    """递增运行时配置版本号，随调用方的事务一同提交。"""
+
+    record = db.get(SystemSetting, RUNTIME_CONFIG_VERSION_KEY)
+    current = record.value if record is not None else None
+    version = (
+        current["version"]
+        if isinstance(current, Mapping) and isinstance(current.get("version"), int)
+        else 0
+    ) + 1
+    if record is None:
+        record = SystemSetting(
+            key=RUNTIME_CONFIG_VERSION_KEY,
+            value={"version": version},
+            description="模型提供者与测试配置的版本号，变更时用于失效各进程缓存",
+        )
+        db.add(record)
+    else:
+        record.value = {"version": version}
+    db.flush()
+    return version
+
+
 __all__ = [
     "TestingTimeoutConfig",
     "DEFAULT_QUICK_TEST_TIMEOUT",
     "DEFAULT_TEST_TASK_TIMEOUT",
+    "RUNTIME_CONFIG_VERSION_KEY",
+    "bump_runtime_config_version",
+    "get_runtime_config_version",
     "get_testing_timeout_config",
     "update_testing_timeout_config",
 ]
@@ -0,0 +1,373 @@
+"""测试任务执行前的 Token、费用与耗时预估。
+
+通过执行引擎与测试任务服务公开的调用计划（``plan_unit_runs``/``plan_test_run``）
+取得与执行时一致的请求体并统计输入 Token，输出 Token 与单次延迟取同一模型
+最近的调用记录，再结合模型的并发上限与 RPM/TPM 限额估算总耗时，避免误启动
+需要数小时才能完成的任务。TPM 按限流器实际预支的额度（输入估算加
+``max_tokens``）计算在途调用占用的额度。
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import math
+import statistics
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.prompt_test_task_queue import resolve_unit_concurrency
+from app.core.rate_limiter import estimate_request_tokens
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt_test import PromptTestTask, PromptTestUnit
+from app.models.test_run import TestRun
+from app.models.usage import LLMUsageLog
+from app.services.prompt_test_engine import PromptTestExecutionError, plan_unit_runs
+from app.services.test_run import plan_test_run
+
+logger = logging.getLogger("promptworks.task_estimator")
+
+# 中文在 UTF-8 中每字 3 字节、约合 1 个 Token，英文约 4 字节 1 个 Token，按偏保守的比例估算
+BYTES_PER_TOKEN = 3
+# 每条消息在对话格式中的角色与分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 4
+# 模型没有历史调用记录时采用的输出 Token 数与单次延迟
+DEFAULT_COMPLETION_TOKENS = 256
+DEFAULT_LATENCY_MS = 3000.0
+
+BOTTLENECK_CONCURRENCY = "concurrency"
+BOTTLENECK_RPM = "rpm"
+BOTTLENECK_TPM = "tpm"
+
+
+@dataclass(slots=True)
+class UsageProfile:
+    """同一模型最近调用的平均输出 Token 与延迟。"""
+
+    sample_count: int
+    completion_tokens: float
+    latency_ms: float
+
+
+@dataclass(slots=True)
+class RunEstimate:
+    """单个测试单元或测试任务的预估结果。"""
+
+    name: str
+    model_name: str
+    run_count: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    cost: float | None
+    duration_seconds: float
+    concurrency: int
+    rpm_limit: int | None
+    tpm_limit: int | None
+    bottleneck: str
+    history_samples: int
+    avg_latency_ms: float
+
+
+@dataclass(slots=True)
+class TaskEstimate:
+    """整个任务的预估汇总，``cost`` 在任一模型未配置单价时为空。"""
+
+    run_count: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    cost: float | None
+    duration_seconds: float
+    tokenizer: str
+    items: list[RunEstimate] = field(default_factory=list)
+
+
+class TaskEstimationError(Exception):
+    """无法渲染请求消息等导致预估失败时抛出。"""
+
+
+@lru_cache(maxsize=1)
+def _load_tokenizer() -> Any | None:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # pragma: no cover - 词表无法加载时回退为字节估算
+        logger.warning("加载 tiktoken 词表失败，Token 数改用字节数估算")
+        return None
+
+
+def tokenizer_name() -> str:
+    return "tiktoken:cl100k_base" if _load_tokenizer() is not None else "bytes"
+
+
+def _message_text(message: Any) -> str:
+    if not isinstance(message, Mapping):
+        return ""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, Sequence):
+        return "".join(
+            part["text"]
+            for part in content
+            if isinstance(part, Mapping) and isinstance(part.get("text"), str)
+        )
+    return ""
+
+
+def count_prompt_tokens(messages: Sequence[Any]) -> int:
+    """统计一次请求的输入 Token，安装了 tiktoken 时精确计数，否则按字节数估算。"""
+
+    encoder = _load_tokenizer()
+    total = 0
+    for message in messages:
+        text = _message_text(message)
+        if encoder is not None:
+            total += len(encoder.encode(text))
+        else:
+            total += math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN)
+        total += MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def load_usage_profile(
+    db: Session,
+    model_name: str,
+    *,
+    provider_id: int | None = None,
+    max_tokens: int | None = None,
+) -> UsageProfile:
+    """读取同一模型最近的调用记录，计算平均输出 Token 与延迟。"""
+
+    stmt = (
+        select(LLMUsageLog.completion_tokens, LLMUsageLog.latency_ms)
+        .where(LLMUsageLog.model_name == model_name)
+        .order_by(LLMUsageLog.created_at.desc(), LLMUsageLog.id.desc())
+        .limit(max(1, settings.TASK_ESTIMATE_HISTORY_SIZE))
+    )
+    if provider_id is not None:
+        stmt = stmt.where(LLMUsageLog.provider_id == provider_id)
+    rows = db.execute(stmt).all()
+
+    completions = [row.completion_tokens for row in rows if row.completion_tokens]
+    latencies = [row.latency_ms for row in rows if row.latency_ms]
+    completion_tokens = (
+        statistics.fmean(completions) if completions else DEFAULT_COMPLETION_TOKENS
+    )
+    if isinstance(max_tokens, int) and not isinstance(max_tokens, bool):
+        completion_tokens = min(completion_tokens, max(max_tokens, 0))
+    return UsageProfile(
+        sample_count=len(rows),
+        completion_tokens=completion_tokens,
+        latency_ms=statistics.fmean(latencies) if latencies else DEFAULT_LATENCY_MS,
+    )
+
+
+def estimate_duration(
+    run_count: int,
+    *,
+    latency_ms: float,
+    concurrency: int,
+    tokens_per_run: float,
+    reserved_tokens_per_run: float | None = None,
+    rpm_limit: int | None = None,
+    tpm_limit: int | None = None,
+) -> tuple[float, str]:
+    """估算执行全部调用的秒数并返回瓶颈。
+
+    并发受限时按批次串行计算；RPM/TPM 令牌桶的容量即每分钟额度，首分钟额度
+    用完后按额度匀速放行，最后一次请求发出后还需等待一次调用的延迟。限流器
+    发送前按 ``reserved_tokens_per_run`` 预支 TPM 额度，调用完成后才按真实用量
+    退回差额，因此在途调用额外占用的额度同样计入。
+    """
+
+    if run_count <= 0:
+        return 0.0, BOTTLENECK_CONCURRENCY
+    latency = max(latency_ms, 0.0) / 1000
+    candidates = [
+        (math.ceil(run_count / max(1, concurrency)) * latency, BOTTLENECK_CONCURRENCY)
+    ]
+    if rpm_limit:
+        candidates.append(
+            (max(0, run_count - rpm_limit) * 60 / rpm_limit + latency, BOTTLENECK_RPM)
+        )
+    if tpm_limit:
+        consumed = max(tokens_per_run, 0.0)
+        reserved = max(reserved_tokens_per_run or 0.0, consumed)
+        in_flight = min(max(1, concurrency), run_count)
+        backlog = max(
+            0.0, run_count * consumed + in_flight * (reserved - consumed) - tpm_limit
+        )
+        candidates.append((backlog * 60 / tpm_limit + latency, BOTTLENECK_TPM))
+    return max(candidates, key=lambda item: item[0])
+
+
+def _resolve_price(model_name: str) -> Mapping[str, Any] | None:
+    pricing = settings.LLM_MODEL_PRICING.get(model_name)
+    return pricing if isinstance(pricing, Mapping) else None
+
+
+def _estimate_cost(
+    model_name: str, prompt_tokens: int, completion_tokens: int
+) -> float | None:
+    pricing = _resolve_price(model_name)
+    if pricing is None:
+        return None
+    input_price = float(pricing.get("input") or 0)
+    output_price = float(pricing.get("output") or 0)
+    return round(
+        prompt_tokens / 1000 * input_price + completion_tokens / 1000 * output_price, 6
+    )
+
+
+def _build_run_estimate(
+    db: Session,
+    *,
+    name: str,
+    model_name: str,
+    provider: LLMProvider | None,
+    model: LLMModel | None,
+    run_count: int,
+    prompt_tokens: int,
+    reserved_tokens: int,
+    max_tokens: Any,
+    concurrency: int,
+) -> RunEstimate:
+    model_name = model.name if model else model_name
+    profile = load_usage_profile(
+        db,
+        model_name,
+        provider_id=provider.id if provider else None,
+        max_tokens=max_tokens,
+    )
+    completion_tokens = math.ceil(profile.completion_tokens * run_count)
+    rpm_limit = model.rpm_limit if model else None
+    tpm_limit = model.tpm_limit if model else None
+    runs = max(run_count, 1)
+    duration, bottleneck = estimate_duration(
+        run_count,
+        latency_ms=profile.latency_ms,
+        concurrency=concurrency,
+        tokens_per_run=(prompt_tokens + completion_tokens) / runs,
+        reserved_tokens_per_run=reserved_tokens / runs,
+        rpm_limit=rpm_limit,
+        tpm_limit=tpm_limit,
+    )
+    return RunEstimate(
+        name=name,
+        model_name=model_name,
+        run_count=run_count,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        cost=_estimate_cost(model_name, prompt_tokens, completion_tokens),
+        duration_seconds=round(duration, 3),
+        concurrency=concurrency,
+        rpm_limit=rpm_limit,
+        tpm_limit=tpm_limit,
+        bottleneck=bottleneck,
+        history_samples=profile.sample_count,
+        avg_latency_ms=round(profile.latency_ms, 3),
+    )
+
+
+def _summarize(items: list[RunEstimate], duration_seconds: float) -> TaskEstimate:
+    costs = [item.cost for item in items]
+    return TaskEstimate(
+        run_count=sum(item.run_count for item in items),
+        prompt_tokens=sum(item.prompt_tokens for item in items),
+        completion_tokens=sum(item.completion_tokens for item in items),
+        total_tokens=sum(item.total_tokens for item in items),
+        cost=None
+        if not costs or any(cost is None for cost in costs)
+        else round(sum(cost for cost in costs if cost is not None), 6),
+        duration_seconds=round(duration_seconds, 3),
+        tokenizer=tokenizer_name(),
+        items=items,
+    )
+
+
+def _estimate_prompt_test_unit(db: Session, unit: PromptTestUnit) -> RunEstimate:
+    try:
+        plan = plan_unit_runs(db, unit)
+    except PromptTestExecutionError as exc:
+        raise TaskEstimationError(f"测试单元「{unit.name}」{exc}") from exc
+
+    payloads = plan.case_payloads
+    return _build_run_estimate(
+        db,
+        name=unit.name,
+        model_name=unit.model_name,
+        provider=plan.provider,
+        model=plan.model,
+        run_count=plan.run_count,
+        prompt_tokens=sum(
+            count_prompt_tokens(payload["messages"]) for payload in payloads
+        )
+        * plan.rounds_per_case,
+        reserved_tokens=sum(estimate_request_tokens(payload) for payload in payloads)
+        * plan.rounds_per_case,
+        max_tokens=payloads[0].get("max_tokens"),
+        concurrency=plan.concurrency,
+    )
+
+
+def estimate_prompt_test_task(
+    db: Session, task: PromptTestTask, units: Sequence[PromptTestUnit]
+) -> TaskEstimate:
+    """预估 Prompt 测试任务，测试单元按任务的单元并行数依次调度。"""
+
+    items = [_estimate_prompt_test_unit(db, unit) for unit in units]
+    if not items:
+        return _summarize(items, 0.0)
+    slots = [0.0] * resolve_unit_concurrency(task, len(items))
+    for item in items:
+        start = heapq.heappop(slots)
+        heapq.heappush(slots, start + item.duration_seconds)
+    return _summarize(items, max(slots))
+
+
+def estimate_test_run(db: Session, test_run: TestRun) -> TaskEstimate:
+    """预估单个测试任务的全部重复调用。"""
+
+    plan = plan_test_run(db, test_run)
+    item = _build_run_estimate(
+        db,
+        name=test_run.model_name,
+        model_name=test_run.model_name,
+        provider=plan.provider,
+        model=plan.model,
+        run_count=plan.run_count,
+        prompt_tokens=sum(
+            count_prompt_tokens(payload["messages"]) for payload in plan.payloads
+        ),
+        reserved_tokens=sum(
+            estimate_request_tokens(payload) for payload in plan.payloads
+        ),
+        max_tokens=plan.payloads[0].get("max_tokens"),
+        concurrency=plan.concurrency,
+    )
+    return _summarize([item], item.duration_seconds)
+
+
+__all__ = [
+    "RunEstimate",
+    "TaskEstimate",
+    "TaskEstimationError",
+    "UsageProfile",
+    "count_prompt_tokens",
+    "estimate_duration",
+    "estimate_prompt_test_task",
+    "estimate_test_run",
+    "load_usage_profile",
+]
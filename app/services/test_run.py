@@ -1,31 +1,70 @@
 from __future__ import annotations
 
 import json
-import random
+import logging
+import threading
 import time
-from collections.abc import Mapping, Sequence
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections.abc import Iterator, Mapping, Sequence
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import Any
 
 import httpx
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 from starlette import status
 
-from app.core.llm_provider_registry import get_provider_defaults
+from app.core.cancellation import (
+    TEST_RUN_SCOPE,
+    CancellationToken,
+    OperationCancelledError,
+    cancellation_registry,
+    raise_if_cancelled,
+    resolve_fail_fast,
+)
+from app.core.concurrency_governor import concurrency_governor
+from app.core.config import settings
+from app.core.llm_http import llm_client_registry
+from app.core.llm_stream import (
+    StreamCollector,
+    aconsume_chat_stream,
+    consume_chat_stream,
+)
+from app.core.rate_limiter import llm_rate_limiter
+from app.core.response_cache import (
+    build_cache_key,
+    is_deterministic_request,
+    resolve_cache_enabled,
+    response_cache,
+)
+from app.core.retry_policy import (
+    RetryDeadlineExceeded,
+    RetryPolicy,
+    acall_with_retry,
+    call_with_retry,
+)
+from app.db import session as db_session
 from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import PromptVersion
 from app.models.result import Result
 from app.models.test_run import TestRun, TestRunStatus
 from app.models.usage import LLMUsageLog
-from app.services.system_settings import (
-    DEFAULT_TEST_TASK_TIMEOUT,
-    get_testing_timeout_config,
+from app.services.llm_resolution import llm_resolution_cache
+from app.services.result_writer import BufferedResultWriter
+from app.services.run_execution import (
+    atrack_reservation,
+    iter_async_outcomes,
+    iter_threaded_outcomes,
+    track_reservation,
 )
+from app.services.system_settings import DEFAULT_TEST_TASK_TIMEOUT
+
+logger = logging.getLogger("promptworks.test_run")
 
 DEFAULT_TEST_TIMEOUT = DEFAULT_TEST_TASK_TIMEOUT
 DEFAULT_CONCURRENCY_LIMIT = 5
-REQUEST_SLEEP_RANGE = (0.05, 0.2)
+_RUNNABLE_STATUSES = (TestRunStatus.PENDING, TestRunStatus.RUNNING)
+EXECUTION_MODES = {"thread", "async"}
 
 _KNOWN_PARAMETER_KEYS = {
     "max_tokens",
@@ -54,6 +93,24 @@ class RunRequestContext:
     prompt_id: int | None
     prompt_version_id: int | None
     timeout_seconds: float
+    response_cache: bool = False
+    streaming: bool = False
+    cancel_token: CancellationToken | None = None
+
+
+@dataclass(frozen=True)
+class TestRunPlan:
+    """测试任务的调用计划：与执行时相同的请求体与并发数，供执行前预估使用。"""
+
+    __test__ = False
+    provider: LLMProvider | None
+    model: LLMModel | None
+    payloads: list[dict[str, Any]]
+    concurrency: int
+
+    @property
+    def run_count(self) -> int:
+        return len(self.payloads)
 
 
 class TestRunExecutionError(Exception):
@@ -71,7 +128,7 @@ class TestRunExecutionError(Exception):
 def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
     """调用外部 LLM 完成测试任务，并记录结果与用量。"""
 
-    if test_run.status not in {TestRunStatus.PENDING, TestRunStatus.RUNNING}:
+    if test_run.status not in _RUNNABLE_STATUSES:
         return test_run
 
     provider, model = _resolve_provider_and_model(db, test_run)
@@ -98,68 +155,67 @@ def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
         "Content-Type": "application/json",
     }
 
+    # 以状态为条件切换为执行中：取消接口以同样的条件把排队中的任务标记为已
+    # 取消，二者只会有一方成功
+    started = db.execute(
+        update(TestRun)
+        .where(TestRun.id == test_run.id, TestRun.status.in_(_RUNNABLE_STATUSES))
+        .values(status=TestRunStatus.RUNNING)
+        .execution_options(synchronize_session=False)
+    )
+    if started.rowcount != 1:
+        db.expire(test_run)
+        return test_run
+
+    # 执行前提交状态：轮次结果由独立会话写入，外键检查需要读取本行，若状态
+    # 变更一直未提交，行锁会持续到任务结束，导致结果写入等待本事务而死锁
     test_run.status = TestRunStatus.RUNNING
-    db.flush()
+    db.commit()
 
-    timeout_config = get_testing_timeout_config(db)
+    timeout_config = llm_resolution_cache.testing_timeout(db)
     request_timeout = float(timeout_config.test_task_timeout or DEFAULT_TEST_TIMEOUT)
 
-    context = RunRequestContext(
-        test_run_id=test_run.id,
-        model_name=test_run.model_name,
-        prompt_id=prompt_version.prompt_id,
-        prompt_version_id=test_run.prompt_version_id,
-        timeout_seconds=request_timeout,
-    )
-
-    concurrency_limit = DEFAULT_CONCURRENCY_LIMIT
-    if model and isinstance(model.concurrency_limit, int):
-        concurrency_limit = max(1, model.concurrency_limit)
-
-    def _execute_single(run_index: int) -> tuple[int, Result, LLMUsageLog]:
-        messages = _build_messages(schema_data, prompt_snapshot, run_index)
-        payload: dict[str, Any] = dict(parameters_template)
-        payload["model"] = model.name if model else test_run.model_name
-        payload["messages"] = messages
+    # 重试时只补齐缺失的轮次，已写入的结果保持不变
+    completed_indices = _load_completed_run_indices(db, test_run.id)
+    run_indices = [
+        index
+        for index in range(1, test_run.repetitions + 1)
+        if index not in completed_indices
+    ]
+    if completed_indices:
+        logger.info(
+            "测试任务 %s 已有 %s 轮结果，本次仅执行剩余 %s 轮",
+            test_run.id,
+            len(completed_indices),
+            len(run_indices),
+        )
 
-        result, usage_log = _invoke_llm_once(
+    with cancellation_registry.track(
+        TEST_RUN_SCOPE, test_run.id
+    ) as cancel_token, _watch_cancel_request(db, test_run.id, cancel_token):
+        error_message, error_status_code, fail_fast_triggered = _run_repetitions(
+            test_run,
+            run_indices,
+            schema_data=schema_data,
             provider=provider,
             model=model,
+            prompt_version_id=test_run.prompt_version_id,
+            prompt_id=prompt_version.prompt_id,
+            prompt_snapshot=prompt_snapshot,
+            parameters_template=parameters_template,
             base_url=base_url,
             headers=headers,
-            payload=payload,
-            context=context,
+            request_timeout=request_timeout,
+            cancel_token=cancel_token,
         )
 
-        result.test_run_id = context.test_run_id
-        result.run_index = run_index
-        return run_index, result, usage_log
-
-    run_indices = range(1, test_run.repetitions + 1)
-    error_message: str | None = None
-    error_status_code: int | None = None
-
-    worker_count = max(1, min(concurrency_limit, test_run.repetitions))
-
-    with ThreadPoolExecutor(max_workers=worker_count) as executor:
-        future_map = {
-            executor.submit(_execute_single, index): index for index in run_indices
-        }
-        for future in as_completed(future_map):
-            try:
-                _, result_obj, usage_obj = future.result()
-            except TestRunExecutionError as exc:
-                if error_message is None:
-                    error_message = str(exc)
-                    error_status_code = getattr(exc, "status_code", None)
-            except Exception as exc:  # pragma: no cover - 防御性
-                if error_message is None:
-                    error_message = f"执行测试任务失败: {exc}"
-                    error_status_code = status.HTTP_502_BAD_GATEWAY
-            else:
-                _persist_run_artifacts(db, result_obj, usage_obj)
+    # 结果由独立会话写入，刷新关联集合以便调用方读取到最新数据
+    db.expire(test_run, ["results"])
 
-    if error_message:
+    if cancel_token.cancelled and not fail_fast_triggered:
+        test_run.status = TestRunStatus.CANCELLED
+        test_run.last_error = cancel_token.reason
+    elif error_message:
         test_run.status = TestRunStatus.FAILED
         test_run.last_error = error_message
         if error_status_code is not None:
@@ -178,12 +234,262 @@ def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
     return test_run
 
 
+def _cancel_requested(session: Session, test_run_id: int) -> bool:
+    return bool(
+        session.scalar(
+            select(TestRun.cancel_requested).where(TestRun.id == test_run_id)
+        )
+    )
+
+
+@contextmanager
+def _watch_cancel_request(
+    db: Session, test_run_id: int, cancel_token: CancellationToken
+) -> Iterator[None]:
+    """把其他进程通过 ``cancel_requested`` 发出的取消请求投递到本地令牌。
+
+    进入时先检查一次，覆盖取消接口在本进程登记令牌之前发出的请求；之后按任务
+    心跳间隔在独立会话中轮询，间隔为 0 时不启动轮询线程。
+    """
+
+    if _cancel_requested(db, test_run_id):
+        cancel_token.cancel("测试任务已取消")
+    interval = settings.TASK_JOB_HEARTBEAT_INTERVAL
+    if interval <= 0 or cancel_token.cancelled:
+        yield
+        return
+
+    stop = threading.Event()
+
+    def _poll() -> None:
+        while not stop.wait(interval):
+            session = db_session.SessionLocal()
+            try:
+                if _cancel_requested(session, test_run_id):
+                    cancel_token.cancel("测试任务已取消")
+                    return
+            except Exception:  # pragma: no cover - 下一次轮询重试
+                logger.exception("读取测试任务 %s 的取消请求失败", test_run_id)
+            finally:
+                session.close()
+
+    watcher = threading.Thread(
+        target=_poll, name=f"test-run-cancel-{test_run_id}", daemon=True
+    )
+    watcher.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+def _run_repetitions(
+    test_run: TestRun,
+    run_indices: Sequence[int],
+    *,
+    schema_data: Mapping[str, Any],
+    provider: LLMProvider,
+    model: LLMModel | None,
+    prompt_id: int | None,
+    prompt_version_id: int | None,
+    prompt_snapshot: str,
+    parameters_template: Mapping[str, Any],
+    base_url: str,
+    headers: Mapping[str, str],
+    request_timeout: float,
+    cancel_token: CancellationToken,
+) -> tuple[str | None, int | None, bool]:
+    """并发执行指定轮次并批量写入结果，返回首个错误信息、状态码与是否触发快速失败。
+
+    开启快速失败时，首个失败轮次会取消令牌：排队中的轮次不再执行，在途请求在
+    协程模式下被直接取消，线程模式下等待其结束并照常写入结果与用量。
+    """
+
+    context = RunRequestContext(
+        test_run_id=test_run.id,
+        model_name=test_run.model_name,
+        prompt_id=prompt_id,
+        prompt_version_id=prompt_version_id,
+        timeout_seconds=request_timeout,
+        response_cache=resolve_cache_enabled(schema_data.get("response_cache")),
+        streaming=schema_data.get("streaming") is True,
+        cancel_token=cancel_token,
+    )
+    fail_fast = resolve_fail_fast(schema_data.get("fail_fast"))
+
+    concurrency_limit = resolve_concurrency_limit(model)
+
+    def _build_payload(run_index: int) -> dict[str, Any]:
+        return _build_request_payload(
+            test_run,
+            model,
+            schema_data=schema_data,
+            prompt_snapshot=prompt_snapshot,
+            parameters_template=parameters_template,
+            run_index=run_index,
+        )
+
+    def _execute_single(run_index: int) -> tuple[Result, LLMUsageLog | None]:
+        return _invoke_llm_once(
+            provider=provider,
+            model=model,
+            base_url=base_url,
+            headers=headers,
+            payload=_build_payload(run_index),
+            context=context,
+        )
+
+    async def _execute_single_async(
+        client: httpx.AsyncClient, run_index: int
+    ) -> tuple[Result, LLMUsageLog | None]:
+        return await _invoke_llm_once_async(
+            client=client,
+            provider=provider,
+            model=model,
+            base_url=base_url,
+            headers=headers,
+            payload=_build_payload(run_index),
+            context=context,
+        )
+
+    error_message: str | None = None
+    error_status_code: int | None = None
+    fail_fast_triggered = False
+
+    worker_count = max(1, min(concurrency_limit, len(run_indices)))
+
+    if _resolve_execution_mode(schema_data) == "async":
+        outcomes = iter_async_outcomes(
+            run_indices,
+            _execute_single_async,
+            client_factory=lambda: llm_client_registry.get_async_client(provider),
+            concurrency_limit=worker_count,
+            cancel_token=cancel_token,
+        )
+    else:
+        outcomes = iter_threaded_outcomes(
+            run_indices,
+            _execute_single,
+            worker_count=worker_count,
+            cancel_token=cancel_token,
+        )
+
+    with BufferedResultWriter() as writer:
+        for run_index, outcome in outcomes:
+            if isinstance(outcome, OperationCancelledError):
+                continue
+            if isinstance(outcome, TestRunExecutionError):
+                if error_message is None:
+                    error_message = str(outcome)
+                    error_status_code = getattr(outcome, "status_code", None)
+            elif isinstance(outcome, BaseException):  # pragma: no cover - 防御性
+                if error_message is None:
+                    error_message = f"执行测试任务失败: {outcome}"
+                    error_status_code = status.HTTP_502_BAD_GATEWAY
+            else:
+                result_obj, usage_obj = outcome
+                result_obj.test_run_id = context.test_run_id
+                result_obj.run_index = run_index
+                writer.add(result_obj, usage_obj)
+                continue
+
+            if fail_fast and cancel_token.cancel(f"快速失败: {error_message}"):
+                # 不提前结束迭代，在途轮次的结果仍需写入
+                fail_fast_triggered = True
+                logger.info(
+                    "测试任务 %s 第 %s 轮失败，已取消剩余轮次", test_run.id, run_index
+                )
+
+    return error_message, error_status_code, fail_fast_triggered
+
+
+def resolve_concurrency_limit(model: LLMModel | None) -> int:
+    """测试任务的轮次并发上限，未关联模型或未配置时采用默认并发。"""
+
+    if model and isinstance(model.concurrency_limit, int):
+        return max(1, model.concurrency_limit)
+    return DEFAULT_CONCURRENCY_LIMIT
+
+
+def _build_request_payload(
+    test_run: TestRun,
+    model: LLMModel | None,
+    *,
+    schema_data: Mapping[str, Any],
+    prompt_snapshot: str,
+    parameters_template: Mapping[str, Any],
+    run_index: int,
+) -> dict[str, Any]:
+    messages = _build_messages(schema_data, prompt_snapshot, run_index)
+    payload: dict[str, Any] = dict(parameters_template)
+    payload["model"] = model.name if model else test_run.model_name
+    payload["messages"] = messages
+    return payload
+
+
+def plan_test_run(db: Session, test_run: TestRun) -> TestRunPlan:
+    """按执行时的逻辑构造每轮请求体，不发起调用也不修改任务。
+
+    尚未配置提供者时 ``provider`` 与 ``model`` 为空，执行时才会报错。
+    """
+
+    try:
+        provider, model = _resolve_provider_and_model(db, test_run)
+    except TestRunExecutionError:
+        provider, model = None, None
+
+    version = test_run.prompt_version
+    if version is None and test_run.prompt_version_id:
+        # 尚未保存的测试任务只有 Prompt 版本 ID，关联对象不会自动加载
+        version = db.get(PromptVersion, test_run.prompt_version_id)
+    prompt_snapshot = version.content if version and version.content else ""
+    schema_data = _ensure_mapping(test_run.schema)
+    parameters_template = _build_parameters(test_run, schema_data)
+    run_count = max(1, int(test_run.repetitions or 1))
+    payloads = [
+        _build_request_payload(
+            test_run,
+            model,
+            schema_data=schema_data,
+            prompt_snapshot=prompt_snapshot,
+            parameters_template=parameters_template,
+            run_index=run_index,
+        )
+        for run_index in range(1, run_count + 1)
+    ]
+    return TestRunPlan(
+        provider=provider,
+        model=model,
+        payloads=payloads,
+        concurrency=min(resolve_concurrency_limit(model), run_count),
+    )
+
+
+def _load_completed_run_indices(db: Session, test_run_id: int) -> set[int]:
+    """读取已持久化的轮次序号；失败的轮次不会写入结果，因此会在重试时补跑。"""
+
+    return set(
+        db.scalars(
+            select(Result.run_index).where(Result.test_run_id == test_run_id)
+        ).all()
+    )
+
+
 def ensure_completed(db: Session, runs: Sequence[TestRun]) -> None:
     for run in runs:
         execute_test_run(db, run)
     db.flush()
 
 
+def _resolve_execution_mode(schema_data: Mapping[str, Any]) -> str:
+    """读取单次测试任务的执行模式，未指定时沿用全局配置。"""
+
+    raw_mode = schema_data.get("execution_mode")
+    if isinstance(raw_mode, str) and raw_mode.strip().lower() in EXECUTION_MODES:
+        return raw_mode.strip().lower()
+    return settings.TEST_RUN_EXECUTION_MODE
+
+
 def _resolve_provider_and_model(
     db: Session, test_run: TestRun
 ) -> tuple[LLMProvider, LLMModel | None]:
@@ -196,39 +502,30 @@ def _resolve_provider_and_model(
     model_id = schema_data.get("llm_model_id") or schema_data.get("model_id")
 
     if isinstance(provider_id, int):
-        provider = db.get(LLMProvider, provider_id)
+        provider = llm_resolution_cache.provider_by_id(db, provider_id)
     elif isinstance(provider_id, str) and provider_id.isdigit():
-        provider = db.get(LLMProvider, int(provider_id))
+        provider = llm_resolution_cache.provider_by_id(db, int(provider_id))
 
     if provider and isinstance(model_id, int):
-        model = db.get(LLMModel, model_id)
+        model = llm_resolution_cache.model_by_id(db, model_id)
     elif provider and isinstance(model_id, str) and model_id.isdigit():
-        model = db.get(LLMModel, int(model_id))
+        model = llm_resolution_cache.model_by_id(db, int(model_id))
 
     if model and provider and model.provider_id != provider.id:
         model = None
 
     if provider is None and test_run.model_version:
-        provider = db.scalar(
-            select(LLMProvider).where(
-                LLMProvider.provider_name == test_run.model_version
-            )
-        )
+        provider = llm_resolution_cache.provider_by_name(db, test_run.model_version)
 
     if provider is None and isinstance(
         schema_key := schema_data.get("provider_key"), str
     ):
-        provider = db.scalar(
-            select(LLMProvider).where(LLMProvider.provider_key == schema_key)
-        )
+        provider = llm_resolution_cache.provider_by_key(db, schema_key)
 
     if provider is None:
-        stmt = (
-            select(LLMProvider, LLMModel)
-            .join(LLMModel, LLMModel.provider_id == LLMProvider.id)
-            .where(LLMModel.name == test_run.model_name)
+        record = llm_resolution_cache.provider_and_model_by_model_name(
+            db, test_run.model_name
         )
-        record = db.execute(stmt).first()
         if record:
             provider, model = record
 
@@ -238,22 +535,18 @@ def _resolve_provider_and_model(
         )
 
     if model is None:
-        model = db.scalar(
-            select(LLMModel).where(
-                LLMModel.provider_id == provider.id,
-                LLMModel.name == test_run.model_name,
-            )
+        model = llm_resolution_cache.model_by_name(
+            db, provider.id, test_run.model_name
         )
 
     return provider, model
 
 
 def _resolve_base_url(provider: LLMProvider) -> str:
-    defaults = get_provider_defaults(provider.provider_key)
-    base_url = provider.base_url or (defaults.base_url if defaults else None)
+    base_url = llm_resolution_cache.base_url(provider)
     if not base_url:
         raise TestRunExecutionError("模型提供者缺少基础 URL 配置。")
-    return base_url.rstrip("/")
+    return base_url
 
 
 def _ensure_mapping(raw: Any) -> dict[str, Any]:
@@ -350,37 +643,265 @@ def _invoke_llm_once(
     headers: Mapping[str, str],
     payload: dict[str, Any],
     context: RunRequestContext,
-) -> tuple[Result, LLMUsageLog]:
+) -> tuple[Result, LLMUsageLog | None]:
+    cache_key = _response_cache_key(provider, payload, context)
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return _build_cached_artifacts(
+                cached, provider=provider, model=model, payload=payload, context=context
+            )
+
     url = f"{base_url}/chat/completions"
-    start_time = time.perf_counter()
+    client = llm_client_registry.get_sync_client(provider)
+    attempt_state: dict[str, Any] = {}
 
-    try:
-        sleep_lower, sleep_upper = REQUEST_SLEEP_RANGE
-        if sleep_upper > 0:
-            jitter = random.uniform(sleep_lower, sleep_upper)
-            if jitter > 0:
-                time.sleep(jitter)
-    except Exception:  # pragma: no cover - 容错
-        pass
+    cancel_token = context.cancel_token
+
+    def _send(timeout: float) -> httpx.Response:
+        raise_if_cancelled(cancel_token)
+        reservation = llm_rate_limiter.acquire(model, payload)
+        try:
+            with concurrency_governor.slot(model) as slot:
+                raise_if_cancelled(cancel_token)
+                attempt_state["start_time"] = time.perf_counter()
+                request_timeout = llm_client_registry.request_timeout(provider, timeout)
+                if context.streaming:
+                    response, attempt_state["stream"] = consume_chat_stream(
+                        client,
+                        url,
+                        headers=headers,
+                        payload=payload,
+                        timeout=request_timeout,
+                        started_at=attempt_state["start_time"],
+                        cancel_token=cancel_token,
+                    )
+                else:
+                    response = client.post(
+                        url,
+                        headers=dict(headers),
+                        json=payload,
+                        timeout=request_timeout,
+                    )
+                slot.observe(
+                    response.status_code,
+                    (time.perf_counter() - attempt_state["start_time"]) * 1000,
+                )
+        except BaseException:
+            # 调用未完成或被取消，预支的额度不会被消耗
+            llm_rate_limiter.settle(reservation, 0)
+            raise
+        track_reservation(attempt_state, reservation, response)
+        return response
 
     try:
-        timeout_value = getattr(context, "timeout_seconds", DEFAULT_TEST_TIMEOUT)
-        response = httpx.post(
-            url, headers=dict(headers), json=payload, timeout=timeout_value
+        outcome = call_with_retry(
+            _send,
+            policy=RetryPolicy.from_mapping(provider.retry_policy),
+            default_timeout=context.timeout_seconds,
+            sleep=cancel_token.sleep if cancel_token is not None else None,
         )
+    except RetryDeadlineExceeded as exc:
+        raise TestRunExecutionError(
+            f"调用外部 LLM 超时: {exc}", status_code=status.HTTP_504_GATEWAY_TIMEOUT
+        ) from exc
     except httpx.HTTPError as exc:  # pragma: no cover - 网络异常场景
         raise TestRunExecutionError(
             f"调用外部 LLM 失败: {exc}", status_code=status.HTTP_502_BAD_GATEWAY
         ) from exc
 
+    response = _completion_response(outcome.response, attempt_state)
+    artifacts = _build_run_artifacts(
+        response,
+        provider=provider,
+        model=model,
+        payload=payload,
+        context=context,
+        start_time=attempt_state["start_time"],
+        attempts=outcome.attempts,
+    )
+    _apply_stream_metrics(artifacts[0], attempt_state.get("stream"))
+    llm_rate_limiter.settle(
+        attempt_state.get("reservation"), artifacts[1].total_tokens
+    )
+    if cache_key is not None:
+        response_cache.set(
+            cache_key,
+            response.json(),
+            provider_id=provider.id,
+            model_name=payload.get("model"),
+        )
+    return artifacts
+
+
+async def _invoke_llm_once_async(
+    *,
+    client: httpx.AsyncClient,
+    provider: LLMProvider,
+    model: LLMModel | None,
+    base_url: str,
+    headers: Mapping[str, str],
+    payload: dict[str, Any],
+    context: RunRequestContext,
+) -> tuple[Result, LLMUsageLog | None]:
+    """协程版本的单次调用，复用提供者连接池中的长连接。"""
+
+    cache_key = _response_cache_key(provider, payload, context)
+    if cache_key is not None:
+        cached = await response_cache.aget(cache_key)
+        if cached is not None:
+            return _build_cached_artifacts(
+                cached, provider=provider, model=model, payload=payload, context=context
+            )
+
+    url = f"{base_url}/chat/completions"
+    attempt_state: dict[str, Any] = {}
+
+    async def _send(timeout: float) -> httpx.Response:
+        reservation = await llm_rate_limiter.acquire_async(model, payload)
+        try:
+            async with concurrency_governor.slot_async(model) as slot:
+                attempt_state["start_time"] = time.perf_counter()
+                request_timeout = llm_client_registry.request_timeout(provider, timeout)
+                if context.streaming:
+                    response, attempt_state["stream"] = await aconsume_chat_stream(
+                        client,
+                        url,
+                        headers=headers,
+                        payload=payload,
+                        timeout=request_timeout,
+                        started_at=attempt_state["start_time"],
+                    )
+                else:
+                    response = await client.post(
+                        url,
+                        headers=dict(headers),
+                        json=payload,
+                        timeout=request_timeout,
+                    )
+                slot.observe(
+                    response.status_code,
+                    (time.perf_counter() - attempt_state["start_time"]) * 1000,
+                )
+        except BaseException:
+            # 调用未完成或被取消，预支的额度不会被消耗
+            await llm_rate_limiter.asettle(reservation, 0)
+            raise
+        await atrack_reservation(attempt_state, reservation, response)
+        return response
+
+    try:
+        outcome = await acall_with_retry(
+            _send,
+            policy=RetryPolicy.from_mapping(provider.retry_policy),
+            default_timeout=context.timeout_seconds,
+        )
+    except RetryDeadlineExceeded as exc:
+        raise TestRunExecutionError(
+            f"调用外部 LLM 超时: {exc}", status_code=status.HTTP_504_GATEWAY_TIMEOUT
+        ) from exc
+    except httpx.HTTPError as exc:
+        raise TestRunExecutionError(
+            f"调用外部 LLM 失败: {exc}", status_code=status.HTTP_502_BAD_GATEWAY
+        ) from exc
+
+    response = _completion_response(outcome.response, attempt_state)
+    artifacts = _build_run_artifacts(
+        response,
+        provider=provider,
+        model=model,
+        payload=payload,
+        context=context,
+        start_time=attempt_state["start_time"],
+        attempts=outcome.attempts,
+    )
+    _apply_stream_metrics(artifacts[0], attempt_state.get("stream"))
+    await llm_rate_limiter.asettle(
+        attempt_state.get("reservation"), artifacts[1].total_tokens
+    )
+    if cache_key is not None:
+        await response_cache.aset(
+            cache_key,
+            response.json(),
+            provider_id=provider.id,
+            model_name=payload.get("model"),
+        )
+    return artifacts
+
+
+def _response_cache_key(
+    provider: LLMProvider, payload: Mapping[str, Any], context: RunRequestContext
+) -> str | None:
+    """开启响应缓存且请求具备确定性时返回缓存键，否则返回 ``None``。"""
+
+    if not context.response_cache:
+        return None
+    if not is_deterministic_request(payload):
+        return None
+    return build_cache_key(provider, payload)
+
+
+def _build_cached_artifacts(
+    cached: Mapping[str, Any],
+    *,
+    provider: LLMProvider,
+    model: LLMModel | None,
+    payload: Mapping[str, Any],
+    context: RunRequestContext,
+) -> tuple[Result, LLMUsageLog | None]:
+    """由缓存的响应体构造结果；未实际调用提供者，因此不产生用量日志。"""
+
+    result, _ = _build_run_artifacts(
+        httpx.Response(status.HTTP_200_OK, json=cached),
+        provider=provider,
+        model=model,
+        payload=payload,
+        context=context,
+        start_time=time.perf_counter(),
+    )
+    result.cache_hit = True
+    return result, None
+
+
+def _completion_response(
+    response: httpx.Response, attempt_state: Mapping[str, Any]
+) -> httpx.Response:
+    """流式调用成功时以收集到的分片还原出非流式响应，供统一解析。"""
+
+    collector: StreamCollector | None = attempt_state.get("stream")
+    if collector is None or response.status_code >= 400:
+        return response
+    return httpx.Response(response.status_code, json=collector.completion_payload())
+
+
+def _apply_stream_metrics(result: Result, collector: StreamCollector | None) -> None:
+    if collector is None:
+        return
+    metrics = collector.metrics()
+    result.ttft_ms = metrics["ttft_ms"]
+    result.inter_token_latency_ms = metrics["inter_token_latency_ms"]
+    result.tokens_per_second = metrics["tokens_per_second"]
+
+
+def _build_run_artifacts(
+    response: httpx.Response,
+    *,
+    provider: LLMProvider,
+    model: LLMModel | None,
+    payload: Mapping[str, Any],
+    context: RunRequestContext,
+    start_time: float,
+    attempts: int = 1,
+) -> tuple[Result, LLMUsageLog]:
     if response.status_code >= 400:
         try:
             error_payload = response.json()
         except ValueError:
             error_payload = {"message": response.text}
         detail_text = _format_error_detail(error_payload)
+        attempts_note = f"，共尝试 {attempts} 次" if attempts > 1 else ""
         raise TestRunExecutionError(
-            f"LLM 请求失败 (HTTP {response.status_code}): {detail_text}",
+            f"LLM 请求失败 (HTTP {response.status_code}{attempts_note}): {detail_text}",
             status_code=response.status_code,
         ) from None
 
@@ -425,7 +946,11 @@ def _invoke_llm_once(
         if isinstance(completion_tokens, (int, float)):
             total_tokens += int(completion_tokens)
 
-    elapsed_delta = getattr(response, "elapsed", None)
+    try:
+        elapsed_delta = getattr(response, "elapsed", None)
+    except RuntimeError:
+        # 流式或模拟响应在未关闭前无法读取 elapsed，回退为本地计时
+        elapsed_delta = None
     if elapsed_delta is not None:
         latency_ms = int(elapsed_delta.total_seconds() * 1000)
     else:
@@ -440,6 +965,7 @@ def _invoke_llm_once(
         if isinstance(total_tokens, (int, float))
         else None,
         latency_ms=latency_ms,
+        attempts=attempts,
     )
 
     request_parameters = {
@@ -504,10 +1030,11 @@ def _try_parse_json(text: str) -> Any:
         return None
 
 
-def _persist_run_artifacts(db: Session, result: Result, usage_log: LLMUsageLog) -> None:
-    db.add(result)
-    db.add(usage_log)
-    db.flush()
-
-
-__all__ = ["execute_test_run", "ensure_completed", "TestRunExecutionError"]
+__all__ = [
+    "execute_test_run",
+    "ensure_completed",
+    "plan_test_run",
+    "resolve_concurrency_limit",
+    "TestRunExecutionError",
+    "TestRunPlan",
+]
@@ -0,0 +1,252 @@
+"""持久化任务队列的独立 worker 进程。
+
+启动方式::
+
+    python -m app.worker --concurrency 4
+
+worker 从 ``task_jobs`` 表按租约领取测试任务与 Prompt 测试任务并在本进程内
+执行，可部署多个进程横向扩容；API 进程需配置 ``TASK_QUEUE_BACKEND=database``。
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import signal
+import threading
+from collections.abc import Callable, Iterable, Sequence
+
+from sqlalchemy import select
+
+from app.core.cancellation import (
+    PROMPT_TEST_TASK_SCOPE,
+    TEST_RUN_SCOPE,
+    cancellation_registry,
+)
+from app.core.config import settings
+from app.core.job_queue import (
+    ClaimedJob,
+    claim_next_job,
+    default_holder,
+    finish_job,
+    renew_lease,
+)
+from app.core.logging_config import configure_logging
+from app.core.prompt_test_task_queue import task_queue as prompt_test_task_queue
+from app.core.task_queue import task_queue as test_run_queue
+from app.core.task_recovery import RecoveryLoop
+from app.db import session as db_session
+from app.models.prompt_test import PromptTestTask, PromptTestTaskStatus
+from app.models.task_job import TaskJobKind
+from app.models.test_run import TestRun
+
+logger = logging.getLogger("promptworks.worker")
+
+JobHandler = Callable[[int], None]
+
+# 执行中的测试任务由取消接口写入取消请求，状态由执行方停止后写回；Prompt
+# 测试任务的状态在开始执行时已提交，取消接口直接改写为已取消
+_CANCEL_TARGETS = {
+    TaskJobKind.TEST_RUN: (
+        TEST_RUN_SCOPE,
+        TestRun,
+        TestRun.cancel_requested.is_(True),
+    ),
+    TaskJobKind.PROMPT_TEST_TASK: (
+        PROMPT_TEST_TASK_SCOPE,
+        PromptTestTask,
+        PromptTestTask.status == PromptTestTaskStatus.CANCELLED,
+    ),
+}
+
+
+def _default_handlers() -> dict[TaskJobKind, JobHandler]:
+    return {
+        TaskJobKind.TEST_RUN: test_run_queue.run,
+        TaskJobKind.PROMPT_TEST_TASK: prompt_test_task_queue.run,
+    }
+
+
+class JobWorker:
+    """领取并执行持久化任务，后台心跳线程负责续期租约与跨进程取消。"""
+
+    def __init__(
+        self,
+        *,
+        concurrency: int | None = None,
+        kinds: Iterable[TaskJobKind] | None = None,
+        holder: str | None = None,
+        handlers: dict[TaskJobKind, JobHandler] | None = None,
+        lease_seconds: float | None = None,
+        heartbeat_interval: float | None = None,
+        poll_interval: float | None = None,
+    ) -> None:
+        self.concurrency = max(1, int(concurrency or settings.TASK_WORKER_CONCURRENCY))
+        self.kinds = list(kinds or TaskJobKind)
+        self.holder = holder or default_holder()
+        self.handlers = handlers or _default_handlers()
+        self.lease_seconds = float(lease_seconds or settings.TASK_JOB_LEASE_SECONDS)
+        self.heartbeat_interval = float(
+            heartbeat_interval or settings.TASK_JOB_HEARTBEAT_INTERVAL
+        )
+        self.poll_interval = float(poll_interval or settings.TASK_JOB_POLL_INTERVAL)
+        self._active: dict[int, ClaimedJob] = {}
+        self._lock = threading.Lock()
+
+    def run_once(self) -> ClaimedJob | None:
+        """领取并执行一条任务，没有可执行任务时返回 ``None``。"""
+
+        session = db_session.SessionLocal()
+        try:
+            job = claim_next_job(
+                session,
+                self.holder,
+                lease_seconds=self.lease_seconds,
+                kinds=self.kinds,
+            )
+        finally:
+            session.close()
+        if job is None:
+            return None
+
+        logger.info(
+            "领取任务 %s:%s (job=%s, 第 %s 次)",
+            job.kind.value,
+            job.target_id,
+            job.id,
+            job.attempts,
+        )
+        with self._lock:
+            self._active[job.id] = job
+        error: str | None = None
+        try:
+            self.handlers[job.kind](job.target_id)
+        except Exception as exc:  # pragma: no cover - 队列执行函数已自行记录失败
+            logger.exception("执行任务 %s:%s 失败", job.kind.value, job.target_id)
+            error = str(exc) or exc.__class__.__name__
+        finally:
+            with self._lock:
+                self._active.pop(job.id, None)
+
+        session = db_session.SessionLocal()
+        try:
+            if not finish_job(session, job.id, self.holder, error=error):
+                logger.warning(
+                    "任务 %s:%s 的租约已被回收，结果以新持有者为准",
+                    job.kind.value,
+                    job.target_id,
+                )
+        finally:
+            session.close()
+        return job
+
+    def heartbeat(self) -> None:
+        """续期执行中任务的租约；租约丢失或目标已请求取消时中止本地执行。"""
+
+        with self._lock:
+            jobs = list(self._active.values())
+        if not jobs:
+            return
+
+        session = db_session.SessionLocal()
+        try:
+            for job in jobs:
+                scope, model, cancel_condition = _CANCEL_TARGETS[job.kind]
+                if not renew_lease(
+                    session, job.id, self.holder, lease_seconds=self.lease_seconds
+                ):
+                    logger.warning(
+                        "任务 %s:%s 的租约已丢失，停止本地执行",
+                        job.kind.value,
+                        job.target_id,
+                    )
+                    cancellation_registry.cancel(scope, job.target_id, "租约已丢失")
+                    continue
+                cancelled = session.scalar(
+                    select(model.id).where(model.id == job.target_id, cancel_condition)
+                )
+                if cancelled is not None:
+                    cancellation_registry.cancel(scope, job.target_id, "任务已取消")
+        finally:
+            session.close()
+
+    def run_forever(self, stop_event: threading.Event) -> None:
+        """启动执行线程与心跳线程，直到 ``stop_event`` 被设置且执行中任务结束。"""
+
+        def _loop() -> None:
+            while not stop_event.is_set():
+                try:
+                    job = self.run_once()
+                except Exception:  # pragma: no cover - 数据库暂时不可用等情况
+                    logger.exception("领取任务失败，稍后重试")
+                    job = None
+                if job is None:
+                    stop_event.wait(self.poll_interval)
+
+        def _heartbeat_loop() -> None:
+            while not stop_event.wait(self.heartbeat_interval):
+                try:
+                    self.heartbeat()
+                except Exception:  # pragma: no cover - 下一次心跳重试
+                    logger.exception("续期任务租约失败")
+
+        threads = [
+            threading.Thread(target=_loop, name=f"task-worker-{index}")
+            for index in range(self.concurrency)
+        ]
+        threads.append(
+            threading.Thread(target=_heartbeat_loop, name="task-worker-heartbeat")
+        )
+        logger.info(
+            "worker %s 已启动，并发 %s，任务类型 %s",
+            self.holder,
+            self.concurrency,
+            ",".join(kind.value for kind in self.kinds),
+        )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.info("worker %s 已停止", self.holder)
+
+
+def main(argv: Sequence[str] | None = None) -> None:  # pragma: no cover - 进程入口
+    parser = argparse.ArgumentParser(description="PromptWorks 持久化任务 worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.TASK_WORKER_CONCURRENCY,
+        help="同时执行的任务数",
+    )
+    parser.add_argument(
+        "--kinds",
+        default=",".join(kind.value for kind in TaskJobKind),
+        help="逗号分隔的任务类型：test_run,prompt_test_task",
+    )
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    kinds = [TaskJobKind(value.strip()) for value in args.kinds.split(",") if value]
+    worker = JobWorker(concurrency=args.concurrency, kinds=kinds)
+    stop_event = threading.Event()
+
+    def _request_stop(signum, _frame) -> None:
+        logger.info("收到信号 %s，等待执行中的任务结束后退出", signum)
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    recovery_loop = RecoveryLoop()
+    if settings.TASK_RECOVERY_ENABLED:
+        recovery_loop.start()
+    try:
+        worker.run_forever(stop_event)
+    finally:
+        recovery_loop.stop()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
+
+
+__all__ = ["JobWorker", "main"]
@@ -44,6 +44,14 @@ export interface PromptTestTask {
   created_at: string
   updated_at: string
   units?: PromptTestUnit[]
+  progress?: PromptTestTaskProgress | null
+}
+
+export interface PromptTestTaskProgress {
+  task_id: number
+  current: number
+  total: number
+  percentage: number
 }
 
 export interface PromptTestUnit {
@@ -1,4 +1,4 @@
-export type TestRunStatus = 'pending' | 'running' | 'completed' | 'failed'
+export type TestRunStatus = 'pending' | 'running' | 'completed' | 'failed' | 'cancelled'
 
 export interface Metric {
   id: number
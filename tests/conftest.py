@@ -8,10 +8,49 @@ from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
 
 import app.db.session as db_session_module
+from app.core.adaptive_concurrency import adaptive_concurrency
+from app.core.concurrency_governor import concurrency_governor
+from app.core.config import settings
+from app.core.rate_limiter import llm_rate_limiter
+from app.core.message_store import message_store
+from app.core.response_cache import response_cache
 from app.core.task_queue import task_queue
 from app.db.session import get_db
 from app.main import app
 from app.models import Base  # noqa: F401 - ensure models are loaded
+from app.services.llm_resolution import llm_resolution_cache
+
+
+@pytest.fixture(scope="session", autouse=True)
+def disable_background_task_maintenance() -> Iterator[None]:
+    """Keep liveness heartbeats and recovery sweeps off the shared test connection."""
+
+    original = (settings.TASK_JOB_HEARTBEAT_INTERVAL, settings.TASK_RECOVERY_ENABLED)
+    settings.TASK_JOB_HEARTBEAT_INTERVAL = 0
+    settings.TASK_RECOVERY_ENABLED = False
+    yield
+    settings.TASK_JOB_HEARTBEAT_INTERVAL, settings.TASK_RECOVERY_ENABLED = original
+
+
+@pytest.fixture(autouse=True)
+def reset_llm_call_controls() -> Iterator[None]:
+    """Reset process-wide limiter state so reused model ids start clean."""
+
+    adaptive_concurrency.reset()
+    concurrency_governor.reset()
+    concurrency_governor.configure(None)
+    llm_rate_limiter.configure(None)
+    response_cache.clear_memory()
+    message_store.reset()
+    llm_resolution_cache.reset()
+    yield
+    adaptive_concurrency.reset()
+    concurrency_governor.reset()
+    concurrency_governor.configure(None)
+    llm_rate_limiter.configure(None)
+    response_cache.clear_memory()
+    message_store.reset()
+    llm_resolution_cache.reset()
 
 
 @pytest.fixture(scope="session")
@@ -54,6 +93,30 @@ def db_session(engine: Engine) -> Iterator[Session]:
         connection.close()
 
 
+@pytest.fixture()
+def isolated_session_factory(tmp_path, monkeypatch) -> Iterator[sessionmaker]:
+    """File-backed database where every session gets its own connection.
+
+    The shared in-memory connection hides lock waits between sessions; tests
+    that depend on transaction isolation use this factory instead.
+    """
+
+    isolated_engine = create_engine(
+        f"sqlite+pysqlite:///{tmp_path / 'isolated.db'}",
+        future=True,
+        connect_args={"check_same_thread": False, "timeout": 0.5},
+    )
+    Base.metadata.create_all(bind=isolated_engine)
+    session_local = sessionmaker(
+        bind=isolated_engine, autoflush=False, autocommit=False, expire_on_commit=False
+    )
+    monkeypatch.setattr(db_session_module, "SessionLocal", session_local)
+    try:
+        yield session_local
+    finally:
+        isolated_engine.dispose()
+
+
 @pytest.fixture()
 def client(db_session: Session) -> Iterator[TestClient]:
     """Return a FastAPI TestClient with a database override."""
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from app.core import adaptive_concurrency as adaptive_module
+from app.core.adaptive_concurrency import AdaptiveConcurrencyController
+from app.models.llm_provider import LLMModel
+
+API_PREFIX = "/api/v1/llm-providers"
+
+
+def _make_model(model_id: int = 1, limit: int = 8) -> LLMModel:
+    return LLMModel(id=model_id, provider_id=1, name="aimd", concurrency_limit=limit)
+
+
+def _complete(controller, model, status_code: int | None, latency_ms=100.0) -> None:
+    controller.effective_limit(model)
+    controller.record(model.id, status_code, latency_ms)
+
+
+def test_throttling_halves_limit_and_successes_grow_it_back():
+    controller = AdaptiveConcurrencyController()
+    model = _make_model(limit=8)
+    assert controller.effective_limit(model) == 8
+
+    _complete(controller, model, 429, latency_ms=None)
+    assert controller.effective_limit(model) == 4
+
+    for _ in range(4):
+        _complete(controller, model, 200)
+    assert controller.effective_limit(model) == 5
+
+    # 普通 4xx 不影响并发
+    _complete(controller, model, 400)
+    assert controller.effective_limit(model) == 5
+
+    model.concurrency_limit = 3
+    assert controller.effective_limit(model) == 3
+
+
+def test_decrease_respects_cooldown_and_minimum(monkeypatch):
+    clock = {"now": 100.0}
+    monkeypatch.setattr(adaptive_module.time, "monotonic", lambda: clock["now"])
+    controller = AdaptiveConcurrencyController()
+    model = _make_model(limit=8)
+
+    for _ in range(5):
+        _complete(controller, model, 200, latency_ms=1000.0)
+    _complete(controller, model, 503, latency_ms=None)
+    _complete(controller, model, 503, latency_ms=None)
+    assert controller.effective_limit(model) == 4
+
+    for _ in range(5):
+        clock["now"] += 10
+        _complete(controller, model, 503, latency_ms=None)
+    assert controller.effective_limit(model) == 1
+    snapshot = controller.snapshot(model)
+    assert snapshot["last_decrease_reason"] == "http_503"
+
+
+def test_rising_latency_triggers_backoff():
+    controller = AdaptiveConcurrencyController(warmup_samples=3)
+    model = _make_model(limit=4)
+
+    for _ in range(3):
+        _complete(controller, model, 200, latency_ms=100.0)
+    for _ in range(10):
+        _complete(controller, model, 200, latency_ms=2000.0)
+
+    snapshot = controller.snapshot(model)
+    assert snapshot["last_decrease_reason"] == "latency"
+    assert snapshot["effective_limit"] < 4
+
+
+def test_disabled_controller_uses_configured_limit(monkeypatch):
+    monkeypatch.setattr(
+        adaptive_module.settings, "LLM_ADAPTIVE_CONCURRENCY_ENABLED", False
+    )
+    controller = AdaptiveConcurrencyController()
+    model = _make_model(limit=6)
+
+    _complete(controller, model, 429)
+    assert controller.effective_limit(model) == 6
+    assert controller.snapshot(model)["adaptive"] is False
+
+
+def test_model_concurrency_endpoint_reports_effective_limit(client):
+    provider = client.post(
+        API_PREFIX + "/",
+        json={
+            "provider_name": "Adaptive",
+            "api_key": "adaptive-key",
+            "is_custom": True,
+            "base_url": "https://adaptive.llm/api",
+        },
+    ).json()
+    model = client.post(
+        f"{API_PREFIX}/{provider['id']}/models",
+        json={"name": "adaptive-model", "concurrency_limit": 6},
+    ).json()
+    assert model["effective_concurrency_limit"] == 6
+
+    adaptive_module.adaptive_concurrency.record(model["id"], 429, None)
+
+    response = client.get(
+        f"{API_PREFIX}/{provider['id']}/models/{model['id']}/concurrency"
+    )
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["configured_limit"] == 6
+    assert payload["effective_limit"] == 3
+    assert payload["last_decrease_reason"] == "http_429"
+    assert payload["in_flight"] == 0
+    assert payload["waiting"] == 0
+    assert payload["backend"] == "memory"
+
+    missing = client.get(f"{API_PREFIX}/{provider['id']}/models/9999/concurrency")
+    assert missing.status_code == 404
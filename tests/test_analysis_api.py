@@ -95,7 +95,7 @@ def _create_prompt_test_task_with_results(db_session: Session) -> PromptTestTask
 
 
 def _create_prompt_test_task_with_failed_output(
-    db_session: Session,
+    db_session: Session, *, legacy: bool = False
 ) -> PromptTestTask:
     prompt_class = PromptClass(name="PromptTestFailed")
     prompt = Prompt(name="PromptTest失败过滤", prompt_class=prompt_class)
@@ -118,28 +118,33 @@ def _create_prompt_test_task_with_failed_output(
         rounds=3,
     )
 
+    outputs = [
+        {
+            "run_index": 1,
+            "latency_ms": 100,
+            "total_tokens": 80,
+        },
+        {
+            "run_index": 2,
+            "status": "failed",
+            "error": "LLM 请求失败",
+        },
+        {
+            "run_index": 3,
+            "latency_ms": 200,
+            "total_tokens": 130,
+        },
+    ]
     experiment = PromptTestExperiment(
         unit=unit,
         sequence=1,
         status=PromptTestExperimentStatus.COMPLETED,
-        outputs=[
-            {
-                "run_index": 1,
-                "latency_ms": 100,
-                "total_tokens": 80,
-            },
-            {
-                "run_index": 2,
-                "status": "failed",
-                "error": "LLM 请求失败",
-            },
-            {
-                "run_index": 3,
-                "latency_ms": 200,
-                "total_tokens": 130,
-            },
-        ],
     )
+    if legacy:
+        # 模拟迁移到轮次表之前写入的 JSON 结果
+        experiment.legacy_outputs = outputs
+    else:
+        experiment.outputs = outputs
 
     db_session.add_all([prompt_class, prompt, prompt_version, task, unit, experiment])
     db_session.commit()
@@ -249,8 +254,11 @@ def test_execute_prompt_test_task_analysis(client, db_session: Session):
     assert insight_details
 
 
-def test_prompt_test_analysis_skips_failed_samples(client, db_session: Session):
-    task = _create_prompt_test_task_with_failed_output(db_session)
+@pytest.mark.parametrize("legacy", [False, True])
+def test_prompt_test_analysis_skips_failed_samples(
+    client, db_session: Session, legacy: bool
+):
+    task = _create_prompt_test_task_with_failed_output(db_session, legacy=legacy)
     response = client.post(
         "/api/v1/analysis/modules/execute",
         json={
@@ -0,0 +1,401 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from sqlalchemy import update
+
+from app.core.cancellation import (
+    PROMPT_TEST_TASK_SCOPE,
+    TEST_RUN_SCOPE,
+    CancellationRegistry,
+    CancellationToken,
+    OperationCancelledError,
+    cancellation_registry,
+)
+from app.core.config import settings
+from app.core.llm_http import llm_client_registry
+from app.core.prompt_test_task_queue import enqueue_prompt_test_task, task_queue
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.prompt_test import (
+    PromptTestExperiment,
+    PromptTestExperimentStatus,
+    PromptTestTask,
+    PromptTestTaskStatus,
+    PromptTestUnit,
+)
+from app.models.test_run import TestRun, TestRunStatus
+from app.services import prompt_test_engine
+from app.services import test_run as test_run_service
+from app.services.prompt_test_engine import PromptTestExecutionError
+
+
+def _create_run(
+    db_session,
+    *,
+    repetitions: int,
+    schema: dict | None = None,
+    concurrency_limit: int = 1,
+) -> TestRun:
+    prompt_class = PromptClass(name="取消测试")
+    prompt = Prompt(name="取消提示词", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="回答问题")
+    provider = LLMProvider(
+        provider_name="CancelProvider",
+        api_key="key",
+        is_custom=True,
+        base_url="https://cancel.llm/api",
+    )
+    model = LLMModel(
+        provider=provider, name="cancel-model", concurrency_limit=concurrency_limit
+    )
+    db_session.add_all([prompt_class, prompt, version, provider, model])
+    db_session.commit()
+
+    run = TestRun(
+        prompt_version=version,
+        model_name=model.name,
+        temperature=0.7,
+        top_p=1.0,
+        repetitions=repetitions,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": model.id,
+            **(schema or {}),
+        },
+    )
+    db_session.add(run)
+    db_session.commit()
+    return run
+
+
+def test_token_runs_callbacks_and_interrupts_sleep():
+    token = CancellationToken()
+    calls: list[str] = []
+    remove = token.add_callback(lambda: calls.append("first"))
+    token.add_callback(lambda: calls.append("second"))
+    remove()
+
+    assert token.cancel("停止") is True
+    assert token.cancel("再次停止") is False
+    assert calls == ["second"]
+    assert token.reason == "停止"
+
+    token.add_callback(lambda: calls.append("late"))
+    assert calls == ["second", "late"]
+
+    started = time.monotonic()
+    with pytest.raises(OperationCancelledError):
+        token.sleep(5)
+    assert time.monotonic() - started < 1
+
+    registry = CancellationRegistry()
+    assert registry.cancel(TEST_RUN_SCOPE, 1) is False
+    with registry.track(TEST_RUN_SCOPE, 1) as tracked:
+        assert registry.cancel(TEST_RUN_SCOPE, 1) is True
+        assert tracked.cancelled
+    assert registry.get(TEST_RUN_SCOPE, 1) is None
+
+
+def test_fail_fast_skips_queued_repetitions(db_session, monkeypatch):
+    calls = {"count": 0}
+
+    def fake_post(*_, **kwargs):
+        calls["count"] += 1
+        time.sleep(0.05)
+        return httpx.Response(400, json={"error": {"message": "bad request"}})
+
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+    run = _create_run(db_session, repetitions=5, schema={"fail_fast": True})
+
+    finished = test_run_service.execute_test_run(db_session, run)
+
+    assert finished.status == TestRunStatus.FAILED
+    # 单并发下最多有一轮已被线程池取走，其余排队轮次被直接丢弃
+    assert calls["count"] <= 2
+    assert finished.results == []
+
+
+def test_fail_fast_keeps_results_of_in_flight_threaded_repetitions(
+    db_session, monkeypatch
+):
+    calls = {"count": 0}
+    lock = threading.Lock()
+
+    def fake_post(*_, **kwargs):
+        with lock:
+            calls["count"] += 1
+            first = calls["count"] == 1
+        if first:
+            time.sleep(0.05)
+            return httpx.Response(400, json={"error": {"message": "bad request"}})
+        time.sleep(0.3)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"role": "assistant", "content": "ok"}}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+            },
+        )
+
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+    run = _create_run(
+        db_session, repetitions=4, schema={"fail_fast": True}, concurrency_limit=2
+    )
+
+    finished = test_run_service.execute_test_run(db_session, run)
+
+    assert finished.status == TestRunStatus.FAILED
+    # 快速失败时已在途的轮次结果与用量仍然落库，排队中的轮次被丢弃
+    assert 2 <= calls["count"] < 4
+    assert len(finished.results) == calls["count"] - 1
+    assert all(result.tokens_used == 5 for result in finished.results)
+
+
+def test_cancel_signal_closes_in_flight_async_requests(db_session, monkeypatch):
+    started = threading.Event()
+    state = {"cancelled": 0}
+
+    class SlowClient:
+        async def post(self, *_, **kwargs):
+            started.set()
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                state["cancelled"] += 1
+                raise
+            return httpx.Response(200, json={"choices": []})  # pragma: no cover
+
+    monkeypatch.setattr(
+        llm_client_registry, "get_async_client", lambda provider: SlowClient()
+    )
+    run = _create_run(db_session, repetitions=3, schema={"execution_mode": "async"})
+
+    def _cancel_when_started() -> None:
+        started.wait(timeout=2)
+        cancellation_registry.cancel(TEST_RUN_SCOPE, run.id, reason="用户取消")
+
+    canceller = threading.Thread(target=_cancel_when_started)
+    canceller.start()
+    began = time.monotonic()
+    finished = test_run_service.execute_test_run(db_session, run)
+    canceller.join()
+
+    assert time.monotonic() - began < 2
+    assert finished.status == TestRunStatus.CANCELLED
+    assert finished.last_error == "用户取消"
+    assert finished.results == []
+    deadline = time.monotonic() + 1
+    while state["cancelled"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert state["cancelled"] == 1
+
+
+def test_cancel_endpoint_marks_pending_run_and_rejects_finished(client, db_session):
+    run = _create_run(db_session, repetitions=1)
+
+    response = client.post(f"/api/v1/test_prompt/{run.id}/cancel")
+    assert response.status_code == 202
+    assert response.json()["status"] == "cancelled"
+
+    conflict = client.post(f"/api/v1/test_prompt/{run.id}/cancel")
+    assert conflict.status_code == 409
+
+    db_session.expire_all()
+    stored = db_session.get(TestRun, run.id)
+    skipped = test_run_service.execute_test_run(db_session, stored)
+    assert skipped.status == TestRunStatus.CANCELLED
+
+
+def test_cancel_endpoint_only_requests_cancel_for_run_in_other_process(
+    client, db_session, monkeypatch
+):
+    run = _create_run(db_session, repetitions=3)
+    run.status = TestRunStatus.RUNNING
+    db_session.commit()
+
+    response = client.post(f"/api/v1/test_prompt/{run.id}/cancel")
+    assert response.status_code == 202
+    # 执行方尚未停止前不改写状态，避免覆盖其最终结果
+    assert response.json()["status"] == "running"
+    db_session.expire_all()
+    assert db_session.get(TestRun, run.id).cancel_requested is True
+
+    calls = {"count": 0}
+
+    def fake_post(*_, **__):
+        calls["count"] += 1
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+    finished = test_run_service.execute_test_run(db_session, run)
+
+    assert finished.status == TestRunStatus.CANCELLED
+    assert finished.last_error == "测试任务已取消"
+    assert calls["count"] == 0
+
+    retry = client.post(f"/api/v1/test_prompt/{run.id}/retry")
+    assert retry.status_code == 200
+    db_session.expire_all()
+    assert db_session.get(TestRun, run.id).cancel_requested is False
+
+
+def test_run_polls_cancel_request_while_executing(
+    isolated_session_factory, monkeypatch
+):
+    monkeypatch.setattr(settings, "TASK_JOB_HEARTBEAT_INTERVAL", 0.02)
+    session = isolated_session_factory()
+    run = _create_run(session, repetitions=2)
+
+    def fake_post(*_, **__):
+        # 模拟其他进程通过取消接口写入取消请求
+        other = isolated_session_factory()
+        try:
+            other.execute(
+                update(TestRun)
+                .where(TestRun.id == run.id)
+                .values(cancel_requested=True)
+            )
+            other.commit()
+        finally:
+            other.close()
+        token = cancellation_registry.get(TEST_RUN_SCOPE, run.id)
+        deadline = time.monotonic() + 2.0
+        while not token.cancelled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+
+    try:
+        finished = test_run_service.execute_test_run(session, run)
+        session.commit()
+        assert finished.status == TestRunStatus.CANCELLED
+        # 第二轮在取消后不再执行
+        assert len(finished.results) <= 1
+    finally:
+        session.close()
+
+
+def test_run_cancelled_before_start_is_not_revived(db_session):
+    run = _create_run(db_session, repetitions=1)
+    stale = db_session.get(TestRun, run.id)
+    db_session.execute(
+        update(TestRun)
+        .where(TestRun.id == run.id)
+        .values(status=TestRunStatus.CANCELLED)
+        .execution_options(synchronize_session=False)
+    )
+    db_session.commit()
+
+    # 执行方读取到的仍是排队状态，以状态为条件的切换失败后不会执行
+    assert stale.status == TestRunStatus.PENDING
+    skipped = test_run_service.execute_test_run(db_session, stale)
+    assert skipped.status == TestRunStatus.CANCELLED
+
+
+def _create_task(db_session, *, unit_count: int, rounds: int) -> PromptTestTask:
+    provider = LLMProvider(
+        provider_name="CancelTaskProvider",
+        api_key="key",
+        is_custom=True,
+        base_url="https://cancel.llm/api",
+    )
+    # 单并发保证轮次按序执行，便于断言取消与快速失败后剩余轮次被跳过
+    model = LLMModel(provider=provider, name="cancel-task-model", concurrency_limit=1)
+    db_session.add_all([provider, model])
+    db_session.commit()
+    task = PromptTestTask(
+        name="取消任务",
+        status=PromptTestTaskStatus.READY,
+        config={"unit_concurrency": 1},
+    )
+    units = [
+        PromptTestUnit(
+            task=task,
+            name=f"单元{index}",
+            model_name=model.name,
+            llm_provider_id=provider.id,
+            rounds=rounds,
+            prompt_template="你好",
+        )
+        for index in range(unit_count)
+    ]
+    db_session.add_all([task, *units])
+    db_session.commit()
+    return task
+
+
+def test_cancel_running_prompt_test_task_keeps_completed_rounds(
+    client, db_session, monkeypatch
+):
+    task = _create_task(db_session, unit_count=2, rounds=3)
+
+    def fake_single_round(*, run_index, cancel_token=None, **_):
+        if run_index == 1:
+            response = client.post(f"/api/v1/prompt-test/tasks/{task.id}/cancel")
+            assert response.status_code == 202
+        return {"run_index": run_index, "output_text": "ok", "latency_ms": 1}
+
+    monkeypatch.setattr(prompt_test_engine, "_execute_single_round", fake_single_round)
+
+    enqueue_prompt_test_task(task.id)
+    assert task_queue.wait_for_idle(timeout=5.0)
+
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert refreshed.status == PromptTestTaskStatus.CANCELLED
+    assert refreshed.config["last_error"] == "测试任务已取消"
+    experiments = db_session.query(PromptTestExperiment).all()
+    assert len(experiments) == 1
+    assert experiments[0].status == PromptTestExperimentStatus.CANCELLED
+    assert [item["run_index"] for item in experiments[0].outputs] == [1]
+
+    conflict = client.post(f"/api/v1/prompt-test/tasks/{task.id}/cancel")
+    assert conflict.status_code == 409
+    assert cancellation_registry.get(PROMPT_TEST_TASK_SCOPE, task.id) is None
+
+
+def test_prompt_test_unit_fail_fast_stops_remaining_rounds(db_session, monkeypatch):
+    task = _create_task(db_session, unit_count=1, rounds=4)
+    unit = task.units[0]
+    unit.extra = {"fail_fast": True}
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add(experiment)
+    db_session.commit()
+
+    calls = {"count": 0}
+
+    def failing_round(**_):
+        calls["count"] += 1
+        raise PromptTestExecutionError("上游错误", status_code=502)
+
+    monkeypatch.setattr(prompt_test_engine, "_execute_single_round", failing_round)
+
+    with pytest.raises(PromptTestExecutionError, match="快速失败"):
+        prompt_test_engine.execute_prompt_test_experiment(db_session, experiment)
+
+    assert calls["count"] == 1
+    assert experiment.status == PromptTestExperimentStatus.FAILED
+    assert len(experiment.outputs) == 1
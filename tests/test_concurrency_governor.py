@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core import concurrency_governor as concurrency_governor_module
+from app.core.adaptive_concurrency import AdaptiveConcurrencyController
+from app.core.concurrency_governor import (
+    ConcurrencyGovernor,
+    DatabaseConcurrencyBackend,
+)
+from app.models.concurrency_lease import LLMConcurrencyLease
+from app.models.llm_provider import LLMModel, LLMProvider
+
+
+def _make_model(model_id: int = 1, limit: int = 2) -> LLMModel:
+    return LLMModel(id=model_id, provider_id=1, name="governed", concurrency_limit=limit)
+
+
+def test_slot_blocks_beyond_limit_and_reports_waiting():
+    governor = ConcurrencyGovernor(AdaptiveConcurrencyController())
+    model = _make_model(limit=2)
+    peak = {"current": 0, "max": 0, "waiting": 0}
+    lock = threading.Lock()
+
+    def worker() -> None:
+        with governor.slot(model) as lease:
+            with lock:
+                peak["current"] += 1
+                peak["max"] = max(peak["max"], peak["current"])
+                peak["waiting"] = max(
+                    peak["waiting"], governor.snapshot(model)["waiting"]
+                )
+            time.sleep(0.03)
+            with lock:
+                peak["current"] -= 1
+            lease.observe(200, 30.0)
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak["max"] == 2
+    assert peak["waiting"] > 0
+    snapshot = governor.snapshot(model)
+    assert snapshot["in_flight"] == 0
+    assert snapshot["waiting"] == 0
+
+
+def test_sync_and_async_paths_share_the_same_slots():
+    governor = ConcurrencyGovernor(AdaptiveConcurrencyController())
+    model = _make_model(limit=1)
+    held = governor.acquire(model)
+
+    async def run() -> bool:
+        task = asyncio.ensure_future(governor.acquire_async(model))
+        await asyncio.sleep(0.05)
+        blocked = not task.done()
+        assert governor.snapshot(model)["waiting"] == 1
+        governor.release(held)
+        lease = await task
+        governor.release(lease)
+        return blocked
+
+    assert asyncio.run(run()) is True
+    assert governor.snapshot(model)["in_flight"] == 0
+
+
+def test_async_waiter_is_woken_by_release_instead_of_polling(monkeypatch):
+    monkeypatch.setattr(concurrency_governor_module, "ASYNC_WAKE_INTERVAL", 30.0)
+    governor = ConcurrencyGovernor(AdaptiveConcurrencyController())
+    model = _make_model(limit=1)
+    held = governor.acquire(model)
+
+    async def run() -> float:
+        task = asyncio.ensure_future(governor.acquire_async(model))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        started = time.perf_counter()
+        threading.Thread(target=governor.release, args=(held,)).start()
+        lease = await asyncio.wait_for(task, 2.0)
+        elapsed = time.perf_counter() - started
+        await governor.arelease(lease)
+        return elapsed
+
+    assert asyncio.run(run()) < 1.0
+    assert governor.snapshot(model)["in_flight"] == 0
+
+
+def test_arelease_drops_global_lease_off_the_event_loop():
+    class RecordingBackend:
+        def __init__(self) -> None:
+            self.released: list[tuple[int, str]] = []
+
+        def try_acquire(self, model_id: int, limit: int) -> int | None:
+            return 7
+
+        def release(self, lease_id: int) -> None:
+            self.released.append((lease_id, threading.current_thread().name))
+
+        def renew(self, lease_ids: list[int]) -> None:
+            pass
+
+        def count(self, model_id: int) -> int:
+            return len(self.released)
+
+    backend = RecordingBackend()
+    governor = ConcurrencyGovernor(AdaptiveConcurrencyController(), backend)
+    model = _make_model(limit=1)
+
+    async def run() -> str:
+        lease = await governor.acquire_async(model)
+        await governor.arelease(lease)
+        await governor.arelease(lease)
+        return threading.current_thread().name
+
+    loop_thread = asyncio.run(run())
+    assert len(backend.released) == 1
+    assert backend.released[0][0] == 7
+    assert backend.released[0][1] != loop_thread
+    assert governor.snapshot(model)["in_flight"] == 0
+
+
+def test_limit_is_enforced_when_adaptive_control_is_disabled(monkeypatch):
+    controller = AdaptiveConcurrencyController()
+    monkeypatch.setattr(controller, "enabled", lambda: False)
+    governor = ConcurrencyGovernor(controller)
+    model = _make_model(limit=1)
+
+    first = governor.acquire(model)
+    acquired = threading.Event()
+
+    def contender() -> None:
+        with governor.slot(model):
+            acquired.set()
+
+    thread = threading.Thread(target=contender)
+    thread.start()
+    assert not acquired.wait(0.1)
+    governor.release(first)
+    assert acquired.wait(1.0)
+    thread.join()
+
+
+def test_async_slot_records_exceptions_as_congestion():
+    controller = AdaptiveConcurrencyController()
+    governor = ConcurrencyGovernor(controller)
+    model = _make_model(limit=4)
+
+    async def run() -> None:
+        with pytest.raises(RuntimeError):
+            async with governor.slot_async(model):
+                raise RuntimeError("boom")
+
+    asyncio.run(run())
+    assert controller.effective_limit(model) == 2
+    assert governor.snapshot(model)["in_flight"] == 0
+
+
+def test_database_backend_shares_limit_across_processes(db_session):
+    provider = LLMProvider(provider_name="Shared", api_key="k", is_custom=True)
+    model = LLMModel(provider=provider, name="shared-model", concurrency_limit=1)
+    db_session.add_all([provider, model])
+    db_session.commit()
+
+    backend = DatabaseConcurrencyBackend(lease_ttl=60)
+    # 另一个进程持有唯一的名额
+    foreign = backend.try_acquire(model.id, 1)
+    assert foreign is not None
+    assert backend.try_acquire(model.id, 1) is None
+
+    governor = ConcurrencyGovernor(AdaptiveConcurrencyController(), backend)
+    snapshot = governor.snapshot(model)
+    assert snapshot["backend"] == "database"
+    assert snapshot["global_in_flight"] == 1
+
+    releaser = threading.Timer(0.1, backend.release, args=(foreign,))
+    releaser.start()
+    with governor.slot(model) as lease:
+        assert lease.lease_id is not None
+        assert backend.count(model.id) == 1
+    releaser.join()
+    assert backend.count(model.id) == 0
+
+    # 过期租约视为持有进程已退出，会在下一次获取时被回收
+    db_session.add(
+        LLMConcurrencyLease(
+            model_id=model.id, holder="dead:1", acquired_at=0.0, expires_at=1.0
+        )
+    )
+    db_session.commit()
+    lease_id = backend.try_acquire(model.id, 1)
+    assert lease_id is not None
+    backend.release(lease_id)
+
+
+def test_database_backend_renews_held_leases(db_session):
+    provider = LLMProvider(provider_name="Renew", api_key="k", is_custom=True)
+    model = LLMModel(provider=provider, name="renew-model", concurrency_limit=1)
+    db_session.add_all([provider, model])
+    db_session.commit()
+
+    backend = DatabaseConcurrencyBackend(lease_ttl=60)
+    governor = ConcurrencyGovernor(AdaptiveConcurrencyController(), backend)
+    with governor.slot(model) as lease:
+        # 调用耗时接近有效期，续期后租约不会被其他进程当作过期回收
+        db_session.query(LLMConcurrencyLease).update(
+            {LLMConcurrencyLease.expires_at: time.time() + 1}
+        )
+        db_session.commit()
+        governor.renew_leases()
+        db_session.expire_all()
+        renewed = db_session.get(LLMConcurrencyLease, lease.lease_id)
+        assert renewed.expires_at > time.time() + 50
+        assert backend.try_acquire(model.id, 1) is None
+    assert backend.count(model.id) == 0
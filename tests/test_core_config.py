@@ -59,3 +59,27 @@ def test_get_settings_uses_cache_and_env(monkeypatch):
 
     assert first is second
     assert first.APP_ENV == "testing"
+
+
+def test_settings_normalize_execution_mode():
+    settings = _make_settings(TEST_RUN_EXECUTION_MODE=" Async ")
+    assert settings.TEST_RUN_EXECUTION_MODE == "async"
+
+    with pytest.raises(ValueError):
+        _make_settings(TEST_RUN_EXECUTION_MODE="process")
+
+
+def test_settings_validate_rate_limit_backend():
+    settings = _make_settings(LLM_RATE_LIMIT_BACKEND=" Redis ")
+    assert settings.LLM_RATE_LIMIT_BACKEND == "redis"
+
+    with pytest.raises(ValueError):
+        _make_settings(LLM_RATE_LIMIT_BACKEND="memcached")
+
+
+def test_settings_validate_concurrency_backend():
+    settings = _make_settings(LLM_CONCURRENCY_BACKEND="Database")
+    assert settings.LLM_CONCURRENCY_BACKEND == "database"
+
+    with pytest.raises(ValueError):
+        _make_settings(LLM_CONCURRENCY_BACKEND="redis")
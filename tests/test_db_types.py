@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+
+from sqlalchemy import text
+
+from app.db.types import decode_json, encode_json
+from app.models.usage import LLMUsageLog
+from app.services.llm_usage import load_usage_messages, store_usage_messages
+
+
+def test_encode_json_compresses_only_above_threshold():
+    small = {"temperature": 0.2}
+    assert encode_json(small) == b"\x00" + b'{"temperature":0.2}'
+
+    messages = [{"role": "user", "content": "请总结以下会议纪要。" * 100}]
+    encoded = encode_json(messages)
+    raw_size = len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+    assert encoded[:1] == b"\x01"
+    assert len(encoded) * 5 < raw_size
+    assert decode_json(encoded) == messages
+
+
+def test_decode_json_reads_legacy_json_text():
+    assert decode_json('{"a": [1, 2]}') == {"a": [1, 2]}
+    assert decode_json(b'[{"role": "user"}]') == [{"role": "user"}]
+
+
+def test_usage_log_columns_round_trip_through_compression(db_session):
+    messages = [{"role": "system", "content": "你是一名严谨的助手。" * 80}]
+    log = LLMUsageLog(
+        model_name="gpt-4o-mini",
+        source="quick_test",
+        messages=messages,
+        parameters={"max_tokens": 64},
+    )
+    store_usage_messages([log])
+    db_session.add(log)
+    db_session.commit()
+
+    stored_parameters = db_session.execute(
+        text("SELECT parameters FROM llm_usage_logs WHERE id = :id"),
+        {"id": log.id},
+    ).scalar_one()
+    stored_message = db_session.execute(
+        text("SELECT content FROM message_blobs WHERE digest = :digest"),
+        {"digest": log.message_refs[0]},
+    ).scalar_one()
+    assert stored_parameters[:1] == b"\x00"
+    assert stored_message[:1] == b"\x01"
+
+    # 迁移前写入的行为未加头字节的 JSON 文本，读取时应原样解析
+    db_session.execute(
+        text("UPDATE llm_usage_logs SET parameters = :value WHERE id = :id"),
+        {"value": '{"max_tokens": 32}', "id": log.id},
+    )
+    db_session.commit()
+    db_session.expire_all()
+    refreshed = db_session.get(LLMUsageLog, log.id)
+    assert refreshed.messages is None
+    assert load_usage_messages([refreshed]) == [messages]
+    assert refreshed.parameters == {"max_tokens": 32}
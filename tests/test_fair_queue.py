@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import logging
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.core.fair_queue import FairTaskQueue, FairWorkQueue
+from app.core.task_priority import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    resolve_priority,
+)
+
+
+def test_owner_with_fewest_active_tasks_is_served_first():
+    queue = FairWorkQueue()
+    for item in (1, 2, 3):
+        queue.put(item, owner=10)
+    queue.put(4, owner=20)
+    assert queue.put(1, owner=10) is False
+
+    assert queue.get(timeout=0) == (1, 10)
+    # 用户 10 已有任务在执行，空闲线程优先调度用户 20
+    assert queue.get(timeout=0) == (4, 20)
+    assert queue.get(timeout=0) == (2, 10)
+
+    stats = queue.stats()
+    assert stats["queue_depth"] == 1
+    assert stats["active_workers"] == 3
+    assert {item["owner_id"]: item for item in stats["owners"]}[10] == {
+        "owner_id": 10,
+        "queued": 1,
+        "active": 2,
+    }
+
+    queue.task_done(4, owner=20)
+    queue.task_done(1, owner=10)
+    queue.task_done(2, owner=10)
+    assert queue.get(timeout=0) == (3, 10)
+    queue.task_done(3, owner=10)
+    assert queue.unfinished_tasks == 0
+    assert queue.stats()["owners"] == []
+
+
+def test_running_item_is_not_picked_twice():
+    queue = FairWorkQueue()
+    queue.put(7)
+    assert queue.get(timeout=0) == (7, None)
+    assert queue.put(7) is True
+    assert queue.get(timeout=0.01) is None
+
+    queue.task_done(7)
+    assert queue.get(timeout=0) == (7, None)
+
+
+class _BlockingQueue(FairTaskQueue):
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.finished: list[int] = []
+        super().__init__(
+            name="fair-test", worker_count=2, logger=logging.getLogger("test")
+        )
+
+    def _execute_task(self, task_id: int) -> None:
+        if task_id == 1:
+            self.started.set()
+            self.release.wait(timeout=5)
+        self.finished.append(task_id)
+
+
+def test_large_task_does_not_block_small_tasks():
+    queue = _BlockingQueue()
+    queue.enqueue(1, owner_id=1)
+    assert queue.started.wait(timeout=2)
+    queue.enqueue(2, owner_id=1)
+    queue.enqueue(3, owner_id=2)
+
+    assert not queue.wait_for_idle(timeout=0.3)
+    assert sorted(queue.finished) == [2, 3]
+    assert queue.stats()["active_workers"] == 1
+
+    queue.release.set()
+    assert queue.wait_for_idle(timeout=2)
+    assert queue.finished[-1] == 1
+
+
+def test_task_queue_base_requires_execute_task():
+    with pytest.raises(TypeError):
+        FairTaskQueue(name="abstract", worker_count=1, logger=logging.getLogger("test"))
+
+
+def test_queue_stats_endpoint_reports_both_queues(client):
+    response = client.get("/api/v1/queues/stats")
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["test_runs"]["workers"] >= 1
+    assert payload["prompt_test_tasks"]["queue_depth"] == 0
+    assert payload["prompt_test_tasks"]["owners"] == []
+
+
+def test_interactive_tasks_jump_ahead_and_batch_tasks_age(monkeypatch):
+    monkeypatch.setattr(settings, "TASK_PRIORITY_AGING_SECONDS", 60.0)
+    queue = FairWorkQueue()
+    queue.put(1, owner=1, priority=PRIORITY_BATCH)
+    queue.put(2, owner=1, priority=PRIORITY_NORMAL)
+    queue.put(3, owner=2, priority=PRIORITY_INTERACTIVE)
+    assert queue.put(2, owner=1, priority=PRIORITY_INTERACTIVE) is False
+    assert queue.stats()["lanes"] == [
+        {"priority": PRIORITY_INTERACTIVE, "queued": 2},
+        {"priority": PRIORITY_BATCH, "queued": 1},
+    ]
+
+    # 重复入队将任务 2 提升为交互式，两个交互式任务都先于批量任务执行
+    assert queue.get(timeout=0) == (2, 1)
+    assert queue.get(timeout=0) == (3, 2)
+
+    queue.put(4, owner=2, priority=PRIORITY_INTERACTIVE)
+    queue._owners[1].pending[0].enqueued_at -= 120
+    # 批量任务排队两个老化周期后与交互式任务同级，所属用户最久未被调度而先执行
+    assert queue.get(timeout=0) == (1, 1)
+
+
+def test_resolve_priority_uses_explicit_value_then_estimated_size():
+    assert resolve_priority(5, 10_000) == 5
+    assert resolve_priority(None, 3) == PRIORITY_INTERACTIVE
+    assert resolve_priority(None, 200) == PRIORITY_NORMAL
+    assert resolve_priority(None, 50_000) == PRIORITY_BATCH
+    assert resolve_priority(None) == PRIORITY_NORMAL
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import time
+
+from sqlalchemy import select
+
+from app.core.cancellation import TEST_RUN_SCOPE, cancellation_registry
+from app.core.config import settings
+from app.core.job_queue import (
+    claim_next_job,
+    enqueue_job,
+    finish_job,
+    renew_lease,
+)
+from app.core.task_queue import enqueue_test_run, task_queue
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.task_job import TaskJob, TaskJobKind, TaskJobStatus
+from app.models.test_run import TestRun
+from app.worker import JobWorker
+
+
+def _expire_lease(db_session, job_id: int) -> None:
+    job = db_session.get(TaskJob, job_id)
+    job.lease_expires_at = time.time() - 1
+    db_session.commit()
+
+
+def test_claim_is_exclusive_and_expired_lease_is_reclaimed(db_session):
+    job_id = enqueue_job(TaskJobKind.TEST_RUN, 11, owner_id=1)
+    assert enqueue_job(TaskJobKind.TEST_RUN, 11, owner_id=1) == job_id
+
+    claimed = claim_next_job(db_session, "worker-a", lease_seconds=30)
+    assert claimed is not None
+    assert (claimed.id, claimed.target_id, claimed.attempts) == (job_id, 11, 1)
+    assert claim_next_job(db_session, "worker-b", lease_seconds=30) is None
+
+    # worker-a 崩溃后租约过期，由 worker-b 接管
+    _expire_lease(db_session, job_id)
+    reclaimed = claim_next_job(db_session, "worker-b", lease_seconds=30)
+    assert reclaimed is not None
+    assert reclaimed.attempts == 2
+
+    assert renew_lease(db_session, job_id, "worker-a") is False
+    assert finish_job(db_session, job_id, "worker-a") is False
+    assert renew_lease(db_session, job_id, "worker-b") is True
+    assert finish_job(db_session, job_id, "worker-b") is True
+
+    db_session.expire_all()
+    job = db_session.get(TaskJob, job_id)
+    assert job.status == TaskJobStatus.COMPLETED
+    assert job.lease_holder is None
+    assert job.finished_at is not None
+
+
+def test_job_exceeding_max_attempts_is_failed(db_session):
+    job_id = enqueue_job(TaskJobKind.PROMPT_TEST_TASK, 21)
+    assert claim_next_job(db_session, "w", lease_seconds=30, max_attempts=1)
+    _expire_lease(db_session, job_id)
+
+    assert claim_next_job(db_session, "w", lease_seconds=30, max_attempts=1) is None
+
+    db_session.expire_all()
+    job = db_session.get(TaskJob, job_id)
+    assert job.status == TaskJobStatus.FAILED
+    assert "已尝试 1 次" in job.last_error
+
+
+def test_claim_prefers_owner_with_fewer_running_jobs(db_session):
+    enqueue_job(TaskJobKind.TEST_RUN, 1, owner_id=1)
+    enqueue_job(TaskJobKind.TEST_RUN, 2, owner_id=1)
+    enqueue_job(TaskJobKind.TEST_RUN, 3, owner_id=2)
+
+    first = claim_next_job(db_session, "w", lease_seconds=30)
+    second = claim_next_job(db_session, "w", lease_seconds=30)
+
+    assert (first.target_id, second.target_id) == (1, 3)
+    assert claim_next_job(
+        db_session, "w", lease_seconds=30, kinds=[TaskJobKind.PROMPT_TEST_TASK]
+    ) is None
+
+
+def _create_pending_run(db_session) -> TestRun:
+    prompt_class = PromptClass(name="队列测试")
+    prompt = Prompt(name="队列提示词", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="你好")
+    run = TestRun(
+        prompt_version=version,
+        model_name="queue-model",
+        temperature=0.7,
+        top_p=1.0,
+        repetitions=1,
+    )
+    db_session.add_all([prompt_class, prompt, version, run])
+    db_session.commit()
+    return run
+
+
+def test_database_backend_routes_runs_to_worker(db_session, monkeypatch):
+    run = _create_pending_run(db_session)
+    monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "database")
+
+    enqueue_test_run(run.id, owner_id=5)
+
+    assert task_queue.stats()["queue_depth"] == 0
+    job = db_session.scalar(select(TaskJob).where(TaskJob.target_id == run.id))
+    assert job.kind == TaskJobKind.TEST_RUN
+    assert job.owner_id == 5
+
+    executed: list[int] = []
+    worker = JobWorker(
+        holder="worker-test",
+        handlers={TaskJobKind.TEST_RUN: executed.append},
+        lease_seconds=30,
+    )
+    claimed = worker.run_once()
+
+    assert claimed is not None and executed == [run.id]
+    assert worker.run_once() is None
+    db_session.expire_all()
+    assert db_session.get(TaskJob, job.id).status == TaskJobStatus.COMPLETED
+
+
+def test_heartbeat_propagates_cancellation_from_database(db_session):
+    run = _create_pending_run(db_session)
+    enqueue_job(TaskJobKind.TEST_RUN, run.id)
+    observed: dict[str, object] = {}
+
+    def _handler(test_run_id: int) -> None:
+        with cancellation_registry.track(TEST_RUN_SCOPE, test_run_id) as token:
+            worker.heartbeat()
+            assert not token.cancelled
+            run.cancel_requested = True
+            db_session.commit()
+            worker.heartbeat()
+            observed["reason"] = token.reason
+
+    worker = JobWorker(
+        holder="worker-test",
+        handlers={TaskJobKind.TEST_RUN: _handler},
+        lease_seconds=30,
+    )
+    assert worker.run_once() is not None
+    assert observed["reason"] == "任务已取消"
+
+
+def test_claim_orders_by_priority_with_aging(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_PRIORITY_AGING_SECONDS", 60.0)
+    batch = enqueue_job(TaskJobKind.TEST_RUN, 1, priority=2)
+    enqueue_job(TaskJobKind.TEST_RUN, 2, priority=1)
+    enqueue_job(TaskJobKind.TEST_RUN, 3, priority=0)
+
+    assert claim_next_job(db_session, "w", lease_seconds=30).target_id == 3
+
+    # 批量任务已排队超过两个老化周期，提升到与普通任务相同甚至更高的优先级
+    db_session.get(TaskJob, batch).enqueued_at = time.time() - 150
+    db_session.commit()
+    assert claim_next_job(db_session, "w", lease_seconds=30).target_id == 1
+    assert claim_next_job(db_session, "w", lease_seconds=30).target_id == 2
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+
+import httpx
+
+from app.core.llm_http import LLMClientRegistry, ProviderHttpOptions, async_runner
+from app.models.llm_provider import LLMProvider
+
+
+def _make_provider(**overrides) -> LLMProvider:
+    data = {
+        "id": 1,
+        "provider_name": "Pool",
+        "api_key": "pool-key",
+        "base_url": "https://pool.example/api",
+        "is_custom": True,
+        "http_options": None,
+    }
+    data.update(overrides)
+    return LLMProvider(**data)
+
+
+def test_registry_reuses_sync_client_until_config_changes(monkeypatch):
+    closed: list[httpx.HTTPTransport] = []
+    original_close = httpx.HTTPTransport.close
+
+    def _record_close(transport: httpx.HTTPTransport) -> None:
+        closed.append(transport)
+        original_close(transport)
+
+    monkeypatch.setattr(httpx.HTTPTransport, "close", _record_close)
+    registry = LLMClientRegistry()
+    provider = _make_provider()
+
+    first = registry.get_sync_client(provider)
+    assert registry.get_sync_client(provider) is first
+    assert first.headers["Authorization"] == "Bearer pool-key"
+
+    provider.api_key = "rotated-key"
+    rebuilt = registry.get_sync_client(provider)
+    assert rebuilt is not first
+    assert rebuilt.headers["Authorization"] == "Bearer rotated-key"
+    # 旧客户端可能仍被其他线程使用，替换时不会被关闭
+    assert not first.is_closed
+    assert closed == []
+
+    registry.invalidate(provider.id)
+    assert not rebuilt.is_closed
+    assert not registry.has_client(provider.id)
+
+    # 最后一个使用者释放引用后由终结器关闭连接池
+    del first, rebuilt
+    gc.collect()
+    assert len(closed) == 2
+
+
+def test_registry_keeps_async_clients_per_event_loop():
+    registry = LLMClientRegistry()
+    provider = _make_provider(id=2)
+
+    async def fetch_pair() -> tuple[httpx.AsyncClient, httpx.AsyncClient]:
+        return registry.get_async_client(provider), registry.get_async_client(provider)
+
+    first_a, first_b = asyncio.run(fetch_pair())
+    second_a, _ = asyncio.run(fetch_pair())
+
+    assert first_a is first_b
+    assert second_a is not first_a
+    registry.close_all()
+    assert not registry.has_client(provider.id)
+
+
+def test_async_client_of_stopped_loop_is_closed_on_runner():
+    registry = LLMClientRegistry()
+    provider = _make_provider(id=3)
+    loop = asyncio.new_event_loop()
+
+    async def fetch() -> httpx.AsyncClient:
+        return registry.get_async_client(provider)
+
+    try:
+        client = loop.run_until_complete(fetch())
+        # 事件循环已停止但尚未关闭，关闭操作转交后台事件循环执行
+        registry.invalidate(provider.id)
+        async_runner.run(asyncio.sleep(0), timeout=1.0)
+        assert client.is_closed
+    finally:
+        loop.close()
+
+
+def test_provider_http_options_build_limits_and_timeout():
+    options = ProviderHttpOptions.from_mapping(
+        {"max_connections": 8, "max_keepalive_connections": 2, "read_timeout": 5}
+    )
+    assert options.limits.max_connections == 8
+    assert options.limits.max_keepalive_connections == 2
+
+    timeout = options.build_timeout(30.0)
+    assert isinstance(timeout, httpx.Timeout)
+    assert timeout.read == 5.0
+    assert timeout.connect == 30.0
+
+    assert ProviderHttpOptions.from_mapping(None).build_timeout(12.0) == 12.0
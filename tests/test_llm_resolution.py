@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from app.db import session as db_session_module
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.services.llm_resolution import LLMResolutionCache, llm_resolution_cache
+from app.services.system_settings import bump_runtime_config_version
+
+
+def _create_provider(db_session) -> tuple[LLMProvider, LLMModel]:
+    provider = LLMProvider(
+        provider_name="CacheProvider",
+        api_key="key",
+        is_custom=True,
+        base_url="https://cache.llm/v1/",
+    )
+    model = LLMModel(provider=provider, name="cache-model")
+    db_session.add_all([provider, model])
+    db_session.commit()
+    return provider, model
+
+
+def _count_loads(monkeypatch) -> list[int]:
+    """记录缓存回源加载时打开独立会话的次数。"""
+
+    loads: list[int] = []
+    factory = db_session_module.SessionLocal
+
+    def _counting_factory(*args, **kwargs):
+        loads.append(1)
+        return factory(*args, **kwargs)
+
+    monkeypatch.setattr(db_session_module, "SessionLocal", _counting_factory)
+    return loads
+
+
+def test_repeated_resolution_is_served_from_cache(db_session, monkeypatch):
+    provider, model = _create_provider(db_session)
+    loads = _count_loads(monkeypatch)
+
+    first = llm_resolution_cache.provider_by_id(db_session, provider.id)
+    second = llm_resolution_cache.provider_by_id(db_session, provider.id)
+    # 调用方会话中已有同一行时直接复用，不会用缓存值覆盖会话中的对象
+    assert first is provider and second is provider
+    assert len(loads) == 1
+    assert llm_resolution_cache.base_url(first) == "https://cache.llm/v1"
+
+    pair = llm_resolution_cache.provider_and_model_by_model_name(
+        db_session, "cache-model"
+    )
+    assert pair is not None and pair[1].id == model.id
+    llm_resolution_cache.model_by_name(db_session, provider.id, "cache-model")
+    llm_resolution_cache.model_by_name(db_session, provider.id, "cache-model")
+    assert len(loads) == 3
+    # 未命中不缓存，新增记录可直接被查到
+    assert llm_resolution_cache.provider_by_name(db_session, "Later") is None
+    later = LLMProvider(provider_name="Later", api_key="key", is_custom=True)
+    db_session.add(later)
+    db_session.commit()
+    assert llm_resolution_cache.provider_by_name(db_session, "Later").id == later.id
+
+
+def test_cached_rows_are_copied_into_each_caller_session(db_session, monkeypatch):
+    provider, _ = _create_provider(db_session)
+    first_session = db_session_module.SessionLocal()
+    second_session = db_session_module.SessionLocal()
+    third_session = db_session_module.SessionLocal()
+    loads = _count_loads(monkeypatch)
+    try:
+        first = llm_resolution_cache.provider_by_id(first_session, provider.id)
+        second = llm_resolution_cache.provider_by_id(second_session, provider.id)
+        assert len(loads) == 1
+        assert first is not second
+        assert first in first_session and second in second_session
+        assert [item.name for item in first.models] == ["cache-model"]
+
+        # 调用方修改自己的副本不会影响缓存与其他会话
+        first.api_key = "mutated"
+        third = llm_resolution_cache.provider_by_id(third_session, provider.id)
+        assert third.api_key == "key"
+        assert second.api_key == "key"
+    finally:
+        for session in (first_session, second_session, third_session):
+            session.close()
+
+
+def test_update_endpoint_invalidates_cached_provider(client, db_session):
+    provider, _ = _create_provider(db_session)
+    cached = llm_resolution_cache.provider_by_id(db_session, provider.id)
+    assert cached.base_url == "https://cache.llm/v1/"
+
+    response = client.patch(
+        f"/api/v1/llm-providers/{provider.id}",
+        json={"base_url": "https://changed.llm/v1"},
+    )
+    assert response.status_code == 200
+
+    refreshed = llm_resolution_cache.provider_by_id(db_session, provider.id)
+    assert refreshed.base_url == "https://changed.llm/v1"
+
+
+def test_version_bump_from_other_process_clears_cache(db_session, monkeypatch):
+    provider, _ = _create_provider(db_session)
+    cache = LLMResolutionCache(ttl_seconds=300, version_check_interval=0)
+    caller = db_session_module.SessionLocal()
+    loads = _count_loads(monkeypatch)
+    cache.provider_by_id(db_session, provider.id)
+    cache.provider_by_id(db_session, provider.id)
+    assert len(loads) == 1
+
+    # 模拟其他进程直接修改数据库并递增版本号，本进程不会收到提交事件
+    provider.api_key = "rotated"
+    bump_runtime_config_version(db_session)
+    db_session.commit()
+
+    try:
+        reloaded = cache.provider_by_id(caller, provider.id)
+        assert reloaded.api_key == "rotated"
+    finally:
+        caller.close()
+    assert len(loads) == 2
+
+    disabled = LLMResolutionCache(ttl_seconds=0)
+    assert disabled.provider_by_id(db_session, provider.id) is provider
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import json
+
+import httpx
+
+from app.core.llm_http import llm_client_registry
+from app.core.llm_stream import (
+    StreamCollector,
+    build_stream_payload,
+    iter_sse_events,
+    parse_sse_data,
+)
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.prompt_test import PromptTestExperiment, PromptTestTask, PromptTestUnit
+from app.models.test_run import TestRun, TestRunStatus
+from app.services import test_run as test_run_service
+from app.services.prompt_test_engine import execute_prompt_test_experiment
+
+
+def _sse_body(chunks: list[str], *, completion_tokens: int | None = None) -> bytes:
+    events = [
+        {"model": "stream-model", "choices": [{"delta": {"content": chunk}}]}
+        for chunk in chunks
+    ]
+    events.append({"choices": [{"delta": {}, "finish_reason": "stop"}]})
+    if completion_tokens is not None:
+        events.append(
+            {
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": 5,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": 5 + completion_tokens,
+                },
+            }
+        )
+    lines = [f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events]
+    lines.append(": keep-alive\n\n")
+    lines.append("data: [DONE]\n\n")
+    return "".join(lines).encode("utf-8")
+
+
+def _stream_transport(captured: list[dict]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        captured.append(json.loads(request.content))
+        return httpx.Response(
+            200,
+            content=_sse_body(["你", "好", "！"], completion_tokens=3),
+            headers={"content-type": "text/event-stream"},
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def test_parse_helpers_split_events_and_skip_comments():
+    lines = ["data: {\"a\": 1}", "", ": ping", "", "data: part1", "data: part2", ""]
+    events = list(iter_sse_events(lines))
+    assert events == [["data: {\"a\": 1}"], [": ping"], ["data: part1", "data: part2"]]
+    assert parse_sse_data(events[1]) is None
+    assert parse_sse_data(events[2]) == "part1\npart2"
+
+    payload = build_stream_payload({"model": "m", "stream_options": {"foo": 1}})
+    assert payload["stream"] is True
+    assert payload["stream_options"] == {"foo": 1, "include_usage": True}
+
+
+def test_collector_metrics_use_token_timestamps():
+    collector = StreamCollector(started_at=10.0)
+    collector.feed({"choices": [{"delta": {"content": "A"}}]}, now=10.25)
+    collector.feed({"choices": [{"delta": {"content": "B"}}]}, now=10.35)
+    collector.feed({"choices": [{"delta": {"content": "C"}}]}, now=10.65)
+    collector.feed(
+        {"choices": [{"delta": {}, "finish_reason": "stop"}]}, now=10.7
+    )
+    collector.feed({"usage": {"completion_tokens": 9}}, now=10.7)
+    assert collector.feed_event(["data: [DONE]"]) is True
+    collector.finish(now=11.25)
+
+    metrics = collector.metrics()
+    assert metrics["ttft_ms"] == 250
+    assert metrics["inter_token_latency_ms"]["max"] == 300.0
+    assert metrics["inter_token_latency_ms"]["p50"] == 100.0
+    assert metrics["tokens_per_second"] == 9.0
+
+    completion = collector.completion_payload()
+    assert completion["choices"][0]["message"]["content"] == "ABC"
+    assert completion["choices"][0]["finish_reason"] == "stop"
+    assert completion["usage"] == {"completion_tokens": 9}
+
+    assert StreamCollector(started_at=0.0).metrics()["ttft_ms"] is None
+
+
+def _create_stream_fixtures(db_session) -> tuple[PromptVersion, LLMModel]:
+    prompt_class = PromptClass(name="流式测试")
+    prompt = Prompt(name="流式提示词", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="请打招呼")
+    provider = LLMProvider(
+        provider_name="StreamProvider",
+        api_key="key",
+        is_custom=True,
+        base_url="https://stream.llm/v1",
+    )
+    model = LLMModel(provider=provider, name="stream-model")
+    db_session.add_all([prompt_class, prompt, version, provider, model])
+    db_session.commit()
+    return version, model
+
+
+def test_streaming_test_run_records_ttft_and_throughput(db_session, monkeypatch):
+    captured: list[dict] = []
+    transport = _stream_transport(captured)
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: httpx.Client(transport=transport),
+    )
+    version, model = _create_stream_fixtures(db_session)
+    run = TestRun(
+        prompt_version=version,
+        model_name=model.name,
+        temperature=0.2,
+        top_p=1.0,
+        repetitions=2,
+        schema={
+            "llm_provider_id": model.provider_id,
+            "llm_model_id": model.id,
+            "streaming": True,
+        },
+    )
+    db_session.add(run)
+    db_session.commit()
+
+    finished = test_run_service.execute_test_run(db_session, run)
+
+    assert finished.status == TestRunStatus.COMPLETED
+    assert len(captured) == 2
+    assert all(item["stream"] is True for item in captured)
+    assert all(item["stream_options"]["include_usage"] for item in captured)
+    for result in finished.results:
+        assert result.output == "你好！"
+        assert result.tokens_used == 8
+        assert result.ttft_ms is not None and result.ttft_ms >= 0
+        assert result.inter_token_latency_ms is not None
+        assert result.inter_token_latency_ms.keys() == {"mean", "p50", "p95", "max"}
+
+
+def test_streaming_async_test_run_records_ttft(db_session, monkeypatch):
+    captured: list[dict] = []
+    transport = _stream_transport(captured)
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_async_client",
+        lambda provider: httpx.AsyncClient(transport=transport),
+    )
+    version, model = _create_stream_fixtures(db_session)
+    run = TestRun(
+        prompt_version=version,
+        model_name=model.name,
+        temperature=0.2,
+        top_p=1.0,
+        repetitions=1,
+        schema={
+            "llm_provider_id": model.provider_id,
+            "llm_model_id": model.id,
+            "streaming": True,
+            "execution_mode": "async",
+        },
+    )
+    db_session.add(run)
+    db_session.commit()
+
+    finished = test_run_service.execute_test_run(db_session, run)
+
+    assert finished.status == TestRunStatus.COMPLETED
+    assert captured[0]["stream"] is True
+    assert finished.results[0].output == "你好！"
+    assert finished.results[0].ttft_ms is not None
+
+
+def test_streaming_prompt_test_experiment_aggregates_ttft(db_session, monkeypatch):
+    captured: list[dict] = []
+    transport = _stream_transport(captured)
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: httpx.Client(transport=transport),
+    )
+    version, model = _create_stream_fixtures(db_session)
+    task = PromptTestTask(name="流式任务", prompt_version_id=version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=version.id,
+        name="流式单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=2,
+        prompt_template="你好",
+        extra={"streaming": True},
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+
+    result = execute_prompt_test_experiment(db_session, experiment)
+
+    assert len(captured) == 2
+    assert [item["output_text"] for item in result.outputs] == ["你好！", "你好！"]
+    assert all(item["ttft_ms"] is not None for item in result.outputs)
+    assert "avg_ttft_ms" in result.metrics
+    assert "p95_ttft_ms" in result.metrics
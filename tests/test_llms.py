@@ -1,24 +1,61 @@
 from datetime import timedelta
-from types import TracebackType
+from types import SimpleNamespace, TracebackType
 from typing import Any, Literal
 
 import anyio
 import httpx
 import pytest
 from fastapi import HTTPException
+from sqlalchemy import func, select
 
 from app.core.config import settings
+from app.core.llm_http import llm_client_registry
+from app.core.message_store import message_store
 from app.api.v1.endpoints import llms as llms_api
 from app.api.v1.endpoints.llms import ChatMessage, LLMStreamInvocationRequest
 from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.message_blob import MessageBlob
 from app.models.system_setting import SystemSetting
 from app.models.usage import LLMUsageLog
+from app.services.llm_usage import load_usage_messages, store_usage_messages
 from app.services.system_settings import DEFAULT_QUICK_TEST_TIMEOUT
 
 
 API_PREFIX = "/api/v1/llm-providers"
 
 
+def _patch_llm_post(monkeypatch, fake_post) -> None:
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+
+
+def _patch_llm_async_client(monkeypatch, async_client) -> None:
+    monkeypatch.setattr(
+        llm_client_registry, "get_async_client", lambda provider: async_client
+    )
+
+
+def _spy_stream_accounting(monkeypatch) -> dict[str, list[Any]]:
+    """记录流式调用的额度校正与并发名额归还。"""
+
+    calls: dict[str, list[Any]] = {"settled": [], "released": []}
+    original_arelease = llms_api.concurrency_governor.arelease
+
+    async def fake_asettle(reservation, actual_tokens) -> None:
+        calls["settled"].append(actual_tokens)
+
+    async def fake_arelease(lease, *, failed: bool = False) -> None:
+        calls["released"].append(failed)
+        await original_arelease(lease, failed=failed)
+
+    monkeypatch.setattr(llms_api.llm_rate_limiter, "asettle", fake_asettle)
+    monkeypatch.setattr(llms_api.concurrency_governor, "arelease", fake_arelease)
+    return calls
+
+
 def create_provider(client, payload: dict[str, Any]) -> dict[str, Any]:
     response = client.post(API_PREFIX + "/", json=payload)
     assert response.status_code == 201, response.text
@@ -190,7 +227,7 @@ def test_invoke_llm_uses_request_parameters_only(client, monkeypatch):
         )
         return DummyResponse()
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     body = {
         "model_id": model["id"],
@@ -260,7 +297,7 @@ def test_invoke_llm_respects_custom_timeout(client, db_session, monkeypatch):
         )
         return DummyResponse()
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     body = {
         "model_id": model["id"],
@@ -329,6 +366,30 @@ def test_update_model_concurrency_limit(client):
     assert invalid_resp.status_code == 422
 
 
+def test_update_model_rate_limits(client):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "RateLimited",
+            "api_key": "rate-secret",
+            "is_custom": True,
+            "base_url": "https://llm.rate/api",
+        },
+    )
+    model = create_model(client, provider["id"], {"name": "chat-rate", "rpm_limit": 60})
+    assert model["rpm_limit"] == 60
+    assert model["tpm_limit"] is None
+
+    update_resp = client.patch(
+        f"{API_PREFIX}/{provider['id']}/models/{model['id']}",
+        json={"rpm_limit": None, "tpm_limit": 20000},
+    )
+    assert update_resp.status_code == 200
+    updated = update_resp.json()
+    assert updated["rpm_limit"] is None
+    assert updated["tpm_limit"] == 20000
+
+
 def test_invoke_llm_uses_known_base_url_when_missing(client, db_session, monkeypatch):
     provider = LLMProvider(
         provider_name="OpenAI",
@@ -363,7 +424,7 @@ def test_invoke_llm_uses_known_base_url_when_missing(client, db_session, monkeyp
         )
         return DummyResponse()
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     body = {
         "messages": [{"role": "user", "content": "Hello"}],
@@ -430,7 +491,7 @@ def test_invoke_llm_persists_usage_when_requested(client, db_session, monkeypatc
         )
         return DummyResponse()
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     before_count = db_session.query(LLMUsageLog).count()
 
@@ -467,8 +528,9 @@ def test_invoke_llm_persists_usage_when_requested(client, db_session, monkeypatc
     assert usage_log.completion_tokens == 12
     assert usage_log.total_tokens == 20
     assert usage_log.latency_ms is not None
-    assert usage_log.messages is not None
-    assert usage_log.messages[0]["content"] == "你好"
+    [messages] = load_usage_messages([usage_log])
+    assert messages is not None
+    assert messages[0]["content"] == "你好"
 
 
 def test_delete_missing_model_returns_404(client):
@@ -623,22 +685,20 @@ def test_stream_invoke_llm_persists_usage(client, db_session, monkeypatch):
         ) -> Literal[False]:
             return False
 
-        def stream(self, method, url, headers=None, json=None):
+        def stream(self, method, url, headers=None, json=None, timeout=None):
             captured.update(
                 {
                     "method": method,
                     "url": url,
                     "headers": headers,
                     "json": json,
-                    "timeout": self.timeout,
+                    "timeout": timeout,
                 }
             )
             return DummyAsyncStream(lines)
 
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.AsyncClient",
-        DummyAsyncClient,
-    )
+    _patch_llm_async_client(monkeypatch, DummyAsyncClient())
+    accounting = _spy_stream_accounting(monkeypatch)
 
     body = {
         "model_id": model["id"],
@@ -675,6 +735,8 @@ def test_stream_invoke_llm_persists_usage(client, db_session, monkeypatch):
     assert captured["json"]["temperature"] == 0.6
     assert captured["json"]["messages"][0]["content"] == "请问你好"
     assert captured["timeout"] == DEFAULT_QUICK_TEST_TIMEOUT
+    # 按流中返回的真实用量校正额度，名额只归还一次
+    assert accounting == {"settled": [12], "released": [False]}
 
 
 def test_stream_invoke_llm_respects_custom_timeout(client, db_session, monkeypatch):
@@ -739,17 +801,15 @@ def test_stream_invoke_llm_respects_custom_timeout(client, db_session, monkeypat
         ) -> Literal[False]:
             return False
 
-        def stream(self, method, url, headers=None, json=None):
+        def stream(self, method, url, headers=None, json=None, timeout=None):
+            captured["timeout"] = timeout
             captured["method"] = method
             captured["url"] = url
             captured["headers"] = headers
             captured["json"] = json
             return DummyAsyncStream()
 
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.AsyncClient",
-        DummyAsyncClient,
-    )
+    _patch_llm_async_client(monkeypatch, DummyAsyncClient())
 
     body = {
         "model_id": model["id"],
@@ -804,6 +864,57 @@ def test_quick_test_history_endpoint_returns_logs(client, db_session):
     assert matched["messages"][0]["content"] == "回顾一下"
 
 
+def test_quick_test_history_rehydrates_shared_message_blobs(
+    client, db_session, caplog
+):
+    system_message = {"role": "system", "content": "你是一名资深翻译。" * 50}
+    logs = [
+        LLMUsageLog(
+            model_name="chat-blob",
+            source="quick_test",
+            messages=[system_message, {"role": "user", "content": f"第{index}句"}],
+        )
+        for index in range(3)
+    ]
+    # 未经服务层写入消息块的记录仍按旧版方式内嵌保存
+    legacy = LLMUsageLog(
+        model_name="chat-blob",
+        source="quick_test",
+        messages=[{"role": "user", "content": "旧记录"}],
+    )
+    store_usage_messages(logs)
+    db_session.add_all([*logs, legacy])
+    db_session.commit()
+
+    # 系统提示词在三条记录间共享同一个消息块
+    assert {log.message_refs[0] for log in logs} == {logs[0].message_refs[0]}
+    assert db_session.scalar(select(func.count()).select_from(MessageBlob)) == 4
+    assert legacy.message_refs is None
+
+    message_store.reset()
+    response = client.get("/api/v1/llm-providers/quick-test/history")
+    assert response.status_code == 200
+    records = {item["id"]: item["messages"] for item in response.json()}
+    assert records[logs[2].id] == [
+        {"role": "system", "content": system_message["content"]},
+        {"role": "user", "content": "第2句"},
+    ]
+    assert records[legacy.id] == [{"role": "user", "content": "旧记录"}]
+
+    # 个别记录的消息块缺失时只有该条不返回消息，不返回残缺列表也不影响其余记录
+    missing_digest = logs[0].message_refs[1]
+    db_session.query(MessageBlob).filter(MessageBlob.digest == missing_digest).delete()
+    db_session.commit()
+    message_store.reset()
+    with caplog.at_level("WARNING", logger="promptworks.llm_usage"):
+        response = client.get("/api/v1/llm-providers/quick-test/history")
+    assert response.status_code == 200
+    records = {item["id"]: item["messages"] for item in response.json()}
+    assert records[logs[0].id] == []
+    assert records[logs[1].id][1] == {"role": "user", "content": "第1句"}
+    assert missing_digest in caplog.text
+
+
 def test_invoke_llm_network_error_returns_gateway_error(client, monkeypatch):
     provider = create_provider(
         client,
@@ -819,7 +930,13 @@ def test_invoke_llm_network_error_returns_gateway_error(client, monkeypatch):
     def fake_post(*args, **kwargs):  # noqa: ANN002 - 与 httpx 接口对齐
         raise httpx.HTTPError("network down")
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
+    settled: list[int | None] = []
+    monkeypatch.setattr(
+        llms_api.llm_rate_limiter,
+        "settle",
+        lambda reservation, actual_tokens: settled.append(actual_tokens),
+    )
 
     payload = {
         "model_id": model["id"],
@@ -828,6 +945,7 @@ def test_invoke_llm_network_error_returns_gateway_error(client, monkeypatch):
     response = client.post(f"{API_PREFIX}/{provider['id']}/invoke", json=payload)
     assert response.status_code == 502
     assert "network down" in response.text
+    assert settled == [0]
 
 
 def test_invoke_llm_error_response_falls_back_to_text(client, monkeypatch):
@@ -852,9 +970,12 @@ def test_invoke_llm_error_response_falls_back_to_text(client, monkeypatch):
         def text(self) -> str:
             return "too many requests"
 
+    _patch_llm_post(monkeypatch, lambda *args, **kwargs: ErrorResponse())
+    settled: list[int | None] = []
     monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.post",
-        lambda *args, **kwargs: ErrorResponse(),
+        llms_api.llm_rate_limiter,
+        "settle",
+        lambda reservation, actual_tokens: settled.append(actual_tokens),
     )
 
     payload = {
@@ -864,6 +985,7 @@ def test_invoke_llm_error_response_falls_back_to_text(client, monkeypatch):
     response = client.post(f"{API_PREFIX}/{provider['id']}/invoke", json=payload)
     assert response.status_code == 429
     assert "too many requests" in response.text
+    assert settled == [0]
 
 
 def test_invoke_llm_without_elapsed_logs(client, monkeypatch):
@@ -889,10 +1011,7 @@ def test_invoke_llm_without_elapsed_logs(client, monkeypatch):
         def text(self) -> str:
             return ""
 
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.post",
-        lambda *args, **kwargs: SuccessResponse(),
-    )
+    _patch_llm_post(monkeypatch, lambda *args, **kwargs: SuccessResponse())
 
     payload = {
         "model_id": model["id"],
@@ -942,10 +1061,8 @@ def test_stream_invoke_llm_handles_error_status(db_session, monkeypatch):
         def stream(self, *args, **kwargs):
             return ErrorAsyncStream()
 
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.AsyncClient",
-        ErrorAsyncClient,
-    )
+    _patch_llm_async_client(monkeypatch, ErrorAsyncClient())
+    accounting = _spy_stream_accounting(monkeypatch)
 
     payload = LLMStreamInvocationRequest(
         model_id=model.id,
@@ -970,6 +1087,7 @@ def test_stream_invoke_llm_handles_error_status(db_session, monkeypatch):
     with pytest.raises(HTTPException) as exc:
         anyio.run(consume)
     assert exc.value.status_code == 502
+    assert accounting == {"settled": [0], "released": [True]}
 
 
 def test_stream_invoke_llm_handles_http_exception(db_session, monkeypatch):
@@ -996,10 +1114,8 @@ def test_stream_invoke_llm_handles_http_exception(db_session, monkeypatch):
         def stream(self, *args, **kwargs):
             raise httpx.HTTPError("stream boom")
 
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.AsyncClient",
-        RaiseAsyncClient,
-    )
+    _patch_llm_async_client(monkeypatch, RaiseAsyncClient())
+    accounting = _spy_stream_accounting(monkeypatch)
 
     payload = LLMStreamInvocationRequest(
         model_id=model.id,
@@ -1025,6 +1141,7 @@ def test_stream_invoke_llm_handles_http_exception(db_session, monkeypatch):
         anyio.run(consume)
 
     assert exc.value.status_code == 502
+    assert accounting == {"settled": [0], "released": [True]}
 
 
 def test_stream_invoke_llm_ignores_invalid_chunks(client, db_session, monkeypatch):
@@ -1079,10 +1196,7 @@ def test_stream_invoke_llm_ignores_invalid_chunks(client, db_session, monkeypatc
         def stream(self, *args, **kwargs):
             return NoiseAsyncStream(noise_lines)
 
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.AsyncClient",
-        NoiseAsyncClient,
-    )
+    _patch_llm_async_client(monkeypatch, NoiseAsyncClient())
 
     payload = {
         "model_id": model["id"],
@@ -1100,3 +1214,37 @@ def test_stream_invoke_llm_ignores_invalid_chunks(client, db_session, monkeypatc
     logs = db_session.query(LLMUsageLog).order_by(LLMUsageLog.id.desc()).first()
     assert logs is not None
     assert logs.response_text == "A"
+
+
+def test_update_provider_http_options_invalidates_client(client):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "PooledProvider",
+            "api_key": "pooled-key",
+            "is_custom": True,
+            "base_url": "https://pooled.llm/api",
+            "http_options": {"max_connections": 10},
+        },
+    )
+    assert provider["http_options"]["max_connections"] == 10
+
+    db_provider = LLMProvider(
+        id=provider["id"],
+        provider_name=provider["provider_name"],
+        api_key="pooled-key",
+        base_url="https://pooled.llm/api",
+        http_options={"max_connections": 10},
+    )
+    llm_client_registry.get_sync_client(db_provider)
+    assert llm_client_registry.has_client(provider["id"])
+
+    response = client.patch(
+        f"{API_PREFIX}/{provider['id']}",
+        json={"http_options": {"read_timeout": 15, "http2": False}},
+    )
+    assert response.status_code == 200, response.text
+    options = response.json()["http_options"]
+    assert options["read_timeout"] == 15
+    assert options["max_connections"] is None
+    assert not llm_client_registry.has_client(provider["id"])
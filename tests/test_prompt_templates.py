@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import pytest
+
+from app.models.prompt_test import PromptTestExperiment, PromptTestTask, PromptTestUnit
+from app.services import prompt_test_engine
+from app.services.prompt_templates import (
+    MissingTemplateVariablesError,
+    compile_template,
+)
+
+
+@pytest.mark.parametrize(
+    "template, context",
+    [
+        ("请翻译：{text}", {"text": "你好"}),
+        ("第 {{run_index}} 轮 {{literal}} {score:.2f}", {"score": 0.5}),
+        ("{item[name]} / {item[size]!r:>6}", {"item": {"name": "a", "size": 3}}),
+        ("{value:{width}}|", {"value": "x", "width": 4}),
+        ("纯文本", {}),
+    ],
+)
+def test_compiled_render_matches_str_format(template, context):
+    context = {"run_index": 3, **context}
+    expected = template.replace("{{run_index}}", "3").format(**context)
+
+    assert compile_template(template).render(context, 3) == expected
+
+
+def test_compile_records_variables_and_is_cached():
+    compiled = compile_template("{a} 与 {b.real} 第 {{run_index}} 轮，宽度 {c:{d}}")
+
+    assert compiled is compile_template(compiled.source)
+    assert compiled.variables == {"a", "b", "c", "d"}
+    assert compiled.missing_variables({"a": 1, "c": 2}) == {"b", "d"}
+    with pytest.raises(MissingTemplateVariablesError, match="b, d"):
+        compiled.render({"a": 1, "c": 2}, 1)
+
+
+def test_unformattable_templates_fall_back_to_source():
+    json_template = '按 {"answer": "..."} 输出，第 {{run_index}} 轮'
+    compiled = compile_template(json_template)
+
+    assert not compiled.formattable
+    assert compiled.variables == frozenset()
+    assert compiled.render({}, 2) == '按 {"answer": "..."} 输出，第 2 轮'
+    assert compile_template("{}").render({}, 1) == "{}"
+    assert compile_template("{a:d}").render({"a": "text"}, 1) == "{a:d}"
+
+
+def test_experiment_reports_missing_variables_before_sending(
+    db_session, monkeypatch
+):
+    calls: list[dict] = []
+    monkeypatch.setattr(
+        prompt_test_engine,
+        "_execute_single_round",
+        lambda **kwargs: calls.append(kwargs),
+    )
+    task = PromptTestTask(name="变量校验")
+    unit = PromptTestUnit(
+        task=task,
+        name="缺少变量",
+        model_name="mock-model",
+        rounds=1,
+        prompt_template="把 {text} 翻译成 {language}",
+        variables={
+            "defaults": {"language": "英语"},
+            "cases": [{"text": "你好"}, {"language": "日语"}],
+        },
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+    monkeypatch.setattr(
+        prompt_test_engine,
+        "_resolve_provider_and_model",
+        lambda db, target: (None, None),
+    )
+
+    with pytest.raises(
+        prompt_test_engine.PromptTestExecutionError, match="text（第 2 组用例）"
+    ):
+        prompt_test_engine.execute_prompt_test_experiment(db_session, experiment)
+
+    assert calls == []
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
+import threading
+import time
 from datetime import timedelta
+from types import SimpleNamespace
 from typing import Any
 
 import pytest
 from sqlalchemy import func, select
 
 from app.core import prompt_test_task_queue
+from app.core.llm_http import llm_client_registry
 from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.prompt import Prompt, PromptClass, PromptVersion
 from app.models.prompt_test import (
     PromptTestExperiment,
     PromptTestExperimentStatus,
+    PromptTestRound,
+    PromptTestRoundStatus,
     PromptTestTask,
     PromptTestTaskStatus,
     PromptTestUnit,
@@ -23,6 +29,14 @@ from app.services.prompt_test_engine import execute_prompt_test_experiment
 from app.services.system_settings import DEFAULT_TEST_TASK_TIMEOUT
 
 
+def _patch_llm_post(monkeypatch, fake_post) -> None:
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+
+
 class DummyResponse:
     """用于伪造 httpx 返回值的简单封装。"""
 
@@ -79,8 +93,8 @@ def test_prompt_test_engine_build_messages_snapshot_uses_user_role():
         prompt_template="第 {run_index} 次提问",
     )
     context = {"run_index": 1}
-    messages = prompt_test_engine._build_messages(
-        unit, "你是一位审校专家。", context, run_index=1
+    messages = prompt_test_engine._compile_messages(unit, "你是一位审校专家。").render(
+        context, 1
     )
     assert len(messages) >= 2
     assert messages[0]["role"] == "user"
@@ -129,7 +143,7 @@ def test_execute_prompt_test_experiment_generates_metrics(db_session, monkeypatc
         }
         return DummyResponse(response, elapsed_ms=24)
 
-    monkeypatch.setattr("app.services.prompt_test_engine.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     execute_prompt_test_experiment(db_session, experiment)
     db_session.commit()
@@ -208,7 +222,7 @@ def test_prompt_test_engine_uses_custom_timeout(db_session, monkeypatch):
         }
         return DummyResponse(response, elapsed_ms=12)
 
-    monkeypatch.setattr("app.services.prompt_test_engine.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     execute_prompt_test_experiment(db_session, experiment)
 
@@ -232,7 +246,7 @@ def test_prompt_test_api_creates_and_executes_experiment(
         }
         return DummyResponse(response, elapsed_ms=10)
 
-    monkeypatch.setattr("app.services.prompt_test_engine.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     response = client.post(
         "/api/v1/prompt-test/tasks",
@@ -277,6 +291,60 @@ def test_prompt_test_api_creates_and_executes_experiment(
     assert detail_resp.json()["status"] == PromptTestExperimentStatus.COMPLETED.value
 
 
+def test_execute_prompt_test_experiment_appends_round_rows(db_session, monkeypatch):
+    model = _create_provider_and_model(db_session)
+    task = PromptTestTask(name="轮次表")
+    unit = PromptTestUnit(
+        task=task,
+        name="逐轮写入",
+        model_name=model.name,
+        llm_provider_id=model.provider.id,
+        rounds=2,
+        prompt_template="你好",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+
+    def fake_post(*_, **__):
+        response = {
+            "choices": [{"message": {"content": "好"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+        }
+        return DummyResponse(response, elapsed_ms=12)
+
+    _patch_llm_post(monkeypatch, fake_post)
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+    # 重新执行会替换上一次的轮次结果，而不是违反序号唯一约束
+    experiment.status = PromptTestExperimentStatus.PENDING
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    rounds = db_session.scalars(
+        select(PromptTestRound)
+        .where(PromptTestRound.experiment_id == experiment.id)
+        .order_by(PromptTestRound.run_index)
+    ).all()
+    assert [item.run_index for item in rounds] == [1, 2]
+    assert all(item.status == PromptTestRoundStatus.SUCCESS for item in rounds)
+    assert (rounds[0].total_tokens, rounds[0].latency_ms) == (5, 12)
+    assert "total_tokens" not in rounds[0].payload
+    assert rounds[0].payload["output_text"] == "好"
+    # 请求消息以摘要引用 message_blobs，两轮共享同一批消息块
+    assert "messages" not in rounds[0].payload
+    assert rounds[0].message_refs and rounds[0].message_refs == rounds[1].message_refs
+
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestExperiment, experiment.id)
+    assert refreshed.legacy_outputs is None
+    assert refreshed.outputs[1]["run_index"] == 2
+    assert refreshed.outputs[1]["total_tokens"] == 5
+    assert refreshed.outputs[1]["cache_hit"] is False
+    assert refreshed.outputs[1]["messages"][-1]["role"] == "user"
+
+
 def test_execute_prompt_test_experiment_continues_after_run_failure(
     db_session, monkeypatch
 ):
@@ -308,6 +376,8 @@ def test_execute_prompt_test_experiment_continues_after_run_failure(
         context,
         run_index,
         request_timeout,
+        cancel_token=None,
+        message_plan=None,
     ):
         if run_index == 1:
             raise prompt_test_engine.PromptTestExecutionError(
@@ -366,7 +436,7 @@ def test_prompt_test_task_queue_executes_task_and_persists_results(
             }
         return DummyResponse(response, elapsed_ms=18)
 
-    monkeypatch.setattr("app.services.prompt_test_engine.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     response = client.post(
         "/api/v1/prompt-test/tasks",
@@ -652,3 +722,205 @@ def test_execute_existing_experiment_handles_engine_error(
     assert body["status"] == PromptTestExperimentStatus.FAILED.value
     assert "二次执行失败" in body["error"]
     assert body["finished_at"] is not None
+
+
+def test_execute_prompt_test_experiment_records_retry_attempts(
+    db_session, monkeypatch
+):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    provider = model.provider
+    provider.retry_policy = {"max_attempts": 2, "base_delay": 0.01}
+
+    task = PromptTestTask(name="重试统计", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="重试单元",
+        model_name=model.name,
+        llm_provider_id=provider.id,
+        rounds=2,
+        prompt_template="第 {run_index} 次",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+
+    # 轮次并发执行，按消息内容区分每轮的响应序列
+    statuses = {"第 1 次": [503, 200], "第 2 次": [503, 503]}
+
+    def fake_post(*_, **kwargs):
+        response = DummyResponse(
+            {"choices": [{"message": {"content": "ok"}}], "usage": {}}, elapsed_ms=5
+        )
+        content = kwargs["json"]["messages"][-1]["content"]
+        response.status_code = statuses[content].pop(0)
+        return response
+
+    _patch_llm_post(monkeypatch, fake_post)
+
+    result = execute_prompt_test_experiment(db_session, experiment)
+
+    assert result.status == PromptTestExperimentStatus.COMPLETED
+    assert [record.get("attempts") for record in result.outputs] == [2, 2]
+    assert result.outputs[1]["status"] == "failed"
+    assert result.outputs[1]["status_code"] == 503
+
+
+def test_execute_prompt_test_experiment_reuses_cached_responses(
+    db_session, monkeypatch
+):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    provider = model.provider
+
+    task = PromptTestTask(name="缓存回归", prompt_version_id=prompt_version.id)
+    units = [
+        PromptTestUnit(
+            task=task,
+            prompt_version_id=prompt_version.id,
+            name=f"缓存单元 {index}",
+            model_name=model.name,
+            llm_provider_id=provider.id,
+            rounds=1,
+            temperature=0.0,
+            prompt_template="固定问题",
+            extra={"response_cache": True},
+        )
+        for index in range(2)
+    ]
+    experiments = [
+        PromptTestExperiment(unit=unit, sequence=1) for unit in units
+    ]
+    db_session.add_all([task, *units, *experiments])
+    db_session.commit()
+
+    calls = {"count": 0}
+
+    def fake_post(*_, **kwargs):
+        calls["count"] += 1
+        return DummyResponse(
+            {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 3}},
+            elapsed_ms=5,
+        )
+
+    _patch_llm_post(monkeypatch, fake_post)
+    before_count = db_session.scalar(select(func.count()).select_from(LLMUsageLog)) or 0
+
+    first = execute_prompt_test_experiment(db_session, experiments[0])
+    second = execute_prompt_test_experiment(db_session, experiments[1])
+
+    assert calls["count"] == 1
+    assert first.outputs[0]["cache_hit"] is False
+    assert second.outputs[0]["cache_hit"] is True
+    assert second.outputs[0]["total_tokens"] == 3
+    assert second.metrics["cache_hits"] == 1
+    after_count = db_session.scalar(select(func.count()).select_from(LLMUsageLog)) or 0
+    assert after_count - before_count == 1
+
+
+def test_usage_logs_are_written_with_rounds_before_a_crash(db_session, monkeypatch):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    model.concurrency_limit = 1
+    db_session.commit()
+
+    task = PromptTestTask(name="中途出错", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="中途出错单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=3,
+        prompt_template="你好",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+    before_count = db_session.scalar(select(func.count()).select_from(LLMUsageLog))
+
+    calls = {"count": 0}
+
+    def fake_post(*_, **kwargs):
+        calls["count"] += 1
+        if calls["count"] > 1:
+            raise RuntimeError("worker crashed")
+        return DummyResponse(
+            {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 4}},
+            elapsed_ms=5,
+        )
+
+    _patch_llm_post(monkeypatch, fake_post)
+
+    with pytest.raises(RuntimeError):
+        execute_prompt_test_experiment(db_session, experiment)
+
+    # 已完成轮次的用量在实验中途出错前已随轮次写入会话
+    after_count = db_session.scalar(select(func.count()).select_from(LLMUsageLog))
+    assert after_count - before_count == 1
+    assert len(experiment.rounds) == 1
+
+
+def test_execute_prompt_test_experiment_runs_rounds_concurrently(
+    db_session, monkeypatch
+):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    model.concurrency_limit = 3
+    db_session.commit()
+
+    task = PromptTestTask(name="并发轮次", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="并发单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=2,
+        prompt_template="请翻译：{text}",
+        variables={"cases": [{"text": f"句子{index}"} for index in range(4)]},
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+    before_count = db_session.scalar(select(func.count()).select_from(LLMUsageLog))
+
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def fake_post(*_, **kwargs):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        content = kwargs["json"]["messages"][-1]["content"]
+        # 序号越小的轮次越晚返回，验证输出仍按轮次排序
+        time.sleep(0.02 * (9 - int(content[-1])) / 4)
+        with lock:
+            state["active"] -= 1
+        return DummyResponse(
+            {
+                "choices": [{"message": {"content": content}}],
+                "usage": {"prompt_tokens": 2, "completion_tokens": 3},
+            },
+            elapsed_ms=5,
+        )
+
+    _patch_llm_post(monkeypatch, fake_post)
+    progress: list[int] = []
+
+    result = execute_prompt_test_experiment(
+        db_session, experiment, progress_callback=progress.append
+    )
+
+    assert result.status == PromptTestExperimentStatus.COMPLETED
+    assert 1 < state["peak"] <= 3
+    assert [record["run_index"] for record in result.outputs] == list(range(1, 9))
+    assert [record["output_text"] for record in result.outputs[:4]] == [
+        f"请翻译：句子{index}" for index in range(4)
+    ]
+    assert progress == [1] * 8
+    assert result.metrics["success_runs"] == 8
+    db_session.flush()
+    after_count = db_session.scalar(select(func.count()).select_from(LLMUsageLog))
+    assert after_count - before_count == 8
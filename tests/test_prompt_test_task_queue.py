@@ -1,3 +1,5 @@
+import threading
+import time
 from datetime import datetime, timezone
 
 import pytest
@@ -46,11 +48,9 @@ def test_prompt_test_task_without_units_marks_completed(db_session):
     db_session.expire_all()
     refreshed = db_session.get(PromptTestTask, task.id)
     assert refreshed.status == PromptTestTaskStatus.COMPLETED
-    assert refreshed.config and "last_error" not in refreshed.config
-    progress = refreshed.config["progress"]
-    assert progress["total"] == 1
-    assert progress["current"] == 1
-    assert progress["percentage"] == 100
+    assert "last_error" not in (refreshed.config or {})
+    assert (refreshed.progress.total, refreshed.progress.current) == (1, 1)
+    assert refreshed.progress.percentage == 100
 
 
 def test_prompt_test_task_execution_failure_sets_last_error(db_session, monkeypatch):
@@ -69,7 +69,13 @@ def test_prompt_test_task_execution_failure_sets_last_error(db_session, monkeypa
     db_session.add_all([task, unit])
     db_session.commit()
 
-    def fail_execute(session, experiment, progress_callback=None):
+    def fail_execute(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
         raise PromptTestExecutionError("执行失败")
 
     monkeypatch.setattr(
@@ -84,10 +90,8 @@ def test_prompt_test_task_execution_failure_sets_last_error(db_session, monkeypa
     refreshed = db_session.get(PromptTestTask, task.id)
     assert refreshed.status == PromptTestTaskStatus.FAILED
     assert refreshed.config and refreshed.config.get("last_error") == "执行失败"
-    assert refreshed.config["progress"]["percentage"] == 100
-    assert (
-        refreshed.config["progress"]["current"] == refreshed.config["progress"]["total"]
-    )
+    assert refreshed.progress.percentage == 100
+    assert refreshed.progress.current == refreshed.progress.total
 
 
 def test_prompt_test_task_execution_succeeds(db_session, monkeypatch):
@@ -106,7 +110,13 @@ def test_prompt_test_task_execution_succeeds(db_session, monkeypatch):
     db_session.add_all([task, unit])
     db_session.commit()
 
-    def succeed_execute(session, experiment, progress_callback=None):
+    def succeed_execute(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
         if progress_callback:
             progress_callback(1)
         experiment.status = PromptTestExperimentStatus.COMPLETED
@@ -124,11 +134,9 @@ def test_prompt_test_task_execution_succeeds(db_session, monkeypatch):
     db_session.expire_all()
     refreshed = db_session.get(PromptTestTask, task.id)
     assert refreshed.status == PromptTestTaskStatus.COMPLETED
-    assert refreshed.config and "last_error" not in refreshed.config
-    progress = refreshed.config["progress"]
-    assert progress["total"] == 1
-    assert progress["current"] == 1
-    assert progress["percentage"] == 100
+    assert "last_error" not in (refreshed.config or {})
+    assert (refreshed.progress.total, refreshed.progress.current) == (1, 1)
+    assert refreshed.progress.percentage == 100
 
     experiments = db_session.scalars(
         select(PromptTestExperiment).where(PromptTestExperiment.unit_id == unit.id)
@@ -159,7 +167,13 @@ def test_prompt_test_task_progress_tracks_total_runs(
 
     expected_total = unit.rounds * len(samples)
 
-    def execute_with_progress(session, experiment, progress_callback=None):
+    def execute_with_progress(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
         if progress_callback:
             for _ in range(expected_total):
                 progress_callback(1)
@@ -178,7 +192,206 @@ def test_prompt_test_task_progress_tracks_total_runs(
     db_session.expire_all()
     refreshed = db_session.get(PromptTestTask, task.id)
     assert refreshed.status == PromptTestTaskStatus.COMPLETED
-    progress = refreshed.config["progress"]
-    assert progress["total"] == expected_total
-    assert progress["current"] == expected_total
-    assert progress["percentage"] == 100
+    assert refreshed.progress.total == expected_total
+    assert refreshed.progress.current == expected_total
+    assert refreshed.progress.percentage == 100
+
+
+def test_prompt_test_task_runs_units_in_parallel_sessions(db_session, monkeypatch):
+    task = PromptTestTask(
+        name="多模型对比",
+        status=PromptTestTaskStatus.READY,
+        config={"unit_concurrency": 2},
+    )
+    units = [
+        PromptTestUnit(
+            task=task,
+            name=f"模型{index}",
+            model_name=f"model-{index}",
+            rounds=2,
+            temperature=0.5,
+        )
+        for index in range(3)
+    ]
+    db_session.add_all([task, *units])
+    db_session.commit()
+
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+    # 保留会话引用，避免已关闭会话被回收后 id 被复用
+    sessions: list[object] = []
+
+    def parallel_execute(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            sessions.append(session)
+        time.sleep(0.05)
+        for _ in range(2):
+            progress_callback(1)
+        with lock:
+            state["active"] -= 1
+        experiment.status = PromptTestExperimentStatus.COMPLETED
+        experiment.finished_at = datetime.now(timezone.utc)
+        session.flush()
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        parallel_execute,
+    )
+
+    enqueue_prompt_test_task(task.id)
+    assert task_queue.wait_for_idle(timeout=5.0)
+
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert refreshed.status == PromptTestTaskStatus.COMPLETED
+    assert state["peak"] == 2
+    assert len({id(session) for session in sessions}) == 3
+    assert refreshed.progress.current == 6
+    experiments = db_session.scalars(select(PromptTestExperiment)).all()
+    assert sorted(item.unit_id for item in experiments) == sorted(
+        unit.id for unit in units
+    )
+
+
+def test_prompt_test_task_unit_failure_stops_scheduling_new_units(
+    db_session, monkeypatch
+):
+    task = PromptTestTask(
+        name="失败后停止",
+        status=PromptTestTaskStatus.READY,
+        config={"unit_concurrency": 1},
+    )
+    units = [
+        PromptTestUnit(task=task, name=f"单元{index}", model_name="m", rounds=1)
+        for index in range(3)
+    ]
+    db_session.add_all([task, *units])
+    db_session.commit()
+    calls: list[int] = []
+
+    def fail_first(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
+        calls.append(experiment.unit_id)
+        raise PromptTestExecutionError("首个单元失败")
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        fail_first,
+    )
+
+    enqueue_prompt_test_task(task.id)
+    assert task_queue.wait_for_idle(timeout=5.0)
+
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert refreshed.status == PromptTestTaskStatus.FAILED
+    assert refreshed.config["last_error"] == "首个单元失败"
+    assert len(calls) == 1
+    experiments = db_session.scalars(select(PromptTestExperiment)).all()
+    assert [item.status for item in experiments] == [PromptTestExperimentStatus.FAILED]
+
+
+@pytest.fixture()
+def celery_eager(monkeypatch):
+    from app.core.celery_app import celery_app
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "celery")
+    monkeypatch.setitem(celery_app.conf, "task_always_eager", True)
+    return celery_app
+
+
+def test_celery_backend_dispatches_units_and_aggregates_results(
+    db_session, monkeypatch, celery_eager
+):
+    task = PromptTestTask(name="分布式任务", status=PromptTestTaskStatus.READY)
+    units = [
+        PromptTestUnit(
+            task=task,
+            name=f"节点单元{index}",
+            model_name=f"model-{index}",
+            rounds=2,
+            temperature=0.5,
+        )
+        for index in range(3)
+    ]
+    db_session.add_all([task, *units])
+    db_session.commit()
+    executed: list[int] = []
+
+    def distributed_execute(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
+        executed.append(experiment.unit_id)
+        progress_callback(2)
+        experiment.status = PromptTestExperimentStatus.COMPLETED
+        experiment.finished_at = datetime.now(timezone.utc)
+        session.flush()
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        distributed_execute,
+    )
+
+    enqueue_prompt_test_task(task.id)
+
+    assert task_queue.stats()["queue_depth"] == 0
+    assert sorted(executed) == sorted(unit.id for unit in units)
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert refreshed.status == PromptTestTaskStatus.COMPLETED
+    assert refreshed.progress.current == 6
+    assert refreshed.progress.percentage == 100
+
+
+def test_celery_backend_skips_units_after_failure(
+    db_session, monkeypatch, celery_eager
+):
+    task = PromptTestTask(name="分布式失败任务", status=PromptTestTaskStatus.READY)
+    units = [
+        PromptTestUnit(task=task, name=f"单元{index}", model_name="m", rounds=1)
+        for index in range(2)
+    ]
+    db_session.add_all([task, *units])
+    db_session.commit()
+    calls: list[int] = []
+
+    def failing_execute(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
+        calls.append(experiment.unit_id)
+        raise PromptTestExecutionError("节点调用失败")
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        failing_execute,
+    )
+
+    enqueue_prompt_test_task(task.id)
+
+    assert len(calls) == 1
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert refreshed.status == PromptTestTaskStatus.FAILED
+    assert refreshed.config["last_error"] == "节点调用失败"
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from app.core import rate_limiter as rate_limiter_module
+from app.core.rate_limiter import (
+    DatabaseRateLimitBackend,
+    LLMRateLimiter,
+    MemoryRateLimitBackend,
+    TokenBucketRule,
+    estimate_request_tokens,
+    usage_total_tokens,
+)
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.rate_limit import LLMRateLimitBucket
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _make_model(**overrides) -> LLMModel:
+    data = {"provider_id": 7, "name": "limited-model", "rpm_limit": None}
+    data.update(overrides)
+    return LLMModel(**data)
+
+
+def test_memory_backend_paces_requests_exactly(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock)
+    backend = MemoryRateLimitBackend()
+    rule = TokenBucketRule(capacity=60)
+
+    waits = [backend.reserve("k", 1, rule) for _ in range(62)]
+    assert waits[:60] == [0.0] * 60
+    assert waits[60] == pytest.approx(1.0)
+    assert waits[61] == pytest.approx(2.0)
+
+    clock.now += 2.0
+    assert backend.reserve("k", 1, rule) == pytest.approx(1.0)
+
+
+def test_limiter_reserves_rpm_and_tpm_and_settles(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock)
+    backend = MemoryRateLimitBackend()
+    limiter = LLMRateLimiter(backend)
+    model = _make_model(rpm_limit=600, tpm_limit=120)
+    payload = {"messages": [{"role": "user", "content": "x" * 200}]}
+
+    reservation, wait = limiter.reserve(model, payload)
+    assert reservation is not None
+    assert reservation.estimated_tokens == 50
+    assert wait == 0.0
+
+    limiter.settle(reservation, 110)
+    _, wait = limiter.reserve(model, payload)
+    # 已消耗 110 + 50 = 160 个 Token，超出 120 的部分按每秒 2 个回填
+    assert wait == pytest.approx(20.0)
+
+    assert limiter.reserve(_make_model(), payload) == (None, 0.0)
+    assert limiter.reserve(None, payload) == (None, 0.0)
+
+
+def test_limiter_acquire_sleeps_for_reserved_delay(monkeypatch):
+    sleeps: list[float] = []
+    monkeypatch.setattr(rate_limiter_module.time, "sleep", sleeps.append)
+    limiter = LLMRateLimiter(MemoryRateLimitBackend())
+    model = _make_model(rpm_limit=1)
+
+    limiter.acquire(model, {"messages": []})
+    limiter.acquire(model, {"messages": []})
+    assert len(sleeps) == 1
+    assert sleeps[0] == pytest.approx(60.0, rel=1e-3)
+
+
+def test_limiter_acquire_async_uses_event_loop_sleep(monkeypatch):
+    delays: list[float] = []
+
+    async def fake_sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(rate_limiter_module.asyncio, "sleep", fake_sleep)
+    limiter = LLMRateLimiter(MemoryRateLimitBackend())
+    model = _make_model(rpm_limit=2)
+
+    async def run() -> None:
+        for _ in range(3):
+            await limiter.acquire_async(model, {"messages": []})
+
+    asyncio.run(run())
+    assert len(delays) == 1
+    assert delays[0] == pytest.approx(30.0, rel=1e-3)
+
+
+def test_limiter_asettle_runs_blocking_backend_off_event_loop():
+    class _BlockingBackend(MemoryRateLimitBackend):
+        blocking = True
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.threads: list[int] = []
+
+        def reserve(self, key: str, cost: float, rule: TokenBucketRule) -> float:
+            self.threads.append(threading.get_ident())
+            return super().reserve(key, cost, rule)
+
+    backend = _BlockingBackend()
+    limiter = LLMRateLimiter(backend)
+    model = _make_model(tpm_limit=1000)
+
+    async def run() -> int:
+        reservation = await limiter.acquire_async(model, {"messages": []})
+        await limiter.asettle(reservation, 200)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(backend.threads) == 2
+    assert loop_thread not in backend.threads
+
+
+def test_database_backend_shares_bucket_state(db_session):
+    backend = DatabaseRateLimitBackend()
+    rule = TokenBucketRule(capacity=2)
+
+    assert backend.reserve("db:model:rpm", 1, rule) == 0.0
+    assert backend.reserve("db:model:rpm", 1, rule) == 0.0
+    assert backend.reserve("db:model:rpm", 1, rule) == pytest.approx(30.0, rel=1e-2)
+
+    bucket = db_session.get(LLMRateLimitBucket, "db:model:rpm")
+    assert bucket is not None
+    assert bucket.tokens < 0
+
+
+def test_estimate_and_usage_helpers():
+    payload = {
+        "messages": [
+            {"role": "system", "content": "abcd"},
+            {"role": "user", "content": [{"type": "text", "text": "efghijkl"}]},
+        ],
+        "max_tokens": 16,
+    }
+    assert estimate_request_tokens(payload) == 3 + 16
+    assert estimate_request_tokens({}) == 1
+    assert usage_total_tokens({"total_tokens": 9}) == 9
+    assert usage_total_tokens({"prompt_tokens": 2, "completion_tokens": 3}) == 5
+    assert usage_total_tokens(None) is None
+
+
+def test_execute_test_run_waits_on_model_rpm_limit(db_session, monkeypatch):
+    from app.core.llm_http import llm_client_registry
+    from app.models.prompt import Prompt, PromptClass, PromptVersion
+    from app.models.test_run import TestRun, TestRunStatus
+    from app.services import test_run as test_run_service
+
+    class _Response:
+        status_code = 200
+        elapsed = None
+        text = ""
+
+        def json(self):
+            return {"choices": [{"message": {"content": "ok"}}], "usage": {}}
+
+    class _Client:
+        def post(self, *args, **kwargs):
+            return _Response()
+
+    sleeps: list[float] = []
+    monkeypatch.setattr(rate_limiter_module.time, "sleep", sleeps.append)
+    monkeypatch.setattr(
+        test_run_service, "llm_rate_limiter", LLMRateLimiter(MemoryRateLimitBackend())
+    )
+    monkeypatch.setattr(
+        llm_client_registry, "get_sync_client", lambda provider: _Client()
+    )
+
+    provider = LLMProvider(
+        provider_name="Limited",
+        api_key="limited",
+        is_custom=True,
+        base_url="https://limited.example/api",
+    )
+    model = LLMModel(provider=provider, name="limited", rpm_limit=2)
+    prompt_class = PromptClass(name="限流")
+    prompt = Prompt(name="限流提示词", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="hi")
+    db_session.add_all([provider, model, prompt_class, prompt, version])
+    db_session.commit()
+
+    test_run = TestRun(
+        prompt_version_id=version.id,
+        model_name=model.name,
+        repetitions=3,
+        schema={"llm_provider_id": provider.id, "llm_model_id": model.id},
+    )
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    assert executed.status == TestRunStatus.COMPLETED
+    assert len(sleeps) == 1
+    assert sleeps[0] == pytest.approx(30.0, rel=1e-2)
+
+
+def test_execute_test_run_refunds_reservation_on_transport_error(
+    db_session, monkeypatch
+):
+    import httpx
+
+    from app.core.llm_http import llm_client_registry
+    from app.models.prompt import Prompt, PromptClass, PromptVersion
+    from app.models.test_run import TestRun, TestRunStatus
+    from app.services import test_run as test_run_service
+
+    class _Client:
+        def post(self, *args, **kwargs):
+            raise httpx.ConnectError("connection refused")
+
+    settled: list[tuple[object, int | None]] = []
+
+    class _SpyLimiter(LLMRateLimiter):
+        def settle(self, reservation, actual_tokens) -> None:
+            settled.append((reservation, actual_tokens))
+            super().settle(reservation, actual_tokens)
+
+    monkeypatch.setattr(
+        test_run_service, "llm_rate_limiter", _SpyLimiter(MemoryRateLimitBackend())
+    )
+    monkeypatch.setattr(
+        llm_client_registry, "get_sync_client", lambda provider: _Client()
+    )
+
+    provider = LLMProvider(
+        provider_name="Refund",
+        api_key="refund",
+        is_custom=True,
+        base_url="https://refund.example/api",
+        retry_policy={"max_attempts": 1},
+    )
+    model = LLMModel(provider=provider, name="refund", tpm_limit=10_000)
+    prompt_class = PromptClass(name="退款")
+    prompt = Prompt(name="退款提示词", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="hi")
+    db_session.add_all([provider, model, prompt_class, prompt, version])
+    db_session.commit()
+
+    test_run = TestRun(
+        prompt_version_id=version.id,
+        model_name=model.name,
+        repetitions=1,
+        schema={"llm_provider_id": provider.id, "llm_model_id": model.id},
+    )
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    assert executed.status == TestRunStatus.FAILED
+    # 连接失败的尝试没有消耗 Token，预支的额度全部退回
+    assert len(settled) == 1
+    assert settled[0][0] is not None
+    assert settled[0][1] == 0
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from sqlalchemy import func, select
+
+from app.core import response_cache as cache_module
+from app.core.llm_http import llm_client_registry
+from app.core.response_cache import (
+    LLMResponseCache,
+    build_cache_key,
+    is_deterministic_request,
+    resolve_cache_enabled,
+)
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.response_cache import LLMResponseCacheEntry
+from app.models.test_run import TestRun, TestRunStatus
+from app.models.usage import LLMUsageLog
+from app.services import test_run as test_run_service
+
+
+def _provider(provider_id: int = 1) -> LLMProvider:
+    return LLMProvider(id=provider_id, provider_name="Cache", base_url="https://c.llm")
+
+
+def test_cache_key_is_canonical_and_detects_determinism():
+    payload = {
+        "model": "m",
+        "messages": [{"role": "user", "content": "你好"}],
+        "temperature": 0,
+        "max_tokens": 8,
+    }
+    reordered = {key: payload[key] for key in reversed(list(payload))}
+    assert build_cache_key(_provider(), payload) == build_cache_key(
+        _provider(), {**reordered, "stream": False}
+    )
+    assert build_cache_key(_provider(), payload) != build_cache_key(
+        _provider(2), payload
+    )
+    assert build_cache_key(_provider(), payload) != build_cache_key(
+        _provider(), {**payload, "max_tokens": 9}
+    )
+
+    assert is_deterministic_request({"temperature": 0.0})
+    assert is_deterministic_request({"temperature": 0.7, "seed": 42})
+    assert not is_deterministic_request({"temperature": 0.7})
+
+    assert resolve_cache_enabled(True) is True
+    assert resolve_cache_enabled(None) is cache_module.settings.LLM_RESPONSE_CACHE_ENABLED
+
+
+def test_memory_tier_evicts_least_recently_used_and_expired(monkeypatch):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(cache_module.time, "time", lambda: clock["now"])
+    cache = LLMResponseCache(max_entries=2, ttl_seconds=60, persistent=False)
+
+    cache.set("a", {"value": 1})
+    cache.set("b", {"value": 2})
+    assert cache.get("a") == {"value": 1}
+    cache.set("c", {"value": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"value": 1}
+
+    clock["now"] += 61
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_persistent_tier_survives_memory_loss_and_trims_to_limit(
+    db_session, monkeypatch
+):
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(cache_module.time, "time", lambda: clock["now"])
+    cache = LLMResponseCache(
+        max_entries=10, ttl_seconds=100, persistent=True, max_persistent_entries=2
+    )
+
+    cache.set("first", {"value": 1}, provider_id=1, model_name="m")
+    clock["now"] += 1
+    cache.set("second", {"value": 2}, provider_id=1, model_name="m")
+    cache.clear_memory()
+
+    clock["now"] += 1
+    assert cache.get("first") == {"value": 1}
+    entry = db_session.get(LLMResponseCacheEntry, "first")
+    db_session.refresh(entry)
+    assert entry.hit_count == 1
+
+    # 新写入超过容量时淘汰最久未访问的 second
+    clock["now"] += 1
+    cache.set("third", {"value": 3})
+    keys = set(db_session.scalars(select(LLMResponseCacheEntry.cache_key)).all())
+    assert keys == {"first", "third"}
+
+    cache.clear_memory()
+    clock["now"] += 200
+    assert cache.get("first") is None
+    assert asyncio.run(cache.aget("third")) is None
+
+
+def _run_factory(db_session):
+    prompt_class = PromptClass(name="缓存回归")
+    prompt = Prompt(name="缓存提示词", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="回答问题")
+    provider = LLMProvider(
+        provider_name="CacheProvider",
+        api_key="key",
+        is_custom=True,
+        base_url="https://cache.llm/api",
+    )
+    model = LLMModel(provider=provider, name="cache-model")
+    db_session.add_all([prompt_class, prompt, version, provider, model])
+    db_session.commit()
+
+    def make_run(*, repetitions: int, response_cache: bool | None) -> TestRun:
+        schema = {"llm_provider_id": provider.id, "llm_model_id": model.id}
+        if response_cache is not None:
+            schema["response_cache"] = response_cache
+        run = TestRun(
+            prompt_version=version,
+            model_name=model.name,
+            temperature=0.0,
+            top_p=1.0,
+            repetitions=repetitions,
+            schema=schema,
+        )
+        db_session.add(run)
+        db_session.commit()
+        return run
+
+    return make_run
+
+
+def test_repeated_deterministic_run_is_served_from_cache(db_session, monkeypatch):
+    calls = {"count": 0}
+
+    def fake_post(*_, **kwargs):
+        calls["count"] += 1
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "缓存的回答"}}],
+                "usage": {"total_tokens": 7},
+            },
+        )
+
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+    make_run = _run_factory(db_session)
+
+    first = test_run_service.execute_test_run(
+        db_session, make_run(repetitions=2, response_cache=True)
+    )
+    assert first.status == TestRunStatus.COMPLETED
+    assert calls["count"] == 2
+    assert [item.cache_hit for item in first.results] == [False, False]
+
+    second = test_run_service.execute_test_run(
+        db_session, make_run(repetitions=2, response_cache=True)
+    )
+    assert second.status == TestRunStatus.COMPLETED
+    assert calls["count"] == 2
+    assert all(item.cache_hit for item in second.results)
+    assert {item.output for item in second.results} == {"缓存的回答"}
+    assert all(item.tokens_used == 7 for item in second.results)
+
+    usage_logs = db_session.scalar(select(func.count()).select_from(LLMUsageLog))
+    assert usage_logs == 2
+
+    # 未开启缓存的任务不会读取缓存
+    disabled = test_run_service.execute_test_run(
+        db_session, make_run(repetitions=1, response_cache=None)
+    )
+    assert calls["count"] == 3
+    assert disabled.results[0].cache_hit is False
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+import app.db.session as db_session_module
+from app.core.llm_http import llm_client_registry
+from app.core.task_queue import task_queue
+from app.models import Base
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.result import Result
+from app.models.test_run import TestRun, TestRunStatus
+from app.models.usage import LLMUsageLog
+from app.services import result_writer as writer_module
+from app.services.result_writer import BufferedResultWriter
+
+
+def _create_test_run(db_session) -> TestRun:
+    prompt_class = PromptClass(name="批量写入")
+    prompt = Prompt(name="写入测试", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="内容")
+    test_run = TestRun(
+        prompt_version=version,
+        model_name="writer-model",
+        temperature=0.1,
+        top_p=1.0,
+        repetitions=5,
+    )
+    db_session.add_all([prompt_class, prompt, version, test_run])
+    db_session.commit()
+    return test_run
+
+
+def _artifacts(test_run: TestRun, run_index: int) -> tuple[Result, LLMUsageLog]:
+    result = Result(test_run_id=test_run.id, run_index=run_index, output=f"第 {run_index} 次")
+    usage_log = LLMUsageLog(
+        provider_id=None, model_name="writer-model", source="test_run"
+    )
+    return result, usage_log
+
+
+def _count(db_session, model) -> int:
+    return db_session.scalar(select(func.count()).select_from(model)) or 0
+
+
+def test_writer_flushes_in_batches(db_session):
+    test_run = _create_test_run(db_session)
+    writer = BufferedResultWriter(batch_size=2, flush_interval=60)
+
+    writer.add(*_artifacts(test_run, 1))
+    assert writer.pending == 1
+    assert _count(db_session, Result) == 0
+
+    writer.add(*_artifacts(test_run, 2))
+    assert writer.pending == 0
+    assert _count(db_session, Result) == 2
+    assert _count(db_session, LLMUsageLog) == 2
+
+    writer.add(*_artifacts(test_run, 3))
+    assert writer.flush() == 1
+    assert writer.flush() == 0
+    assert writer.flushed_count == 3
+
+
+def test_writer_flushes_after_interval(db_session, monkeypatch):
+    test_run = _create_test_run(db_session)
+    clock = {"now": 0.0}
+    monkeypatch.setattr(writer_module.time, "monotonic", lambda: clock["now"])
+    writer = BufferedResultWriter(batch_size=100, flush_interval=1.0)
+
+    writer.add(*_artifacts(test_run, 1))
+    assert writer.pending == 1
+
+    clock["now"] = 1.5
+    writer.add(*_artifacts(test_run, 2))
+    assert writer.pending == 0
+    assert _count(db_session, Result) == 2
+
+
+def test_writer_keeps_partial_progress_when_run_aborts(db_session):
+    test_run = _create_test_run(db_session)
+
+    with pytest.raises(RuntimeError):
+        with BufferedResultWriter(batch_size=10, flush_interval=60) as writer:
+            writer.add(*_artifacts(test_run, 1))
+            writer.add(*_artifacts(test_run, 2))
+            raise RuntimeError("worker crashed")
+
+    db_session.expire(test_run, ["results"])
+    assert sorted(item.run_index for item in test_run.results) == [1, 2]
+
+
+def test_writer_requeues_batch_when_commit_fails(db_session):
+    class FailingSession:
+        def add_all(self, items) -> None:
+            return None
+
+        def commit(self) -> None:
+            raise RuntimeError("database unavailable")
+
+        def rollback(self) -> None:
+            return None
+
+        def close(self) -> None:
+            return None
+
+    test_run = _create_test_run(db_session)
+    writer = BufferedResultWriter(
+        batch_size=10, flush_interval=60, session_factory=FailingSession
+    )
+    writer.add(*_artifacts(test_run, 1))
+
+    with pytest.raises(RuntimeError):
+        writer.flush()
+    assert writer.pending == 1
+
+
+def test_test_run_results_are_written_while_run_executes(tmp_path, monkeypatch):
+    # 每个会话使用独立连接：执行线程若一直持有测试任务的写锁，结果写入会超时失败
+    engine = create_engine(
+        f"sqlite+pysqlite:///{tmp_path / 'runs.db'}",
+        connect_args={"check_same_thread": False, "timeout": 0.5},
+    )
+    Base.metadata.create_all(bind=engine)
+    session_local = sessionmaker(
+        bind=engine, autoflush=False, autocommit=False, expire_on_commit=False
+    )
+    monkeypatch.setattr(db_session_module, "SessionLocal", session_local)
+
+    session = session_local()
+    try:
+        test_run = _create_test_run(session)
+        provider = LLMProvider(
+            provider_name="Writer",
+            api_key="secret",
+            is_custom=True,
+            base_url="https://writer.llm/api",
+        )
+        model = LLMModel(provider=provider, name="writer-model")
+        session.add_all([provider, model])
+        session.flush()
+        test_run.repetitions = 3
+        test_run.schema = {"llm_provider_id": provider.id, "llm_model_id": model.id}
+        session.commit()
+        run_id = test_run.id
+    finally:
+        session.close()
+
+    def fake_post(*_, **__):
+        return SimpleNamespace(
+            status_code=200,
+            elapsed=None,
+            text="",
+            json=lambda: {
+                "choices": [{"message": {"content": "完成"}}],
+                "usage": {"prompt_tokens": 2, "completion_tokens": 3},
+            },
+        )
+
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+    monkeypatch.setattr(writer_module.settings, "TEST_RUN_RESULT_BATCH_SIZE", 1)
+
+    task_queue.run(run_id)
+
+    check = session_local()
+    try:
+        finished = check.get(TestRun, run_id)
+        assert finished.status == TestRunStatus.COMPLETED, finished.last_error
+        assert _count(check, Result) == 3
+    finally:
+        check.close()
+        engine.dispose()
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from app.core import retry_policy as retry_module
+from app.core.retry_policy import (
+    RetryDeadlineExceeded,
+    RetryPolicy,
+    acall_with_retry,
+    call_with_retry,
+    parse_retry_after,
+)
+
+
+def _response(status_code: int, headers: dict[str, str] | None = None) -> httpx.Response:
+    return httpx.Response(status_code, headers=headers, json={})
+
+
+def test_parse_retry_after_supports_seconds_and_dates():
+    assert parse_retry_after({"Retry-After": "3"}) == 3.0
+    future = datetime.now(timezone.utc) + timedelta(seconds=30)
+    parsed = parse_retry_after({"retry-after": format_datetime(future, usegmt=True)})
+    assert parsed is not None and 25 <= parsed <= 30
+    assert parse_retry_after({"Retry-After": "soon"}) is None
+    assert parse_retry_after(None) is None
+
+
+def test_policy_from_mapping_overrides_defaults():
+    policy = RetryPolicy.from_mapping(
+        {"max_attempts": 5, "base_delay": 1, "deadline": 20, "retry_statuses": [429]}
+    )
+    assert policy.max_attempts == 5
+    assert policy.base_delay == 1.0
+    assert policy.deadline == 20.0
+    assert policy.should_retry_status(429)
+    assert not policy.should_retry_status(503)
+
+    default_policy = RetryPolicy.from_mapping(None)
+    assert default_policy.should_retry_status(503)
+    assert 0 <= default_policy.backoff_delay(10) <= default_policy.max_delay
+    assert default_policy.backoff_delay(1, retry_after=7) >= 7
+    assert RetryPolicy.from_mapping({"max_retry_after": 5}).max_retry_after == 5.0
+
+
+def test_call_with_retry_gives_up_when_retry_after_exceeds_limit():
+    responses = [_response(429, {"Retry-After": "3600"}), _response(200)]
+    sleeps: list[float] = []
+
+    outcome = call_with_retry(
+        lambda timeout: responses.pop(0),
+        policy=RetryPolicy(max_attempts=3, max_retry_after=120),
+        default_timeout=10,
+        sleep=sleeps.append,
+    )
+    # 服务端要求等待一小时，超过上限后直接返回限流响应，不挂起调用
+    assert outcome.response.status_code == 429
+    assert outcome.attempts == 1
+    assert sleeps == []
+
+
+def test_call_with_retry_honours_retry_after():
+    responses = [_response(429, {"Retry-After": "2"}), _response(503), _response(200)]
+    sleeps: list[float] = []
+    timeouts: list[float] = []
+
+    def send(timeout: float) -> httpx.Response:
+        timeouts.append(timeout)
+        return responses.pop(0)
+
+    outcome = call_with_retry(
+        send,
+        policy=RetryPolicy(max_attempts=3, base_delay=0.1, attempt_timeout=5),
+        default_timeout=30,
+        sleep=sleeps.append,
+    )
+    assert outcome.response.status_code == 200
+    assert outcome.attempts == 3
+    assert sleeps[0] >= 2
+    assert 0 <= sleeps[1] <= 0.2
+    assert timeouts == [5, 5, 5]
+
+
+def test_call_with_retry_stops_on_non_retryable_and_exhaustion():
+    outcome = call_with_retry(
+        lambda timeout: _response(400),
+        policy=RetryPolicy(max_attempts=3),
+        default_timeout=10,
+        sleep=lambda _: None,
+    )
+    assert outcome.attempts == 1
+
+    calls = {"count": 0}
+
+    def failing(timeout: float) -> httpx.Response:
+        calls["count"] += 1
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        call_with_retry(
+            failing,
+            policy=RetryPolicy(max_attempts=2, base_delay=0.01),
+            default_timeout=10,
+            sleep=lambda _: None,
+        )
+    assert calls["count"] == 2
+
+
+def test_call_with_retry_respects_deadline(monkeypatch):
+    clock = {"now": 0.0}
+    monkeypatch.setattr(retry_module.time, "monotonic", lambda: clock["now"])
+
+    def slow(timeout: float) -> httpx.Response:
+        clock["now"] += timeout
+        return _response(503)
+
+    outcome = call_with_retry(
+        slow,
+        policy=RetryPolicy(max_attempts=5, base_delay=0.01, deadline=3),
+        default_timeout=2,
+        sleep=lambda delay: clock.__setitem__("now", clock["now"] + delay),
+    )
+    # 第二次尝试只能使用剩余的 1 秒，随后截止时间耗尽
+    assert outcome.attempts == 2
+    assert outcome.response.status_code == 503
+
+    # 退避等待被系统调度拖长并越过截止时间时，不再发起新的尝试
+    clock["now"] = 0.0
+    with pytest.raises(RetryDeadlineExceeded) as exc_info:
+        call_with_retry(
+            lambda timeout: _response(503),
+            policy=RetryPolicy(max_attempts=5, base_delay=0.01, deadline=3),
+            default_timeout=1,
+            sleep=lambda delay: clock.__setitem__("now", clock["now"] + 10),
+        )
+    assert exc_info.value.attempts == 1
+
+
+def test_acall_with_retry_retries_transport_errors(monkeypatch):
+    async def fake_sleep(delay: float) -> None:
+        return None
+
+    monkeypatch.setattr(retry_module.asyncio, "sleep", fake_sleep)
+    attempts = {"count": 0}
+
+    async def send(timeout: float) -> httpx.Response:
+        attempts["count"] += 1
+        if attempts["count"] == 1:
+            raise httpx.ReadTimeout("slow")
+        return _response(200)
+
+    outcome = asyncio.run(
+        acall_with_retry(send, policy=RetryPolicy(max_attempts=3), default_timeout=5)
+    )
+    assert outcome.attempts == 2
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.config import settings
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.usage import LLMUsageLog
+from app.services import task_estimator
+
+
+@pytest.fixture(autouse=True)
+def _byte_tokenizer(monkeypatch):
+    # 固定使用字节估算，结果不受环境中是否安装 tiktoken 影响
+    monkeypatch.setattr(task_estimator, "_load_tokenizer", lambda: None)
+
+
+def _create_prompt_version(db_session) -> PromptVersion:
+    prompt_class = PromptClass(name="预估类")
+    prompt = Prompt(name="摘要助手", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="你是摘要助手。")
+    prompt.current_version = version
+    db_session.add_all([prompt_class, prompt, version])
+    db_session.commit()
+    return version
+
+
+def _create_model(db_session, **limits) -> LLMModel:
+    provider = LLMProvider(
+        provider_name="Internal",
+        api_key="fake-key",
+        is_custom=True,
+        base_url="https://llm.fake/api",
+    )
+    model = LLMModel(provider=provider, name="chat-mini", **limits)
+    db_session.add_all([provider, model])
+    db_session.commit()
+    return model
+
+
+def _add_history(db_session, model: LLMModel, samples: list[tuple[int, int]]) -> None:
+    base_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    db_session.add_all(
+        LLMUsageLog(
+            provider_id=model.provider_id,
+            model_id=model.id,
+            model_name=model.name,
+            source="prompt_test",
+            completion_tokens=completion_tokens,
+            latency_ms=latency_ms,
+            created_at=base_time + timedelta(minutes=index),
+        )
+        for index, (completion_tokens, latency_ms) in enumerate(samples)
+    )
+    db_session.commit()
+
+
+def test_count_prompt_tokens_uses_byte_heuristic():
+    messages = [
+        {"role": "system", "content": "你是助手"},
+        {"role": "user", "content": [{"type": "text", "text": "hello world!"}]},
+    ]
+    # 4 个汉字 12 字节、12 个 ASCII 字节，各按 3 字节 1 Token，另加每条消息的开销
+    assert task_estimator.count_prompt_tokens(messages) == 4 + 4 + 2 * 4
+    assert task_estimator.tokenizer_name() == "bytes"
+
+
+def test_estimate_duration_reports_bottleneck():
+    by_concurrency = task_estimator.estimate_duration(
+        100, latency_ms=2000, concurrency=10, tokens_per_run=100
+    )
+    assert by_concurrency == (20.0, task_estimator.BOTTLENECK_CONCURRENCY)
+
+    by_rpm = task_estimator.estimate_duration(
+        100, latency_ms=2000, concurrency=50, tokens_per_run=100, rpm_limit=20
+    )
+    assert by_rpm == (242.0, task_estimator.BOTTLENECK_RPM)
+
+    by_tpm = task_estimator.estimate_duration(
+        100,
+        latency_ms=2000,
+        concurrency=50,
+        tokens_per_run=1000,
+        rpm_limit=600,
+        tpm_limit=10000,
+    )
+    assert by_tpm == (542.0, task_estimator.BOTTLENECK_TPM)
+
+    # 实际只消耗 1000 个 Token，但 5 个在途调用各按 1100 预支，额外占用 5000
+    by_reservation = task_estimator.estimate_duration(
+        10,
+        latency_ms=1000,
+        concurrency=5,
+        tokens_per_run=100,
+        reserved_tokens_per_run=1100,
+        tpm_limit=2000,
+    )
+    assert by_reservation == (121.0, task_estimator.BOTTLENECK_TPM)
+
+    assert task_estimator.estimate_duration(
+        0, latency_ms=2000, concurrency=1, tokens_per_run=0
+    ) == (0.0, task_estimator.BOTTLENECK_CONCURRENCY)
+
+
+def test_load_usage_profile_averages_recent_history(db_session, monkeypatch):
+    model = _create_model(db_session)
+    empty = task_estimator.load_usage_profile(db_session, model.name)
+    assert empty.sample_count == 0
+    assert empty.completion_tokens == task_estimator.DEFAULT_COMPLETION_TOKENS
+
+    _add_history(db_session, model, [(999, 9000), (100, 1000), (300, 3000)])
+    monkeypatch.setattr(settings, "TASK_ESTIMATE_HISTORY_SIZE", 2)
+
+    profile = task_estimator.load_usage_profile(
+        db_session, model.name, provider_id=model.provider_id
+    )
+    assert profile == task_estimator.UsageProfile(
+        sample_count=2, completion_tokens=200.0, latency_ms=2000.0
+    )
+    capped = task_estimator.load_usage_profile(db_session, model.name, max_tokens=64)
+    assert capped.completion_tokens == 64
+
+
+def test_estimate_prompt_test_task_before_creation(client, db_session, monkeypatch):
+    version = _create_prompt_version(db_session)
+    model = _create_model(db_session, concurrency_limit=2, rpm_limit=3)
+    _add_history(db_session, model, [(40, 1500), (60, 2500)])
+    monkeypatch.setattr(
+        settings, "LLM_MODEL_PRICING", {model.name: {"input": 1.0, "output": 2.0}}
+    )
+
+    response = client.post(
+        "/api/v1/prompt-test/tasks/estimate",
+        json={
+            "name": "摘要实验",
+            "prompt_version_id": version.id,
+            "units": [
+                {
+                    "name": "摘要单元",
+                    "model_name": model.name,
+                    "llm_provider_id": model.provider_id,
+                    "rounds": 2,
+                    "prompt_template": "总结：{text}",
+                    "variables": {"cases": [{"text": "今天"}, {"text": "明天"}]},
+                }
+            ],
+        },
+    )
+    assert response.status_code == 200
+    payload = response.json()
+    item = payload["items"][0]
+    assert item["run_count"] == 4
+    assert item["history_samples"] == 2
+    assert item["avg_latency_ms"] == 2000.0
+    assert item["completion_tokens"] == 200
+    assert item["rpm_limit"] == 3
+    # 4 次调用受每分钟 3 次限制，第 4 次需等待 20 秒后发出
+    assert item["bottleneck"] == "rpm"
+    assert item["duration_seconds"] == pytest.approx(22.0)
+    assert payload["run_count"] == 4
+    assert payload["total_tokens"] == item["prompt_tokens"] + 200
+    assert payload["cost"] == pytest.approx(
+        (item["prompt_tokens"] * 1.0 + 200 * 2.0) / 1000
+    )
+    assert payload["tokenizer"] == "bytes"
+    assert db_session.query(LLMUsageLog).count() == 2
+
+
+def test_estimate_prompt_test_task_rejects_missing_variable(client, db_session):
+    model = _create_model(db_session)
+
+    response = client.post(
+        "/api/v1/prompt-test/tasks/estimate",
+        json={
+            "name": "缺少变量",
+            "units": [
+                {
+                    "name": "翻译单元",
+                    "model_name": model.name,
+                    "llm_provider_id": model.provider_id,
+                    "prompt_template": "翻译：{text}",
+                    "variables": {"other": "你好"},
+                }
+            ],
+        },
+    )
+    assert response.status_code == 400
+    assert "翻译单元" in response.json()["detail"]
+
+
+def test_estimate_saved_prompt_test_task(client, db_session):
+    version = _create_prompt_version(db_session)
+    model = _create_model(db_session)
+    create_resp = client.post(
+        "/api/v1/prompt-test/tasks",
+        json={
+            "name": "已保存任务",
+            "prompt_version_id": version.id,
+            "units": [
+                {"name": f"单元 {index}", "model_name": model.name, "rounds": 3}
+                for index in range(2)
+            ],
+        },
+    )
+    assert create_resp.status_code == 201
+
+    task_id = create_resp.json()["id"]
+    response = client.get(f"/api/v1/prompt-test/tasks/{task_id}/estimate")
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["run_count"] == 6
+    assert payload["cost"] is None
+    assert [item["history_samples"] for item in payload["items"]] == [0, 0]
+
+    missing = client.get("/api/v1/prompt-test/tasks/9999/estimate")
+    assert missing.status_code == 404
+
+
+def test_estimate_test_run_before_creation(client, db_session):
+    version = _create_prompt_version(db_session)
+    model = _create_model(db_session, concurrency_limit=2)
+    _add_history(db_session, model, [(80, 1000)])
+
+    response = client.post(
+        "/api/v1/test_prompt/estimate",
+        json={
+            "prompt_version_id": version.id,
+            "model_name": model.name,
+            "model_version": "2024-05",
+            "temperature": 0.2,
+            "repetitions": 3,
+        },
+    )
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["run_count"] == 3
+    assert payload["completion_tokens"] == 240
+    # 并发 2 时 3 次调用分两批执行
+    assert payload["duration_seconds"] == pytest.approx(2.0)
+    assert payload["items"][0]["concurrency"] == 2
+
+    missing = client.post(
+        "/api/v1/test_prompt/estimate",
+        json={"prompt_version_id": 9999, "model_name": model.name},
+    )
+    assert missing.status_code == 404
+
+
+def test_estimate_test_run_models_tpm_reservation(client, db_session):
+    version = _create_prompt_version(db_session)
+    model = _create_model(db_session, concurrency_limit=4, tpm_limit=10000)
+    _add_history(db_session, model, [(50, 1000)])
+
+    def estimate(max_tokens: int) -> dict:
+        response = client.post(
+            "/api/v1/test_prompt/estimate",
+            json={
+                "prompt_version_id": version.id,
+                "model_name": model.name,
+                "repetitions": 8,
+                "schema": {"max_tokens": max_tokens},
+            },
+        )
+        assert response.status_code == 200
+        return response.json()["items"][0]
+
+    # 实际用量远低于 TPM 限额，但限流器按 max_tokens 预支，4 个在途调用即占满额度
+    small = estimate(100)
+    large = estimate(4000)
+    assert small["completion_tokens"] == large["completion_tokens"] == 400
+    assert small["bottleneck"] == "concurrency"
+    assert large["bottleneck"] == "tpm"
+    assert large["duration_seconds"] > small["duration_seconds"] * 10
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import json
+import threading
+
+from app.api.v1.endpoints import prompt_test_tasks
+from app.core.config import settings
+from app.core.task_progress import TaskProgressStore, progress_store
+from app.models.prompt_test import (
+    PromptTestTask,
+    PromptTestTaskProgress,
+    PromptTestTaskStatus,
+)
+
+
+def _create_task(db_session, status: PromptTestTaskStatus) -> PromptTestTask:
+    task = PromptTestTask(name="进度任务", status=status, config={"foo": "bar"})
+    db_session.add(task)
+    db_session.commit()
+    return task
+
+
+def _read_events(response) -> list[tuple[str, dict]]:
+    events: list[tuple[str, dict]] = []
+    name = None
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            name = line[len("event: ") :]
+        elif line.startswith("data: ") and name:
+            events.append((name, json.loads(line[len("data: ") :])))
+            name = None
+    return events
+
+
+def test_progress_store_persists_on_step_boundaries(db_session):
+    task = _create_task(db_session, PromptTestTaskStatus.RUNNING)
+    store = TaskProgressStore(step_percent=10)
+
+    def _persisted() -> tuple[int, int]:
+        db_session.expire_all()
+        record = db_session.get(PromptTestTaskProgress, task.id)
+        return record.current, record.percentage
+
+    store.start(task.id, 100)
+    store.advance(task.id, 5)
+    assert store.get(task.id).current == 5
+    assert _persisted() == (0, 0)
+
+    store.advance(task.id, 5)
+    assert _persisted() == (10, 10)
+    store.advance(task.id, 1, persist=True)
+    assert _persisted() == (11, 11)
+
+    store.complete(task.id)
+    store.close(task.id, PromptTestTaskStatus.COMPLETED.value)
+    assert _persisted() == (100, 100)
+    # 任务结束后内存快照释放，读取回退到进度表；任务配置始终不被改写
+    assert store.get(task.id).percentage == 100
+    assert db_session.get(PromptTestTask, task.id).config == {"foo": "bar"}
+
+
+def test_progress_endpoint_reads_progress_table(client, db_session):
+    task = _create_task(db_session, PromptTestTaskStatus.READY)
+    response = client.get(f"/api/v1/prompt-test/tasks/{task.id}/progress")
+    assert response.status_code == 404
+
+    db_session.add(
+        PromptTestTaskProgress(task_id=task.id, current=3, total=4, percentage=75)
+    )
+    db_session.commit()
+
+    response = client.get(f"/api/v1/prompt-test/tasks/{task.id}/progress")
+    assert response.status_code == 200
+    assert response.json() == {
+        "task_id": task.id,
+        "current": 3,
+        "total": 4,
+        "percentage": 75,
+    }
+    listed = client.get("/api/v1/prompt-test/tasks").json()
+    assert listed[0]["progress"]["current"] == 3
+
+
+def test_progress_stream_closes_for_finished_task(client, db_session):
+    task = _create_task(db_session, PromptTestTaskStatus.COMPLETED)
+    db_session.add(
+        PromptTestTaskProgress(task_id=task.id, current=2, total=2, percentage=100)
+    )
+    db_session.commit()
+
+    with client.stream(
+        "GET", f"/api/v1/prompt-test/tasks/{task.id}/progress/stream"
+    ) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = _read_events(response)
+
+    assert events == [
+        ("progress", {"task_id": task.id, "current": 2, "total": 2, "percentage": 100}),
+        ("status", {"task_id": task.id, "status": "completed"}),
+    ]
+
+
+def test_progress_stream_pushes_round_and_status_events(
+    client, db_session, monkeypatch
+):
+    monkeypatch.setattr(settings, "PROMPT_TEST_PROGRESS_POLL_INTERVAL", 0.1)
+    task = _create_task(db_session, PromptTestTaskStatus.RUNNING)
+    task_id = task.id
+    progress_store.start(task_id, 2)
+    initial_read = threading.Event()
+    read_state = prompt_test_tasks._read_progress_state
+
+    def _read_and_signal(target_id: int):
+        state = read_state(target_id)
+        initial_read.set()
+        return state
+
+    monkeypatch.setattr(prompt_test_tasks, "_read_progress_state", _read_and_signal)
+
+    def _execute() -> None:
+        # 等待连接读取初始进度后再推进，保证首个事件为初始快照
+        if not initial_read.wait(timeout=2.0):
+            return
+        progress_store.publish_round(task_id, {"run_index": 1, "status": "success"})
+        progress_store.advance(task_id, 1)
+        progress_store.complete(task_id)
+        progress_store.close(task_id, PromptTestTaskStatus.COMPLETED.value)
+
+    worker = threading.Thread(target=_execute)
+    worker.start()
+    with client.stream(
+        "GET", f"/api/v1/prompt-test/tasks/{task_id}/progress/stream"
+    ) as response:
+        events = _read_events(response)
+    worker.join()
+
+    assert [name for name, _ in events] == [
+        "progress",
+        "round",
+        "progress",
+        "progress",
+        "status",
+    ]
+    assert events[0][1]["current"] == 0
+    assert events[1][1]["run_index"] == 1
+    assert events[3][1]["percentage"] == 100
+    assert events[-1][1] == {"task_id": task_id, "status": "completed"}
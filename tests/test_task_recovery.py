@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.prompt_test_task_queue import task_queue as prompt_test_task_queue
+from app.core.task_recovery import (
+    _claim,
+    _load_candidates,
+    recover_orphaned_tasks,
+    task_liveness,
+)
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.prompt_test import (
+    PromptTestExperiment,
+    PromptTestExperimentStatus,
+    PromptTestTask,
+    PromptTestTaskStatus,
+    PromptTestUnit,
+)
+from app.models.task_heartbeat import TaskHeartbeat
+from app.models.task_job import TaskJob, TaskJobKind, TaskJobStatus
+from app.models.test_run import TestRun, TestRunStatus
+
+
+def _make_stale(db_session, model, target_id: int, minutes: int = 10) -> None:
+    db_session.execute(
+        update(model)
+        .where(model.id == target_id)
+        .values(updated_at=datetime.now(timezone.utc) - timedelta(minutes=minutes))
+    )
+    db_session.commit()
+
+
+def _create_runs(db_session, *statuses: TestRunStatus) -> list[TestRun]:
+    prompt_class = PromptClass(name="恢复测试")
+    prompt = Prompt(name="恢复提示词", prompt_class=prompt_class, owner_id=7)
+    version = PromptVersion(prompt=prompt, version="v1", content="你好")
+    runs = [
+        TestRun(
+            prompt_version=version,
+            model_name="recovery-model",
+            temperature=0.7,
+            top_p=1.0,
+            repetitions=3,
+            status=status,
+        )
+        for status in statuses
+    ]
+    db_session.add_all([prompt_class, prompt, version, *runs])
+    db_session.commit()
+    return runs
+
+
+def test_stale_running_test_run_is_requeued_once(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "database")
+    orphan, fresh, held = _create_runs(
+        db_session, TestRunStatus.RUNNING, TestRunStatus.RUNNING, TestRunStatus.PENDING
+    )
+    _make_stale(db_session, TestRun, orphan.id)
+    _make_stale(db_session, TestRun, held.id)
+    stale_snapshot = next(
+        item for item in _load_candidates(db_session) if item.target_id == orphan.id
+    )
+
+    with task_liveness.hold(TaskJobKind.TEST_RUN, held.id):
+        report = recover_orphaned_tasks(stale_after=60)
+
+    assert report.requeued == [(TaskJobKind.TEST_RUN, orphan.id)]
+    db_session.expire_all()
+    recovered = db_session.get(TestRun, orphan.id)
+    assert recovered.status == TestRunStatus.PENDING
+    assert recovered.schema["recovery_attempts"] == 1
+    job = db_session.scalar(select(TaskJob).where(TaskJob.target_id == orphan.id))
+    assert job.status == TaskJobStatus.QUEUED
+    assert job.owner_id == 7
+    assert db_session.get(TestRun, fresh.id).status == TestRunStatus.RUNNING
+
+    # 其他进程基于同一快照再次恢复时比较并交换失败，不会重复入队
+    assert _claim(
+        db_session, stale_snapshot, status=TestRunStatus.PENDING, payload={}
+    ) is False
+    # 已有持久化队列记录的任务不会再次恢复；释放持有后的任务才会被其他进程接管
+    assert recover_orphaned_tasks(stale_after=60).requeued == [
+        (TaskJobKind.TEST_RUN, held.id)
+    ]
+
+
+def test_heartbeat_of_other_process_keeps_task_alive(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "database")
+    (run,) = _create_runs(db_session, TestRunStatus.RUNNING)
+    _make_stale(db_session, TestRun, run.id)
+    db_session.expire_all()
+    stale_updated_at = db_session.get(TestRun, run.id).updated_at
+
+    # 心跳只写入心跳表，不改动执行方会锁定的任务行
+    with task_liveness.hold(TaskJobKind.TEST_RUN, run.id):
+        task_liveness.touch()
+        task_liveness.touch()
+    db_session.expire_all()
+    assert db_session.get(TestRun, run.id).updated_at == stale_updated_at
+    heartbeat = db_session.get(TaskHeartbeat, (TaskJobKind.TEST_RUN.value, run.id))
+    assert heartbeat.holder
+
+    # 本进程已不再持有，但心跳仍新鲜，视为其他进程持有
+    assert recover_orphaned_tasks(stale_after=60).requeued == []
+    snapshot = next(
+        item for item in _load_candidates(db_session) if item.target_id == run.id
+    )
+
+    # 读取快照后心跳又被刷新，比较并交换失败
+    with task_liveness.hold(TaskJobKind.TEST_RUN, run.id):
+        task_liveness.touch()
+    stale_snapshot = replace(
+        snapshot, heartbeat_at=snapshot.heartbeat_at - timedelta(minutes=10)
+    )
+    assert (
+        _claim(db_session, stale_snapshot, status=TestRunStatus.PENDING, payload={})
+        is False
+    )
+
+    # 心跳过期后任务被恢复，过期心跳随之清理
+    db_session.execute(
+        update(TaskHeartbeat).values(
+            heartbeat_at=datetime.now(timezone.utc) - timedelta(minutes=10)
+        )
+    )
+    db_session.commit()
+    assert recover_orphaned_tasks(stale_after=60).requeued == [
+        (TaskJobKind.TEST_RUN, run.id)
+    ]
+    assert db_session.scalar(select(TaskHeartbeat.target_id)) is None
+
+
+def test_repeatedly_orphaned_test_run_is_failed(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_QUEUE_BACKEND", "database")
+    (run,) = _create_runs(db_session, TestRunStatus.RUNNING)
+    run.schema = {"recovery_attempts": 3}
+    db_session.commit()
+    _make_stale(db_session, TestRun, run.id)
+
+    report = recover_orphaned_tasks(stale_after=60, max_attempts=3)
+
+    assert report.failed == [(TaskJobKind.TEST_RUN, run.id)]
+    db_session.expire_all()
+    failed = db_session.get(TestRun, run.id)
+    assert failed.status == TestRunStatus.FAILED
+    assert "已恢复 3 次" in failed.last_error
+    assert db_session.scalar(select(TaskJob.id)) is None
+
+
+def test_recovered_prompt_test_task_resumes_remaining_units(db_session, monkeypatch):
+    task = PromptTestTask(
+        name="中断任务",
+        status=PromptTestTaskStatus.RUNNING,
+        config={"unit_concurrency": 1},
+    )
+    done_unit = PromptTestUnit(task=task, name="已完成", model_name="m", rounds=2)
+    pending_unit = PromptTestUnit(task=task, name="未完成", model_name="m", rounds=2)
+    db_session.add_all([task, done_unit, pending_unit])
+    db_session.flush()
+    db_session.add(
+        PromptTestExperiment(
+            unit_id=done_unit.id,
+            sequence=1,
+            status=PromptTestExperimentStatus.COMPLETED,
+        )
+    )
+    db_session.commit()
+    _make_stale(db_session, PromptTestTask, task.id)
+    executed: list[int] = []
+
+    def resume_execute(
+        session,
+        experiment,
+        progress_callback=None,
+        cancel_token=None,
+        round_callback=None,
+    ):
+        executed.append(experiment.unit_id)
+        progress_callback(2)
+        experiment.status = PromptTestExperimentStatus.COMPLETED
+        session.flush()
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        resume_execute,
+    )
+
+    report = recover_orphaned_tasks(stale_after=60)
+    assert prompt_test_task_queue.wait_for_idle(timeout=2.0)
+
+    assert report.requeued == [(TaskJobKind.PROMPT_TEST_TASK, task.id)]
+    assert executed == [pending_unit.id]
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert refreshed.status == PromptTestTaskStatus.COMPLETED
+    assert refreshed.progress.current == 4
+    assert refreshed.config["recovery_attempts"] == 1
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import asyncio
+import json
 from datetime import timedelta
+from types import SimpleNamespace
 from typing import Any, Mapping
 
 import httpx
 import pytest
 from sqlalchemy import select
 
+from app.core.llm_http import llm_client_registry
 from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.prompt import Prompt, PromptClass, PromptVersion
 from app.models.system_setting import SystemSetting
@@ -16,6 +20,14 @@ from app.services import test_run as test_run_service
 from app.services.system_settings import DEFAULT_TEST_TASK_TIMEOUT
 
 
+def _patch_llm_post(monkeypatch, fake_post) -> None:
+    monkeypatch.setattr(
+        llm_client_registry,
+        "get_sync_client",
+        lambda provider: SimpleNamespace(post=fake_post),
+    )
+
+
 def _create_prompt_version(db_session) -> PromptVersion:
     prompt_class = PromptClass(name="聊天类")
     prompt = Prompt(name="对话助手", prompt_class=prompt_class)
@@ -96,7 +108,7 @@ def test_execute_test_run_generates_results_and_usage(
         elapsed_ms = 12 if run_index == 1 else None
         return DummyResponse(selected, elapsed_ms=elapsed_ms)
 
-    monkeypatch.setattr("app.services.test_run.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     test_run = TestRun(
         prompt_version_id=prompt_version.id,
@@ -152,7 +164,7 @@ def test_execute_test_run_skips_completed(
         called = True
         raise AssertionError("httpx.post should not be called")
 
-    monkeypatch.setattr("app.services.test_run.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     test_run = TestRun(
         prompt_version_id=prompt_version.id,
@@ -221,7 +233,7 @@ def test_execute_test_run_respects_custom_timeout(
         timeout_values.append(kwargs["timeout"])
         return DummyResponse()
 
-    monkeypatch.setattr("app.services.test_run.httpx.post", fake_post)
+    _patch_llm_post(monkeypatch, fake_post)
 
     test_run = TestRun(
         prompt_version_id=prompt_version.id,
@@ -364,3 +376,200 @@ def test_resolve_base_url_requires_value(db_session):
 def test_ensure_mapping_handles_non_mapping():
     assert test_run_service._ensure_mapping({"a": 1}) == {"a": 1}
     assert test_run_service._ensure_mapping("invalid") == {}
+
+
+def test_execute_test_run_async_mode_shares_client(
+    db_session, prompt_version, provider_model, monkeypatch
+):
+    provider = provider_model.provider
+    seen_clients: list[int] = []
+    in_flight = {"current": 0, "peak": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        in_flight["current"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+        try:
+            await asyncio.sleep(0.01)
+            body = json.loads(request.content)
+            content = body["messages"][-1]["content"]
+            return httpx.Response(
+                200,
+                json={
+                    "choices": [{"message": {"content": f"回复 {content}"}}],
+                    "usage": {"prompt_tokens": 2, "completion_tokens": 3},
+                },
+            )
+        finally:
+            in_flight["current"] -= 1
+
+    shared_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def fake_async_client(target: LLMProvider) -> httpx.AsyncClient:
+        assert target.id == provider.id
+        seen_clients.append(id(shared_client))
+        return shared_client
+
+    monkeypatch.setattr(llm_client_registry, "get_async_client", fake_async_client)
+
+    provider_model.concurrency_limit = 2
+    db_session.commit()
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        repetitions=5,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "execution_mode": "async",
+            "conversation": [
+                {"role": "system", "content": "保持专业"},
+                {"role": "user", "content": "第 {{run_index}} 次"},
+            ],
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.COMPLETED, executed.last_error
+    assert len(set(seen_clients)) == 1
+    assert 1 <= in_flight["peak"] <= 2
+    results = sorted(executed.results, key=lambda item: item.run_index)
+    assert [item.run_index for item in results] == [1, 2, 3, 4, 5]
+    assert results[2].output == "回复 第 3 次"
+    assert all(item.tokens_used == 5 for item in results)
+
+
+def test_execute_test_run_async_mode_records_http_errors(
+    db_session, prompt_version, provider_model, monkeypatch
+):
+    provider = provider_model.provider
+    provider.retry_policy = {"max_attempts": 2, "base_delay": 0.01}
+    db_session.commit()
+    request_count = {"value": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        request_count["value"] += 1
+        return httpx.Response(429, json={"error": {"message": "too many requests"}})
+
+    shared_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(
+        llm_client_registry, "get_async_client", lambda provider: shared_client
+    )
+    monkeypatch.setattr(
+        "app.services.test_run.settings.TEST_RUN_EXECUTION_MODE", "async"
+    )
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        repetitions=2,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+
+    assert executed.status == TestRunStatus.FAILED
+    assert "HTTP 429" in (executed.last_error or "")
+    assert "共尝试 2 次" in (executed.last_error or "")
+    assert executed.schema["last_error_status"] == 429
+    assert request_count["value"] == 4
+
+
+def test_execute_test_run_retries_transient_errors(
+    db_session, prompt_version, provider_model, monkeypatch
+):
+    provider = provider_model.provider
+    provider.retry_policy = {"max_attempts": 3, "base_delay": 0.01}
+    db_session.commit()
+    statuses = [503, 200]
+
+    class FlakyResponse(DummyResponse):
+        def __init__(self, status_code: int) -> None:
+            super().__init__(
+                {"choices": [{"message": {"content": "恢复"}}], "usage": {}},
+                elapsed_ms=5,
+            )
+            self.status_code = status_code
+            self.headers = {"Retry-After": "0"}
+
+    def fake_post(*_, **kwargs):  # noqa: ANN002
+        return FlakyResponse(statuses.pop(0))
+
+    _patch_llm_post(monkeypatch, fake_post)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        repetitions=1,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+
+    assert executed.status == TestRunStatus.COMPLETED, executed.last_error
+    assert [item.attempts for item in executed.results] == [2]
+
+
+def test_execute_test_run_resumes_only_missing_repetitions(
+    db_session, prompt_version, provider_model, monkeypatch
+):
+    provider = provider_model.provider
+    requested: list[str] = []
+    failing = {"index": "第 3 次"}
+
+    class StatusResponse(DummyResponse):
+        def __init__(self, status_code: int, content: str) -> None:
+            super().__init__(
+                {"choices": [{"message": {"content": content}}], "usage": {}},
+                elapsed_ms=5,
+            )
+            self.status_code = status_code
+
+    def fake_post(*_, **kwargs):  # noqa: ANN002
+        user_content = str(kwargs["json"]["messages"][-1]["content"])
+        requested.append(user_content)
+        if failing["index"] and failing["index"] in user_content:
+            return StatusResponse(500, "上游故障")
+        return StatusResponse(200, user_content)
+
+    _patch_llm_post(monkeypatch, fake_post)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        repetitions=4,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "conversation": [{"role": "user", "content": "第 {{run_index}} 次提问"}],
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    failed = test_run_service.execute_test_run(db_session, test_run)
+    assert failed.status == TestRunStatus.FAILED
+    assert sorted(item.run_index for item in failed.results) == [1, 2, 4]
+
+    requested.clear()
+    failing["index"] = None
+    failed.status = TestRunStatus.PENDING
+    db_session.commit()
+
+    resumed = test_run_service.execute_test_run(db_session, failed)
+
+    assert resumed.status == TestRunStatus.COMPLETED
+    assert requested == ["第 3 次提问"]
+    assert sorted(item.run_index for item in resumed.results) == [1, 2, 3, 4]